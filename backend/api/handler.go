@@ -118,6 +118,7 @@ func (h *Handler) GetOpportunities(c *gin.Context) {
 // @Produce      json
 // @Param        startTime   query      int    true   "开始时间 (13位毫秒时间戳)"  example(1756694400000)
 // @Param        endTime     query      int    true   "结束时间 (13位毫秒时间戳)"  example(1756780799000)
+// @Param        interval    query      string false  "聚合粒度 (1m/5m/15m/1h/4h/1d)，默认 1m"  example(1m)
 // @Success      200         {object}   api.SuccessPriceResponse  "成功响应 (符合 API 规范 3.1.A)"
 // @Failure      400         {object}   api.ErrorResponse         "参数错误 (Code: 40001)"
 // @Failure      500         {object}   api.ErrorResponse         "服务器内部错误 (Code: 50001)"
@@ -140,8 +141,10 @@ func (h *Handler) GetPriceComparisonData(c *gin.Context) {
 		return
 	}
 
+	interval := c.DefaultQuery("interval", service.DefaultPriceInterval)
+
 	// 1. 只调用 service，并传入参数
-	dataMap, err := h.service.GetPriceComparisonData(startTime, endTime)
+	dataMap, err := h.service.GetPriceComparisonData(startTime, endTime, interval)
 
 	// 2. 处理错误
 	if err != nil {
@@ -236,6 +236,13 @@ const docTemplate = `{
                         "name": "endTime",
                         "in": "query",
                         "required": true
+                    },
+                    {
+                        "type": "string",
+                        "example": "1m",
+                        "description": "聚合粒度 (1m/5m/15m/1h/4h/1d)，默认 1m",
+                        "name": "interval",
+                        "in": "query"
                     }
                 ],
                 "responses": {
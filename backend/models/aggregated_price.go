@@ -2,8 +2,10 @@ package models
 
 import "time"
 
+// AggregatedPrice 聚合行情，主键 (bucket_interval, time_bucket, source)，不同粒度可以并存
 type AggregatedPrice struct {
-	TimeBucket   time.Time `gorm:"primaryKey"` // 按小时或分钟聚合的时间点
-	Source       string    `gorm:"primaryKey"` // 'Binance' 或 'Uniswap'
-	AveragePrice float64   `gorm:"not null"`
+	BucketInterval string    `gorm:"primaryKey;default:'1m'"` // 聚合粒度，如 '1m'、'1h'
+	TimeBucket     time.Time `gorm:"primaryKey"`              // 按小时或分钟聚合的时间点
+	Source         string    `gorm:"primaryKey"`              // 'Binance' 或 'Uniswap'
+	AveragePrice   float64   `gorm:"not null"`
 }
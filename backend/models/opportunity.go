@@ -18,8 +18,18 @@ type ArbitrageOpportunity struct {
 	DetailsJSON     datatypes.JSONMap `json:"details,omitempty" gorm:"type:jsonb" swaggertype:"object"`
 	RiskMetricsJSON datatypes.JSONMap `json:"risk_metrics,omitempty" gorm:"type:jsonb" swaggertype:"object"`
 	LLMAnalysisJSON datatypes.JSONMap `json:"llm_analysis,omitempty" gorm:"type:jsonb" swaggertype:"object"`
-	CreatedAt       time.Time         `json:"created_at" gorm:"autoCreateTime"`
-	UpdatedAt       time.Time         `json:"updated_at" gorm:"autoUpdateTime"`
+	// 以下类型化列由 Worker 写入（旧记录由 python -m block_chain.analyse --backfill 从 JSON 回填），报表直接按列过滤与汇总。
+	// (batch_id, block_time) INCLUDE (profit_usdt, risk_score) 与 experiment_id 索引由 Worker 在写入后创建
+	BlockTime       *time.Time `json:"block_time,omitempty" gorm:"type:timestamptz"`
+	ExperimentID    *uint      `json:"experiment_id,omitempty" gorm:"type:integer"`
+	RiskScore       *float64   `json:"risk_score,omitempty" gorm:"type:double precision"`
+	Volatility      *float64   `json:"volatility,omitempty" gorm:"type:double precision"`
+	SlippagePct     *float64   `json:"slippage_pct,omitempty" gorm:"type:double precision"`
+	SlippageCost    *float64   `json:"slippage_cost,omitempty" gorm:"type:double precision"`
+	MarketVolumeETH *float64   `json:"market_volume_eth,omitempty" gorm:"column:market_volume_eth;type:double precision"`
+	TradeSizeETH    *float64   `json:"trade_size_eth,omitempty" gorm:"column:trade_size_eth;type:double precision"`
+	CreatedAt       time.Time  `json:"created_at" gorm:"autoCreateTime"`
+	UpdatedAt       time.Time  `json:"updated_at" gorm:"autoUpdateTime"`
 }
 
 // PaginationData 定义分页响应的结构
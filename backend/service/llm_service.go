@@ -54,10 +54,12 @@ func (s *Service) AnalyzeOpportunityWithLLM(opportunityID uint) (datatypes.JSONM
 	}
 
 	// 4. 获取交易时间窗口及该窗口内的市场信息
-	// 假设我们在 DetailsJSON 中存储了 block_time，如果没有则使用 CreatedAt
+	// 优先使用类型化列 block_time，旧记录回退到 DetailsJSON 中的 block_time，都没有则使用 CreatedAt
 	// 窗口大小：前后 1 小时 (3600秒) 以获取足够的上下文
 	tradeTime := opp.CreatedAt
-	if val, ok := opp.DetailsJSON["block_time"]; ok {
+	if opp.BlockTime != nil {
+		tradeTime = *opp.BlockTime
+	} else if val, ok := opp.DetailsJSON["block_time"]; ok {
 		if tStr, ok := val.(string); ok {
 			if t, err := time.Parse(time.RFC3339, tStr); err == nil {
 				tradeTime = t
@@ -68,7 +70,7 @@ func (s *Service) AnalyzeOpportunityWithLLM(opportunityID uint) (datatypes.JSONM
 	startTime := tradeTime.UnixMilli() - windowSeconds*1000
 	endTime := tradeTime.UnixMilli() + windowSeconds*1000
 
-	marketData, _ := s.GetPriceComparisonData(startTime, endTime)
+	marketData, _ := s.GetPriceComparisonData(startTime, endTime, DefaultPriceInterval)
 
 	// 5. 构造 Prompt
 	contextData := map[string]interface{}{
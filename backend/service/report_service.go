@@ -116,12 +116,8 @@ func (s *ReportService) GenerateReportFile(reportID uint, batchID uint, format s
 			minProfit = p
 		}
 
-		if rm := getJSONMap(row, "risk_metrics", "risk_metrics_json", "RiskMetricsJSON"); rm != nil {
-			if v, ok := rm["risk_score"]; ok {
-				if score, ok := asFloat64(v); ok {
-					riskScores = append(riskScores, score)
-				}
-			}
+		if score := extractRiskScore(row); score != nil {
+			riskScores = append(riskScores, *score)
 		}
 
 		t := extractOpportunityTime(row)
@@ -175,15 +171,7 @@ func (s *ReportService) GenerateReportFile(reportID uint, batchID uint, format s
 		bp := getFloat(row, "buy_price", "BuyPrice")
 		sp := getFloat(row, "sell_price", "SellPrice")
 		p := getFloat(row, "profit_usdt", "profit", "ProfitUSDT")
-		var riskPtr *float64
-		if rm := getJSONMap(row, "risk_metrics", "risk_metrics_json", "RiskMetricsJSON"); rm != nil {
-			if v, ok := rm["risk_score"]; ok {
-				if score, ok := asFloat64(v); ok {
-					cp := score
-					riskPtr = &cp
-				}
-			}
-		}
+		riskPtr := extractRiskScore(row)
 		bt := extractOpportunityTime(row)
 		tStr := "--"
 		if bt != nil {
@@ -688,8 +676,30 @@ func getJSONMap(row map[string]interface{}, keys ...string) map[string]interface
 	return nil
 }
 
+// extractRiskScore 优先读取类型化列 risk_score，旧记录回退到 risk_metrics_json
+func extractRiskScore(row map[string]interface{}) *float64 {
+	if v, ok := row["risk_score"]; ok && v != nil {
+		if score, ok := asFloat64(v); ok {
+			return &score
+		}
+	}
+	if rm := getJSONMap(row, "risk_metrics", "risk_metrics_json", "RiskMetricsJSON"); rm != nil {
+		if v, ok := rm["risk_score"]; ok {
+			if score, ok := asFloat64(v); ok {
+				return &score
+			}
+		}
+	}
+	return nil
+}
+
 func extractOpportunityTime(row map[string]interface{}) *time.Time {
-	// Prefer details_json.block_time if exists
+	// Prefer the typed block_time column, then details_json.block_time
+	if v, ok := row["block_time"]; ok && v != nil {
+		if t, ok := v.(time.Time); ok {
+			return &t
+		}
+	}
 	if details := getJSONMap(row, "details", "details_json", "DetailsJSON", "details_jsonb"); details != nil {
 		if v, ok := details["block_time"]; ok && v != nil {
 			if s, ok := v.(string); ok && s != "" {
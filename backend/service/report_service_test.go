@@ -99,3 +99,26 @@ func TestReportHelpers(t *testing.T) {
 	t.Cleanup(func() { _ = os.Chdir(cwd) })
 	require.NoError(t, svc.updateStatus(report.ID, "SUCCESS", filepath.Join(tmpDir, "file.pdf")))
 }
+
+func TestReportPrefersTypedColumns(t *testing.T) {
+	blockTime := time.Date(2025, 9, 1, 10, 0, 0, 0, time.UTC)
+	row := map[string]interface{}{
+		"block_time":        blockTime,
+		"risk_score":        72.5,
+		"details_json":      `{"block_time": "2024-01-01T00:00:00Z"}`,
+		"risk_metrics_json": `{"risk_score": 10}`,
+	}
+	require.Equal(t, blockTime, *extractOpportunityTime(row))
+	require.Equal(t, 72.5, *extractRiskScore(row))
+
+	// 回填前的旧记录：类型化列为空时回退到 JSON
+	legacy := map[string]interface{}{
+		"block_time":        nil,
+		"risk_score":        nil,
+		"details_json":      `{"block_time": "2024-01-01T00:00:00Z"}`,
+		"risk_metrics_json": `{"risk_score": 10}`,
+	}
+	require.Equal(t, time.Date(2024, 1, 1, 0, 0, 0, 0, time.UTC), *extractOpportunityTime(legacy))
+	require.Equal(t, 10.0, *extractRiskScore(legacy))
+	require.Nil(t, extractRiskScore(map[string]interface{}{}))
+}
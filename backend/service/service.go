@@ -55,9 +55,15 @@ func (s *Service) GetOpportunities(page, limit int, sortBy, order string, batchI
 	return opportunities, paginationData, err
 }
 
-// 添加了 startTime 和 endTime 参数
-func (s *Service) GetPriceComparisonData(startTime, endTime int64) (map[string][][2]interface{}, error) {
+// DefaultPriceInterval 未指定粒度时使用的聚合粒度
+const DefaultPriceInterval = "1m"
+
+// 添加了 startTime、endTime 与聚合粒度 interval 参数
+func (s *Service) GetPriceComparisonData(startTime, endTime int64, interval string) (map[string][][2]interface{}, error) {
 	var results []models.AggregatedPrice
+	if interval == "" {
+		interval = DefaultPriceInterval
+	}
 
 	// 将毫秒时间戳转换为 time.Time
 	start := time.UnixMilli(startTime).UTC()
@@ -65,7 +71,7 @@ func (s *Service) GetPriceComparisonData(startTime, endTime int64) (map[string][
 
 	// 1. 从 service 层访问数据库, 添加 WHERE 条件
 	if err := s.db.
-		Where("time_bucket BETWEEN ? AND ?", start, end).
+		Where("bucket_interval = ? AND time_bucket BETWEEN ? AND ?", interval, start, end).
 		Order("time_bucket asc").
 		Find(&results).Error; err != nil {
 		// 向上传递错误
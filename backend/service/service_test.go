@@ -49,13 +49,15 @@ func TestGetPriceComparisonDataFiltersWindowAndGroupsBySource(t *testing.T) {
 		{TimeBucket: base.Add(10 * time.Minute), Source: "Binance", AveragePrice: 3000},
 		{TimeBucket: base.Add(20 * time.Minute), Source: "Uniswap", AveragePrice: 3050},
 		{TimeBucket: base.Add(3 * time.Hour), Source: "Binance", AveragePrice: 2900},
+		// 其他粒度的数据不会混入结果
+		{BucketInterval: "1h", TimeBucket: base.Add(10 * time.Minute), Source: "Binance", AveragePrice: 2950},
 	}
 	require.NoError(t, db.Create(&rows).Error)
 
 	start := base.Add(5 * time.Minute).UnixMilli()
 	end := base.Add(30 * time.Minute).UnixMilli()
 
-	data, err := svc.GetPriceComparisonData(start, end)
+	data, err := svc.GetPriceComparisonData(start, end, "1m")
 	require.NoError(t, err)
 
 	require.Len(t, data["binance"], 1)
@@ -87,6 +89,6 @@ func TestGetPriceComparisonDataPropagatesDBError(t *testing.T) {
 	require.NoError(t, err)
 	require.NoError(t, sqlDB.Close())
 
-	_, err = svc.GetPriceComparisonData(0, 10)
+	_, err = svc.GetPriceComparisonData(0, 10, "")
 	require.Error(t, err)
 }
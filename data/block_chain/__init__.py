@@ -2,12 +2,46 @@
 block_chain 包导出核心任务模块，便于 `import block_chain.process_prices` 等写法。
 """
 
-from . import analyse, analyze_risk, collect_binance, collect_uniswap, process_prices
+from . import (
+    analyse,
+    analyze_risk,
+    coalesce,
+    collect_binance,
+    collect_uniswap,
+    columnar,
+    gas_index,
+    incremental,
+    lease,
+    pool_state,
+    process_prices,
+    publisher,
+    replay,
+    rollup,
+    routes,
+    streaming,
+    symbols,
+    tickstore,
+    venues,
+)
 
 __all__ = [
     "analyse",
     "analyze_risk",
+    "coalesce",
+    "columnar",
     "collect_binance",
     "collect_uniswap",
+    "gas_index",
+    "incremental",
+    "lease",
+    "pool_state",
     "process_prices",
+    "publisher",
+    "replay",
+    "rollup",
+    "routes",
+    "streaming",
+    "symbols",
+    "tickstore",
+    "venues",
 ]
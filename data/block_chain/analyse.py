@@ -1,12 +1,30 @@
 import argparse
+import csv
+import io
+import itertools
+import json
+import math
+import time
 from typing import Any, Optional, Tuple
 
+import numpy as np
+import orjson
 import pandas as pd
 import psycopg2
 import yaml
 from loguru import logger
 from psycopg2.extras import Json, execute_values
 
+from . import (
+    columnar,
+    gas_index,
+    incremental,
+    pool_state,
+    symbols,
+    tickstore,
+    venues,
+)
+from .rolling_stats import VOLUME_WINDOW, TimeWindowSum, rolling_volatility
 from .task import check_task, update_task_status
 from .utils import load_config_from_string
 
@@ -39,21 +57,26 @@ def fetch_price_pairs(
     end_time: pd.Timestamp = None,
 ) -> list[Tuple]:
     """
-    使用单个 SQL JOIN 查询，让数据库服务器完成所有繁重的计算.
+    使用单个 SQL JOIN 查询，让数据库服务器完成延迟窗口内的 Binance 均价计算.
+    10 分钟累计成交量不再用窗口函数在服务器上逐行计算，而是按时间顺序在本地用 TimeWindowSum 增量累加。
+    两张表都只取 strategy 中 symbol（默认为 symbols.default）交易对的成交，可以使用 (symbol, 时间) 索引。
     """
-    logger.info("正在请求服务器计算并返回所有价格对...")
+    symbol = symbols.normalize_symbol(strategy.get("symbol") or symbols.DEFAULT_SYMBOL)
+    trades_table = venues.venue_table(strategy.get("venue"))
+    logger.info(f"正在请求服务器计算并返回 {symbol} 的所有价格对（{trades_table}）...")
     params = {
         "delay_seconds": f"{strategy['time_delay_seconds']} seconds",
         "window_seconds": f"{strategy['window_seconds']} seconds",
+        "symbol": symbol,
     }
-    time_conditions = []
+    time_conditions = ["u.symbol = %(symbol)s"]
     if start_time is not None:
         params["start_ts"] = start_time.to_pydatetime()
         time_conditions.append("u.block_time >= %(start_ts)s")
     if end_time is not None:
         params["end_ts"] = end_time.to_pydatetime()
         time_conditions.append("u.block_time <= %(end_ts)s")
-    where_clause = f"WHERE {' AND '.join(time_conditions)}" if time_conditions else ""
+    where_clause = f"WHERE {' AND '.join(time_conditions)}"
 
     sql_query = f"""
         WITH 
@@ -67,11 +90,8 @@ def fetch_price_pairs(
                 block_time, 
                 price AS uniswap_price, 
                 gas_price,
-                -- 计算过去 10 分钟的绝对累计成交量 (ETH) 作为市场深度/流动性的代理
-                SUM(ABS(amount_eth)) OVER (
-                    ORDER BY block_time 
-                    RANGE BETWEEN INTERVAL '10 minutes' PRECEDING AND CURRENT ROW
-                ) as window_volume
+                -- 单笔绝对成交量 (ETH)，10 分钟累计值在本地计算
+                ABS(amount_eth) AS volume
             FROM uniswap_swaps u
             {where_clause}
         ),
@@ -84,9 +104,10 @@ def fetch_price_pairs(
             CROSS JOIN 
                 config c 
             JOIN 
-                binance_trades b 
+                {trades_table} b 
             ON 
-                b.trade_time BETWEEN 
+                b.symbol = %(symbol)s
+                AND b.trade_time BETWEEN 
                     (u.block_time - c.delay - c.window)
                 AND 
                     (u.block_time - c.delay + c.window)
@@ -97,29 +118,99 @@ def fetch_price_pairs(
             u.block_time,
             u.uniswap_price,
             u.gas_price,
-            u.window_volume,
+            u.volume,
             b.binance_price
         FROM 
             uniswap_data u
-        JOIN 
+        -- 保留没有匹配到 Binance 成交的 Swap：它们同样计入累计成交量
+        LEFT JOIN 
             binance_avg b ON u.block_time = b.block_time
         ORDER BY
             u.block_time;
     """
     with conn.cursor() as cur:
         cur.execute(sql_query, params)
-        price_pairs = cur.fetchall()
+        rows = cur.fetchall()
+
+    # 计算过去 10 分钟的绝对累计成交量 (ETH) 作为市场深度/流动性的代理
+    window_volume = TimeWindowSum(VOLUME_WINDOW).update(
+        [row[0] for row in rows],
+        [0.0 if row[3] is None else row[3] for row in rows],
+    )
+    # 窗口内没有 Binance 成交的 Swap 不构成价格对（与内连接一致）
+    price_pairs = [
+        (row[0], row[1], row[2], volume, row[4])
+        for row, volume in zip(rows, window_volume)
+        if row[4] is not None
+    ]
     logger.info(f"计算完成，从服务器收到 {len(price_pairs)} 对价格。")
     return price_pairs
 
 
+def fetch_price_pairs_columnar(
+    conn,
+    strategy: dict[str, Any],
+    start_time: pd.Timestamp = None,
+    end_time: pd.Timestamp = None,
+    refresh: bool = False,
+) -> list[Tuple]:
+    """
+    在 Worker 本机的 Parquet 镜像上用 DuckDB 计算价格对，Postgres 只负责导出尚未镜像的日期.
+    """
+    logger.info("正在本地列式引擎中计算价格对...")
+    margin = pd.Timedelta(
+        seconds=float(strategy["time_delay_seconds"])
+        + float(strategy["window_seconds"])
+    )
+    with columnar.ColumnarStore() as store:
+        store.sync(
+            conn,
+            start_time - margin if start_time is not None else None,
+            end_time + margin if end_time is not None else None,
+            refresh=refresh,
+        )
+        return store.price_pairs(strategy, start_time, end_time)
+
+
+def fetch_price_pairs_ticks(
+    conn,
+    strategy: dict[str, Any],
+    start_time: pd.Timestamp = None,
+    end_time: pd.Timestamp = None,
+    refresh: bool = False,
+) -> pd.DataFrame:
+    """
+    在 Worker 本机内存映射的逐笔数组上计算价格对，Postgres 只负责构建尚未缓存的日期.
+    """
+    logger.info("正在逐笔数组上计算价格对...")
+    margin = pd.Timedelta(
+        seconds=float(strategy["time_delay_seconds"])
+        + float(strategy["window_seconds"])
+    )
+    store = tickstore.TickStore()
+    store.sync(
+        conn,
+        start_time - margin if start_time is not None else None,
+        end_time + margin if end_time is not None else None,
+        refresh=refresh,
+    )
+    return store.price_pairs(strategy, start_time, end_time)
+
+
+def _gas_used(strategy: dict[str, Any], route: str):
+    """strategy 中有 route_gas_used 时按路线取 Gas 用量，否则使用统一的 estimated_gas_used"""
+    return (strategy.get("route_gas_used") or {}).get(
+        route, strategy["estimated_gas_used"]
+    )
+
+
 def calculate_profit_buy_cex_sell_dex(
     strategy: dict[str, Any], price_cex, price_dex, gas_price
 ):
     investment = strategy["initial_investment"]
     binance_fee = strategy["binance_fee_rate"]
     uniswap_fee = strategy["uniswap_fee_rate"]
-    gas_used = strategy["estimated_gas_used"]
+    gas_used = _gas_used(strategy, "buy_cex_sell_dex")
 
     eth_acquired = (investment * (1 - binance_fee)) / price_cex
     gross_revenue_usdt = eth_acquired * price_dex
@@ -139,7 +230,7 @@ def calculate_profit_buy_dex_sell_cex(
     investment = strategy["initial_investment"]
     binance_fee = strategy["binance_fee_rate"]
     uniswap_fee = strategy["uniswap_fee_rate"]
-    gas_used = strategy["estimated_gas_used"]
+    gas_used = _gas_used(strategy, "buy_dex_sell_cex")
 
     gas_cost_eth = (gas_used * gas_price) / 1e18
     gas_cost_usdt = gas_cost_eth * price_dex
@@ -155,115 +246,399 @@ def calculate_profit_buy_dex_sell_cex(
     return net_profit
 
 
-def analyze_opportunities(price_pairs: list, strategy: dict[str, Any]):
-    logger.info("开始在本地内存中分析套利机会...")
+def evaluate_pair(
+    strategy: dict[str, Any],
+    block_time,
+    uniswap_price: float,
+    gas_price: float,
+    binance_price: float,
+    volatility: float,
+    market_volume: float,
+    with_risk: bool = True,
+) -> Optional[dict[str, Any]]:
+    """
+    描述：评估一个价格对：价差方向决定买卖平台，净利润超过阈值时返回附带风险指标的机会
+        批量分析（analyze_opportunities）与流式检测（streaming）共用这一套公式
+    参数：strategy: 策略参数, block_time: Uniswap 成交时间, uniswap_price / binance_price: 两边价格,
+        gas_price: Gas 价格（Wei）, volatility: 滚动波动率, market_volume: 10 分钟累计成交量（ETH）,
+        with_risk: 是否逐条计算风险指标（批量分析在最后统一向量化计算）
+    返回值：机会字典；不满足阈值时返回 None
+    """
     from .analyze_risk import calculate_risk_metrics_local
 
-    profitable_trades = []
     threshold = float(strategy["profit_threshold"])
-    investment = float(strategy["initial_investment"])
+    opp = None
+    if uniswap_price > binance_price and binance_price != 0:
+        profit = calculate_profit_buy_cex_sell_dex(
+            strategy, binance_price, uniswap_price, gas_price
+        )
+        if profit > threshold:
+            opp = {
+                "block_time": block_time,
+                "buy_platform": venues.display_name(strategy.get("venue")),
+                "sell_platform": "Uniswap",
+                "buy_price": float(binance_price),
+                "sell_price": float(uniswap_price),
+                "profit_usdt": float(profit),
+            }
+    elif binance_price > uniswap_price and uniswap_price != 0:
+        profit = calculate_profit_buy_dex_sell_cex(
+            strategy, uniswap_price, binance_price, gas_price
+        )
+        if profit > threshold:
+            opp = {
+                "block_time": block_time,
+                "buy_platform": "Uniswap",
+                "sell_platform": venues.display_name(strategy.get("venue")),
+                "buy_price": float(uniswap_price),
+                "sell_price": float(binance_price),
+                "profit_usdt": float(profit),
+            }
+
+    if opp and with_risk:
+        # 集成风险分析
+        opp["risk_metrics"] = calculate_risk_metrics_local(
+            opp, volatility, market_volume, float(strategy["initial_investment"])
+        )
+    return opp
+
+
+def analyze_opportunities(price_pairs, strategy: dict[str, Any]):
+    from .analyze_risk import calculate_risk_metrics_batch
+
+    logger.info("开始在本地内存中分析套利机会...")
+    profitable_trades = []
+    volatilities, volumes = [], []
 
     # 将 price_pairs 转为 DataFrame 以便计算波动率
-    # 注意：现在多了 window_volume 列
-    df = pd.DataFrame(
-        price_pairs,
-        columns=[
-            "block_time",
-            "uniswap_price",
-            "gas_price",
-            "window_volume",
-            "binance_price",
-        ],
-    )
+    # 注意：现在多了 window_volume 列；逐笔数组后端直接返回 float64 列的 DataFrame
+    if isinstance(price_pairs, pd.DataFrame):
+        df = price_pairs.copy(deep=False)
+    else:
+        df = pd.DataFrame(
+            price_pairs,
+            columns=[
+                "block_time",
+                "uniswap_price",
+                "gas_price",
+                "window_volume",
+                "binance_price",
+            ],
+        )
     # 确保类型正确
     df["uniswap_price"] = pd.to_numeric(df["uniswap_price"], errors="coerce")
     df["binance_price"] = pd.to_numeric(df["binance_price"], errors="coerce")
     df["window_volume"] = pd.to_numeric(df["window_volume"], errors="coerce").fillna(0)
 
+    # gas_model=index：按我们的交易的执行时刻从 Gas 索引向量化地查询 Gas 价格，并按路线计算 Gas 用量；
+    # 索引中没有可用区块的行仍用触发机会的 Swap 自身的 gas_price
+    if gas_index.gas_model(strategy) == "index":
+        index = gas_index.load_gas_index()
+        if index is not None and len(df):
+            priced = gas_index.execution_gas_prices(index, df["block_time"], strategy)
+            df["gas_price"] = np.where(
+                np.isnan(priced), pd.to_numeric(df["gas_price"]), priced
+            )
+            strategy = {
+                **strategy,
+                "route_gas_used": gas_index.route_gas_used(strategy),
+            }
+
     # 计算滑动窗口波动率 (Rolling Volatility)
-    # 假设数据是按时间排序的。计算过去 10 个点的标准差作为波动率估计
-    df["volatility"] = (
-        df["uniswap_price"].rolling(window=10).std()
-        / df["uniswap_price"].rolling(window=10).mean()
-    )
+    # 假设数据是按时间排序的。计算过去 10 个点的标准差作为波动率估计（与流式检测共用 RollingMeanStd）
+    df["volatility"] = rolling_volatility(df["uniswap_price"].to_numpy())
     df["volatility"] = df["volatility"].fillna(0)
 
     for index, row in df.iterrows():
-        block_time = row["block_time"]
         uniswap_price = row["uniswap_price"]
         gas_price = row["gas_price"]
         binance_price = row["binance_price"]
-        volatility = row["volatility"]
-        # 使用数据库查出来的真实 volume
-        market_volume = row["window_volume"]
 
         if pd.isna(uniswap_price) or pd.isna(gas_price) or pd.isna(binance_price):
             continue
 
-        opp = None
-        if uniswap_price > binance_price and binance_price != 0:
-            profit = calculate_profit_buy_cex_sell_dex(
-                strategy, binance_price, uniswap_price, gas_price
-            )
-            if profit > threshold:
-                opp = {
-                    "block_time": block_time,
-                    "buy_platform": "Binance",
-                    "sell_platform": "Uniswap",
-                    "buy_price": float(binance_price),
-                    "sell_price": float(uniswap_price),
-                    "profit_usdt": float(profit),
-                }
-        elif binance_price > uniswap_price and uniswap_price != 0:
-            profit = calculate_profit_buy_dex_sell_cex(
-                strategy, uniswap_price, binance_price, gas_price
-            )
-            if profit > threshold:
-                opp = {
-                    "block_time": block_time,
-                    "buy_platform": "Uniswap",
-                    "sell_platform": "Binance",
-                    "buy_price": float(uniswap_price),
-                    "sell_price": float(binance_price),
-                    "profit_usdt": float(profit),
-                }
-
+        # 使用数据库查出来的真实 volume
+        opp = evaluate_pair(
+            strategy,
+            row["block_time"],
+            uniswap_price,
+            gas_price,
+            binance_price,
+            row["volatility"],
+            row["window_volume"],
+            with_risk=False,
+        )
         if opp:
-            # 集成风险分析
-            risk_metrics = calculate_risk_metrics_local(
-                opp, volatility, market_volume, investment
-            )
-            opp["risk_metrics"] = risk_metrics
             profitable_trades.append(opp)
+            volatilities.append(row["volatility"])
+            volumes.append(row["window_volume"])
+
+    if profitable_trades:
+        # slippage_model=v3 时按机会所在区块的池子深度模拟 Uniswap 一侧的兑换，没有快照的机会仍用平方根法则
+        # 池子快照只覆盖默认交易对
+        depth_slippage = None
+        if pool_state.slippage_model(strategy) == "v3" and symbols.is_default(
+            strategy.get("symbol")
+        ):
+            state = pool_state.load_pool_state()
+            if state is not None:
+                depth_slippage = state.opportunity_slippage(profitable_trades, strategy)
+        # 集成风险分析：全部机会一次向量化计算（与逐条 calculate_risk_metrics_local 的结果相同）
+        metrics = calculate_risk_metrics_batch(
+            [opp["buy_price"] for opp in profitable_trades],
+            [opp["profit_usdt"] for opp in profitable_trades],
+            volatilities,
+            volumes,
+            float(strategy["initial_investment"]),
+            depth_slippage,
+        )
+        for opp, risk_metrics in zip(profitable_trades, metrics.to_dict("records")):
+            opp["risk_metrics"] = risk_metrics
 
     logger.info("分析结束，本次找到 %s 条机会", len(profitable_trades))
     return profitable_trades
 
 
+# 风险指标的类型化列（列名 -> risk_metrics 中的键），与 risk_metrics_json 同时写入
+RISK_METRIC_COLUMNS = {
+    "risk_score": "risk_score",
+    "volatility": "volatility",
+    "slippage_pct": "estimated_slippage_pct",
+    "slippage_cost": "estimated_slippage_cost",
+    "market_volume_eth": "market_volume_eth",
+    "trade_size_eth": "trade_size_eth",
+}
+
+# 由 details_json / risk_metrics_json 提升出来的类型化列（列名 -> 类型）
+# 报表按这些列过滤与汇总，不再逐行解析 JSONB；JSON 列保持不变，供 API 原样返回
+TYPED_COLUMNS = {
+    "block_time": "timestamptz",
+    "experiment_id": "integer",
+    **{column: "double precision" for column in RISK_METRIC_COLUMNS},
+    # 机会所属的交易对；旧记录都是默认交易对，补列时由默认值填充，不需要回填
+    "symbol": f"text NOT NULL DEFAULT '{symbols.DEFAULT_SYMBOL}'",
+}
+
+_TYPED_COLUMNS_DDL = ",\n    ".join(
+    f"{name} {kind}" for name, kind in TYPED_COLUMNS.items()
+)
+
+OPPORTUNITIES_DDL = """
+CREATE TABLE IF NOT EXISTS arbitrage_opportunities (
+    id SERIAL PRIMARY KEY,
+    batch_id integer,
+    buy_platform text,
+    sell_platform text,
+    buy_price numeric,
+    sell_price numeric,
+    profit_usdt numeric,
+    details_json jsonb,
+    risk_metrics_json jsonb,
+    """ + _TYPED_COLUMNS_DDL + "\n);\n"
+
+# arbitrage_opportunities 的辅助索引（名称 -> 列），在 COPY 写入之后创建
+# 批次索引带上报表汇总用到的列，按批次统计利润、风险评分与时间范围时只扫描索引
+OPPORTUNITY_INDEXES = {
+    "arbitrage_opportunities_batch_time_idx": "(batch_id, block_time) INCLUDE (profit_usdt, risk_score)",
+    "arbitrage_opportunities_experiment_idx": "(experiment_id)",
+}
+
+OPPORTUNITY_COLUMNS = (
+    "batch_id",
+    "buy_platform",
+    "sell_platform",
+    "buy_price",
+    "sell_price",
+    "profit_usdt",
+    "details_json",
+    "risk_metrics_json",
+    *TYPED_COLUMNS,
+)
+
+_COPY_OPPORTUNITIES_SQL = (
+    f"COPY arbitrage_opportunities ({', '.join(OPPORTUNITY_COLUMNS)})"
+    " FROM STDIN WITH (FORMAT CSV)"
+)
+
+# 默认是否按批次水位线增量分析，可通过任务配置 incremental 覆盖
+DEFAULT_INCREMENTAL = bool((config.get("analyse", {}) or {}).get("incremental", False))
+
+# 机会记录不少于该条数时，先删除辅助索引，写入后再整体重建（0 表示从不删除）
+DEFER_INDEX_MIN_ROWS = int(
+    (config.get("analyse", {}) or {}).get("defer_index_min_rows", 0) or 0
+)
+
+# 每次编码为 CSV 的记录数；COPY 按块读取，整批数据不会在内存中拼成一个字符串
+_COPY_BATCH_ROWS = 10_000
+_COPY_READ_SIZE = 1 << 20
+
+
+def _dumps_json(value: Any) -> str:
+    """
+    描述：紧凑 JSON 编码（orjson：NumPy 标量直接编码，NaN / Inf 编码为 null）
+    """
+    return orjson.dumps(
+        value, option=orjson.OPT_SERIALIZE_NUMPY, default=float
+    ).decode()
+
+
+def _metric(value) -> Optional[float]:
+    """风险指标转为 float；缺失、非数值与 NaN / Inf 写为 NULL（与 JSON 中的 null 一致）"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _opportunity_rows(
+    results: list[dict[str, Any]], batch_id: int, experiment_id: Optional[int]
+):
+    """按 OPPORTUNITY_COLUMNS 的顺序逐条生成待写入的记录"""
+    for item in results:
+        block_time = item.get("block_time")
+        block_time = block_time.isoformat() if block_time else None
+        details = {
+            "block_time": block_time,
+            "experiment_id": experiment_id,
+        }
+        risk_metrics = item.get("risk_metrics", {}) or {}
+        yield (
+            batch_id,
+            item["buy_platform"],
+            item["sell_platform"],
+            item["buy_price"],
+            item["sell_price"],
+            item["profit_usdt"],
+            _dumps_json(details),
+            # 独立存入 risk_metrics_json
+            _dumps_json(risk_metrics),
+            block_time,
+            experiment_id,
+            *(_metric(risk_metrics.get(key)) for key in RISK_METRIC_COLUMNS.values()),
+            item.get("symbol") or symbols.DEFAULT_SYMBOL,
+        )
+
+
+class _CsvStream(io.TextIOBase):
+    """把记录迭代器按块编码为 CSV，供 copy_expert 边编码边发送"""
+
+    def __init__(self, rows, batch_rows: int = _COPY_BATCH_ROWS):
+        self._rows = iter(rows)
+        self._batch_rows = batch_rows
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._data = ""
+        self._pos = 0
+        self.rows = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self) -> bool:
+        batch = list(itertools.islice(self._rows, self._batch_rows))
+        if not batch:
+            return False
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._writer.writerows(batch)
+        self._data = self._buffer.getvalue()
+        self._pos = 0
+        self.rows += len(batch)
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        if size is None or size < 0:
+            parts = [self._data[self._pos :]]
+            while self._fill():
+                parts.append(self._data)
+            self._data, self._pos = "", 0
+            return "".join(parts)
+        if self._pos >= len(self._data) and not self._fill():
+            return ""
+        chunk = self._data[self._pos : self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+
+def copy_opportunities(cur, rows) -> int:
+    """
+    描述：用一次 COPY FROM STDIN 写入机会记录（行按块编码后流式发送）
+    参数：cur: 游标, rows: 按 OPPORTUNITY_COLUMNS 顺序的记录迭代器
+    返回值：写入的记录数
+    """
+    stream = _CsvStream(rows)
+    cur.copy_expert(_COPY_OPPORTUNITIES_SQL, stream, size=_COPY_READ_SIZE)
+    return stream.rows
+
+
+def ensure_opportunities_table(cur) -> None:
+    """
+    描述：创建机会表，并为旧版本创建的表补齐类型化列
+        只在确实缺列时才执行 ALTER TABLE，避免每次写入都对表加排他锁
+    """
+    cur.execute(OPPORTUNITIES_DDL)
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns"
+        " WHERE table_schema = current_schema() AND table_name = 'arbitrage_opportunities'"
+    )
+    existing = {row[0] for row in cur.fetchall()}
+    missing = [name for name in TYPED_COLUMNS if name not in existing]
+    if missing:
+        logger.info(f"arbitrage_opportunities 补齐类型化列: {missing}")
+        cur.execute(
+            "ALTER TABLE arbitrage_opportunities "
+            + ", ".join(
+                f"ADD COLUMN IF NOT EXISTS {name} {TYPED_COLUMNS[name]}"
+                for name in missing
+            )
+        )
+
+
+def drop_opportunity_indexes(cur) -> None:
+    """删除辅助索引（批量写入前调用；删除到提交前会阻塞其他会话对该表的读取）"""
+    for name in OPPORTUNITY_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def ensure_opportunity_indexes(cur) -> list[str]:
+    """
+    描述：创建缺失的辅助索引（已存在则跳过，不对表加锁）
+    返回值：本次新建的索引名
+    """
+    cur.execute(
+        "SELECT indexname FROM pg_indexes"
+        " WHERE schemaname = current_schema() AND indexname = ANY(%s)",
+        (list(OPPORTUNITY_INDEXES),),
+    )
+    existing = {row[0] for row in cur.fetchall()}
+    missing = [name for name in OPPORTUNITY_INDEXES if name not in existing]
+    for name in missing:
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {name}"
+            f" ON arbitrage_opportunities {OPPORTUNITY_INDEXES[name]}"
+        )
+    return missing
+
+
 def save_results(
     conn,
     results: list[dict[str, Any]],
     batch_id: int,
     overwrite: bool = False,
     experiment_id: Optional[int] = None,
+    defer_index_min_rows: Optional[int] = None,
 ) -> None:
+    """
+    描述：把套利机会写入 arbitrage_opportunities（单次 COPY，JSON 紧凑编码），辅助索引在写入之后创建
+    参数：conn: 数据库连接, results: 机会列表, batch_id: 批次 ID, overwrite: 是否先清空当前批次,
+        experiment_id: 实验 ID, defer_index_min_rows: 不少于该条数时先删除辅助索引、写入后重建（默认读取配置）
+    """
+    if defer_index_min_rows is None:
+        defer_index_min_rows = DEFER_INDEX_MIN_ROWS
     with conn.cursor() as cur:
         # ⚠️ overwrite 只能覆盖当前 batch_id 的数据：不能 DROP 整张表，否则会清空其他批次的机会记录。
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS arbitrage_opportunities (
-                id SERIAL PRIMARY KEY,
-                batch_id integer,
-                buy_platform text,
-                sell_platform text,
-                buy_price numeric,
-                sell_price numeric,
-                profit_usdt numeric,
-                details_json jsonb,
-                risk_metrics_json jsonb
-            );
-            """
-        )
+        ensure_opportunities_table(cur)
         if overwrite:
             logger.info("overwrite=True：清空当前 batch_id=%s 的历史机会记录", batch_id)
             cur.execute(
@@ -272,45 +647,157 @@ def save_results(
             )
 
         if not results:
+            ensure_opportunity_indexes(cur)
             conn.commit()
             logger.info("没有结果需要写入。")
             return
 
         logger.info(f"正在写入 {len(results)} 条套利机会...")
-        records = []
-        for item in results:
-            details = {
-                "block_time": (
-                    item["block_time"].isoformat() if item.get("block_time") else None
-                ),
-                "experiment_id": experiment_id,
-            }
-            records.append(
-                (
-                    batch_id,
-                    item["buy_platform"],
-                    item["sell_platform"],
-                    item["buy_price"],
-                    item["sell_price"],
-                    item["profit_usdt"],
-                    Json(details),
-                    # 独立存入 risk_metrics_json
-                    Json(item.get("risk_metrics", {})),
-                )
-            )
-        execute_values(
-            cur,
-            """
-            INSERT INTO arbitrage_opportunities
-            (batch_id, buy_platform, sell_platform, buy_price, sell_price, profit_usdt, details_json, risk_metrics_json)
-            VALUES %s
-            """,
-            records,
-        )
+        if 0 < defer_index_min_rows <= len(results):
+            drop_opportunity_indexes(cur)
+        copy_opportunities(cur, _opportunity_rows(results, batch_id, experiment_id))
+        ensure_opportunity_indexes(cur)
     conn.commit()
     logger.info("写入完成并已提交。")
 
 
+def _json_value(column: str, key: str, kind: str, json_type: str = "number") -> str:
+    return (
+        f"CASE WHEN jsonb_typeof({column}->'{key}') = '{json_type}'"
+        f" THEN ({column}->>'{key}')::{kind} END"
+    )
+
+
+_BACKFILL_VALUES = {
+    "block_time": _json_value("details_json", "block_time", "timestamptz", "string"),
+    "experiment_id": _json_value("details_json", "experiment_id", "integer"),
+    **{
+        column: _json_value("risk_metrics_json", key, "double precision")
+        for column, key in RISK_METRIC_COLUMNS.items()
+    },
+}
+
+# 从 JSON 列回填类型化列（只填补为空的列，可以重复执行）
+_BACKFILL_SQL = (
+    "UPDATE arbitrage_opportunities SET\n    "
+    + ",\n    ".join(
+        f"{column} = COALESCE({column}, {value})"
+        for column, value in _BACKFILL_VALUES.items()
+    )
+    + "\nWHERE id >= %s AND id < %s AND ("
+    + " OR ".join(f"{column} IS NULL" for column in _BACKFILL_VALUES)
+    + ")"
+)
+
+
+def backfill_typed_columns(conn, batch_rows: int = 50_000) -> int:
+    """
+    描述：一次性把已有记录 details_json / risk_metrics_json 中的值回填到类型化列
+        按 id 区间分批更新并逐批提交，避免长事务与一次性锁住整张表；完成后创建辅助索引
+    参数：conn: 数据库连接, batch_rows: 每批覆盖的 id 区间长度
+    返回值：更新的记录数
+    """
+    with conn.cursor() as cur:
+        ensure_opportunities_table(cur)
+        cur.execute("SELECT MIN(id), MAX(id) FROM arbitrage_opportunities")
+        low, high = cur.fetchone()
+    conn.commit()
+    if low is None:
+        return 0
+
+    updated = 0
+    for start in range(low, high + 1, batch_rows):
+        with conn.cursor() as cur:
+            cur.execute(_BACKFILL_SQL, (start, start + batch_rows))
+            updated += max(cur.rowcount, 0)
+        conn.commit()
+    with conn.cursor() as cur:
+        ensure_opportunity_indexes(cur)
+        cur.execute("ANALYZE arbitrage_opportunities")
+    conn.commit()
+    logger.info(f"类型化列回填完成，共更新 {updated} 条机会记录。")
+    return updated
+
+
+_BENCH_SCHEMA = "bench_analyse"
+
+
+def _insert_opportunities_values(cur, results, batch_id, experiment_id=None) -> None:
+    """旧写法：execute_values 多行 INSERT（每页 100 行，每行两个 Json 包装），仅用于基准对比"""
+    records = [
+        (*row[:6], Json(json.loads(row[6])), Json(json.loads(row[7])), *row[8:])
+        for row in _opportunity_rows(results, batch_id, experiment_id)
+    ]
+    execute_values(
+        cur,
+        f"INSERT INTO arbitrage_opportunities ({', '.join(OPPORTUNITY_COLUMNS)}) VALUES %s",
+        records,
+    )
+
+
+def _synthetic_results(rows: int) -> list[dict[str, Any]]:
+    start = pd.Timestamp("2025-01-01", tz="UTC")
+    return [
+        {
+            "block_time": start + pd.Timedelta(seconds=i),
+            "buy_platform": "Binance" if i % 2 else "Uniswap",
+            "sell_platform": "Uniswap" if i % 2 else "Binance",
+            "buy_price": 3000.0 + (i % 997) * 0.01,
+            "sell_price": 3005.0 + (i % 991) * 0.01,
+            "profit_usdt": 1.0 + (i % 113) * 0.1,
+            "risk_metrics": {
+                "volatility": 0.0123,
+                "market_volume_eth": 12.5 + i % 7,
+                "estimated_slippage_pct": 0.0456,
+                "risk_score": 0.2,
+            },
+        }
+        for i in range(rows)
+    ]
+
+
+def benchmark_save_results(conn, rows: int = 1_000_000) -> dict[str, float]:
+    """
+    描述：写入基准测试：旧写法（execute_values）与 COPY 写入 rows 条机会记录的耗时对比
+        在独立 schema 中运行，两次写入各自回滚
+    返回值：{"execute_values_seconds", "copy_seconds", "copy_rows_per_second"}
+    """
+    logger.info(f"正在生成 {rows} 条基准机会记录 ...")
+    results = _synthetic_results(rows)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {_BENCH_SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {_BENCH_SCHEMA}")
+        cur.execute(f"SET search_path TO {_BENCH_SCHEMA}, public")
+        ensure_opportunities_table(cur)
+        ensure_opportunity_indexes(cur)
+    conn.commit()
+
+    def timed(write):
+        with conn.cursor() as cur:
+            began = time.perf_counter()
+            write(cur)
+            elapsed = time.perf_counter() - began
+        conn.rollback()
+        return elapsed
+
+    legacy = timed(lambda cur: _insert_opportunities_values(cur, results, 1))
+
+    def copy_with_deferred_indexes(cur):
+        drop_opportunity_indexes(cur)
+        copy_opportunities(cur, _opportunity_rows(results, 1, None))
+        ensure_opportunity_indexes(cur)
+
+    copied = timed(copy_with_deferred_indexes)
+
+    result = {
+        "execute_values_seconds": round(legacy, 3),
+        "copy_seconds": round(copied, 3),
+        "copy_rows_per_second": round(rows / copied, 1) if copied else 0.0,
+    }
+    logger.info(f"机会写入基准（{rows} 条）: {result}")
+    return result
+
+
 def ensure_batch_exists(conn, batch_id: int) -> None:
     if not batch_id:
         return
@@ -331,6 +818,88 @@ def ensure_batch_exists(conn, batch_id: int) -> None:
     conn.commit()
 
 
+def _connect():
+    return psycopg2.connect(
+        host=db_config["host"],
+        port=db_config["port"],
+        dbname=db_config["database"],
+        user=db_config["username"],
+        password=db_config["password"],
+    )
+
+
+def _fetch_pairs(conn, config, strategy, start_ts, end_ts):
+    """
+    按任务配置或策略参数中的 analytics_backend 选择计算后端取价格对；
+    本地镜像只覆盖默认交易对与 Binance，其他交易对或交易所总是在数据库中计算
+    """
+    backend = columnar.resolve_backend(
+        config.get("analytics_backend") or strategy.get("analytics_backend")
+    )
+    if backend != "postgres" and not symbols.is_default(strategy.get("symbol")):
+        logger.info(f"{strategy['symbol']} 没有本地镜像，改为在数据库中计算价格对")
+        backend = "postgres"
+    if backend != "postgres" and not venues.is_default(strategy.get("venue")):
+        logger.info(f"{strategy['venue']} 没有本地镜像，改为在数据库中计算价格对")
+        backend = "postgres"
+    if backend == "duckdb":
+        return fetch_price_pairs_columnar(
+            conn,
+            strategy,
+            start_ts,
+            end_ts,
+            refresh=bool(config.get("mirror_refresh", False)),
+        )
+    if backend == "tickstore":
+        return fetch_price_pairs_ticks(
+            conn,
+            strategy,
+            start_ts,
+            end_ts,
+            refresh=bool(config.get("mirror_refresh", False)),
+        )
+    return fetch_price_pairs(conn, strategy, start_ts, end_ts)
+
+
+def _analyse_symbol(conn, config, strategy, start_ts, end_ts) -> list[dict[str, Any]]:
+    """取一个交易对（strategy["symbol"]）的价格对并分析，机会记录带上 symbol"""
+    price_pairs = _fetch_pairs(conn, config, strategy, start_ts, end_ts)
+    opportunities = analyze_opportunities(price_pairs, strategy)
+    for opp in opportunities:
+        opp["symbol"] = strategy["symbol"]
+    return opportunities
+
+
+def analyse_symbols(
+    config: dict[str, Any],
+    strategy: dict[str, Any],
+    symbol_list: list[str],
+    start_ts: pd.Timestamp = None,
+    end_ts: pd.Timestamp = None,
+) -> list[dict[str, Any]]:
+    """
+    描述：在一个任务内并行分析多个交易对：每个交易对在独立的数据库连接上取价格对并分析
+    参数：config: 任务配置（parallelism 覆盖 symbols.parallelism）, strategy: 策略参数,
+        symbol_list: 交易对列表, start_ts / end_ts: 时间范围
+    返回值：按 symbol_list 顺序拼接的机会列表
+    """
+
+    def work(symbol: str) -> list[dict[str, Any]]:
+        conn = _connect()
+        try:
+            return _analyse_symbol(
+                conn, config, {**strategy, "symbol": symbol}, start_ts, end_ts
+            )
+        finally:
+            conn.close()
+
+    parallelism = int(config.get("parallelism") or symbols.DEFAULT_PARALLELISM)
+    results = symbols.fan_out(symbol_list, work, parallelism)
+    for symbol, opportunities in results.items():
+        logger.info(f"{symbol}: {len(opportunities)} 条机会")
+    return list(itertools.chain.from_iterable(results.values()))
+
+
 def run_analyse(task_id: Optional[str] = None, config_json: Optional[str] = None):
     config = load_config_from_string(config_json)
     # 默认策略 + 自定义参数
@@ -339,6 +908,16 @@ def run_analyse(task_id: Optional[str] = None, config_json: Optional[str] = None
     batch_id = int(config.get("batch_id", 1))
     overwrite = bool(config.get("overwrite", False))
     experiment_id = config.get("experiment_id")
+    symbol_list = symbols.resolve_symbols(config, strategy)
+    strategy["symbol"] = symbol_list[0]
+    # overwrite=True 总是整批重算
+    incremental_mode = (
+        bool(config.get("incremental", DEFAULT_INCREMENTAL)) and not overwrite
+    )
+    if incremental_mode and len(symbol_list) > 1:
+        # 批次水位线不区分交易对
+        logger.warning("多交易对分析不支持增量模式，改为整批分析")
+        incremental_mode = False
 
     start_ts = _parse_timestamp(strategy.get("start"))
     end_ts = _parse_timestamp(strategy.get("end"))
@@ -346,20 +925,45 @@ def run_analyse(task_id: Optional[str] = None, config_json: Optional[str] = None
         update_task_status(task_id, 2)
         return
 
-    logger.info("套利分析任务启动")
-    conn = psycopg2.connect(
-        host=db_config["host"],
-        port=db_config["port"],
-        dbname=db_config["database"],
-        user=db_config["username"],
-        password=db_config["password"],
-    )
+    logger.info(f"套利分析任务启动，交易对: {', '.join(symbol_list)}")
+    conn = _connect()
     conn.autocommit = False
     try:
         ensure_batch_exists(conn, batch_id)
-        price_pairs = fetch_price_pairs(conn, strategy, start_ts, end_ts)
-        opportunities = analyze_opportunities(price_pairs, strategy)
-        save_results(conn, opportunities, batch_id, overwrite, experiment_id)
+        symbols.ensure_symbol_columns(conn)
+        conn.commit()
+        if incremental_mode:
+            # 增量模式：同一批次串行刷新，只分析水位线之后的新数据
+            incremental.ensure_watermark_table(conn)
+            conn.commit()
+            with incremental.batch_lock(conn, batch_id):
+                plan = incremental.plan_refresh(conn, batch_id, strategy, start_ts)
+                price_pairs = _fetch_pairs(
+                    conn, config, strategy, plan.fetch_start, end_ts
+                )
+                opportunities = analyze_opportunities(price_pairs, strategy)
+                for opp in opportunities:
+                    opp["symbol"] = strategy["symbol"]
+                opportunities = incremental.new_opportunities(
+                    opportunities, plan.watermark
+                )
+                with conn.cursor() as cur:
+                    incremental.save_watermark(
+                        cur, plan, batch_id, incremental.last_block_time(price_pairs)
+                    )
+                # 整批重算时先清空批次，避免与此前的结果重复
+                save_results(conn, opportunities, batch_id, plan.full, experiment_id)
+        else:
+            if len(symbol_list) > 1:
+                opportunities = analyse_symbols(
+                    config, strategy, symbol_list, start_ts, end_ts
+                )
+            else:
+                opportunities = _analyse_symbol(
+                    conn, config, strategy, start_ts, end_ts
+                )
+            # 所有交易对的机会在一个事务中写入同一批次
+            save_results(conn, opportunities, batch_id, overwrite, experiment_id)
     except Exception as exc:
         conn.rollback()
         logger.error(f"分析失败: {exc}")
@@ -377,4 +981,33 @@ def run_analyse(task_id: Optional[str] = None, config_json: Optional[str] = None
 
 
 if __name__ == "__main__":
-    pass
+    parser = argparse.ArgumentParser(description="套利分析")
+    parser.add_argument(
+        "--benchmark", action="store_true", help="在独立 schema 中运行机会写入基准测试"
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000, help="基准机会记录数")
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="把已有机会记录 JSON 中的 block_time / experiment_id / 风险指标回填到类型化列",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark or args.backfill:
+        cli_conn = psycopg2.connect(
+            host=db_config["host"],
+            port=db_config["port"],
+            dbname=db_config["database"],
+            user=db_config["username"],
+            password=db_config["password"],
+        )
+        try:
+            if args.backfill:
+                backfill_typed_columns(cli_conn)
+            if args.benchmark:
+                benchmark_save_results(cli_conn, args.rows)
+                with cli_conn.cursor() as cur:
+                    cur.execute(f"DROP SCHEMA IF EXISTS {_BENCH_SCHEMA} CASCADE")
+                cli_conn.commit()
+        finally:
+            cli_conn.close()
@@ -1,10 +1,28 @@
 """
 Risk analysis logic module.
 提供纯函数用于风险指标计算，被 analyse.py 调用。
+calculate_risk_metrics_batch 是逐条函数的向量化版本，结果与逐条计算完全相同（包括取整）。
+两者都可以传入按池子深度模拟的滑点（pool_state），替代平方根法则的估算。
 """
 
 import math
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# 冲击系数
+IMPACT_CONSTANT = 2.0
+
+# 风险指标的键与保留的小数位数（与 calculate_risk_metrics_local 返回的字典一致）
+RISK_METRIC_DIGITS = {
+    "volatility": 6,
+    "market_volume_eth": 2,
+    "trade_size_eth": 4,
+    "estimated_slippage_pct": 4,
+    "estimated_slippage_cost": 2,
+    "risk_score": 1,
+}
 
 
 def calculate_risk_metrics_local(
@@ -12,6 +30,7 @@ def calculate_risk_metrics_local(
     volatility: float,
     market_volume: float,
     investment_usdt: float,
+    depth_slippage: Optional[float] = None,
 ) -> Dict[str, Any]:
     """
     计算单条机会的风险指标
@@ -19,17 +38,25 @@ def calculate_risk_metrics_local(
     :param volatility: 当前时间窗口的价格波动率
     :param market_volume: 市场总成交量 (ETH)
     :param investment_usdt: 投入本金 (USDT)
+    :param depth_slippage: 按池子深度模拟的滑点比例（可选），为 None 或 NaN 时使用平方根法则
     :return: 包含 risk_score, slippage 等的字典
     """
+    # 输入可能是 NumPy 标量，统一为 float，输出类型与批量计算一致
+    volatility = float(volatility)
+    market_volume = float(market_volume)
+    investment_usdt = float(investment_usdt)
+
     # 1. 计算交易规模 (ETH)
     price = float(opportunity["buy_price"])
-    trade_size_eth = investment_usdt / price if price > 0 else 0
+    trade_size_eth = investment_usdt / price if price > 0 else 0.0
 
     # 2. 滑点估算 (Square Root Law)
     # Impact = c * sigma * sqrt(Q / V)
-    impact_constant = 2.0  # 冲击系数
+    impact_constant = IMPACT_CONSTANT
 
-    if market_volume <= 0:
+    if depth_slippage is not None and not math.isnan(depth_slippage):
+        slippage_pct = float(depth_slippage)
+    elif market_volume <= 0:
         slippage_pct = 1.0
     else:
         slippage_pct = (
@@ -45,13 +72,13 @@ def calculate_risk_metrics_local(
     profit = float(opportunity["profit_usdt"])
 
     if profit <= 0:
-        risk_score = 0
+        risk_score = 0.0
     else:
         # 剩余净利润 = 理论利润 - 滑点成本
         net_result = profit - estimated_slippage_cost
         # Score = (剩余利润 / 理论利润) * 100
         # 如果滑点吃掉了所有利润，分为0
-        risk_score = max(0, min(100, (net_result / profit) * 100))
+        risk_score = max(0.0, min(100.0, (net_result / profit) * 100))
 
     return {
         "volatility": round(volatility, 6),
@@ -61,3 +88,92 @@ def calculate_risk_metrics_local(
         "estimated_slippage_cost": round(estimated_slippage_cost, 2),
         "risk_score": round(risk_score, 1),
     }
+
+
+def _round_half_even(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    与内置 round(x, ndigits) 逐元素相同的取整。
+    np.round 先乘以 10^n 再取整，乘法的舍入误差会让恰好落在 .5 附近的值与 round 不一致；
+    这些值（以及非有限值、超出精确整数范围的值）逐个用 round 计算，其余直接向量化。
+    """
+    scale = 10.0**ndigits
+    with np.errstate(invalid="ignore", over="ignore"):
+        scaled = values * scale
+        rounded = np.rint(scaled) / scale
+        magnitude = np.abs(scaled)
+        distance = np.abs(magnitude - np.floor(magnitude) - 0.5)
+        suspect = (
+            ~np.isfinite(scaled)
+            | (magnitude >= 2.0**52)
+            | (distance <= magnitude * 2.0**-50 + 1e-12)
+        )
+    if suspect.any():
+        index = np.flatnonzero(suspect)
+        rounded[index] = [round(float(value), ndigits) for value in values[index]]
+    return rounded
+
+
+def calculate_risk_metrics_batch(
+    buy_price,
+    profit,
+    volatility,
+    market_volume,
+    investment_usdt: float,
+    depth_slippage=None,
+) -> pd.DataFrame:
+    """
+    批量计算风险指标（一次向量化计算，结果与逐条调用 calculate_risk_metrics_local 相同）
+    :param buy_price: 买入价格数组
+    :param profit: 理论利润数组 (USDT)
+    :param volatility: 波动率数组
+    :param market_volume: 市场总成交量数组 (ETH)
+    :param investment_usdt: 投入本金 (USDT)
+    :param depth_slippage: 按池子深度模拟的滑点比例数组（可选），NaN 的行使用平方根法则
+    :return: 列为 RISK_METRIC_DIGITS 各键的 DataFrame，行顺序与输入一致
+    """
+    price = np.asarray(buy_price, dtype=np.float64)
+    profit = np.asarray(profit, dtype=np.float64)
+    volatility = np.asarray(volatility, dtype=np.float64)
+    market_volume = np.asarray(market_volume, dtype=np.float64)
+    investment = float(investment_usdt)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # 1. 交易规模 (ETH)；价格非正（或 NaN）时为 0
+        trade_size_eth = np.where(price > 0, investment / price, 0.0)
+
+        # 2. 滑点估算；成交量非正时为 100%。与内置 min 一致：NaN 保留为 NaN
+        slippage_pct = np.where(
+            market_volume <= 0,
+            1.0,
+            IMPACT_CONSTANT * volatility * np.sqrt(trade_size_eth / market_volume),
+        )
+        if depth_slippage is not None:
+            depth_slippage = np.asarray(depth_slippage, dtype=np.float64)
+            slippage_pct = np.where(
+                np.isnan(depth_slippage), slippage_pct, depth_slippage
+            )
+        slippage_pct = np.where(1.0 < slippage_pct, 1.0, slippage_pct)
+
+        # 3. 预估滑点成本
+        estimated_slippage_cost = investment * slippage_pct
+
+        # 4. 风险评分；与内置 max(0, min(100, x)) 的比较顺序一致（NaN 得到 100）
+        score = (profit - estimated_slippage_cost) / profit * 100
+        score = np.where(score < 100, score, 100.0)
+        score = np.where(score > 0, score, 0.0)
+        risk_score = np.where(profit <= 0, 0.0, score)
+
+    columns = {
+        "volatility": volatility,
+        "market_volume_eth": market_volume,
+        "trade_size_eth": trade_size_eth,
+        "estimated_slippage_pct": slippage_pct * 100,
+        "estimated_slippage_cost": estimated_slippage_cost,
+        "risk_score": risk_score,
+    }
+    return pd.DataFrame(
+        {
+            key: _round_half_even(np.atleast_1d(values), RISK_METRIC_DIGITS[key])
+            for key, values in columns.items()
+        }
+    )
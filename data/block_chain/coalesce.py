@@ -0,0 +1,119 @@
+"""
+重复任务合并
+
+以 (任务类型, 参数) 的规范化哈希识别重复请求：
+- 相同指纹的任务正在执行时，后来者等待并复用首个任务（leader）的执行结果；
+- 相同指纹的任务在去重窗口内刚刚成功完成时，后来者直接复用结果而不再重复计算。
+"""
+
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable
+
+
+def task_fingerprint(
+    task_type: str, task_data: dict[str, Any], exclude: Iterable[str] = ("task_id",)
+) -> str:
+    """
+    描述：计算任务的规范化指纹（键排序、紧凑分隔符，与字段顺序无关）
+    参数：
+        task_type: 任务类型
+        task_data: 任务参数
+        exclude: 不参与指纹计算的字段，默认忽略 task_id
+    返回值：sha256 十六进制字符串
+    """
+    excluded = set(exclude)
+    params = {k: v for k, v in task_data.items() if k not in excluded}
+    canonical = json.dumps(
+        [task_type, params], sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("future", "leader_task_id", "finished_at")
+
+    def __init__(self, leader_task_id: str):
+        self.future = Future()
+        self.leader_task_id = leader_task_id
+        self.finished_at = None
+
+
+class TaskCoalescer:
+    """按指纹合并正在执行或刚刚完成的重复任务（线程安全）"""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._entries: dict[str, _Entry] = {}
+        self._admitted: dict[str, float] = {}
+
+    def _prune(self, now: float) -> None:
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if entry.finished_at is not None
+            and now - entry.finished_at > self.window_seconds
+        ]
+        for key in expired:
+            del self._entries[key]
+        expired = [
+            key
+            for key, admitted_at in self._admitted.items()
+            if now - admitted_at > self.window_seconds
+        ]
+        for key in expired:
+            del self._admitted[key]
+
+    def run(self, key: str, task_id: str, fn: Callable[[], Any]):
+        """
+        描述：以合并方式执行任务
+            第一个到达的调用者（leader）执行 fn；执行期间或成功后的去重窗口内到达的相同指纹调用者
+            直接等待并复用 leader 的结果。leader 失败时异常同样传递给等待者，且失败结果不会被缓存。
+        参数：key: 任务指纹, task_id: 当前任务ID, fn: 实际执行函数
+        返回值：(执行结果, leader 任务ID, 当前调用者是否为 leader)
+        """
+        with self._lock:
+            self._prune(time.monotonic())
+            entry = self._entries.get(key)
+            is_leader = entry is None
+            if is_leader:
+                entry = _Entry(task_id)
+                self._entries[key] = entry
+
+        if not is_leader:
+            return entry.future.result(), entry.leader_task_id, False
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            with self._lock:
+                self._entries.pop(key, None)
+            entry.future.set_exception(exc)
+            raise
+        with self._lock:
+            entry.finished_at = time.monotonic()
+        entry.future.set_result(result)
+        return result, task_id, True
+
+    def admit(self, key: str) -> bool:
+        """
+        描述：请求入口去重：去重窗口内首次出现的指纹返回 True 并记录，重复出现返回 False
+        参数：key: 请求指纹
+        返回值：是否为新请求
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            if key in self._admitted:
+                return False
+            self._admitted[key] = now
+            return True
+
+    def forget(self, key: str) -> None:
+        """撤销 admit 的记录（例如入队失败时允许立即重试）"""
+        with self._lock:
+            self._admitted.pop(key, None)
@@ -1,4 +1,3 @@
-import io
 import math
 import os
 import sys
@@ -15,6 +14,7 @@ import requests
 import yaml
 from loguru import logger
 
+from . import columnar, rollup, symbols, venues
 from .task import check_task, update_task_status
 
 # 默认配置
@@ -22,29 +22,24 @@ with open("./config/config.yaml", "r", encoding="utf-8") as file:
     config = yaml.safe_load(file)
 
 db_config = config.get("db", {})
-COLUMN_NAMES = ["id", "price", "qty", "quoteQty", "time", "isBuyerMaker", "isBestMatch"]
-DTYPE_MAP = {
-    "id": "int64",
-    "price": "float64",
-    "qty": "float64",
-    "quoteQty": "float64",
-    "time": "int64",
-    "isBuyerMaker": "bool",
-    "isBestMatch": "bool",
-}
-
-
-def count_lines(task_id: str, filepath: str) -> Optional[int]:
+COLUMN_NAMES = venues.BINANCE_COLUMN_NAMES
+DTYPE_MAP = venues.BINANCE_DTYPE_MAP
+
+
+def count_lines(
+    task_id: str, filepath: str, venue: str = venues.DEFAULT_VENUE
+) -> Optional[int]:
     """
-    描述：估算文件总行数，用于百分比导入控制
-    参数：filepath: 文件路径
-    返回值：文件总行数
+    描述：估算文件的数据行数（压缩文件边解压边统计，不含表头），用于百分比导入控制
+    参数：filepath: 文件路径, venue: 交易所，决定表头行数
+    返回值：文件数据行数
     """
     try:
         logger.info(f"正在估算文件总行数: {filepath}")
         start_time = time.time()
+        header_lines = venues.get_adapter(venue).header_lines
         count = 0
-        with open(filepath, "r", encoding="utf-8") as file:
+        with venues.open_raw(filepath) as file:
             for _ in file:
                 count += 1
                 if count % 1000000 == 0:
@@ -52,6 +47,7 @@ def count_lines(task_id: str, filepath: str) -> Optional[int]:
                     if check_task(task_id):
                         logger.info(f"任务 {task_id} 已取消，停止估算 Binance 数据")
                         break
+        count = max(count - header_lines, 0)
         end_time = time.time()
         logger.info(
             f"估算完成，共约 {count} 行数据，耗时 {end_time - start_time:.2f} 秒。"
@@ -67,6 +63,21 @@ def count_lines(task_id: str, filepath: str) -> Optional[int]:
         raise
 
 
+def _extend_time_range(
+    time_range: list, chunk: pd.DataFrame, venue: str = venues.DEFAULT_VENUE
+):
+    """用原始分块的成交时间扩展 [最早, 最晚] 时间范围"""
+    times = venues.get_adapter(venue).trade_times(chunk)
+    start, end = times.min(), times.max()
+    if pd.isna(start):
+        return
+    start, end = start.to_pydatetime(), end.to_pydatetime()
+    if time_range[0] is None or start < time_range[0]:
+        time_range[0] = start
+    if time_range[1] is None or end > time_range[1]:
+        time_range[1] = end
+
+
 def process_chunk(
     task_id: str,
     chunk_data: pd.DataFrame,
@@ -74,42 +85,29 @@ def process_chunk(
     rows_counter,
     target_rows: Optional[int],
     conn: Optional[Any] = None,
+    sink: Optional[columnar.ParquetSink] = None,
+    symbol: str = symbols.DEFAULT_SYMBOL,
+    venue: str = venues.DEFAULT_VENUE,
 ):
     """
-    描述：处理单个分块：预处理数据并写入数据库
-    参数：task_id: 任务ID, chunk_data: 分块数据, chunk_index: 分块索引, rows_counter: 计数器, target_rows: 目标行数, conn: 数据库连接（可选）
+    描述：处理单个分块：由交易所适配器规范化后用 COPY 写入该交易所的成交表
+    参数：task_id: 任务ID, chunk_data: 分块数据, chunk_index: 分块索引, rows_counter: 计数器, target_rows: 目标行数, conn: 数据库连接（可选）,
+        sink: Parquet 镜像写入器（可选），写入与数据库相同的规范化分块，事务提交后由调用者提交,
+        symbol: 写入 symbol 列的交易对, venue: 交易所（默认 binance）
     返回值：成功标志, 处理行数, 导入行数, 是否停止标志
     """
     original_chunk_len = len(chunk_data)
-    chunk = chunk_data.copy()
-    chunk.rename(
-        columns={
-            "time": "trade_time",
-            "quoteQty": "quote_qty",
-            "isBuyerMaker": "is_buyer_maker",
-            "isBestMatch": "is_best_match",
-        },
-        inplace=True,
-    )
-    chunk["trade_time"] = pd.to_datetime(
-        chunk["trade_time"], unit="us", utc=True, errors="coerce"
-    )
-    chunk.dropna(subset=["trade_time"], inplace=True)
+    adapter = venues.get_adapter(venue)
+    chunk = adapter.normalize(chunk_data, symbol)
     if chunk.empty:
         rows_counter[0] += original_chunk_len
         should_stop = target_rows is not None and rows_counter[0] >= target_rows
         return True, original_chunk_len, 0, should_stop
     try:
-        csv_buffer = io.StringIO()
-        chunk.to_csv(csv_buffer, index=False, header=False)
-        csv_buffer.seek(0)
-        columns = "id, price, qty, quote_qty, trade_time, is_buyer_maker, is_best_match"
-        copy_sql = f"COPY binance_trades ({columns}) FROM STDIN WITH (FORMAT CSV)"
-
         # 如果提供了连接，使用它；否则创建新连接
         if conn is not None:
             with conn.cursor() as cursor:
-                cursor.copy_expert(sql=copy_sql, file=csv_buffer)
+                venues.copy_trades(cursor, chunk, adapter.table)
             # 不在这里提交，由调用者控制事务
         else:
             with psycopg2.connect(
@@ -120,8 +118,10 @@ def process_chunk(
                 password=db_config["password"],
             ) as new_conn:
                 with new_conn.cursor() as cursor:
-                    cursor.copy_expert(sql=copy_sql, file=csv_buffer)
+                    venues.copy_trades(cursor, chunk, adapter.table)
                 new_conn.commit()
+        if sink is not None:
+            sink.write(chunk)
         rows_imported = len(chunk)
         rows_counter[0] += original_chunk_len
         rows_counter[1] += rows_imported
@@ -140,27 +140,22 @@ def import_data_to_database(
     total_lines: Optional[int],
     chunk_size: int,
     conn: Optional[Any] = None,
+    time_range: Optional[list] = None,
+    sink: Optional[columnar.ParquetSink] = None,
+    symbol: str = symbols.DEFAULT_SYMBOL,
+    venue: str = venues.DEFAULT_VENUE,
 ):
     """
-    描述：主导入逻辑：读取CSV，分块处理并写入数据库。
-    参数：target_rows: 目标行数, total_lines: 总行数, chunk_size: 分块大小, conn: 数据库连接（可选）
+    描述：主导入逻辑：按交易所的格式分块读取成交文件并写入数据库。
+    参数：target_rows: 目标行数, total_lines: 总行数, chunk_size: 分块大小, conn: 数据库连接（可选）,
+        time_range: [最早, 最晚] 成交时间，导入后原地更新（可选，用于刷新 K 线）,
+        sink: Parquet 镜像写入器（可选）, symbol: 交易对, venue: 交易所
     返回值：处理行数, 导入行数
     """
     rows_counter = [0, 0]
     try:
         logger.info("正在读取CSV文件分块并导入...")
-        chunk_iterator = pd.read_csv(
-            csv_path,
-            chunksize=chunk_size,
-            header=None,
-            names=COLUMN_NAMES,
-            usecols=COLUMN_NAMES,
-            dtype=DTYPE_MAP,
-            engine="c",
-            low_memory=False,
-            memory_map=True,
-            on_bad_lines="skip",
-        )
+        chunk_iterator = venues.get_adapter(venue).read_chunks(csv_path, chunk_size)
         should_stop = False
         for i, chunk in enumerate(chunk_iterator):
             if check_task(task_id):
@@ -173,7 +168,12 @@ def import_data_to_database(
                 rows_counter,
                 target_rows,
                 conn,
+                sink=sink,
+                symbol=symbol,
+                venue=venue,
             )
+            if time_range is not None:
+                _extend_time_range(time_range, chunk, venue)
             if stop_flag and not should_stop:
                 logger.info(
                     f"已处理约 {rows_counter[0]} 行，达到目标 {target_rows} 行。"
@@ -203,23 +203,33 @@ def _calc_target_rows(
 
 
 def collect_binance(
-    task_id: str, csv_path: str, import_percentage: int, chunk_size: int
+    task_id: str,
+    csv_path: str,
+    import_percentage: int,
+    chunk_size: int,
+    symbol: str = symbols.DEFAULT_SYMBOL,
+    venue: str = venues.DEFAULT_VENUE,
 ):
     """
-    描述：收集 Binance 数据（作为事务处理，如果任务取消则完全回滚）
+    描述：收集 CEX 成交文件（默认 Binance；作为事务处理，如果任务取消则完全回滚）
     参数：
         task_id: 任务ID
         csv_path: CSV文件路径
         import_percentage: 导入百分比
         chunk_size: 分块大小
+        symbol: 交易对符号，写入 symbol 列
+        venue: 交易所，决定文件格式与写入的成交表（见 venues.py）
     返回值：导入的总行数
     """
     conn = None
+    sink = None
     try:
+        symbol = symbols.normalize_symbol(symbol)
+        adapter = venues.get_adapter(venue)
         start_time = time.time()
-        total_lines = count_lines(task_id, csv_path)
+        total_lines = count_lines(task_id, csv_path, adapter.name)
         if check_task(task_id):
-            logger.info(f"任务 {task_id} 已取消，停止导入 Binance 数据")
+            logger.info(f"任务 {task_id} 已取消，停止导入 {adapter.display_name} 数据")
             return 0
 
         # 创建数据库连接并开始事务
@@ -232,10 +242,24 @@ def collect_binance(
         )
         conn.autocommit = False  # 禁用自动提交，使用事务
         logger.info("已开启数据库事务，所有导入操作将在事务中执行")
+        venues.ensure_venue_table(conn, adapter.name)
 
         target_rows = _calc_target_rows(total_lines, import_percentage)
+        time_range = [None, None]
+        # Parquet 镜像与 K 线只覆盖 Binance 的默认交易对
+        derived = venues.is_default(adapter.name) and symbols.is_default(symbol)
+        sink = columnar.open_ingest_sink("binance_trades") if derived else None
         rows_counter = import_data_to_database(
-            task_id, csv_path, target_rows, total_lines, chunk_size, conn
+            task_id,
+            csv_path,
+            target_rows,
+            total_lines,
+            chunk_size,
+            conn,
+            time_range=time_range,
+            sink=sink,
+            symbol=symbol,
+            venue=adapter.name,
         )
         total_time = time.time() - start_time
 
@@ -249,6 +273,11 @@ def collect_binance(
         conn.commit()
         logger.info("事务已提交，所有数据已成功导入")
         logger.info(f"成功导入 {rows_counter[1]} 行，耗时 {total_time:.2f}s")
+        # 事务提交后才把镜像文件移动到正式分区
+        columnar.promote_after_commit(sink)
+        # 只重算本次导入涉及的 K 线时间桶
+        if derived:
+            rollup.refresh_after_ingest(conn, "Binance", *time_range)
         # 在标记成功前，再次检查任务是否被取消
         if check_task(task_id):
             logger.info(f"任务 {task_id} 已取消，不标记为成功")
@@ -268,6 +297,9 @@ def collect_binance(
         update_task_status(task_id, "FAILED")
         raise
     finally:
+        # 未提交（取消或失败）时丢弃镜像暂存文件
+        if sink is not None:
+            sink.abort()
         # 确保关闭数据库连接
         if conn is not None:
             try:
@@ -357,7 +389,9 @@ def collect_binance_by_date(
     返回值：导入的总行数
     """
     conn = None
+    sink = None
     try:
+        symbol = symbols.normalize_symbol(symbol)
         start_time = time.time()
 
         # 将时间戳转换为日期
@@ -376,8 +410,13 @@ def collect_binance_by_date(
         )
         conn.autocommit = False  # 禁用自动提交，使用事务
         logger.info("已开启数据库事务，所有导入操作将在事务中执行")
+        venues.ensure_venue_table(conn)
 
         total_rows_imported = 0
+        time_range = [None, None]
+        # Parquet 镜像与 K 线只覆盖默认交易对
+        derived = symbols.is_default(symbol)
+        sink = columnar.open_ingest_sink("binance_trades") if derived else None
         temp_files = []  # 记录临时文件，用于清理
 
         # 遍历日期范围
@@ -409,7 +448,15 @@ def collect_binance_by_date(
                 # 导入数据（导入全部数据，不限制百分比）
                 # 使用共享的数据库连接，所有操作在同一事务中
                 rows_counter = import_data_to_database(
-                    task_id, csv_path, None, None, chunk_size, conn
+                    task_id,
+                    csv_path,
+                    None,
+                    None,
+                    chunk_size,
+                    conn,
+                    time_range=time_range,
+                    sink=sink,
+                    symbol=symbol,
                 )
                 total_rows_imported += rows_counter[1]
                 logger.info(f"日期 {date_str} 导入完成，导入 {rows_counter[1]} 行")
@@ -445,6 +492,9 @@ def collect_binance_by_date(
         logger.info("事务已提交，所有数据已成功导入")
 
         logger.info(f"成功导入 {total_rows_imported} 行，耗时 {total_time:.2f}s")
+        columnar.promote_after_commit(sink)
+        if derived:
+            rollup.refresh_after_ingest(conn, "Binance", *time_range)
         # 在标记成功前，再次检查任务是否被取消
         if check_task(task_id):
             logger.info(f"任务 {task_id} 已取消，不标记为成功")
@@ -465,6 +515,9 @@ def collect_binance_by_date(
         update_task_status(task_id, "FAILED")
         raise
     finally:
+        # 未提交（取消或失败）时丢弃镜像暂存文件
+        if sink is not None:
+            sink.abort()
         # 确保关闭数据库连接
         if conn is not None:
             try:
@@ -8,6 +8,7 @@ import yaml
 from loguru import logger
 from psycopg2.extras import execute_values
 
+from . import columnar, gas_index, rollup, symbols
 from .task import check_task, update_task_status
 
 with open("./config/config.yaml", "r", encoding="utf-8") as file:
@@ -89,7 +90,12 @@ def fetch_all_swaps(task_id: str, pool_address: str, start_ts: int, end_ts: int)
 
 
 def process_and_store_uniswap_data(
-    task_id: str, swaps_data: Iterable[dict[str, Any]], conn: Optional[Any] = None
+    task_id: str,
+    swaps_data: Iterable[dict[str, Any]],
+    conn: Optional[Any] = None,
+    time_range: Optional[list] = None,
+    sink: Optional[columnar.ParquetSink] = None,
+    symbol: str = symbols.DEFAULT_SYMBOL,
 ) -> int:
     """
     描述：处理数据并存入数据库。
@@ -97,6 +103,9 @@ def process_and_store_uniswap_data(
         task_id: 任务ID
         swaps_data: Uniswap数据
         conn: 数据库连接（可选），如果提供则使用该连接，否则创建新连接
+        time_range: [最早, 最晚] 区块时间，写入后原地更新（可选，用于刷新 K 线）
+        sink: Parquet 镜像写入器（可选），写入与数据库相同的记录，事务提交后由调用者提交
+        symbol: 写入 symbol 列的交易对
     返回值：写入的记录数量
     """
     swaps = list(swaps_data)
@@ -122,21 +131,41 @@ def process_and_store_uniswap_data(
                 amount1,
                 int(s["transaction"]["gasPrice"]),
                 s["transaction"]["id"],
+                symbol,
             )
         )
 
     if not records:
         logger.info("没有可写入的数据。")
         return 0
+    if time_range is not None:
+        block_times = [r[0] for r in records]
+        time_range[0] = min(block_times)
+        time_range[1] = max(block_times)
 
     # 如果提供了连接，使用它；否则创建新连接
     if conn is not None:
         with conn.cursor() as cur:
             insert_sql = """
-            INSERT INTO uniswap_swaps (block_time, price, amount_eth, amount_usdt, gas_price, tx_hash)
+            INSERT INTO uniswap_swaps (block_time, price, amount_eth, amount_usdt, gas_price, tx_hash, symbol)
             VALUES %s
             """
             execute_values(cur, insert_sql, records, page_size=1000)
+        if sink is not None:
+            sink.write(
+                pd.DataFrame(
+                    records,
+                    columns=[
+                        "block_time",
+                        "price",
+                        "amount_eth",
+                        "amount_usdt",
+                        "gas_price",
+                        "tx_hash",
+                        "symbol",
+                    ],
+                )
+            )
         # 不在这里提交，由调用者控制事务
     else:
         with psycopg2.connect(
@@ -147,7 +176,7 @@ def process_and_store_uniswap_data(
             password=db_config["password"],
         ) as new_conn, new_conn.cursor() as cur:
             insert_sql = """
-            INSERT INTO uniswap_swaps (block_time, price, amount_eth, amount_usdt, gas_price, tx_hash)
+            INSERT INTO uniswap_swaps (block_time, price, amount_eth, amount_usdt, gas_price, tx_hash, symbol)
             VALUES %s
             """
             execute_values(cur, insert_sql, records, page_size=1000)
@@ -155,7 +184,13 @@ def process_and_store_uniswap_data(
     return len(records)
 
 
-def collect_uniswap(task_id: str, pool_address: str, start_ts: int, end_ts: int) -> int:
+def collect_uniswap(
+    task_id: str,
+    pool_address: str,
+    start_ts: int,
+    end_ts: int,
+    symbol: Optional[str] = None,
+) -> int:
     """
     描述：收集 Uniswap 数据（作为事务处理，如果任务取消则完全回滚）
     参数：
@@ -163,10 +198,13 @@ def collect_uniswap(task_id: str, pool_address: str, start_ts: int, end_ts: int)
         pool_address: 池地址
         start_ts: 起始时间戳（秒级）
         end_ts: 终止时间戳（秒级）
+        symbol: 交易对符号（可选），默认按 symbols.pools 由池地址推出
     返回值：导入的总行数
     """
     conn = None
+    sink = None
     try:
+        symbol = symbols.symbol_for_pool(pool_address, symbol)
         # 创建数据库连接并开始事务
         conn = psycopg2.connect(
             host=db_config["host"],
@@ -177,6 +215,7 @@ def collect_uniswap(task_id: str, pool_address: str, start_ts: int, end_ts: int)
         )
         conn.autocommit = False  # 禁用自动提交，使用事务
         logger.info("已开启数据库事务，所有导入操作将在事务中执行")
+        symbols.ensure_symbol_columns(conn, ["uniswap_swaps"])
 
         swaps = fetch_all_swaps(task_id, pool_address, start_ts, end_ts)
         if check_task(task_id):
@@ -185,7 +224,13 @@ def collect_uniswap(task_id: str, pool_address: str, start_ts: int, end_ts: int)
             logger.info("已回滚所有数据")
             return 0
 
-        rows_counter = process_and_store_uniswap_data(task_id, swaps, conn)
+        time_range = [None, None]
+        # Parquet 镜像与 K 线只覆盖默认交易对；Gas 价格与交易对无关
+        derived = symbols.is_default(symbol)
+        sink = columnar.open_ingest_sink("uniswap_swaps") if derived else None
+        rows_counter = process_and_store_uniswap_data(
+            task_id, swaps, conn, time_range=time_range, sink=sink, symbol=symbol
+        )
 
         if check_task(task_id):
             logger.info(f"任务 {task_id} 已取消，回滚所有已导入的数据")
@@ -196,6 +241,13 @@ def collect_uniswap(task_id: str, pool_address: str, start_ts: int, end_ts: int)
         # 所有数据导入成功，提交事务
         conn.commit()
         logger.info("事务已提交，所有数据已成功导入")
+        # 事务提交后才把镜像文件移动到正式分区
+        columnar.promote_after_commit(sink)
+        # 同样在提交后把本次 Swap 的 Gas 价格并入 Gas 索引
+        gas_index.update_after_ingest(swaps)
+        # 只重算本次写入涉及的 K 线时间桶
+        if derived:
+            rollup.refresh_after_ingest(conn, "Uniswap", *time_range)
         # 在标记成功前，再次检查任务是否被取消
         if check_task(task_id):
             logger.info(f"任务 {task_id} 已取消，不标记为成功")
@@ -214,6 +266,9 @@ def collect_uniswap(task_id: str, pool_address: str, start_ts: int, end_ts: int)
         update_task_status(task_id, "FAILED")
         return 0
     finally:
+        # 未提交（取消或失败）时丢弃镜像暂存文件
+        if sink is not None:
+            sink.abort()
         # 确保关闭数据库连接
         if conn is not None:
             try:
@@ -0,0 +1,633 @@
+"""
+本地列式分析引擎（DuckDB + 按天分区的 Parquet 镜像）
+
+- binance_trades / uniswap_swaps 按 UTC 日期导出为 Parquet：<parquet_dir>/<表名>/day=YYYY-MM-DD/data.parquet；
+- 套利分析的窗口关联（fetch_price_pairs）与价格聚合的时间桶（process_prices）在 Worker 本机多核执行，
+  Postgres 只负责导出尚未镜像的日期、接收最终结果，分析负载不再影响 Go API 使用的 OLTP 库；
+- 已结束且已导出的日期不再重复导出；当天（数据仍在增长）的分区每次重新导出，refresh=True 时全部重新导出；
+- 开启 analytics.ingest_mirror 后，采集任务把写入数据库的同一批规范化数据同时写成 Parquet（ParquetSink），
+  文件先写入暂存目录，数据库事务提交后才移动到正式分区，并登记到每张表的 _manifest.json。
+
+duckdb 为可选依赖，只有任务选择 analytics_backend=duckdb 时才需要安装。
+Parquet 中的时间列统一保存为不带时区的 UTC 时间，结果返回前再附加 UTC 时区。
+"""
+
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+import shutil
+import uuid
+from typing import Any, Optional
+
+import pandas as pd
+import yaml
+from loguru import logger
+
+from . import symbols
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - 取决于运行环境
+    duckdb = None
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+ANALYTICS_CONFIG = config.get("analytics", {}) or {}
+# postgres: 在数据库中计算（默认）；duckdb: 在本机 Parquet 镜像上计算
+DEFAULT_BACKEND = ANALYTICS_CONFIG.get("backend", "postgres")
+DEFAULT_PARQUET_DIR = ANALYTICS_CONFIG.get("parquet_dir", "./parquet")
+# DuckDB 使用的线程数，0 表示使用全部 CPU 核
+DEFAULT_THREADS = int(ANALYTICS_CONFIG.get("threads", 0))
+# tickstore: 在本机内存映射的 NumPy 逐笔数组上计算（见 tickstore.py）
+BACKENDS = ("postgres", "duckdb", "tickstore")
+# 采集任务是否同时写入 Parquet 镜像
+DEFAULT_INGEST_MIRROR = bool(ANALYTICS_CONFIG.get("ingest_mirror", False))
+MANIFEST_NAME = "_manifest.json"
+# 从数据库导出的整天快照；采集镜像写入的文件为 part-<批次>-<序号>.parquet
+SNAPSHOT_NAME = "data.parquet"
+
+# 镜像的原始成交表：时间列与导出列（列名 -> DuckDB 类型）
+MIRROR_TABLES = {
+    "binance_trades": {
+        "time_column": "trade_time",
+        "columns": {
+            "id": "BIGINT",
+            "trade_time": "TIMESTAMPTZ",
+            "price": "DOUBLE",
+            "qty": "DOUBLE",
+            "quote_qty": "DOUBLE",
+        },
+    },
+    "uniswap_swaps": {
+        "time_column": "block_time",
+        "columns": {
+            "id": "BIGINT",
+            "block_time": "TIMESTAMPTZ",
+            "price": "DOUBLE",
+            "amount_eth": "DOUBLE",
+            "amount_usdt": "DOUBLE",
+            "gas_price": "DOUBLE",
+        },
+    },
+}
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+# 与 analyse.fetch_price_pairs 相同的语义：先按时间过滤，再计算 10 分钟累计成交量与延迟窗口内的 Binance 均价
+_PRICE_PAIRS_SQL = """
+WITH uniswap_data AS (
+    SELECT
+        block_time,
+        price AS uniswap_price,
+        gas_price,
+        SUM(ABS(amount_eth)) OVER (
+            ORDER BY block_time
+            RANGE BETWEEN INTERVAL 10 MINUTES PRECEDING AND CURRENT ROW
+        ) AS window_volume
+    FROM {uniswap}
+    {where_clause}
+),
+binance_avg AS (
+    SELECT
+        u.block_time,
+        AVG(b.price) AS binance_price
+    FROM uniswap_data u
+    JOIN {binance} b
+    ON b.trade_time BETWEEN
+        u.block_time - to_seconds($delay) - to_seconds($window)
+        AND u.block_time - to_seconds($delay) + to_seconds($window)
+    GROUP BY u.block_time
+)
+SELECT
+    u.block_time,
+    u.uniswap_price,
+    u.gas_price,
+    u.window_volume,
+    b.binance_price
+FROM uniswap_data u
+JOIN binance_avg b ON u.block_time = b.block_time
+ORDER BY u.block_time
+"""
+
+# 与 process_prices.sql_query 相同结构的 (time_bucket, source, average_price)
+_AGGREGATE_SQL = """
+SELECT
+    time_bucket(to_seconds($interval), block_time, TIMESTAMP '1970-01-01') AS time_bucket,
+    'Uniswap' AS source,
+    AVG(price) AS average_price
+FROM {uniswap}
+WHERE block_time >= $start AND block_time < $end
+GROUP BY 1
+UNION ALL
+SELECT
+    time_bucket(to_seconds($interval), trade_time, TIMESTAMP '1970-01-01') AS time_bucket,
+    'Binance' AS source,
+    AVG(price) AS average_price
+FROM {binance}
+WHERE trade_time >= $start AND trade_time < $end
+GROUP BY 1
+"""
+
+
+def _require_duckdb():
+    if duckdb is None:
+        raise RuntimeError(
+            "analytics_backend=duckdb 需要安装 duckdb（pip install duckdb）"
+        )
+
+
+def _utc_naive(value) -> Optional[datetime.datetime]:
+    """转换为不带时区的 UTC 时间（与 Parquet 中的时间列一致）"""
+    if value is None:
+        return None
+    if hasattr(value, "to_pydatetime"):
+        value = value.to_pydatetime()
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _with_utc(value: datetime.datetime) -> datetime.datetime:
+    return value.replace(tzinfo=datetime.timezone.utc)
+
+
+def _floor_day(value: datetime.datetime) -> datetime.datetime:
+    return datetime.datetime(value.year, value.month, value.day)
+
+
+def _days(start: datetime.datetime, end: datetime.datetime) -> list[datetime.date]:
+    """[start, end] 覆盖的全部 UTC 日期"""
+    days = []
+    day = _floor_day(start)
+    while day <= end:
+        days.append(day.date())
+        day += _ONE_DAY
+    return days
+
+
+def _mirror_columns(table: str) -> dict[str, str]:
+    """Parquet 中的列类型（时间列保存为不带时区的 UTC 时间）"""
+    return {
+        name: "TIMESTAMP" if kind == "TIMESTAMPTZ" else kind
+        for name, kind in MIRROR_TABLES[table]["columns"].items()
+    }
+
+
+def read_manifest(root: str, table: str) -> dict[str, Any]:
+    """
+    描述：读取表的镜像清单
+    返回值：{"table": 表名, "days": {"YYYY-MM-DD": [{"file", "kind", "rows", "min_time", "max_time", "batch", "committed_at"}]}}
+    """
+    path = os.path.join(root, table, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"table": table, "days": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(root: str, table: str, manifest: dict[str, Any]) -> None:
+    path = os.path.join(root, table, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+@contextlib.contextmanager
+def _manifest_lock(root: str, table: str):
+    """多个采集 / 导出进程并发修改同一张表的分区时，用文件锁串行化"""
+    os.makedirs(os.path.join(root, table), exist_ok=True)
+    with open(os.path.join(root, table, MANIFEST_NAME + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _manifest_entry(root: str, path: str, kind: str, rows: int, low, high, batch):
+    return {
+        "file": os.path.relpath(path, root),
+        "kind": kind,
+        "rows": int(rows),
+        "min_time": low.isoformat() if low is not None else None,
+        "max_time": high.isoformat() if high is not None else None,
+        "batch": batch,
+        "committed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def resolve_backend(value: Optional[str]) -> str:
+    """
+    描述：解析任务选择的分析后端（strategy / db_overrides 中的 analytics_backend）
+    返回值：BACKENDS 之一
+    """
+    backend = (value or DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的分析后端: {value}")
+    return backend
+
+
+class ColumnarStore:
+    """按天分区的 Parquet 镜像与基于它的 DuckDB 查询"""
+
+    def __init__(self, root: str = DEFAULT_PARQUET_DIR, threads: int = DEFAULT_THREADS):
+        """
+        描述：初始化列式存储
+        参数：root: Parquet 镜像根目录, threads: DuckDB 线程数（0 表示全部 CPU 核）
+        """
+        _require_duckdb()
+        self.root = root
+        self._duck = duckdb.connect(":memory:")
+        self._duck.execute("SET TimeZone = 'UTC'")
+        if threads:
+            self._duck.execute(f"SET threads = {int(threads)}")
+
+    def close(self) -> None:
+        self._duck.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def partition_path(self, table: str, day: datetime.date) -> str:
+        return os.path.join(self.root, table, f"day={day.isoformat()}", SNAPSHOT_NAME)
+
+    def _day_files(self, table: str, day: datetime.date) -> list[str]:
+        """一天的全部已提交文件：导出快照与采集镜像写入的文件"""
+        day_dir = os.path.dirname(self.partition_path(table, day))
+        if not os.path.isdir(day_dir):
+            return []
+        return [
+            os.path.join(day_dir, name)
+            for name in sorted(os.listdir(day_dir))
+            if name.endswith(".parquet")
+        ]
+
+    def _partition_files(
+        self,
+        table: str,
+        start: Optional[datetime.datetime],
+        end: Optional[datetime.datetime],
+    ) -> list[str]:
+        """[start, end] 内已镜像的分区文件；未指定范围时返回该表的全部分区"""
+        start, end = _utc_naive(start), _utc_naive(end)
+        if start is None or end is None:
+            table_dir = os.path.join(self.root, table)
+            if not os.path.isdir(table_dir):
+                return []
+            days = sorted(
+                datetime.date.fromisoformat(name[len("day=") :])
+                for name in os.listdir(table_dir)
+                if name.startswith("day=")
+            )
+            days = [
+                d
+                for d in days
+                if (start is None or d >= start.date())
+                and (end is None or d <= end.date())
+            ]
+        else:
+            days = _days(start, end)
+        return [path for day in days for path in self._day_files(table, day)]
+
+    def _source(self, table: str, start, end) -> str:
+        """生成 FROM 子句：分区文件列表，没有文件时为同结构的空表"""
+        files = self._partition_files(table, start, end)
+        if files:
+            quoted = ", ".join("'" + path.replace("'", "''") + "'" for path in files)
+            return f"read_parquet([{quoted}])"
+        columns = ", ".join(
+            f"NULL::{kind} AS {name}" for name, kind in _mirror_columns(table).items()
+        )
+        return f"(SELECT {columns} WHERE false)"
+
+    def _export_day(self, conn, table: str, day: datetime.date) -> None:
+        """
+        把一天的数据从 Postgres 导出为 Parquet 快照（先写临时文件再原子替换）。
+        导出开始前已提交的采集镜像文件已包含在快照中，替换后删除；导出期间新提交的文件保留。
+        """
+        spec = MIRROR_TABLES[table]
+        time_column = spec["time_column"]
+        path = self.partition_path(table, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        csv_path = path + ".csv.tmp"
+        parquet_path = path + ".tmp"
+        day_start = datetime.datetime.combine(
+            day, datetime.time(), datetime.timezone.utc
+        )
+        superseded = [p for p in self._day_files(table, day) if p != path]
+
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE 'UTC'")
+            select = cur.mogrify(
+                f"SELECT {', '.join(spec['columns'])} FROM {table}"
+                f" WHERE {time_column} >= %s AND {time_column} < %s"
+                f" AND {symbols.DEFAULT_SYMBOL_FILTER}",
+                (day_start, day_start + _ONE_DAY),
+            ).decode()
+            with open(csv_path, "w", encoding="utf-8") as f:
+                cur.copy_expert(
+                    f"COPY ({select}) TO STDOUT WITH (FORMAT CSV, HEADER)", f
+                )
+        conn.rollback()
+
+        columns = ", ".join(
+            f"'{name}': '{kind}'" for name, kind in spec["columns"].items()
+        )
+        projection = ", ".join(
+            f"{name}::TIMESTAMP AS {name}" if kind == "TIMESTAMPTZ" else name
+            for name, kind in spec["columns"].items()
+        )
+        try:
+            self._duck.execute(
+                f"COPY (SELECT {projection} FROM read_csv(?, header = true, columns = {{{columns}}})"
+                f" ORDER BY {time_column}) TO '{parquet_path}'"
+                " (FORMAT parquet, COMPRESSION zstd)",
+                [csv_path],
+            )
+            rows, low, high = self._duck.execute(
+                f"SELECT COUNT(*), MIN({time_column}), MAX({time_column})"
+                " FROM read_parquet(?)",
+                [parquet_path],
+            ).fetchone()
+            with _manifest_lock(self.root, table):
+                os.replace(parquet_path, path)
+                for stale in superseded:
+                    if os.path.exists(stale):
+                        os.remove(stale)
+                manifest = read_manifest(self.root, table)
+                removed = {os.path.relpath(p, self.root) for p in superseded}
+                removed.add(os.path.relpath(path, self.root))
+                kept = [
+                    entry
+                    for entry in manifest["days"].get(day.isoformat(), [])
+                    if entry["file"] not in removed
+                ]
+                manifest["days"][day.isoformat()] = [
+                    _manifest_entry(self.root, path, "snapshot", rows, low, high, None)
+                ] + kept
+                _write_manifest(self.root, table, manifest)
+        finally:
+            for tmp in (csv_path, parquet_path):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def sync(
+        self,
+        conn,
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        refresh: bool = False,
+    ) -> int:
+        """
+        描述：把 [start, end] 覆盖的日期镜像到本地 Parquet
+            已结束且已导出的日期跳过；当天与 refresh=True 时重新导出。未指定范围时使用原始表的最早 / 最晚时间。
+        参数：conn: Postgres 连接, start / end: 时间范围（含）, refresh: 是否重新导出全部日期
+        返回值：本次导出的分区数
+        """
+        # 升级前的数据库可能还没有 symbol 列
+        symbols.ensure_symbol_columns(conn)
+        start, end = _utc_naive(start), _utc_naive(end)
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        exported = 0
+        for table, spec in MIRROR_TABLES.items():
+            table_start, table_end = start, end
+            if table_start is None or table_end is None:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"SELECT MIN({spec['time_column']}), MAX({spec['time_column']}) FROM {table}"
+                        f" WHERE {symbols.DEFAULT_SYMBOL_FILTER}"
+                    )
+                    low, high = cur.fetchone()
+                conn.rollback()
+                if low is None:
+                    continue
+                table_start = table_start or _utc_naive(low)
+                table_end = table_end or _utc_naive(high)
+            for day in _days(table_start, table_end):
+                if (
+                    not refresh
+                    and day < today
+                    and os.path.exists(self.partition_path(table, day))
+                ):
+                    continue
+                self._export_day(conn, table, day)
+                exported += 1
+        if exported:
+            logger.info(f"已导出 {exported} 个 Parquet 分区到 {self.root}")
+        return exported
+
+    def price_pairs(
+        self,
+        strategy: dict[str, Any],
+        start_time=None,
+        end_time=None,
+    ) -> list[tuple]:
+        """
+        描述：在 Parquet 镜像上计算与 analyse.fetch_price_pairs 相同的价格对
+        返回值：[(block_time, uniswap_price, gas_price, window_volume, binance_price), ...]
+        """
+        start, end = _utc_naive(start_time), _utc_naive(end_time)
+        delay = float(strategy["time_delay_seconds"])
+        window = float(strategy["window_seconds"])
+        margin = datetime.timedelta(seconds=delay + window)
+
+        params: dict[str, Any] = {"delay": delay, "window": window}
+        conditions = []
+        if start is not None:
+            params["start"] = start
+            conditions.append("block_time >= $start")
+        if end is not None:
+            params["end"] = end
+            conditions.append("block_time <= $end")
+        query = _PRICE_PAIRS_SQL.format(
+            uniswap=self._source("uniswap_swaps", start, end),
+            binance=self._source(
+                "binance_trades",
+                start - margin if start is not None else None,
+                end + margin if end is not None else None,
+            ),
+            where_clause=f"WHERE {' AND '.join(conditions)}" if conditions else "",
+        )
+        rows = self._duck.execute(query, params).fetchall()
+        logger.info(f"DuckDB 计算完成，共 {len(rows)} 对价格。")
+        return [(_with_utc(row[0]), *row[1:]) for row in rows]
+
+    def aggregate(
+        self,
+        interval_seconds: int,
+        chunk_start: datetime.datetime,
+        chunk_end: datetime.datetime,
+    ) -> list[tuple]:
+        """
+        描述：在 Parquet 镜像上聚合 [chunk_start, chunk_end) 的时间桶均价
+        返回值：[(time_bucket, source, average_price), ...]，与 process_prices.sql_query 结构相同
+        """
+        start, end = _utc_naive(chunk_start), _utc_naive(chunk_end)
+        last = end - datetime.timedelta(microseconds=1)
+        query = _AGGREGATE_SQL.format(
+            uniswap=self._source("uniswap_swaps", start, last),
+            binance=self._source("binance_trades", start, last),
+        )
+        # DuckDB 连接不能跨线程共享，每次查询使用独立游标
+        with self._duck.cursor() as cur:
+            rows = cur.execute(
+                query,
+                {"interval": float(interval_seconds), "start": start, "end": end},
+            ).fetchall()
+        return [(_with_utc(row[0]), *row[1:]) for row in rows]
+
+
+class ParquetSink:
+    """
+    采集任务的 Parquet 镜像写入器
+    与数据库写入相同的规范化分块先按天写入暂存目录；数据库事务提交后调用 commit() 才移动到正式分区
+    并登记到 manifest，回滚时调用 abort() 丢弃，因此镜像中只会出现已提交的数据。
+    """
+
+    def __init__(self, table: str, root: str = DEFAULT_PARQUET_DIR):
+        """
+        描述：初始化写入器
+        参数：table: 镜像的原始表（MIRROR_TABLES 的键）, root: Parquet 镜像根目录
+        """
+        _require_duckdb()
+        self.table = table
+        self.root = root
+        self.batch_id = uuid.uuid4().hex[:16]
+        self._staging_dir = os.path.join(root, table, "_staging", self.batch_id)
+        self._staged: list[dict[str, Any]] = []
+        self._duck = duckdb.connect(":memory:")
+
+    def write(self, frame: pd.DataFrame) -> int:
+        """
+        描述：把一个规范化分块按 UTC 日期写入暂存文件（zstd 压缩、列类型与 MIRROR_TABLES 一致）
+        参数：frame: 列名与原始表一致的 DataFrame，时间列为带时区的时间；缺少的列写为 NULL
+        返回值：写入的行数
+        """
+        time_column = MIRROR_TABLES[self.table]["time_column"]
+        columns = _mirror_columns(self.table)
+        if frame.empty:
+            return 0
+        data = frame[[name for name in columns if name in frame.columns]].copy()
+        data[time_column] = pd.to_datetime(data[time_column], utc=True).dt.tz_convert(
+            None
+        )
+        data = data.dropna(subset=[time_column])
+        projection = ", ".join(
+            (
+                f"CAST({name} AS {kind}) AS {name}"
+                if name in data.columns
+                else f"CAST(NULL AS {kind}) AS {name}"
+            )
+            for name, kind in columns.items()
+        )
+
+        self._duck.register("chunk", data)
+        try:
+            for day, part in data.groupby(data[time_column].dt.floor("D")):
+                day = day.date()
+                path = os.path.join(
+                    self._staging_dir,
+                    f"day={day.isoformat()}",
+                    f"part-{self.batch_id}-{len(self._staged):05d}.parquet",
+                )
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                day_start = datetime.datetime.combine(day, datetime.time())
+                self._duck.execute(
+                    f"COPY (SELECT {projection} FROM chunk"
+                    f" WHERE {time_column} >= ? AND {time_column} < ?"
+                    f" ORDER BY {time_column}) TO '{path}'"
+                    " (FORMAT parquet, COMPRESSION zstd)",
+                    [day_start, day_start + _ONE_DAY],
+                )
+                self._staged.append(
+                    {
+                        "day": day.isoformat(),
+                        "path": path,
+                        "rows": len(part),
+                        "min_time": part[time_column].min().to_pydatetime(),
+                        "max_time": part[time_column].max().to_pydatetime(),
+                    }
+                )
+        finally:
+            self._duck.unregister("chunk")
+        return len(data)
+
+    def commit(self) -> int:
+        """
+        描述：数据库事务提交后调用：把暂存文件移动到正式分区并登记到 manifest
+        返回值：提交的行数
+        """
+        rows = 0
+        if self._staged:
+            with _manifest_lock(self.root, self.table):
+                manifest = read_manifest(self.root, self.table)
+                for staged in self._staged:
+                    target = os.path.join(
+                        self.root,
+                        self.table,
+                        f"day={staged['day']}",
+                        os.path.basename(staged["path"]),
+                    )
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(staged["path"], target)
+                    manifest["days"].setdefault(staged["day"], []).append(
+                        _manifest_entry(
+                            self.root,
+                            target,
+                            "ingest",
+                            staged["rows"],
+                            staged["min_time"],
+                            staged["max_time"],
+                            self.batch_id,
+                        )
+                    )
+                    rows += staged["rows"]
+                _write_manifest(self.root, self.table, manifest)
+            logger.info(
+                f"{self.table} Parquet 镜像已提交 {len(self._staged)} 个文件，共 {rows} 行"
+            )
+        self._staged = []
+        self.abort()
+        return rows
+
+    def abort(self) -> None:
+        """丢弃尚未提交的暂存文件（幂等，commit 之后调用无影响）"""
+        self._staged = []
+        shutil.rmtree(self._staging_dir, ignore_errors=True)
+        self._duck.close()
+
+
+def open_ingest_sink(
+    table: str, enabled: Optional[bool] = None
+) -> Optional[ParquetSink]:
+    """
+    描述：按 analytics.ingest_mirror 为采集任务创建 Parquet 镜像写入器
+    返回值：ParquetSink；未开启或未安装 duckdb 时返回 None（只写数据库）
+    """
+    if not (DEFAULT_INGEST_MIRROR if enabled is None else enabled):
+        return None
+    if duckdb is None:
+        logger.warning("未安装 duckdb，跳过 Parquet 镜像写入")
+        return None
+    return ParquetSink(table)
+
+
+def promote_after_commit(sink: Optional[ParquetSink]) -> None:
+    """
+    描述：采集任务提交数据库事务后调用
+        镜像只是派生数据，提交失败只记录警告；受影响的日期可以通过 mirror_refresh 重新导出
+    """
+    if sink is None:
+        return
+    try:
+        sink.commit()
+    except Exception as exc:
+        logger.warning(f"提交 {sink.table} Parquet 镜像失败: {exc}")
+        sink.abort()
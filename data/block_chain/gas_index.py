@@ -0,0 +1,347 @@
+"""
+Gas 价格时间序列索引
+
+- 采集 Uniswap 数据时按秒（以太坊每个区块一个时间戳，即按区块）汇总交易的 Gas 价格：
+  区块内最低的成交 Gas 价格作为基础费用（base fee）的估计，其余部分为优先费，保存优先费的 PERCENTILES 分位数；
+- GasIndex 把这些汇总保存为按时间排序的定长数组（.npz），查询时用 searchsorted 向量化地取
+  某个时刻之前最近一个区块的 Gas 价格，分析热路径中不再查询数据库；
+- 分析时（gas_model=index）按“我们的交易”的执行时刻（Swap 时间 + time_delay_seconds）定价 Gas，
+  Gas 用量按路线取 route_gas_used，而不是沿用触发机会的那笔 Swap 的 gas_price。
+"""
+
+import contextlib
+import fcntl
+import os
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+from loguru import logger
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+GAS_INDEX_CONFIG = config.get("gas_index", {}) or {}
+
+# 保存的优先费分位数
+PERCENTILES = (25, 50, 75, 90)
+# 两条套利路线在链上的 Gas 用量（都只有一笔 Uniswap Swap）
+DEFAULT_ROUTE_GAS_USED = {"buy_cex_sell_dex": 130_000, "buy_dex_sell_cex": 150_000}
+
+_NS_PER_SECOND = 1_000_000_000
+
+
+def _percentile_columns(
+    values: np.ndarray, starts: np.ndarray, counts: np.ndarray
+) -> np.ndarray:
+    """
+    描述：对按组排序的 values，逐组计算 PERCENTILES 分位数（线性插值，与 np.percentile / percentile_cont 一致）
+    返回值：形状为 (组数, len(PERCENTILES)) 的数组
+    """
+    out = np.empty((len(starts), len(PERCENTILES)), dtype=np.float64)
+    for j, p in enumerate(PERCENTILES):
+        pos = (counts - 1) * (p / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, counts - 1)
+        frac = pos - lo
+        low, high = values[starts + lo], values[starts + hi]
+        out[:, j] = low + (high - low) * frac
+    return out
+
+
+class GasIndex:
+    """按秒的 Gas 价格汇总：time（纳秒，升序且唯一）、base_fee、priority（各分位数的优先费）与 count，单位均为 Wei"""
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self.time = np.asarray(arrays["time"], dtype=np.int64)
+        self.base_fee = np.asarray(arrays["base_fee"], dtype=np.float64)
+        self.priority = np.asarray(arrays["priority"], dtype=np.float64).reshape(
+            -1, len(PERCENTILES)
+        )
+        self.count = np.asarray(arrays["count"], dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @classmethod
+    def empty(cls) -> "GasIndex":
+        return cls(
+            {
+                "time": np.empty(0, dtype=np.int64),
+                "base_fee": np.empty(0),
+                "priority": np.empty((0, len(PERCENTILES))),
+                "count": np.empty(0, dtype=np.int32),
+            }
+        )
+
+    @classmethod
+    def from_transactions(cls, times_ns, gas_prices) -> "GasIndex":
+        """
+        描述：由逐笔交易的时间（纳秒）与成交 Gas 价格（Wei）按秒汇总；Gas 价格缺失的交易忽略
+        """
+        seconds = np.asarray(times_ns, dtype=np.int64) // _NS_PER_SECOND
+        gas = np.asarray(gas_prices, dtype=np.float64)
+        keep = ~np.isnan(gas)
+        seconds, gas = seconds[keep], gas[keep]
+        if not len(seconds):
+            return cls.empty()
+        order = np.lexsort((gas, seconds))
+        seconds, gas = seconds[order], gas[order]
+        keys, starts, counts = np.unique(seconds, return_index=True, return_counts=True)
+        base = gas[starts]
+        return cls(
+            {
+                "time": keys * _NS_PER_SECOND,
+                "base_fee": base,
+                "priority": _percentile_columns(gas, starts, counts) - base[:, None],
+                "count": counts,
+            }
+        )
+
+    def merge(self, other: "GasIndex") -> "GasIndex":
+        """合并两个索引：同一秒以 other 为准（重新采集同一时间段时覆盖旧的汇总）"""
+        if not len(other):
+            return self
+        keep = ~np.isin(self.time, other.time)
+        time = np.concatenate((self.time[keep], other.time))
+        order = np.argsort(time, kind="stable")
+        return GasIndex(
+            {
+                "time": time[order],
+                "base_fee": np.concatenate((self.base_fee[keep], other.base_fee))[
+                    order
+                ],
+                "priority": np.concatenate((self.priority[keep], other.priority))[
+                    order
+                ],
+                "count": np.concatenate((self.count[keep], other.count))[order],
+            }
+        )
+
+    def gas_price(
+        self,
+        times_ns,
+        percentile: int = 50,
+        max_age_seconds: Optional[float] = None,
+    ) -> np.ndarray:
+        """
+        描述：每个时刻之前（含该时刻）最近一个区块的 Gas 价格估计 = 基础费用 + 优先费分位数
+        参数：times_ns: 纳秒时间数组, percentile: PERCENTILES 中的一个,
+            max_age_seconds: 最近的区块早于该秒数时视为缺失（None 表示不限制）
+        返回值：float64 数组（Wei）；没有更早的区块或已过期时为 NaN
+        """
+        if percentile not in PERCENTILES:
+            raise ValueError(f"percentile 必须是 {PERCENTILES} 之一: {percentile}")
+        times_ns = np.asarray(times_ns, dtype=np.int64)
+        out = np.full(len(times_ns), np.nan)
+        index = np.searchsorted(self.time, times_ns, side="right") - 1
+        valid = index >= 0
+        if max_age_seconds is not None:
+            valid &= (
+                times_ns - self.time[np.maximum(index, 0)]
+                <= max_age_seconds * _NS_PER_SECOND
+            )
+        column = PERCENTILES.index(percentile)
+        picked = index[valid]
+        out[valid] = self.base_fee[picked] + self.priority[picked, column]
+        return out
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                time=self.time,
+                base_fee=self.base_fee,
+                priority=self.priority,
+                count=self.count,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "GasIndex":
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+
+def default_path() -> str:
+    return GAS_INDEX_CONFIG.get("path", "./gas_index/gas_index.npz")
+
+
+@contextlib.contextmanager
+def _index_lock(path: str):
+    """多个采集进程并发合并同一个索引文件时，用文件锁串行化"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def update(index: GasIndex, path: Optional[str] = None) -> GasIndex:
+    """
+    描述：把新的汇总并入保存的索引（读取、合并、原子替换）
+    返回值：合并后的索引
+    """
+    path = path or default_path()
+    with _index_lock(path):
+        merged = GasIndex.load(path).merge(index) if os.path.exists(path) else index
+        merged.save(path)
+    _loaded.pop(path, None)
+    return merged
+
+
+def update_after_ingest(
+    swaps: Iterable[dict[str, Any]],
+    path: Optional[str] = None,
+    enabled: Optional[bool] = None,
+) -> Optional[GasIndex]:
+    """
+    描述：采集任务提交数据库事务后调用，把 The Graph 返回的 Swap（timestamp、transaction.gasPrice）并入 Gas 索引
+        索引只是派生数据，更新失败只记录警告；可以用 rebuild_from_db 由 uniswap_swaps 重新构建
+    返回值：合并后的索引；未开启 gas_index.build_on_ingest 或更新失败时返回 None
+    """
+    if not (
+        GAS_INDEX_CONFIG.get("build_on_ingest", False) if enabled is None else enabled
+    ):
+        return None
+    try:
+        swaps = list(swaps)
+        times = [int(s["timestamp"]) * _NS_PER_SECOND for s in swaps]
+        gas = [float(s["transaction"]["gasPrice"]) for s in swaps]
+        return update(GasIndex.from_transactions(times, gas), path)
+    except Exception as exc:
+        logger.warning(f"更新 Gas 索引失败: {exc}")
+        return None
+
+
+def rebuild_from_db(conn, path: Optional[str] = None) -> GasIndex:
+    """
+    描述：由 uniswap_swaps 在数据库中按秒汇总后重新构建整个索引（一次查询，用于补建历史数据）
+    返回值：新的索引
+    """
+    fractions = ", ".join(str(p / 100) for p in PERCENTILES)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT
+                EXTRACT(EPOCH FROM date_trunc('second', block_time))::bigint AS ts,
+                MIN(gas_price)::float8 AS base_fee,
+                percentile_cont(ARRAY[{fractions}]) WITHIN GROUP (ORDER BY gas_price::float8),
+                COUNT(*)
+            FROM uniswap_swaps
+            WHERE gas_price IS NOT NULL
+            GROUP BY 1
+            ORDER BY 1
+            """)
+        rows = cur.fetchall()
+    base = np.array([row[1] for row in rows], dtype=np.float64)
+    index = GasIndex(
+        {
+            "time": np.array([row[0] for row in rows], dtype=np.int64) * _NS_PER_SECOND,
+            "base_fee": base,
+            "priority": np.array([row[2] for row in rows], dtype=np.float64).reshape(
+                -1, len(PERCENTILES)
+            )
+            - base[:, None],
+            "count": np.array([row[3] for row in rows], dtype=np.int32),
+        }
+    )
+    path = path or default_path()
+    with _index_lock(path):
+        index.save(path)
+    _loaded.pop(path, None)
+    logger.info(f"已由 uniswap_swaps 重建 Gas 索引：{len(index)} 个区块")
+    return index
+
+
+# 已加载的索引（路径 -> (修改时间, GasIndex)）
+_loaded: dict[str, tuple[float, GasIndex]] = {}
+
+
+def load_gas_index(path: Optional[str] = None) -> Optional[GasIndex]:
+    """
+    描述：加载保存的 Gas 索引；文件修改后重新加载
+    返回值：GasIndex；文件不存在时返回 None
+    """
+    path = path or default_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        logger.warning(f"Gas 索引 {path} 不存在")
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, GasIndex.load(path))
+        _loaded[path] = cached
+    return cached[1]
+
+
+def gas_model(strategy: dict[str, Any]) -> str:
+    """Gas 定价方式：strategy 中的 gas_model 优先，其次是配置 gas_index.gas_model（swap / index）"""
+    return str(strategy.get("gas_model") or GAS_INDEX_CONFIG.get("gas_model") or "swap")
+
+
+def route_gas_used(strategy: dict[str, Any]) -> dict[str, float]:
+    """按路线的 Gas 用量：默认值 < 配置 gas_index.route_gas_used < strategy 中的 route_gas_used"""
+    return {
+        **DEFAULT_ROUTE_GAS_USED,
+        **(GAS_INDEX_CONFIG.get("route_gas_used") or {}),
+        **(strategy.get("route_gas_used") or {}),
+    }
+
+
+def execution_gas_prices(
+    index: GasIndex, block_times, strategy: dict[str, Any]
+) -> np.ndarray:
+    """
+    描述：按执行时刻（Swap 时间 + time_delay_seconds）向量化地查询 Gas 价格
+    参数：block_times: 触发机会的 Swap 时间（datetime / Timestamp 序列）
+    返回值：float64 数组（Wei）；没有可用的区块时为 NaN，由调用方回退到 Swap 自身的 gas_price
+    """
+    times = (
+        pd.to_datetime(pd.Series(block_times), utc=True)
+        .dt.as_unit("ns")
+        .astype("int64")
+        .to_numpy()
+    )
+    delay = int(float(strategy.get("time_delay_seconds", 0)) * _NS_PER_SECOND)
+    return index.gas_price(
+        times + delay,
+        int(strategy.get("gas_percentile", GAS_INDEX_CONFIG.get("percentile", 50))),
+        GAS_INDEX_CONFIG.get("max_age_seconds"),
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description="Gas 价格索引")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="由 uniswap_swaps 重新构建整个索引"
+    )
+    parser.add_argument("--path", help="索引保存路径（默认 gas_index.path）")
+    args = parser.parse_args()
+    if args.rebuild:
+        db_config = config.get("db", {})
+        with psycopg2.connect(
+            host=db_config["host"],
+            port=db_config["port"],
+            dbname=db_config["database"],
+            user=db_config["username"],
+            password=db_config["password"],
+        ) as conn:
+            rebuild_from_db(conn, args.path)
+    else:
+        index = load_gas_index(args.path)
+        if index is not None and len(index):
+            logger.info(
+                f"Gas 索引：{len(index)} 个区块，"
+                f"{pd.Timestamp(index.time[0], tz='UTC')} - {pd.Timestamp(index.time[-1], tz='UTC')}"
+            )
@@ -0,0 +1,234 @@
+"""
+套利分析的增量刷新
+
+- batch_watermarks 按批次记录已分析到的最晚 block_time（水位线）与策略参数的哈希；
+- 增量模式下再次运行同一批次时，只取水位线之后的价格对，并向前多取一段预热数据：
+  10 分钟累计成交量窗口（与 fetch_price_pairs 的 RANGE 窗口一致）与 10 个价格对的滚动波动率窗口，
+  预热区间内的机会已在上次写入，只追加水位线之后的新机会；
+- 策略参数变化或批次被删除后重建（created_at 不同）时，整批重新计算并覆盖；
+- 同一批次的增量刷新用会话级 advisory lock 串行执行，避免两次刷新读到同一水位线而重复追加。
+
+水位线之前才写入的迟到数据不会被增量刷新覆盖，需要用 overwrite=True 整批重算。
+"""
+
+import contextlib
+import datetime
+import hashlib
+import json
+from typing import Any, NamedTuple, Optional
+
+import pandas as pd
+from loguru import logger
+
+from . import symbols, venues
+from .rolling_stats import VOLATILITY_POINTS, VOLUME_WINDOW
+
+WATERMARK_DDL = """
+CREATE TABLE IF NOT EXISTS batch_watermarks (
+    batch_id integer PRIMARY KEY,
+    strategy_hash text NOT NULL,
+    watermark timestamptz NOT NULL,
+    batch_created_at timestamptz,
+    updated_at timestamptz NOT NULL DEFAULT NOW()
+);
+"""
+
+# 不影响分析结果的策略字段，不参与哈希（增量刷新时可以延长 end）
+_UNHASHED_KEYS = {"start", "end", "analytics_backend"}
+
+# pg_advisory_lock 的第一个键，区分其他模块的 advisory lock
+_LOCK_NAMESPACE = 0x45544144
+
+
+class RefreshPlan(NamedTuple):
+    """一次分析的取数计划：fetch_start 为取数起点，watermark 为 None 表示整批重算"""
+
+    fetch_start: Optional[pd.Timestamp]
+    watermark: Optional[pd.Timestamp]
+    strategy_hash: str
+    batch_created_at: Optional[datetime.datetime]
+
+    @property
+    def full(self) -> bool:
+        return self.watermark is None
+
+
+def _utc(value) -> pd.Timestamp:
+    value = pd.Timestamp(value)
+    return value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+
+
+def strategy_hash(strategy: dict[str, Any]) -> str:
+    """策略参数的稳定哈希（忽略时间范围与计算后端；默认交易对与交易所不计入，与增加交易对之前的哈希相同）"""
+    payload = {
+        key: value for key, value in strategy.items() if key not in _UNHASHED_KEYS
+    }
+    if symbols.is_default(payload.get("symbol")):
+        payload.pop("symbol", None)
+    if venues.is_default(payload.get("venue")):
+        payload.pop("venue", None)
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def ensure_watermark_table(conn) -> None:
+    """创建水位线表（幂等）"""
+    with conn.cursor() as cur:
+        cur.execute(WATERMARK_DDL)
+
+
+@contextlib.contextmanager
+def batch_lock(conn, batch_id: int):
+    """同一批次的增量刷新串行执行（会话级 advisory lock，不受中途提交 / 回滚影响）"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s, %s)", (_LOCK_NAMESPACE, batch_id))
+    try:
+        yield
+    finally:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT pg_advisory_unlock(%s, %s)", (_LOCK_NAMESPACE, batch_id)
+                )
+            conn.commit()
+        except Exception as exc:
+            logger.warning(f"释放批次 {batch_id} 的刷新锁失败: {exc}")
+
+
+def warmup_start(
+    cur, watermark: pd.Timestamp, strategy: dict[str, Any]
+) -> pd.Timestamp:
+    """
+    描述：计算水位线之前需要预热的起点：覆盖 10 分钟成交量窗口，且至少包含 VOLATILITY_POINTS - 1 个此前的价格对
+        滚动波动率只由价格对（延迟窗口内匹配到交易所成交的 Swap，与 fetch_price_pairs 的条件一致）推进，
+        交易所数据有缺口时按 Swap 计数的预热区间会不够长
+    参数：cur: 游标, watermark: 水位线, strategy: 策略参数（time_delay_seconds / window_seconds / symbol / venue）
+    返回值：取数起点
+    """
+    start = watermark - VOLUME_WINDOW
+    symbol = symbols.normalize_symbol(strategy.get("symbol") or symbols.DEFAULT_SYMBOL)
+    trades_table = venues.venue_table(strategy.get("venue"))
+    cur.execute(
+        f"""
+        SELECT u.block_time FROM uniswap_swaps u
+        WHERE u.symbol = %(symbol)s AND u.block_time <= %(watermark)s
+          AND EXISTS (
+              SELECT 1 FROM {trades_table} b
+              WHERE b.symbol = %(symbol)s
+                AND b.trade_time BETWEEN
+                    u.block_time - %(delay)s::interval - %(window)s::interval
+                AND u.block_time - %(delay)s::interval + %(window)s::interval
+          )
+        ORDER BY u.block_time DESC OFFSET %(offset)s LIMIT 1
+        """,
+        {
+            "symbol": symbol,
+            "watermark": watermark.to_pydatetime(),
+            "delay": f"{strategy['time_delay_seconds']} seconds",
+            "window": f"{strategy['window_seconds']} seconds",
+            "offset": VOLATILITY_POINTS - 1,
+        },
+    )
+    row = cur.fetchone()
+    if row and row[0] is not None:
+        start = min(start, _utc(row[0]))
+    return start
+
+
+def plan_refresh(
+    conn,
+    batch_id: int,
+    strategy: dict[str, Any],
+    start_ts: Optional[pd.Timestamp],
+) -> RefreshPlan:
+    """
+    描述：根据批次的水位线决定本次取数范围
+        没有水位线、策略参数变化或批次已被重建时整批重算；否则从预热起点开始取数
+    参数：conn: 数据库连接, batch_id: 批次 ID, strategy: 策略参数, start_ts: 任务指定的起始时间
+    返回值：RefreshPlan
+    """
+    digest = strategy_hash(strategy)
+    with conn.cursor() as cur:
+        cur.execute("SELECT created_at FROM batches WHERE id = %s", (batch_id,))
+        row = cur.fetchone()
+        batch_created_at = row[0] if row else None
+        cur.execute(
+            "SELECT strategy_hash, watermark, batch_created_at"
+            " FROM batch_watermarks WHERE batch_id = %s",
+            (batch_id,),
+        )
+        state = cur.fetchone()
+
+        if state is None:
+            logger.info(f"批次 {batch_id} 没有水位线，整批计算")
+            return RefreshPlan(start_ts, None, digest, batch_created_at)
+        saved_hash, watermark, saved_created_at = state
+        if saved_hash != digest:
+            logger.info(f"批次 {batch_id} 的策略参数已变化，整批重新计算")
+            return RefreshPlan(start_ts, None, digest, batch_created_at)
+        if saved_created_at != batch_created_at:
+            logger.info(f"批次 {batch_id} 已被重建，整批重新计算")
+            return RefreshPlan(start_ts, None, digest, batch_created_at)
+
+        watermark = _utc(watermark)
+        fetch_start = warmup_start(cur, watermark, strategy)
+    if start_ts is not None and start_ts > fetch_start:
+        fetch_start = start_ts
+    logger.info(
+        f"批次 {batch_id} 增量刷新：水位线 {watermark}，从 {fetch_start} 开始取数"
+    )
+    return RefreshPlan(fetch_start, watermark, digest, batch_created_at)
+
+
+def last_block_time(price_pairs) -> Optional[pd.Timestamp]:
+    """价格对（按时间排序的元组列表或 DataFrame）中最晚的 block_time"""
+    if isinstance(price_pairs, pd.DataFrame):
+        if price_pairs.empty:
+            return None
+        value = price_pairs["block_time"].iloc[-1]
+    else:
+        if not price_pairs:
+            return None
+        value = price_pairs[-1][0]
+    return _utc(value)
+
+
+def new_opportunities(
+    opportunities: list[dict[str, Any]], watermark: Optional[pd.Timestamp]
+) -> list[dict[str, Any]]:
+    """去掉预热区间（水位线及之前）的机会"""
+    if watermark is None:
+        return opportunities
+    return [opp for opp in opportunities if opp["block_time"] > watermark]
+
+
+def save_watermark(cur, plan: RefreshPlan, batch_id: int, last_time) -> None:
+    """
+    描述：记录批次新的水位线并更新 batches.last_refreshed_at；调用方在写入机会记录的同一事务中提交
+    参数：cur: 游标, plan: 本次的取数计划, batch_id: 批次 ID, last_time: 本次分析到的最晚 block_time（None 表示没有数据）
+    """
+    watermark = plan.watermark
+    if last_time is not None:
+        last_time = _utc(last_time)
+        watermark = last_time if watermark is None else max(watermark, last_time)
+    if watermark is not None:
+        cur.execute(
+            """
+            INSERT INTO batch_watermarks (batch_id, strategy_hash, watermark, batch_created_at, updated_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON CONFLICT (batch_id) DO UPDATE SET
+                strategy_hash = EXCLUDED.strategy_hash,
+                watermark = EXCLUDED.watermark,
+                batch_created_at = EXCLUDED.batch_created_at,
+                updated_at = NOW()
+            """,
+            (
+                batch_id,
+                plan.strategy_hash,
+                watermark.to_pydatetime(),
+                plan.batch_created_at,
+            ),
+        )
+    cur.execute(
+        "UPDATE batches SET last_refreshed_at = NOW() WHERE id = %s", (batch_id,)
+    )
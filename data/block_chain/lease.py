@@ -0,0 +1,237 @@
+"""
+任务租约与 Worker 心跳
+
+多个消费者进程（可以分布在多台主机上）共享同一个任务队列时，需要保证：
+1. 同一个任务只会被一个 Worker 认领（原子化 UPDATE ... WHERE status='WAIT' RETURNING）；
+2. Worker 持有任务期间定期续约，进程崩溃后租约过期，任务重新回到 WAIT 并重新入队；
+   重新入队的消息发布成功后才提交状态重置，发布失败时租约保持过期，下一轮回收会再次处理。
+
+所有函数只接收数据库连接，不自行建立连接，便于由 server.py 统一管理。
+"""
+
+import os
+import socket
+import uuid
+from typing import Any, Callable, Optional
+
+from loguru import logger
+from psycopg2.extras import Json
+
+LEASE_TABLES_DDL = """
+CREATE TABLE IF NOT EXISTS task_leases (
+    task_id varchar(64) PRIMARY KEY,
+    worker_id text,
+    task_type text NOT NULL,
+    payload jsonb NOT NULL,
+    attempts integer NOT NULL DEFAULT 1,
+    claimed_at timestamptz NOT NULL DEFAULT NOW(),
+    lease_expires_at timestamptz
+);
+CREATE INDEX IF NOT EXISTS idx_task_leases_expires
+    ON task_leases (lease_expires_at) WHERE worker_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS worker_heartbeats (
+    worker_id text PRIMARY KEY,
+    hostname text NOT NULL,
+    pid integer NOT NULL,
+    started_at timestamptz NOT NULL DEFAULT NOW(),
+    last_heartbeat timestamptz NOT NULL DEFAULT NOW()
+);
+"""
+
+# 只有处于 WAIT 的任务才能被认领；认领成功后在同一条语句中写入租约
+CLAIM_SQL = """
+WITH claimed AS (
+    UPDATE tasks
+    SET status = 'RUNNING', started_at = COALESCE(started_at, NOW())
+    WHERE task_id = %(task_id)s AND status = 'WAIT'
+    RETURNING task_id
+)
+INSERT INTO task_leases (task_id, worker_id, task_type, payload, attempts, claimed_at, lease_expires_at)
+SELECT task_id, %(worker_id)s, %(task_type)s, %(payload)s, 1, NOW(),
+       NOW() + make_interval(secs => %(lease_seconds)s)
+FROM claimed
+ON CONFLICT (task_id) DO UPDATE
+SET worker_id = EXCLUDED.worker_id,
+    task_type = EXCLUDED.task_type,
+    payload = EXCLUDED.payload,
+    attempts = task_leases.attempts + 1,
+    claimed_at = EXCLUDED.claimed_at,
+    lease_expires_at = EXCLUDED.lease_expires_at
+RETURNING task_id, attempts
+"""
+
+# SKIP LOCKED 使多个 Worker 可以同时回收而不会重复处理同一条租约；
+# 行锁一直持有到回收事务提交，其间重新入队的消息被消费时，认领会等待提交后再判断状态
+REAP_SQL = """
+SELECT task_id, task_type, payload, attempts FROM task_leases
+WHERE worker_id IS NOT NULL AND lease_expires_at < NOW()
+FOR UPDATE SKIP LOCKED
+"""
+
+
+def make_worker_id() -> str:
+    """
+    描述：生成当前进程的 Worker 标识（主机名:进程号:随机后缀）
+    返回值：worker_id 字符串
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def ensure_lease_tables(conn) -> None:
+    """
+    描述：创建租约表与心跳表（幂等）
+    参数：conn: 数据库连接
+    """
+    with conn.cursor() as cur:
+        cur.execute(LEASE_TABLES_DDL)
+    conn.commit()
+
+
+def claim_task(
+    conn,
+    task_id: str,
+    worker_id: str,
+    task_type: str,
+    payload: dict[str, Any],
+    lease_seconds: int,
+) -> Optional[int]:
+    """
+    描述：原子认领任务，成功时写入/续写租约
+    参数：
+        conn: 数据库连接
+        task_id: 任务ID
+        worker_id: 当前 Worker 标识
+        task_type: 任务类型（用于租约过期后重新入队）
+        payload: 任务消息体（用于租约过期后重新入队）
+        lease_seconds: 租约时长（秒）
+    返回值：认领成功返回本次尝试次数，否则返回 None（已被其他 Worker 认领或已取消）
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            CLAIM_SQL,
+            {
+                "task_id": task_id,
+                "worker_id": worker_id,
+                "task_type": task_type,
+                "payload": Json(payload),
+                "lease_seconds": lease_seconds,
+            },
+        )
+        row = cur.fetchone()
+    conn.commit()
+    if row is None:
+        return None
+    return row[1]
+
+
+def heartbeat(conn, worker_id: str, lease_seconds: int) -> int:
+    """
+    描述：上报 Worker 心跳，并为该 Worker 持有的全部租约续期
+    参数：conn: 数据库连接, worker_id: Worker 标识, lease_seconds: 租约时长（秒）
+    返回值：续期的租约数量
+    """
+    hostname, pid = worker_id.split(":")[:2]
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO worker_heartbeats (worker_id, hostname, pid, started_at, last_heartbeat)
+            VALUES (%s, %s, %s, NOW(), NOW())
+            ON CONFLICT (worker_id) DO UPDATE SET last_heartbeat = NOW()
+            """,
+            (worker_id, hostname, int(pid)),
+        )
+        cur.execute(
+            """
+            UPDATE task_leases
+            SET lease_expires_at = NOW() + make_interval(secs => %s)
+            WHERE worker_id = %s
+            """,
+            (lease_seconds, worker_id),
+        )
+        renewed = cur.rowcount
+    conn.commit()
+    return renewed
+
+
+def release_task(conn, task_id: str, worker_id: str) -> None:
+    """
+    描述：任务结束后释放租约（只释放本 Worker 持有的租约）
+    参数：conn: 数据库连接, task_id: 任务ID, worker_id: Worker 标识
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM task_leases WHERE task_id = %s AND worker_id = %s",
+            (task_id, worker_id),
+        )
+    conn.commit()
+
+
+def reap_expired_leases(
+    conn, max_attempts: int, publish: Callable[[dict[str, Any]], None]
+) -> tuple[list[dict[str, Any]], list[str]]:
+    """
+    描述：回收已过期的租约（持有者已失联），决定重新入队或标记失败
+        每个任务在各自的保存点内重置状态并调用 publish 重新发布；发布失败时回滚到保存点，
+        租约保留原持有者与过期时间，下一轮回收会再次尝试，不会出现没有消息也没有租约的 WAIT 任务
+    参数：
+        conn: 数据库连接
+        max_attempts: 最大尝试次数，超过后不再重新入队
+        publish: 重新发布任务消息的函数，接收 {"task_id", "task_type", "task_data", "attempts"}
+    返回值：(已重新入队的任务列表, 被标记为失败的任务ID列表)
+    """
+    requeue = []
+    failed = []
+    with conn.cursor() as cur:
+        cur.execute(REAP_SQL)
+        expired = cur.fetchall()
+        for task_id, task_type, payload, attempts in expired:
+            if attempts >= max_attempts:
+                cur.execute(
+                    """
+                    UPDATE tasks
+                    SET status = 'FAILED', finished_at = NOW(),
+                        log_summary = %s
+                    WHERE task_id = %s AND status = 'RUNNING'
+                    """,
+                    (f"Worker 失联，已重试 {attempts} 次", task_id),
+                )
+                cur.execute("DELETE FROM task_leases WHERE task_id = %s", (task_id,))
+                failed.append(task_id)
+                continue
+            # 任务可能在 Worker 失联期间被取消，只有仍为 RUNNING 的任务才重新入队
+            cur.execute("SAVEPOINT reap_requeue")
+            cur.execute(
+                "UPDATE tasks SET status = 'WAIT' WHERE task_id = %s AND status = 'RUNNING'",
+                (task_id,),
+            )
+            if not cur.rowcount:
+                cur.execute("DELETE FROM task_leases WHERE task_id = %s", (task_id,))
+                cur.execute("RELEASE SAVEPOINT reap_requeue")
+                continue
+            cur.execute(
+                """
+                UPDATE task_leases SET worker_id = NULL, lease_expires_at = NULL
+                WHERE task_id = %s
+                """,
+                (task_id,),
+            )
+            item = {
+                "task_id": task_id,
+                "task_type": task_type,
+                "task_data": payload,
+                "attempts": attempts,
+            }
+            try:
+                publish(item)
+            except Exception as exc:
+                logger.error(f"任务 {task_id} 重新入队失败，等待下一轮回收: {exc}")
+                cur.execute("ROLLBACK TO SAVEPOINT reap_requeue")
+                continue
+            cur.execute("RELEASE SAVEPOINT reap_requeue")
+            requeue.append(item)
+    conn.commit()
+    if requeue or failed:
+        logger.warning(
+            f"回收过期租约: 重新入队 {len(requeue)} 个任务, 标记失败 {len(failed)} 个任务"
+        )
+    return requeue, failed
@@ -0,0 +1,1124 @@
+"""
+Uniswap V3 池子状态与按深度计算的滑点
+
+- 采集：按区块记录池子状态（sqrtPriceX96、tick、活跃流动性），数据来自 The Graph
+  （起始区块的池子与已初始化 tick 表，加上区间内的 Swap / Mint / Burn 事件），也可以从本地 JSON 夹具构建；
+- 存储：PoolState 用紧凑的 NumPy 数组按时间索引，每个区块一条快照；160/128 位整数拆成 uint64 分段精确保存，
+  tick 表只保存起始表与逐条的 liquidityNet 变化（每 TICK_CHECKPOINT_EVERY 个版本保存一次完整的表），
+  需要时再还原并缓存；
+- 模拟：swap_exact_input 按合约的整数运算（TickMath / SqrtPriceMath / SwapMath，逐个 tick 跨越）
+  精确计算 exact input 兑换的输出，结果与链上一致；
+- 批量：slippage_batch 为每个 tick 表版本预先计算深度曲线（逐段穿越所需输入 / 得到输出的前缀和，浮点），
+  在曲线上二分查找向量化地完成逐段穿越；流动性耗尽等少数情况逐个精确模拟，结果按（快照、方向、数量）缓存。
+
+滑点定义为相对兑换前现价（扣除池子手续费后）的输出损失：1 - 实际输出 / (扣费后输入 × 现价)，
+手续费已经计入 analyse 的利润公式，这里不重复计算。
+"""
+
+import argparse
+import json
+import os
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import requests
+import yaml
+from loguru import logger
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+graph_config = config.get("the_graph", {})
+POOL_STATE_CONFIG = config.get("pool_state", {}) or {}
+
+# TickMath 的取值范围
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+
+Q96 = 1 << 96
+Q192 = 1 << 192
+_UINT256 = 1 << 256
+_FEE_DENOMINATOR = 1_000_000
+
+# 各手续费档位（百万分之一）对应的 tick 间距
+FEE_TICK_SPACING = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+# 每隔这么多个 tick 表版本保存一次完整的表
+TICK_CHECKPOINT_EVERY = 256
+
+# getSqrtRatioAtTick 中 |tick| 各二进制位对应的 Q128.128 系数
+_TICK_RATIOS = (
+    (0x2, 0xFFF97272373D413259A46990580E213A),
+    (0x4, 0xFFF2E50F5F656932EF12357CF3C7FDCC),
+    (0x8, 0xFFE5CACA7E10E4E61C3624EAA0941CD0),
+    (0x10, 0xFFCB9843D60F6159C9DB58835C926644),
+    (0x20, 0xFF973B41FA98C081472E6896DFB254C0),
+    (0x40, 0xFF2EA16466C96A3843EC78B326B52861),
+    (0x80, 0xFE5DEE046A99A2A811C461F1969C3053),
+    (0x100, 0xFCBE86C7900A88AEDCFFC83B479AA3A4),
+    (0x200, 0xF987A7253AC413176F2B074CF7815E54),
+    (0x400, 0xF3392B0822B70005940C7A398E4B70F3),
+    (0x800, 0xE7159475A2C29B7443B29C7FA6E889D9),
+    (0x1000, 0xD097F3BDFD2022B8845AD8F792AA5825),
+    (0x2000, 0xA9F746462D870FDF8A65DC1F90E061E5),
+    (0x4000, 0x70D869A156D2A1B890BB3DF62BAF32F7),
+    (0x8000, 0x31BE135F97D08FD981231505542FCFA6),
+    (0x10000, 0x9AA508B5B7A84E1C677DE54F3E99BC9),
+    (0x20000, 0x5D6AF8DEDB81196699C329225EE604),
+    (0x40000, 0x2216E584F5FA1EA926041BEDFE98),
+    (0x80000, 0x48A170391F7DC42444E8FA2),
+)
+
+
+@lru_cache(maxsize=65536)
+def get_sqrt_ratio_at_tick(tick: int) -> int:
+    """
+    描述：TickMath.getSqrtRatioAtTick 的整数实现，sqrt(1.0001^tick) * 2^96（向上取整）
+    返回值：sqrtPriceX96
+    """
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"tick 超出范围: {tick}")
+    ratio = (
+        0xFFFCB933BD6FAD37AA2D162D1A594001
+        if abs_tick & 0x1
+        else 0x100000000000000000000000000000000
+    )
+    for bit, factor in _TICK_RATIOS:
+        if abs_tick & bit:
+            ratio = (ratio * factor) >> 128
+    if tick > 0:
+        ratio = (_UINT256 - 1) // ratio
+    return (ratio >> 32) + (1 if ratio & 0xFFFFFFFF else 0)
+
+
+def _mul_div_rounding_up(a: int, b: int, denominator: int) -> int:
+    return -(-(a * b) // denominator)
+
+
+def _div_rounding_up(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def _amount0_delta(sqrt_a: int, sqrt_b: int, liquidity: int, round_up: bool) -> int:
+    """SqrtPriceMath.getAmount0Delta：两个价格之间的 token0 数量"""
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_b - sqrt_a
+    if round_up:
+        return _div_rounding_up(
+            _mul_div_rounding_up(numerator1, numerator2, sqrt_b), sqrt_a
+        )
+    return numerator1 * numerator2 // sqrt_b // sqrt_a
+
+
+def _amount1_delta(sqrt_a: int, sqrt_b: int, liquidity: int, round_up: bool) -> int:
+    """SqrtPriceMath.getAmount1Delta：两个价格之间的 token1 数量"""
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    if round_up:
+        return _mul_div_rounding_up(liquidity, sqrt_b - sqrt_a, Q96)
+    return liquidity * (sqrt_b - sqrt_a) // Q96
+
+
+def _next_sqrt_price_from_input(
+    sqrt_price: int, liquidity: int, amount_in: int, zero_for_one: bool
+) -> int:
+    """SqrtPriceMath.getNextSqrtPriceFromInput（包括合约在 256 位乘法溢出时改用的公式）"""
+    if zero_for_one:
+        if amount_in == 0:
+            return sqrt_price
+        numerator1 = liquidity << 96
+        product = amount_in * sqrt_price
+        if product < _UINT256 and numerator1 + product < _UINT256:
+            return _mul_div_rounding_up(numerator1, sqrt_price, numerator1 + product)
+        return _div_rounding_up(numerator1, numerator1 // sqrt_price + amount_in)
+    return sqrt_price + (amount_in << 96) // liquidity
+
+
+def compute_swap_step(
+    sqrt_price: int,
+    sqrt_target: int,
+    liquidity: int,
+    amount_remaining: int,
+    fee_pips: int,
+) -> tuple[int, int, int, int]:
+    """
+    描述：SwapMath.computeSwapStep（只支持 exact input）
+    返回值：(下一价格, 输入数量, 输出数量, 手续费)
+    """
+    zero_for_one = sqrt_price >= sqrt_target
+    remaining_less_fee = (
+        amount_remaining * (_FEE_DENOMINATOR - fee_pips) // _FEE_DENOMINATOR
+    )
+    if zero_for_one:
+        amount_in = _amount0_delta(sqrt_target, sqrt_price, liquidity, True)
+    else:
+        amount_in = _amount1_delta(sqrt_price, sqrt_target, liquidity, True)
+    if remaining_less_fee >= amount_in:
+        sqrt_next = sqrt_target
+    else:
+        sqrt_next = _next_sqrt_price_from_input(
+            sqrt_price, liquidity, remaining_less_fee, zero_for_one
+        )
+    reached = sqrt_next == sqrt_target
+    if zero_for_one:
+        if not reached:
+            amount_in = _amount0_delta(sqrt_next, sqrt_price, liquidity, True)
+        amount_out = _amount1_delta(sqrt_next, sqrt_price, liquidity, False)
+    else:
+        if not reached:
+            amount_in = _amount1_delta(sqrt_price, sqrt_next, liquidity, True)
+        amount_out = _amount0_delta(sqrt_price, sqrt_next, liquidity, False)
+    if reached:
+        fee_amount = _mul_div_rounding_up(
+            amount_in, fee_pips, _FEE_DENOMINATOR - fee_pips
+        )
+    else:
+        fee_amount = amount_remaining - amount_in
+    return sqrt_next, amount_in, amount_out, fee_amount
+
+
+def _next_initialized_tick(
+    ticks: Sequence[int], tick: int, tick_spacing: int, lte: bool
+) -> tuple[int, bool]:
+    """
+    描述：TickBitmap.nextInitializedTickWithinOneWord：只在当前 256 位字内查找，
+        找不到时返回字的边界（未初始化），与合约的分步方式一致（逐步取整也就一致）
+    """
+    compressed = tick // tick_spacing
+    if lte:
+        word_start = (compressed - compressed % 256) * tick_spacing
+        i = bisect_right(ticks, compressed * tick_spacing) - 1
+        if i >= 0 and ticks[i] >= word_start:
+            return ticks[i], True
+        return word_start, False
+    compressed += 1
+    word_end = (compressed + 255 - compressed % 256) * tick_spacing
+    i = bisect_left(ticks, compressed * tick_spacing)
+    if i < len(ticks) and ticks[i] <= word_end:
+        return ticks[i], True
+    return word_end, False
+
+
+def swap_exact_input(
+    sqrt_price: int,
+    tick: int,
+    liquidity: int,
+    ticks: Sequence[int],
+    liquidity_net: dict[int, int],
+    tick_spacing: int,
+    fee_pips: int,
+    amount_in: int,
+    zero_for_one: bool,
+) -> tuple[int, int]:
+    """
+    描述：按 UniswapV3Pool.swap 的整数运算精确模拟 exact input 兑换（不设价格限制，逐个 tick 跨越）
+    参数：sqrt_price / tick / liquidity: 兑换前的池子状态, ticks: 已初始化 tick（升序）,
+        liquidity_net: tick -> liquidityNet, tick_spacing / fee_pips: 池子参数,
+        amount_in: 输入数量（最小单位）, zero_for_one: True 表示输入 token0 换 token1
+    返回值：(实际消耗的输入, 输出)；流动性耗尽时输入可能没有用完
+    """
+    limit = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+    remaining = amount_in
+    amount_out = 0
+    while remaining and sqrt_price != limit:
+        tick_next, initialized = _next_initialized_tick(
+            ticks, tick, tick_spacing, zero_for_one
+        )
+        tick_next = min(max(tick_next, MIN_TICK), MAX_TICK)
+        sqrt_next = get_sqrt_ratio_at_tick(tick_next)
+        if zero_for_one:
+            target = limit if sqrt_next < limit else sqrt_next
+        else:
+            target = limit if sqrt_next > limit else sqrt_next
+        sqrt_price, step_in, step_out, fee = compute_swap_step(
+            sqrt_price, target, liquidity, remaining, fee_pips
+        )
+        remaining -= step_in + fee
+        amount_out += step_out
+        if sqrt_price != sqrt_next:
+            # 没有到达下一个 tick：输入已经用完（或到达价格限制）
+            break
+        if initialized:
+            net = liquidity_net[tick_next]
+            liquidity += -net if zero_for_one else net
+        tick = tick_next - 1 if zero_for_one else tick_next
+    return amount_in - remaining, amount_out
+
+
+def _to_limbs(values: Iterable[int], count: int) -> np.ndarray:
+    """把（可能为负的）大整数按 64 位分段存为 uint64 数组，负数按 64*count 位补码保存"""
+    modulus = 1 << (64 * count)
+    mask = (1 << 64) - 1
+    rows = []
+    for value in values:
+        value = int(value) % modulus
+        rows.append([(value >> (64 * k)) & mask for k in range(count)])
+    return np.asarray(rows, dtype=np.uint64).reshape(-1, count)
+
+
+def _from_limbs(row: np.ndarray, signed: bool = False) -> int:
+    value = 0
+    for k, limb in enumerate(row.tolist()):
+        value |= int(limb) << (64 * k)
+    bits = 64 * len(row)
+    if signed and value >> (bits - 1):
+        value -= 1 << bits
+    return value
+
+
+class PoolState:
+    """
+    按区块的 Uniswap V3 池子状态（只读）。
+    每条快照：区块时间（纳秒）、区块号、sqrtPriceX96、tick、活跃流动性与 tick 表版本；
+    tick 表版本 v 由第 v // TICK_CHECKPOINT_EVERY 个完整表加上之后的逐条变化还原。
+    """
+
+    def __init__(
+        self,
+        arrays: dict[str, np.ndarray],
+        fee_pips: int,
+        tick_spacing: int,
+        decimals0: int,
+        decimals1: int,
+        base_is_token0: bool = True,
+        cache_size: Optional[int] = None,
+    ):
+        self.arrays = arrays
+        self.fee_pips = int(fee_pips)
+        self.tick_spacing = int(tick_spacing)
+        self.decimals0 = int(decimals0)
+        self.decimals1 = int(decimals1)
+        # 计价资产（ETH）是否为 token0；WETH/USDT 池子中 WETH 为 token0
+        self.base_is_token0 = bool(base_is_token0)
+        self.time = arrays["time"]
+        # 浮点副本只用于向量化的快速路径
+        self._sqrt_price_f = (
+            arrays["sqrt_price"].astype(np.float64)
+            @ (2.0 ** np.array([0.0, 64.0, 128.0]))
+            / float(Q96)
+        )
+        cache_size = int(
+            cache_size
+            if cache_size is not None
+            else POOL_STATE_CONFIG.get("cache_size", 1_000_000)
+        )
+        self._layouts: OrderedDict = OrderedDict()
+        self._curves: OrderedDict = OrderedDict()
+        self._layout_cache_size = 64
+        self._simulate = lru_cache(maxsize=cache_size)(self._simulate_uncached)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    # ---------------- 快照与 tick 表 ----------------
+
+    def index_at(self, times_ns) -> np.ndarray:
+        """每个时间之前（含该时刻）最后一条快照的下标，没有快照时为 -1"""
+        return (
+            np.searchsorted(self.time, np.asarray(times_ns, dtype=np.int64), "right")
+            - 1
+        )
+
+    def snapshot(self, index: int) -> tuple[int, int, int, int]:
+        """返回 (sqrtPriceX96, tick, liquidity, tick 表版本)"""
+        a = self.arrays
+        return (
+            _from_limbs(a["sqrt_price"][index]),
+            int(a["tick"][index]),
+            _from_limbs(a["liquidity"][index]),
+            int(a["layout"][index]),
+        )
+
+    def tick_table(self, version: int) -> tuple[list[int], dict[int, int]]:
+        """还原第 version 个 tick 表版本：(已初始化 tick 升序列表, tick -> liquidityNet)"""
+        cached = self._layouts.get(version)
+        if cached is not None:
+            self._layouts.move_to_end(version)
+            return cached
+        a = self.arrays
+        checkpoint = version // TICK_CHECKPOINT_EVERY
+        lo, hi = a["checkpoint_offsets"][checkpoint : checkpoint + 2]
+        net = {
+            int(t): _from_limbs(row, signed=True)
+            for t, row in zip(a["checkpoint_ticks"][lo:hi], a["checkpoint_net"][lo:hi])
+        }
+        versions = a["delta_version"]
+        start = np.searchsorted(versions, checkpoint * TICK_CHECKPOINT_EVERY, "right")
+        stop = np.searchsorted(versions, version, "right")
+        for t, row in zip(a["delta_tick"][start:stop], a["delta_net"][start:stop]):
+            t = int(t)
+            value = net.get(t, 0) + _from_limbs(row, signed=True)
+            if value:
+                net[t] = value
+            else:
+                net.pop(t, None)
+        table = (sorted(net), net)
+        self._layouts[version] = table
+        if len(self._layouts) > self._layout_cache_size:
+            self._layouts.popitem(last=False)
+        return table
+
+    # ---------------- 兑换模拟 ----------------
+
+    def _simulate_uncached(
+        self, index: int, zero_for_one: bool, amount_in: int
+    ) -> float:
+        sqrt_price, tick, liquidity, version = self.snapshot(index)
+        ticks, net = self.tick_table(version)
+        used, amount_out = swap_exact_input(
+            sqrt_price,
+            tick,
+            liquidity,
+            ticks,
+            net,
+            self.tick_spacing,
+            self.fee_pips,
+            amount_in,
+            zero_for_one,
+        )
+        less_fee = amount_in * (_FEE_DENOMINATOR - self.fee_pips) // _FEE_DENOMINATOR
+        if not less_fee:
+            return float("nan")
+        # 按现价（扣费后）应得的输出：token1 = x * P，token0 = x / P，P = (sqrtPriceX96 / 2^96)^2
+        if zero_for_one:
+            ratio = amount_out * Q192 / (less_fee * sqrt_price * sqrt_price)
+        else:
+            ratio = amount_out * sqrt_price * sqrt_price / (less_fee * Q192)
+        return 1.0 - ratio
+
+    def swap(self, time_ns: int, zero_for_one: bool, amount_in: int) -> tuple[int, int]:
+        """
+        描述：在 time_ns 时刻（含）最后一个区块之后的池子状态上精确模拟一次 exact input 兑换
+        返回值：(实际消耗的输入, 输出)，数量均为最小单位
+        """
+        index = int(self.index_at([time_ns])[0])
+        if index < 0:
+            raise ValueError("该时间之前没有池子快照")
+        sqrt_price, tick, liquidity, version = self.snapshot(index)
+        ticks, net = self.tick_table(version)
+        return swap_exact_input(
+            sqrt_price,
+            tick,
+            liquidity,
+            ticks,
+            net,
+            self.tick_spacing,
+            self.fee_pips,
+            int(amount_in),
+            bool(zero_for_one),
+        )
+
+    def slippage(self, time_ns: int, zero_for_one: bool, amount_in: int) -> float:
+        """精确模拟的滑点（比例）；该时间之前没有快照时为 NaN"""
+        index = int(self.index_at([time_ns])[0])
+        if index < 0 or amount_in <= 0:
+            return float("nan")
+        return self._simulate(index, bool(zero_for_one), int(amount_in))
+
+    def depth_curve(self, version: int) -> dict[str, np.ndarray]:
+        """
+        描述：tick 表版本的深度曲线（浮点）：相邻已初始化 tick 之间每一段的 sqrt 价格与活跃流动性，
+            以及从最低的 tick 起逐段完全穿越所需输入 / 得到输出的前缀和（两个方向各一组）
+        返回值：ticks, sqrt（各 tick 的 sqrt 价格）, liquidity（第 i 段 [ticks[i], ticks[i+1]) 的流动性）,
+            in0 / out1（价格向下：token0 输入、token1 输出）, in1 / out0（价格向上）的前缀和，长度均为 len(ticks)
+        """
+        cached = self._curves.get(version)
+        if cached is not None:
+            self._curves.move_to_end(version)
+            return cached
+        ticks, net = self.tick_table(version)
+        sqrt = np.array(
+            [get_sqrt_ratio_at_tick(t) for t in ticks], dtype=np.float64
+        ) / float(Q96)
+        # 各段的流动性为 liquidityNet 的前缀和（Python 整数累加后再转浮点）
+        running, liquidity = 0, []
+        for t in ticks:
+            running += net[t]
+            liquidity.append(float(running))
+        liquidity = np.asarray(liquidity, dtype=np.float64)
+        lo, hi, seg = sqrt[:-1], sqrt[1:], liquidity[:-1]
+
+        def prefix(values):
+            return np.concatenate(([0.0], np.cumsum(values)))
+
+        curve = {
+            "ticks": np.asarray(ticks, dtype=np.int64),
+            "sqrt": sqrt,
+            "liquidity": liquidity,
+            "in0": prefix(seg * (1.0 / lo - 1.0 / hi)),
+            "out1": prefix(seg * (hi - lo)),
+            "in1": prefix(seg * (hi - lo)),
+            "out0": prefix(seg * (1.0 / lo - 1.0 / hi)),
+        }
+        self._curves[version] = curve
+        if len(self._curves) > self._layout_cache_size:
+            self._curves.popitem(last=False)
+        return curve
+
+    def _walk(
+        self, version: int, index: np.ndarray, down: np.ndarray, x: np.ndarray
+    ) -> np.ndarray:
+        """
+        描述：在同一 tick 表版本的快照上向量化地逐段穿越：先走完当前段，再在前缀和上二分查找兑换结束的段，
+            最后在该段内用闭式解计算
+        参数：index: 快照下标, down: 是否为 token0 输入（价格向下）, x: 扣费后的输入（浮点，最小单位）
+        返回值：输出（浮点）；流动性不足以吃下输入或当前段没有流动性时为 NaN，由调用方精确模拟
+        """
+        curve = self.depth_curve(version)
+        ticks, sqrt, seg_l = curve["ticks"], curve["sqrt"], curve["liquidity"]
+        m = len(ticks)
+        out = np.full(len(index), np.nan)
+        if m < 2:
+            return out
+        r = self._sqrt_price_f[index]
+        # 当前所在段 k：ticks[k] <= tick < ticks[k + 1]
+        k = (
+            np.searchsorted(ticks, self.arrays["tick"][index].astype(np.int64), "right")
+            - 1
+        )
+        inside = (k >= 0) & (k < m - 1)
+        kc = np.clip(k, 0, m - 2)
+        lk = seg_l[kc]
+        inside &= lk > 0
+        s_lo, s_hi = sqrt[kc], sqrt[kc + 1]
+
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            # 价格向下（token0 -> token1）
+            first_in = lk * (1.0 / s_lo - 1.0 / r)
+            first_out = lk * (r - s_lo)
+            rest = x - first_in
+            j = np.searchsorted(curve["in0"], curve["in0"][kc] - rest, "right") - 1
+            jc = np.clip(j, 0, m - 2)
+            rem = rest - (curve["in0"][kc] - curve["in0"][jc + 1])
+            top, lj = sqrt[jc + 1], seg_l[jc]
+            end = lj * top / (lj + rem * top)
+            walked = (
+                first_out
+                + (curve["out1"][kc] - curve["out1"][jc + 1])
+                + lj * (top - end)
+            )
+            local = lk * (r - lk * r / (lk + x * r))
+            down_out = np.where(rest <= 0, local, np.where(j >= 0, walked, np.nan))
+
+            # 价格向上（token1 -> token0）
+            first_in = lk * (s_hi - r)
+            first_out = lk * (1.0 / r - 1.0 / s_hi)
+            rest = x - first_in
+            j = np.searchsorted(curve["in1"], curve["in1"][kc + 1] + rest, "left") - 1
+            jc = np.clip(j, 0, m - 2)
+            rem = rest - (curve["in1"][jc] - curve["in1"][kc + 1])
+            bottom, lj = sqrt[jc], seg_l[jc]
+            end = bottom + rem / lj
+            walked = (
+                first_out
+                + (curve["out0"][jc] - curve["out0"][kc + 1])
+                + rem / (bottom * end)
+            )
+            local = x / (r * (r + x / lk))
+            up_out = np.where(rest <= 0, local, np.where(j < m - 1, walked, np.nan))
+
+        out[inside] = np.where(down, down_out, up_out)[inside]
+        return out
+
+    def slippage_batch(self, times_ns, zero_for_one, amounts_in) -> np.ndarray:
+        """
+        描述：批量计算滑点（比例）。按 tick 表版本分组，在深度曲线上向量化地逐段穿越（浮点，
+            精确模拟逐步向下取整，两者的差别小于 1e-6）；流动性耗尽等少数情况逐个精确模拟，结果按（快照、方向、数量）缓存
+        参数：times_ns: 纳秒时间数组, zero_for_one: 方向数组, amounts_in: 输入数量（最小单位，可以是浮点）
+        返回值：float64 数组；没有快照、数量非正或 NaN 时为 NaN
+        """
+        times_ns = np.asarray(times_ns, dtype=np.int64)
+        zero_for_one = np.asarray(zero_for_one, dtype=bool)
+        amounts = np.asarray(amounts_in, dtype=np.float64)
+        result = np.full(len(times_ns), np.nan)
+        index = self.index_at(times_ns)
+        valid = np.flatnonzero((index >= 0) & (amounts >= 1))
+        if not len(valid):
+            return result
+
+        idx = index[valid]
+        down = zero_for_one[valid]
+        x = (
+            np.floor(amounts[valid])
+            * (_FEE_DENOMINATOR - self.fee_pips)
+            / _FEE_DENOMINATOR
+        )
+        out = np.full(len(valid), np.nan)
+        versions = self.arrays["layout"][idx]
+        # 按时间排序的查询中同一版本是连续的
+        bounds = np.flatnonzero(np.diff(versions)) + 1
+        for rows in np.split(np.arange(len(valid)), bounds):
+            if len(rows):
+                out[rows] = self._walk(
+                    int(versions[rows[0]]), idx[rows], down[rows], x[rows]
+                )
+
+        r = self._sqrt_price_f[idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # 按现价应得的输出：token1 = x * r^2，token0 = x / r^2
+            ideal = np.where(down, x * r * r, x / (r * r))
+            result[valid] = 1.0 - out / ideal
+        for k in np.flatnonzero(np.isnan(out)):
+            result[valid[k]] = self._simulate(
+                int(idx[k]), bool(down[k]), int(amounts[valid[k]])
+            )
+        return result
+
+    def opportunity_slippage(
+        self, opportunities: Sequence[dict[str, Any]], strategy: dict[str, Any]
+    ) -> np.ndarray:
+        """
+        描述：按机会在 Uniswap 一侧的兑换计算滑点：在 Uniswap 买入时投入 initial_investment 的计价资产，
+            在 Uniswap 卖出时卖出 Binance 买到的 ETH（与 analyse 的利润公式一致）
+        返回值：与 opportunities 等长的滑点比例数组（NaN 表示没有快照，调用方回退到平方根法则）
+        """
+        investment = float(strategy["initial_investment"])
+        binance_fee = float(strategy["binance_fee_rate"])
+        base_decimals, quote_decimals = (
+            (self.decimals0, self.decimals1)
+            if self.base_is_token0
+            else (self.decimals1, self.decimals0)
+        )
+        times = (
+            pd.to_datetime([opp["block_time"] for opp in opportunities], utc=True)
+            .as_unit("ns")
+            .asi8
+        )
+        sell_on_dex = np.array(
+            [opp["buy_platform"] != "Uniswap" for opp in opportunities], dtype=bool
+        )
+        buy_price = np.array(
+            [opp["buy_price"] for opp in opportunities], dtype=np.float64
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            amounts = np.where(
+                sell_on_dex,
+                investment * (1 - binance_fee) / buy_price * 10.0**base_decimals,
+                investment * 10.0**quote_decimals,
+            )
+        # 卖出 ETH 时输入的是计价资产以外的一侧
+        zero_for_one = sell_on_dex == self.base_is_token0
+        return self.slippage_batch(times, zero_for_one, np.floor(amounts))
+
+    # ---------------- 持久化 ----------------
+
+    def save(self, path: str) -> None:
+        meta = np.array(
+            [
+                self.fee_pips,
+                self.tick_spacing,
+                self.decimals0,
+                self.decimals1,
+                int(self.base_is_token0),
+            ],
+            dtype=np.int64,
+        )
+        with open(path, "wb") as f:
+            np.savez(f, meta=meta, **self.arrays)
+
+    @classmethod
+    def load(cls, path: str, cache_size: Optional[int] = None) -> "PoolState":
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files if key != "meta"}
+            fee_pips, tick_spacing, decimals0, decimals1, base = data["meta"].tolist()
+        return cls(
+            arrays, fee_pips, tick_spacing, decimals0, decimals1, bool(base), cache_size
+        )
+
+
+def build_pool_state(
+    pool: dict[str, Any],
+    ticks: Iterable[dict[str, Any]],
+    events: Iterable[dict[str, Any]],
+    base_is_token0: bool = True,
+) -> PoolState:
+    """
+    描述：由起始区块的池子状态与 tick 表，加上之后的 Swap / Mint / Burn 事件，构建按区块的快照
+    参数：pool: The Graph 的 pool 实体（feeTier、sqrtPrice、tick、liquidity、token0/token1.decimals，
+            以及起始快照的 timestamp 与 block）,
+        ticks: 起始区块的 tick 实体（tickIdx、liquidityNet）,
+        events: 事件字典，type 为 swap（sqrtPriceX96、tick）或 mint / burn（tickLower、tickUpper、amount），
+            都带 timestamp、blockNumber、logIndex
+    返回值：PoolState；每个区块取区块内最后一个事件之后的状态，活跃流动性按 tick 表由当前 tick 推出
+    """
+    fee_pips = int(pool["feeTier"])
+    tick_spacing = int(pool.get("tickSpacing") or FEE_TICK_SPACING[fee_pips])
+    net: dict[int, int] = {}
+    for t in ticks:
+        value = int(t["liquidityNet"])
+        if value:
+            net[int(t["tickIdx"])] = value
+
+    checkpoint_ticks, checkpoint_net, checkpoint_offsets = [], [], [0]
+
+    def add_checkpoint():
+        for t in sorted(net):
+            checkpoint_ticks.append(t)
+            checkpoint_net.append(net[t])
+        checkpoint_offsets.append(len(checkpoint_ticks))
+
+    prefix: tuple[list[int], list[int]] = ([], [])
+
+    def refresh_prefix():
+        ordered_ticks = sorted(net)
+        sums, total = [], 0
+        for t in ordered_ticks:
+            total += net[t]
+            sums.append(total)
+        prefix[0][:] = ordered_ticks
+        prefix[1][:] = sums
+
+    def active_liquidity(tick: int) -> int:
+        i = bisect_right(prefix[0], tick) - 1
+        return prefix[1][i] if i >= 0 else 0
+
+    add_checkpoint()
+    refresh_prefix()
+    version = 0
+    delta_version, delta_tick, delta_net = [], [], []
+    sqrt_price = int(pool["sqrtPrice"])
+    tick = int(pool["tick"])
+    liquidity = active_liquidity(tick)
+    if liquidity != int(pool.get("liquidity", liquidity)):
+        logger.warning(
+            f"tick 表推出的活跃流动性 {liquidity} 与池子记录的 {pool['liquidity']} 不一致"
+        )
+    rows = [
+        (
+            int(pool["timestamp"]) * 1_000_000_000,
+            int(pool.get("block", 0)),
+            sqrt_price,
+            tick,
+            liquidity,
+            version,
+        )
+    ]
+
+    ordered = sorted(events, key=lambda e: (int(e["blockNumber"]), int(e["logIndex"])))
+    for block, group in _group_by_block(ordered):
+        changed = False
+        for event in group:
+            if event["type"] == "swap":
+                sqrt_price = int(event["sqrtPriceX96"])
+                tick = int(event["tick"])
+                continue
+            amount = int(event["amount"])
+            if event["type"] == "burn":
+                amount = -amount
+            if not amount:
+                continue
+            if not changed:
+                version += 1
+                changed = True
+            for t, value in (
+                (int(event["tickLower"]), amount),
+                (int(event["tickUpper"]), -amount),
+            ):
+                delta_version.append(version)
+                delta_tick.append(t)
+                delta_net.append(value)
+                total = net.get(t, 0) + value
+                if total:
+                    net[t] = total
+                else:
+                    net.pop(t, None)
+        if changed:
+            refresh_prefix()
+            if version % TICK_CHECKPOINT_EVERY == 0:
+                add_checkpoint()
+        rows.append(
+            (
+                int(group[-1]["timestamp"]) * 1_000_000_000,
+                block,
+                sqrt_price,
+                tick,
+                active_liquidity(tick),
+                version,
+            )
+        )
+
+    arrays = {
+        "time": np.array([r[0] for r in rows], dtype=np.int64),
+        "block": np.array([r[1] for r in rows], dtype=np.int64),
+        "sqrt_price": _to_limbs((r[2] for r in rows), 3),
+        "tick": np.array([r[3] for r in rows], dtype=np.int32),
+        "liquidity": _to_limbs((r[4] for r in rows), 2),
+        "layout": np.array([r[5] for r in rows], dtype=np.int32),
+        "checkpoint_offsets": np.array(checkpoint_offsets, dtype=np.int64),
+        "checkpoint_ticks": np.array(checkpoint_ticks, dtype=np.int32),
+        "checkpoint_net": _to_limbs(checkpoint_net, 2),
+        "delta_version": np.array(delta_version, dtype=np.int32),
+        "delta_tick": np.array(delta_tick, dtype=np.int32),
+        "delta_net": _to_limbs(delta_net, 2),
+    }
+    return PoolState(
+        arrays,
+        fee_pips,
+        tick_spacing,
+        int(pool["token0"]["decimals"]),
+        int(pool["token1"]["decimals"]),
+        base_is_token0,
+    )
+
+
+def _group_by_block(events: list[dict[str, Any]]):
+    group: list[dict[str, Any]] = []
+    for event in events:
+        if group and int(event["blockNumber"]) != int(group[-1]["blockNumber"]):
+            yield int(group[-1]["blockNumber"]), group
+            group = []
+        group.append(event)
+    if group:
+        yield int(group[-1]["blockNumber"]), group
+
+
+# ---------------- 采集 ----------------
+
+_GRAPH_FIELDS = {
+    "swaps": "sqrtPriceX96 tick",
+    "mints": "tickLower tickUpper amount",
+    "burns": "tickLower tickUpper amount",
+}
+
+
+def _graph_query(query: str) -> dict[str, Any]:
+    headers = {
+        "Authorization": f"Bearer {graph_config['api_key']}",
+        "Content-Type": "application/json",
+    }
+    for attempt in range(3):
+        try:
+            response = requests.post(
+                graph_config["graph_api_url"],
+                json={"query": query},
+                headers=headers,
+                timeout=30,
+            )
+            response.raise_for_status()
+            return response.json()["data"]
+        except (requests.exceptions.RequestException, KeyError) as exc:
+            if attempt == 2:
+                raise
+            logger.warning(f"请求失败: {exc}，5秒后重试...")
+            time.sleep(5)
+
+
+def fetch_pool_events(
+    pool_address: str, start_ts: int, end_ts: int
+) -> list[dict[str, Any]]:
+    """
+    描述：分页获取时间范围内改变池子状态的 Swap / Mint / Burn 事件
+    返回值：事件字典列表（未排序），type 为 swap / mint / burn
+    """
+    events = []
+    for entity, fields in _GRAPH_FIELDS.items():
+        last_id = ""
+        while True:
+            data = _graph_query(f"""
+                {{
+                  {entity}(
+                    first: 1000
+                    orderBy: id
+                    orderDirection: asc
+                    where: {{
+                      pool: "{pool_address}"
+                      timestamp_gte: {start_ts}
+                      timestamp_lte: {end_ts}
+                      id_gt: "{last_id}"
+                    }}
+                  ) {{
+                    id
+                    timestamp
+                    logIndex
+                    {fields}
+                    transaction {{ blockNumber }}
+                  }}
+                }}
+                """)
+            rows = data[entity]
+            if not rows:
+                break
+            for row in rows:
+                event = {key: row[key] for key in row if key != "transaction"}
+                event["type"] = entity[:-1]
+                event["blockNumber"] = row["transaction"]["blockNumber"]
+                events.append(event)
+            last_id = rows[-1]["id"]
+        logger.info(f"已获取 {entity}: 累计 {len(events)} 条事件")
+    return events
+
+
+def fetch_pool_snapshot(
+    pool_address: str, block: int
+) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+    """
+    描述：获取指定区块的池子状态与全部已初始化 tick（liquidityNet 非 0）
+    返回值：(pool, ticks)
+    """
+    pool = _graph_query(f"""
+        {{
+          pool(id: "{pool_address}", block: {{ number: {block} }}) {{
+            feeTier
+            sqrtPrice
+            tick
+            liquidity
+            token0 {{ decimals }}
+            token1 {{ decimals }}
+          }}
+        }}
+        """)["pool"]
+    ticks, last_tick = [], MIN_TICK - 1
+    while True:
+        rows = _graph_query(f"""
+            {{
+              ticks(
+                first: 1000
+                orderBy: tickIdx
+                orderDirection: asc
+                block: {{ number: {block} }}
+                where: {{ pool: "{pool_address}", tickIdx_gt: {last_tick}, liquidityNet_not: "0" }}
+              ) {{
+                tickIdx
+                liquidityNet
+              }}
+            }}
+            """)["ticks"]
+        if not rows:
+            break
+        ticks.extend(rows)
+        last_tick = int(rows[-1]["tickIdx"])
+    pool["block"] = block
+    return pool, ticks
+
+
+def fetch_pool_state(pool_address: str, start_ts: int, end_ts: int) -> dict[str, Any]:
+    """
+    描述：从 The Graph 获取构建快照所需的数据：第一个事件之前一个区块的池子与 tick 表，加上区间内的事件
+    返回值：{"pool", "ticks", "events"}，格式与本地夹具相同，可直接 json.dump 保存
+    """
+    events = fetch_pool_events(pool_address, start_ts, end_ts)
+    if not events:
+        raise ValueError("时间范围内没有池子事件")
+    first_block = min(int(e["blockNumber"]) for e in events)
+    pool, ticks = fetch_pool_snapshot(pool_address, first_block - 1)
+    pool["timestamp"] = start_ts
+    return {"pool": pool, "ticks": ticks, "events": events}
+
+
+def load_fixture(path: str) -> dict[str, Any]:
+    """读取本地夹具（fetch_pool_state 返回值的 JSON）"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def ingest(data: dict[str, Any], path: Optional[str] = None) -> PoolState:
+    """
+    描述：由 fetch_pool_state / load_fixture 的数据构建快照并保存为 .npz
+    返回值：PoolState
+    """
+    state = build_pool_state(data["pool"], data["ticks"], data["events"])
+    path = path or POOL_STATE_CONFIG.get("path", "./pool_state.npz")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    state.save(path)
+    _loaded.pop(path, None)
+    logger.info(f"已保存 {len(state)} 个区块的池子快照到 {path}")
+    return state
+
+
+# 已加载的快照（路径 -> (修改时间, PoolState)），多次分析共用精确模拟的缓存
+_loaded: dict[str, tuple[float, PoolState]] = {}
+
+
+def load_pool_state(path: Optional[str] = None) -> Optional[PoolState]:
+    """
+    描述：加载保存的池子快照；文件修改后重新加载
+    返回值：PoolState；文件不存在时返回 None
+    """
+    path = path or POOL_STATE_CONFIG.get("path", "./pool_state.npz")
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        logger.warning(f"池子快照 {path} 不存在")
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, PoolState.load(path))
+        _loaded[path] = cached
+    return cached[1]
+
+
+def slippage_model(strategy: dict[str, Any]) -> str:
+    """滑点模型：strategy 中的 slippage_model 优先，其次是配置 pool_state.slippage_model"""
+    return str(
+        strategy.get("slippage_model")
+        or POOL_STATE_CONFIG.get("slippage_model")
+        or "sqrt"
+    )
+
+
+# ---------------- 基准 ----------------
+
+
+def synthetic_pool_data(
+    blocks: int = 10_000, seed: int = 7, price: float = 3000.0
+) -> dict[str, Any]:
+    """
+    描述：生成 WETH/USDT 0.05% 池子的合成数据（与 fetch_pool_state 格式相同）：
+        现价附近若干流动性区间（包括很薄的 tick），tick 随机游走，偶尔有 Mint / Burn
+    """
+    rng = np.random.default_rng(seed)
+    spacing = FEE_TICK_SPACING[500]
+    # 原始单位的价格：USDT(6 位) / WETH(18 位)
+    tick0 = int(np.floor(np.log(price * 1e-12) / np.log(1.0001)))
+    center = tick0 // spacing * spacing
+    positions = []
+    for _ in range(200):
+        lower = center + int(rng.integers(-300, 300)) * spacing
+        width = int(rng.integers(1, 60)) * spacing
+        positions.append((lower, lower + width, int(rng.lognormal(36, 1.5))))
+    # 宽区间的底仓，保证价格游走时始终有流动性
+    positions.append((center - 2000 * spacing, center + 2000 * spacing, 10**17))
+
+    net: dict[int, int] = {}
+    for lower, upper, amount in positions:
+        net[lower] = net.get(lower, 0) + amount
+        net[upper] = net.get(upper, 0) - amount
+    ticks = [{"tickIdx": str(t), "liquidityNet": str(v)} for t, v in net.items() if v]
+
+    def sqrt_price_in(tick: int) -> int:
+        lo, hi = get_sqrt_ratio_at_tick(tick), get_sqrt_ratio_at_tick(tick + 1)
+        return lo + int((hi - lo) * float(rng.random()))
+
+    start_ts = int(pd.Timestamp("2025-09-01", tz="UTC").timestamp())
+    pool = {
+        "feeTier": "500",
+        "sqrtPrice": str(sqrt_price_in(tick0)),
+        "tick": str(tick0),
+        "liquidity": str(sum(v for t, v in net.items() if t <= tick0)),
+        "token0": {"decimals": "18"},
+        "token1": {"decimals": "6"},
+        "timestamp": start_ts,
+        "block": 20_000_000,
+    }
+    events = []
+    tick = tick0
+    for k in range(1, blocks + 1):
+        block, ts = 20_000_000 + k, start_ts + 12 * k
+        tick = int(
+            np.clip(
+                tick + rng.integers(-40, 41),
+                center - 1500 * spacing,
+                center + 1500 * spacing,
+            )
+        )
+        events.append(
+            {
+                "type": "swap",
+                "timestamp": str(ts),
+                "blockNumber": str(block),
+                "logIndex": "1",
+                "sqrtPriceX96": str(sqrt_price_in(tick)),
+                "tick": str(tick),
+            }
+        )
+        if rng.random() < 0.05:
+            lower = center + int(rng.integers(-300, 300)) * spacing
+            events.append(
+                {
+                    "type": "mint",
+                    "timestamp": str(ts),
+                    "blockNumber": str(block),
+                    "logIndex": "2",
+                    "tickLower": str(lower),
+                    "tickUpper": str(lower + int(rng.integers(1, 60)) * spacing),
+                    "amount": str(int(rng.lognormal(36, 1.5))),
+                }
+            )
+    return {"pool": pool, "ticks": ticks, "events": events}
+
+
+def benchmark(
+    blocks: int = 10_000, opportunities: int = 1_000_000, investment: float = 1000.0
+) -> dict[str, Any]:
+    """
+    描述：在合成池子上批量计算 opportunities 条机会的滑点，报告吞吐、走精确模拟的比例，
+        以及只用精确模拟（不缓存）时的单条耗时
+    返回值：统计字典
+    """
+    state = build_pool_state(*synthetic_pool_data(blocks).values())
+    rng = np.random.default_rng(1)
+    times = rng.integers(state.time[0], state.time[-1], opportunities)
+    times.sort()
+    zero_for_one = rng.random(opportunities) < 0.5
+    amounts = np.where(
+        zero_for_one, investment / 3000.0 * 1e18, investment * 1e6
+    ) * rng.uniform(0.2, 50, opportunities)
+
+    started = time.perf_counter()
+    slippage = state.slippage_batch(times, zero_for_one, np.floor(amounts))
+    elapsed = time.perf_counter() - started
+    info = state._simulate.cache_info()
+
+    sample = min(opportunities, 2000)
+    started = time.perf_counter()
+    for k in range(sample):
+        state._simulate_uncached(
+            int(state.index_at([times[k]])[0]), bool(zero_for_one[k]), int(amounts[k])
+        )
+    exact_us = (time.perf_counter() - started) / sample * 1e6
+
+    result = {
+        "opportunities": opportunities,
+        "snapshots": len(state),
+        "seconds": round(elapsed, 3),
+        "per_second": round(opportunities / elapsed),
+        "exact_fraction": round((info.hits + info.misses) / opportunities, 4),
+        "exact_us_per_swap": round(exact_us, 1),
+        "median_slippage_pct": round(float(np.nanmedian(slippage)) * 100, 4),
+    }
+    logger.info(f"V3 滑点基准: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Uniswap V3 池子快照采集与滑点基准")
+    parser.add_argument(
+        "--benchmark", action="store_true", help="在合成池子上测量批量滑点吞吐"
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000, help="基准的机会条数")
+    parser.add_argument("--pool", default=graph_config.get("uniswap_pool_address"))
+    parser.add_argument("--start", help="采集起始时间（UTC）")
+    parser.add_argument("--end", help="采集结束时间（UTC）")
+    parser.add_argument("--fixture", help="从本地 JSON 夹具构建，而不是请求 The Graph")
+    parser.add_argument(
+        "--save-fixture", help="把从 The Graph 获取的数据另存为 JSON 夹具"
+    )
+    parser.add_argument("--out", help="快照保存路径（默认 pool_state.path）")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(opportunities=args.rows)
+    else:
+        if args.fixture:
+            data = load_fixture(args.fixture)
+        else:
+            data = fetch_pool_state(
+                args.pool,
+                int(pd.Timestamp(args.start, tz="UTC").timestamp()),
+                int(pd.Timestamp(args.end, tz="UTC").timestamp()),
+            )
+            if args.save_fixture:
+                with open(args.save_fixture, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+        ingest(data, args.out)
@@ -1,20 +1,66 @@
 import argparse
 import datetime
+import io
+import json
+import queue
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional
 
 import pandas as pd
 import psycopg2
 import yaml
 from loguru import logger
-from psycopg2.extras import execute_values
 
+from . import columnar, rollup, symbols
 from .task import check_task, update_task_status
 
 with open("./config/config.yaml", "r", encoding="utf-8") as file:
     config = yaml.safe_load(file)
 
 DEFAULT_DB_CONFIG = config.get("db", {})
+PROCESS_PRICES_CONFIG = config.get("process_prices", {}) or {}
+# 每个聚合分片覆盖的天数（一条语句聚合整个分片，而不是逐天查询）
+DEFAULT_CHUNK_DAYS = int(PROCESS_PRICES_CONFIG.get("chunk_days", 7))
+# 并行执行分片查询的数据库连接数
+DEFAULT_PARALLEL_CONNECTIONS = int(PROCESS_PRICES_CONFIG.get("parallel_connections", 4))
+# client: 聚合结果取回 Python 再写入；server: 在数据库内 INSERT ... SELECT，数据不出库
+DEFAULT_WRITE_MODE = PROCESS_PRICES_CONFIG.get("write_mode", "client")
+# 已物化 K 线的区间直接由 ohlcv_bars 汇总，不再扫描原始成交
+DEFAULT_USE_BARS = bool(PROCESS_PRICES_CONFIG.get("use_bars", True))
+
+# 以 (粒度, 时间桶, 数据源) 为主键，不同粒度与时间范围的聚合结果可以并存、独立刷新
+AGGREGATED_PRICES_DDL = """
+CREATE TABLE IF NOT EXISTS aggregated_prices (
+    bucket_interval text NOT NULL DEFAULT '1m',
+    time_bucket timestamptz NOT NULL,
+    source text NOT NULL,
+    average_price numeric NOT NULL,
+    PRIMARY KEY (bucket_interval, time_bucket, source)
+)
+"""
+
+# 旧表（无粒度列，主键为 (time_bucket, source) 或没有主键）迁移为新主键，已有数据视为 1m；
+# 没有主键的旧表在非覆盖模式下会重复追加同一时间桶，加主键前每个 (time_bucket, source)
+# 只保留最后写入的一行（表只追加写入，ctid 最大的即最新）
+_AGGREGATED_PRICES_MIGRATION = """
+ALTER TABLE aggregated_prices ADD COLUMN IF NOT EXISTS bucket_interval text NOT NULL DEFAULT '1m';
+ALTER TABLE aggregated_prices DROP CONSTRAINT IF EXISTS aggregated_prices_pkey;
+DELETE FROM aggregated_prices WHERE time_bucket IS NULL OR source IS NULL;
+DELETE FROM aggregated_prices a
+USING aggregated_prices b
+WHERE a.time_bucket = b.time_bucket AND a.source = b.source AND a.ctid < b.ctid;
+ALTER TABLE aggregated_prices ADD PRIMARY KEY (bucket_interval, time_bucket, source);
+"""
+
+_UPSERT_CONFLICT = """
+ON CONFLICT (bucket_interval, time_bucket, source)
+DO UPDATE SET average_price = EXCLUDED.average_price
+"""
+
+# COPY 的暂存表（会话级临时表，提交时清空）
+STAGING_TABLE = "aggregated_prices_staging"
 
 # 解析时间间隔
 interval_map = {
@@ -26,42 +72,75 @@ interval_map = {
     "1d": 86400,
 }
 
-# 使用数学取整法进行任意时间间隔分桶
-# 这种写法兼容性好，支持 5m, 15m 等非标准 date_trunc 粒度
-sql_query = """
+# 使用 date_bin 进行任意时间间隔分桶（以 Unix 纪元为原点，与 floor(epoch / n) * n 结果相同）
+# 过滤条件直接作用在原始时间列上，可以使用 trade_time / block_time 上的索引
+BUCKET_ORIGIN = "TIMESTAMPTZ '1970-01-01 00:00:00+00'"
+sql_query = f"""
 (
     SELECT 
-        to_timestamp(floor(extract(epoch from block_time) / %s) * %s) AS time_bucket,
+        date_bin(%s * INTERVAL '1 second', block_time, {BUCKET_ORIGIN}) AS time_bucket,
         'Uniswap' AS source,
         AVG(price) AS average_price
     FROM 
         uniswap_swaps
     WHERE 
-        block_time BETWEEN %s AND %s
+        block_time >= %s AND block_time < %s AND {symbols.DEFAULT_SYMBOL_FILTER}
     GROUP BY 
         1
 )
 UNION ALL
 (
     SELECT 
-        to_timestamp(floor(extract(epoch from trade_time) / %s) * %s) AS time_bucket,
+        date_bin(%s * INTERVAL '1 second', trade_time, {BUCKET_ORIGIN}) AS time_bucket,
         'Binance' AS source,
         AVG(price) AS average_price
     FROM 
         binance_trades
     WHERE 
-        trade_time BETWEEN %s AND %s
+        trade_time >= %s AND trade_time < %s AND {symbols.DEFAULT_SYMBOL_FILTER}
     GROUP BY 
         1
 );
 """
 
+# 支持分片聚合的索引：brin 体积极小、适合按时间追加写入的大表；
+# covering 为 (时间) INCLUDE (price) 的 B 树索引，可以仅扫描索引完成聚合
+AGGREGATION_INDEXES = {
+    "brin": {
+        "binance_trades_trade_time_brin": "binance_trades USING brin (trade_time) WITH (pages_per_range = 32)",
+        "uniswap_swaps_block_time_brin": "uniswap_swaps USING brin (block_time) WITH (pages_per_range = 32)",
+    },
+    "covering": {
+        "binance_trades_trade_time_price_idx": "binance_trades (trade_time) INCLUDE (price)",
+        "uniswap_swaps_block_time_price_idx": "uniswap_swaps (block_time) INCLUDE (price)",
+    },
+}
+DEFAULT_INDEX_MODE = PROCESS_PRICES_CONFIG.get("index_mode", "brin")
+# 每次任务用 EXPLAIN 检查第一个分片的执行计划是否走索引
+DEFAULT_EXPLAIN_CHECK = bool(PROCESS_PRICES_CONFIG.get("explain_check", True))
+_RAW_TABLES = ("binance_trades", "uniswap_swaps")
 
-def _daterange(start: datetime.datetime, end: datetime.datetime):
-    cursor = start
-    while cursor <= end:
-        yield cursor
-        cursor += datetime.timedelta(days=1)
+
+def _day_chunks(
+    start: datetime.datetime, end: datetime.datetime, chunk_days: int
+) -> list[tuple[datetime.datetime, datetime.datetime]]:
+    """
+    描述：把 [start 当天 00:00, end 次日 00:00) 按 chunk_days 天切分为左闭右开的区间
+        分片边界都在 UTC 零点，而所有聚合粒度都能整除一天，因此同一时间桶不会跨分片
+    """
+    cursor = datetime.datetime(
+        start.year, start.month, start.day, tzinfo=datetime.timezone.utc
+    )
+    stop = datetime.datetime(
+        end.year, end.month, end.day, tzinfo=datetime.timezone.utc
+    ) + datetime.timedelta(days=1)
+    step = datetime.timedelta(days=max(1, int(chunk_days)))
+    chunks = []
+    while cursor < stop:
+        chunk_end = min(cursor + step, stop)
+        chunks.append((cursor, chunk_end))
+        cursor = chunk_end
+    return chunks
 
 
 def _parse_date(value: Optional[str], default: datetime.datetime) -> datetime.datetime:
@@ -73,24 +152,347 @@ def _parse_date(value: Optional[str], default: datetime.datetime) -> datetime.da
     return dt.astimezone(datetime.timezone.utc)
 
 
-def _write_aggregated_prices(conn, df: pd.DataFrame, overwrite: bool):
+def _interval_label(interval_seconds: int) -> str:
+    """聚合粒度秒数 -> 写入 bucket_interval 的标签（如 60 -> '1m'）"""
+    for label, seconds in interval_map.items():
+        if seconds == interval_seconds:
+            return label
+    return f"{interval_seconds}s"
+
+
+def ensure_aggregated_prices_table(conn):
+    """
+    描述：创建 aggregated_prices 表，或把旧表迁移为 (bucket_interval, time_bucket, source) 主键
+        在独立的短事务中执行并提交，避免聚合期间长时间持有表锁
+    """
+    with conn.cursor() as cur:
+        cur.execute(AGGREGATED_PRICES_DDL)
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema()
+              AND table_name = 'aggregated_prices' AND column_name = 'bucket_interval'
+            """)
+        if not cur.fetchone():
+            logger.info("正在迁移 aggregated_prices 表结构...")
+            cur.execute(_AGGREGATED_PRICES_MIGRATION)
+    conn.commit()
+
+
+def _clear_range(
+    cur,
+    interval_label: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> int:
+    """覆盖模式：只删除本次请求的粒度与时间范围 [start, end) 内的旧数据"""
+    cur.execute(
+        """
+        DELETE FROM aggregated_prices
+        WHERE bucket_interval = %s AND time_bucket >= %s AND time_bucket < %s
+        """,
+        (interval_label, start, end),
+    )
+    logger.info(
+        f"已清除 {interval_label} 粒度 {start} - {end} 的旧数据 {cur.rowcount} 条"
+    )
+    return cur.rowcount
+
+
+def _write_aggregated_prices(
+    conn, df: pd.DataFrame, interval_label: str = "1m", commit: bool = True
+):
+    """
+    描述：COPY 到临时暂存表后 INSERT ... ON CONFLICT 写入，重复的时间桶直接更新
+    返回值：写入的记录数
+    """
     logger.info(f"准备写入 {len(df)} 条聚合记录")
+    buffer = io.StringIO()
+    df[["time_bucket", "source", "average_price"]].to_csv(
+        buffer, index=False, header=False
+    )
+    buffer.seek(0)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+                time_bucket timestamptz, source text, average_price numeric
+            ) ON COMMIT DELETE ROWS
+            """)
+        cur.execute(f"TRUNCATE {STAGING_TABLE}")
+        cur.copy_expert(
+            f"COPY {STAGING_TABLE} (time_bucket, source, average_price) "
+            "FROM STDIN WITH (FORMAT CSV)",
+            buffer,
+        )
+        cur.execute(
+            f"""
+            INSERT INTO aggregated_prices (bucket_interval, time_bucket, source, average_price)
+            SELECT %s, time_bucket, source, average_price FROM {STAGING_TABLE}
+            """ + _UPSERT_CONFLICT,
+            (interval_label,),
+        )
+    if commit:
+        conn.commit()
+    logger.info(f"聚合结果写入完成，写入 {len(df)} 条记录")
+    return len(df)
+
+
+def _connect():
+    return psycopg2.connect(
+        host=DEFAULT_DB_CONFIG["host"],
+        port=DEFAULT_DB_CONFIG["port"],
+        dbname=DEFAULT_DB_CONFIG["database"],
+        user=DEFAULT_DB_CONFIG["username"],
+        password=DEFAULT_DB_CONFIG["password"],
+    )
+
+
+def _chunk_query(
+    cur,
+    interval_seconds: int,
+    chunk_start: datetime.datetime,
+    chunk_end: datetime.datetime,
+    use_bars: bool,
+) -> tuple[str, tuple]:
+    """选择分片的聚合语句：已物化的区间由 K 线汇总，否则扫描原始成交"""
+    if use_bars and rollup.is_covered(cur, chunk_start, chunk_end, interval_seconds):
+        logger.info(f"分片 {chunk_start.date()} - {chunk_end.date()} 使用 K 线汇总")
+        return rollup.bars_average_query, (interval_seconds, chunk_start, chunk_end)
+    return sql_query, _chunk_params(interval_seconds, chunk_start, chunk_end)
+
+
+def _prepare_bars(conn) -> bool:
+    """确保 K 线表存在；失败时退回到扫描原始成交"""
+    try:
+        rollup.ensure_rollup_tables(conn)
+        conn.commit()
+        return True
+    except Exception as exc:
+        conn.rollback()
+        logger.warning(f"K 线表不可用，使用原始成交聚合: {exc}")
+        return False
+
+
+def _aggregate_chunk(
+    connections: queue.Queue,
+    interval_seconds: int,
+    chunk_start: datetime.datetime,
+    chunk_end: datetime.datetime,
+    use_bars: bool = False,
+) -> list[tuple]:
+    """从连接池借出一个连接，用一条语句聚合整个分片"""
+    conn = connections.get()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                *_chunk_query(cur, interval_seconds, chunk_start, chunk_end, use_bars)
+            )
+            rows = cur.fetchall()
+        # 只读查询，结束事务避免连接长时间处于 idle in transaction
+        conn.rollback()
+        return rows
+    finally:
+        connections.put(conn)
+
+
+def _chunk_params(interval_seconds: int, chunk_start, chunk_end) -> tuple:
+    return (
+        interval_seconds,
+        chunk_start,
+        chunk_end,
+        interval_seconds,
+        chunk_start,
+        chunk_end,
+    )
+
+
+def ensure_aggregation_indexes(conn, mode: str = DEFAULT_INDEX_MODE) -> list[str]:
+    """
+    描述：创建分片聚合使用的索引（已存在则跳过）
+        使用 CREATE INDEX CONCURRENTLY，建索引期间不阻塞采集任务写入；需要临时切换为自动提交
+    参数：conn: 数据库连接, mode: brin / covering / none
+    返回值：本次新建的索引名
+    """
+    indexes = AGGREGATION_INDEXES.get(mode, {})
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT indexname FROM pg_indexes"
+            " WHERE schemaname = current_schema() AND indexname = ANY(%s)",
+            (list(indexes),),
+        )
+        existing = {row[0] for row in cur.fetchall()}
+    conn.rollback()
+    missing = [name for name in indexes if name not in existing]
+    if not missing:
+        return []
+
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name in missing:
+                logger.info(f"正在创建聚合索引 {name} ...")
+                cur.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {indexes[name]}"
+                )
+    finally:
+        conn.autocommit = autocommit
+    return missing
+
+
+def _plan_scans(plan: dict, scans: Optional[dict] = None) -> dict:
+    """递归收集执行计划中每张表的扫描方式"""
+    if scans is None:
+        scans = {}
+    relation = plan.get("Relation Name")
+    if relation:
+        scans.setdefault(relation, []).append(plan.get("Node Type"))
+    for child in plan.get("Plans", []):
+        _plan_scans(child, scans)
+    return scans
+
+
+def explain_chunk(cur, query: str, params: tuple) -> dict:
+    """
+    描述：EXPLAIN 分片聚合语句（不实际执行），检查原始成交表是否走索引
+    返回值：{"scans": {表名: [扫描节点类型]}, "seq_scans": [全表扫描的表], "total_cost": 估算代价}
+    """
+    cur.execute("EXPLAIN (FORMAT JSON) " + query.strip().rstrip(";"), params)
+    raw = cur.fetchone()[0]
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    plan = raw[0]["Plan"]
+    scans = _plan_scans(plan)
+    seq_scans = sorted(
+        table
+        for table, nodes in scans.items()
+        if table in _RAW_TABLES and "Seq Scan" in nodes
+    )
+    return {
+        "scans": scans,
+        "seq_scans": seq_scans,
+        "total_cost": plan.get("Total Cost"),
+    }
+
+
+def _self_check_plan(conn, interval_seconds: int, chunk_start, chunk_end):
+    """对第一个分片做执行计划自检，全表扫描原始成交表时给出警告（不影响任务执行）"""
+    try:
+        with conn.cursor() as cur:
+            report = explain_chunk(
+                cur, sql_query, _chunk_params(interval_seconds, chunk_start, chunk_end)
+            )
+        conn.rollback()
+    except Exception as exc:
+        conn.rollback()
+        logger.warning(f"执行计划自检失败: {exc}")
+        return None
+    if report["seq_scans"]:
+        logger.warning(
+            f"聚合语句对 {report['seq_scans']} 使用了全表扫描，"
+            f"请检查索引或统计信息（ANALYZE）: {report['scans']}"
+        )
+    else:
+        logger.info(
+            f"执行计划自检通过: {report['scans']}，估算代价 {report['total_cost']}"
+        )
+    return report
+
+
+def _prepare_indexes(
+    conn, index_mode: str, explain_check: bool, interval_seconds, chunk
+):
+    """建索引与执行计划自检都是优化手段，失败只记录警告"""
+    try:
+        ensure_aggregation_indexes(conn, index_mode)
+    except Exception as exc:
+        conn.rollback()
+        logger.warning(f"创建聚合索引失败: {exc}")
+    if explain_check:
+        _self_check_plan(conn, interval_seconds, *chunk)
+
+
+def _aggregate_server_side(
+    conn,
+    task_id: str,
+    chunks: list[tuple[datetime.datetime, datetime.datetime]],
+    interval_seconds: int,
+    overwrite: bool,
+    use_bars: bool = False,
+) -> Optional[int]:
+    """
+    描述：在数据库内完成聚合与写入（INSERT INTO ... SELECT ... ON CONFLICT），结果不经过 Python
+        覆盖模式下先删除本次粒度与时间范围内的旧数据；所有操作在同一事务中，
+        分片之间检查任务是否被取消。调用方负责提交或回滚。
+    参数：conn: 写入连接, task_id: 任务ID, chunks: 分片区间, interval_seconds: 聚合粒度, overwrite: 是否覆盖
+    返回值：写入行数；任务被取消时返回 None
+    """
+    interval_label = _interval_label(interval_seconds)
+    total_rows = 0
     with conn.cursor() as cur:
         if overwrite:
-            logger.info("正在重建 aggregated_prices 表...")
-            cur.execute("DROP TABLE IF EXISTS aggregated_prices")
+            _clear_range(cur, interval_label, chunks[0][0], chunks[-1][1])
+        for chunk_start, chunk_end in chunks:
+            if check_task(task_id):
+                return None
+            query, params = _chunk_query(
+                cur, interval_seconds, chunk_start, chunk_end, use_bars
+            )
             cur.execute(
-                "CREATE TABLE IF NOT EXISTS aggregated_prices (time_bucket timestamptz, source text, average_price numeric)"
+                "INSERT INTO aggregated_prices (bucket_interval, time_bucket, source, average_price) "
+                f"SELECT %s, q.* FROM ({query.strip().rstrip(';')}) AS q"
+                + _UPSERT_CONFLICT,
+                (interval_label, *params),
+            )
+            total_rows += max(cur.rowcount, 0)
+            logger.info(
+                f"分片 {chunk_start.date()} - {chunk_end.date()} 写入 {cur.rowcount} 条记录"
             )
-        records = df[["time_bucket", "source", "average_price"]].values.tolist()
-        execute_values(
-            cur,
-            "INSERT INTO aggregated_prices (time_bucket, source, average_price) VALUES %s",
-            records,
-            page_size=10000,
+    return total_rows
+
+
+def _run_server_side(
+    task_id: str,
+    chunks: list[tuple[datetime.datetime, datetime.datetime]],
+    interval_seconds: int,
+    overwrite: bool,
+    use_bars: bool,
+    index_mode: str = DEFAULT_INDEX_MODE,
+    explain_check: bool = False,
+):
+    logger.info(f"正在数据库内聚合写入，共 {len(chunks)} 个分片")
+    conn = _connect()
+    start_time = time.time()
+    try:
+        symbols.ensure_symbol_columns(conn)
+        use_bars = use_bars and _prepare_bars(conn)
+        _prepare_indexes(conn, index_mode, explain_check, interval_seconds, chunks[0])
+        ensure_aggregated_prices_table(conn)
+        rows = _aggregate_server_side(
+            conn, task_id, chunks, interval_seconds, overwrite, use_bars
         )
-    conn.commit()
-    logger.info(f"聚合结果写入完成，写入 {len(records)} 条记录")
+        # 在提交并标记成功前，再次检查任务是否被取消
+        if rows is None or check_task(task_id):
+            logger.info(f"任务 {task_id} 已取消，停止聚合")
+            conn.rollback()
+            return
+        conn.commit()
+    except Exception as exc:
+        conn.rollback()
+        logger.error(f"数据库内聚合写入失败: {exc}")
+        update_task_status(task_id, 2)
+        raise
+    finally:
+        conn.close()
+    duration = time.time() - start_time
+    logger.info(f"聚合完成，共写入 {rows} 条记录，耗时 {duration:.2f}s")
+    update_task_status(task_id, 1)
+
+
+def _as_bool(value) -> bool:
+    # db_overrides 中的值都是字符串
+    if isinstance(value, str):
+        return value.lower() not in ("0", "false", "no")
+    return bool(value)
 
 
 def run_process_prices(task_id: str, **kwargs: Any):
@@ -109,85 +511,299 @@ def run_process_prices(task_id: str, **kwargs: Any):
         return
     logger.info(f"开始聚合 {start_dt} - {end_dt} 数据，粒度 {aggregation_interval}")
 
-    conn = psycopg2.connect(
-        host=DEFAULT_DB_CONFIG["host"],
-        port=DEFAULT_DB_CONFIG["port"],
-        dbname=DEFAULT_DB_CONFIG["database"],
-        user=DEFAULT_DB_CONFIG["username"],
-        password=DEFAULT_DB_CONFIG["password"],
+    chunk_days = int(kwargs.get("chunk_days") or DEFAULT_CHUNK_DAYS)
+    parallelism = max(
+        1, int(kwargs.get("parallel_connections") or DEFAULT_PARALLEL_CONNECTIONS)
+    )
+    chunks = _day_chunks(start_dt, end_dt, chunk_days)
+    parallelism = min(parallelism, len(chunks))
+    use_bars = _as_bool(kwargs.get("use_bars", DEFAULT_USE_BARS))
+
+    index_mode = kwargs.get("index_mode") or DEFAULT_INDEX_MODE
+    explain_check = _as_bool(kwargs.get("explain_check", DEFAULT_EXPLAIN_CHECK))
+    backend = columnar.resolve_backend(kwargs.get("analytics_backend"))
+    write_mode = kwargs.get("write_mode") or DEFAULT_WRITE_MODE
+    if backend == "duckdb" and write_mode == "server":
+        # 在本机 Parquet 镜像上聚合时结果只能由客户端写回
+        logger.info("analytics_backend=duckdb 时忽略 write_mode=server")
+        write_mode = "client"
+
+    if write_mode == "server":
+        _run_server_side(
+            task_id,
+            chunks,
+            interval_seconds,
+            overwrite,
+            use_bars,
+            index_mode,
+            explain_check,
+        )
+        return
+
+    logger.info(
+        f"正在分片聚合，共 {len(chunks)} 个分片（每片 {chunk_days} 天），"
+        f"并行度 {parallelism}，分析后端 {backend}"
     )
-    all_days_dfs = []
-    num_days = (end_dt.date() - start_dt.date()).days + 1
-    logger.info(f"正在按天聚合，共 {num_days} 天")
+
+    # conn 作为唯一的写入连接，所有分片结果在同一个事务中写入，最后统一提交
+    conn = _connect()
+    store = None
+    readers = []
+    connections: queue.Queue = queue.Queue()
+    if backend == "duckdb":
+        # 分片在本机 Parquet 镜像上聚合，Postgres 只负责导出缺失的日期与接收结果
+        store = columnar.ColumnarStore()
+
+        def aggregate(chunk):
+            return store.aggregate(interval_seconds, *chunk)
+
+    else:
+        # 升级前的数据库可能还没有 symbol 列，聚合语句按默认交易对过滤
+        symbols.ensure_symbol_columns(conn)
+        use_bars = use_bars and _prepare_bars(conn)
+        _prepare_indexes(conn, index_mode, explain_check, interval_seconds, chunks[0])
+        readers = [_connect() for _ in range(parallelism)]
+        for reader in readers:
+            connections.put(reader)
+
+        def aggregate(chunk):
+            return _aggregate_chunk(connections, interval_seconds, *chunk, use_bars)
+
+    interval_label = _interval_label(interval_seconds)
     start_time = time.time()
-    with conn.cursor() as cur:
-        for day in _daterange(start_dt, end_dt):
+    total_rows = 0
+    written = False
+    pending = deque()
+    executor = ThreadPoolExecutor(
+        max_workers=parallelism, thread_name_prefix="process-prices"
+    )
+
+    def submit(chunk):
+        return executor.submit(aggregate, chunk)
+
+    try:
+        try:
+            if store is not None:
+                store.sync(
+                    conn,
+                    chunks[0][0],
+                    chunks[-1][1] - datetime.timedelta(microseconds=1),
+                    refresh=_as_bool(kwargs.get("mirror_refresh", False)),
+                )
+            ensure_aggregated_prices_table(conn)
+            if overwrite:
+                # 与写入在同一事务中，提交前读者仍能看到旧数据
+                with conn.cursor() as cur:
+                    _clear_range(cur, interval_label, chunks[0][0], chunks[-1][1])
+        except Exception as exc:
+            conn.rollback()
+            logger.error(f"准备 aggregated_prices 失败: {exc}")
+            update_task_status(task_id, 2)
+            raise
+
+        chunk_iter = iter(chunks)
+        # 最多同时持有 2 * parallelism 个分片结果，限制内存占用
+        for chunk in chunk_iter:
+            pending.append((chunk, submit(chunk)))
+            if len(pending) >= 2 * parallelism:
+                break
+        while pending:
             if check_task(task_id):
                 logger.info(f"任务 {task_id} 已取消，停止聚合")
-                conn.close()
+                for _, future in pending:
+                    future.cancel()
+                conn.rollback()
                 return
-            day_start = datetime.datetime(
-                day.year, day.month, day.day, 0, 0, 0, tzinfo=datetime.timezone.utc
-            )
-            day_end = datetime.datetime(
-                day.year, day.month, day.day, 23, 59, 59, tzinfo=datetime.timezone.utc
+            (chunk_start, chunk_end), future = pending.popleft()
+            next_chunk = next(chunk_iter, None)
+            if next_chunk is not None:
+                pending.append((next_chunk, submit(next_chunk)))
+            try:
+                rows = future.result()
+            except Exception as exc:
+                for _, other in pending:
+                    other.cancel()
+                update_task_status(task_id, 2)
+                logger.warning(
+                    f"处理 {chunk_start.date()} - {chunk_end.date()} 发生错误: {exc}"
+                )
+                raise
+            if not rows:
+                continue
+            chunk_df = pd.DataFrame(
+                rows, columns=["time_bucket", "source", "average_price"]
             )
             try:
-                params = (
-                    interval_seconds,
-                    interval_seconds,
-                    day_start,
-                    day_end,
-                    interval_seconds,
-                    interval_seconds,
-                    day_start,
-                    day_end,
+                total_rows += _write_aggregated_prices(
+                    conn, chunk_df, interval_label=interval_label, commit=False
                 )
-                cur.execute(sql_query, params)
-                rows = cur.fetchall()
-                if rows:
-                    day_df = pd.DataFrame(
-                        rows, columns=["time_bucket", "source", "average_price"]
-                    )
-                    all_days_dfs.append(day_df)
+                written = True
             except Exception as exc:
+                for _, other in pending:
+                    other.cancel()
+                conn.rollback()
+                logger.error(f"写入失败: {exc}")
                 update_task_status(task_id, 2)
-                logger.warning(f"处理 {day_start.date()} 发生错误: {exc}")
                 raise
 
-    if not all_days_dfs:
-        logger.info("没有聚合出任何数据。")
-        conn.close()
-        return
+        if not written and not overwrite:
+            logger.info("没有聚合出任何数据。")
+            return
 
-    df_final = pd.concat(all_days_dfs)
-    duration = time.time() - start_time
-    logger.info(f"聚合完成，共 {len(df_final)} 条记录，耗时 {duration:.2f}s")
-    try:
-        _write_aggregated_prices(conn, df_final, overwrite=overwrite)
-    except Exception as exc:
-        conn.rollback()
-        logger.error(f"写入失败: {exc}")
-        update_task_status(task_id, 2)
-        raise
-    else:
-        # 在标记成功前，再次检查任务是否被取消
+        duration = time.time() - start_time
+        # 在提交并标记成功前，再次检查任务是否被取消
         if check_task(task_id):
             logger.info(f"任务 {task_id} 已取消，不标记为成功")
-        else:
-            logger.info(
-                f"聚合完成，共写入 {len(df_final)} 条记录，耗时 {duration:.2f}s"
-            )
-            update_task_status(task_id, 1)
+            conn.rollback()
+            return
+        try:
+            conn.commit()
+        except Exception as exc:
+            conn.rollback()
+            logger.error(f"写入失败: {exc}")
+            update_task_status(task_id, 2)
+            raise
+        logger.info(f"聚合完成，共写入 {total_rows} 条记录，耗时 {duration:.2f}s")
+        update_task_status(task_id, 1)
     finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for reader in readers:
+            reader.close()
+        if store is not None:
+            store.close()
         conn.close()
 
 
+# 原先的分桶写法（对时间列套函数、BETWEEN 过滤），仅用于基准对比
+# 旧写法的分桶表达式；过滤条件与 sql_query 完全相同，基准只比较分桶方式与索引
+_LEGACY_SQL_QUERY = f"""
+(
+    SELECT to_timestamp(floor(extract(epoch from block_time) / %s) * %s) AS time_bucket,
+        'Uniswap' AS source, AVG(price) AS average_price
+    FROM uniswap_swaps
+    WHERE block_time >= %s AND block_time < %s AND {symbols.DEFAULT_SYMBOL_FILTER}
+    GROUP BY time_bucket
+)
+UNION ALL
+(
+    SELECT to_timestamp(floor(extract(epoch from trade_time) / %s) * %s) AS time_bucket,
+        'Binance' AS source, AVG(price) AS average_price
+    FROM binance_trades
+    WHERE trade_time >= %s AND trade_time < %s AND {symbols.DEFAULT_SYMBOL_FILTER}
+    GROUP BY time_bucket
+);
+"""
+
+_BENCH_SCHEMA = "bench_process_prices"
+_BENCH_FIXTURE_SQL = f"""
+DROP SCHEMA IF EXISTS {_BENCH_SCHEMA} CASCADE;
+CREATE SCHEMA {_BENCH_SCHEMA};
+CREATE TABLE {_BENCH_SCHEMA}.binance_trades AS
+SELECT g AS id,
+    %(start)s::timestamptz + (g * %(step)s) * INTERVAL '1 second' AS trade_time,
+    3000 + 50 * sin(g / 1e5) + random() AS price,
+    '{symbols.DEFAULT_SYMBOL}'::text AS symbol
+FROM generate_series(1, %(rows)s) AS g;
+CREATE TABLE {_BENCH_SCHEMA}.uniswap_swaps AS
+SELECT g AS id,
+    %(start)s::timestamptz + (g * %(step)s * 10) * INTERVAL '1 second' AS block_time,
+    3000 + 50 * sin(g / 1e4) + random() AS price,
+    '{symbols.DEFAULT_SYMBOL}'::text AS symbol
+FROM generate_series(1, %(rows)s / 10) AS g;
+"""
+
+
+def benchmark_day_aggregation(
+    conn,
+    start: datetime.datetime,
+    days: int,
+    interval_seconds: int = 60,
+    rows: Optional[int] = None,
+    index_mode: str = DEFAULT_INDEX_MODE,
+) -> dict[str, float]:
+    """
+    描述：逐天聚合的基准测试：旧写法（floor 分桶，无索引）与 date_bin + 索引的耗时对比，两者的过滤条件相同
+        rows 不为空时先在独立 schema 中生成 rows 条 Binance 成交（及其 1/10 的 Uniswap 成交）均匀分布在 days 天内
+    参数：conn: 数据库连接, start: 起始日期（UTC 零点）, days: 天数, interval_seconds: 聚合粒度,
+        rows: 生成的夹具行数, index_mode: 新写法使用的索引
+    返回值：{"legacy_seconds", "date_bin_seconds", "legacy_per_day", "date_bin_per_day"}
+    """
+    with conn.cursor() as cur:
+        if rows:
+            logger.info(f"正在生成 {rows} 行基准数据 ...")
+            cur.execute(
+                _BENCH_FIXTURE_SQL,
+                {"start": start, "step": days * 86400.0 / rows, "rows": rows},
+            )
+            cur.execute(f"ANALYZE {_BENCH_SCHEMA}.binance_trades")
+            cur.execute(f"ANALYZE {_BENCH_SCHEMA}.uniswap_swaps")
+        cur.execute(f"SET search_path TO {_BENCH_SCHEMA}, public")
+    conn.commit()
+
+    def timed(query, params_for_day):
+        elapsed = 0.0
+        with conn.cursor() as cur:
+            for day in range(days):
+                day_start = start + datetime.timedelta(days=day)
+                day_end = day_start + datetime.timedelta(days=1)
+                began = time.perf_counter()
+                cur.execute(query, params_for_day(day_start, day_end))
+                cur.fetchall()
+                elapsed += time.perf_counter() - began
+        conn.rollback()
+        return elapsed
+
+    i = interval_seconds
+    legacy = timed(_LEGACY_SQL_QUERY, lambda s, e: (i, i, s, e, i, i, s, e))
+    ensure_aggregation_indexes(conn, index_mode)
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE binance_trades")
+        cur.execute("ANALYZE uniswap_swaps")
+    conn.commit()
+    date_bin = timed(sql_query, lambda s, e: _chunk_params(i, s, e))
+
+    result = {
+        "legacy_seconds": round(legacy, 3),
+        "date_bin_seconds": round(date_bin, 3),
+        "legacy_per_day": round(legacy / days, 4),
+        "date_bin_per_day": round(date_bin / days, 4),
+    }
+    logger.info(f"逐天聚合基准（{days} 天，索引 {index_mode}）: {result}")
+    return result
+
+
 if __name__ == "__main__":
-    run_process_prices(
-        task_id="1",
-        aggregation_interval="minute",
-        overwrite=True,
-        start_date="2025-09-01",
-        end_date="2025-09-07",
+    parser = argparse.ArgumentParser(description="价格聚合")
+    parser.add_argument(
+        "--benchmark", action="store_true", help="在独立 schema 中运行逐天聚合基准测试"
     )
+    parser.add_argument("--rows", type=int, default=50_000_000, help="基准数据行数")
+    parser.add_argument("--days", type=int, default=30, help="基准数据覆盖天数")
+    parser.add_argument(
+        "--index-mode", default=DEFAULT_INDEX_MODE, choices=sorted(AGGREGATION_INDEXES)
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        bench_conn = _connect()
+        try:
+            benchmark_day_aggregation(
+                bench_conn,
+                datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc),
+                args.days,
+                rows=args.rows,
+                index_mode=args.index_mode,
+            )
+            with bench_conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {_BENCH_SCHEMA} CASCADE")
+            bench_conn.commit()
+        finally:
+            bench_conn.close()
+    else:
+        run_process_prices(
+            task_id="1",
+            aggregation_interval="minute",
+            overwrite=True,
+            start_date="2025-09-01",
+            end_date="2025-09-07",
+        )
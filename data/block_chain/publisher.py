@@ -0,0 +1,272 @@
+"""
+带发布确认（publisher confirms）的 RabbitMQ 发布器
+
+- 多个发布线程组成一个小型 channel 池，每个线程独占一个 BlockingConnection（pika 连接不是线程安全的）；
+- 调用方把消息放入内存队列后立即得到 Future，发布线程批量取出消息并在 confirm 模式下发布，
+  Broker 确认（持久化接收）后 Future 才完成，因此调用方可以知道消息是否真正被接收；
+- 连接断开时按指数退避重连，未确认的消息在重连后重新发布（至少一次语义）；
+- 统计发布数量、失败数量、确认延迟分位数与吞吐量，并定期写入日志。
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+import pika
+import pika.exceptions
+from loguru import logger
+
+# 发布线程退出信号
+_STOP = object()
+
+
+class _Message:
+    __slots__ = (
+        "exchange",
+        "routing_key",
+        "body",
+        "properties",
+        "future",
+        "enqueued_at",
+    )
+
+    def __init__(self, exchange, routing_key, body, properties):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class ConfirmedPublisher:
+    """发布确认模式的 RabbitMQ 发布器（线程安全）"""
+
+    def __init__(
+        self,
+        connection_factory: Callable[[], Any],
+        setup_channel: Optional[Callable[[Any], None]] = None,
+        workers: int = 2,
+        batch_size: int = 100,
+        initial_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        report_interval: float = 60.0,
+    ):
+        """
+        描述：初始化发布器
+        参数：
+            connection_factory: 创建 pika.BlockingConnection（或兼容对象）的函数
+            setup_channel: 新建 channel 后的初始化回调（如声明交换机与队列）
+            workers: 发布线程数（即 channel 池大小）
+            batch_size: 每个发布线程一次从队列中取出的最大消息数
+            initial_backoff: 重连初始等待时间（秒），每次失败翻倍
+            max_backoff: 重连最大等待时间（秒）
+            report_interval: 统计日志输出间隔（秒），<=0 表示不输出
+        """
+        self._connection_factory = connection_factory
+        self._setup_channel = setup_channel
+        self._workers = max(1, int(workers))
+        self._batch_size = max(1, int(batch_size))
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._report_interval = report_interval
+
+        self._queue: queue.Queue = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self._published = 0
+        self._failed = 0
+        self._reconnects = 0
+        self._latencies = deque(maxlen=10000)
+        self._started_at = None
+        self._last_report = time.monotonic()
+
+    def start(self) -> None:
+        """启动发布线程（幂等）"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            self._started_at = time.monotonic()
+            for index in range(self._workers):
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f"rabbitmq-publisher-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def publish(
+        self,
+        exchange: str,
+        routing_key: str,
+        body: bytes,
+        properties: Optional[pika.BasicProperties] = None,
+    ) -> Future:
+        """
+        描述：提交一条消息，立即返回 Future
+        参数：exchange: 交换机, routing_key: 路由键, body: 消息体, properties: 消息属性
+        返回值：Future，Broker 确认后结果为确认延迟（秒）；被退回或拒绝时抛出异常。
+            在发布前取消 Future 可以撤回消息。
+        """
+        if self._stopping.is_set():
+            raise RuntimeError("发布器已停止")
+        self.start()
+        message = _Message(exchange, routing_key, body, properties)
+        self._queue.put(message)
+        return message.future
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """停止发布线程：队列中已有的消息会先被发布完"""
+        with self._start_lock:
+            threads, self._threads = self._threads, []
+            self._stopping.set()
+            for _ in threads:
+                self._queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self) -> dict[str, Any]:
+        """
+        描述：返回发布统计
+        返回值：包含 published, failed, reconnects, pending, p50_ms, p99_ms, throughput_per_sec 的字典
+        """
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            published = self._published
+            failed = self._failed
+            reconnects = self._reconnects
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            index = min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))
+            return latencies[index] * 1000
+
+        return {
+            "published": published,
+            "failed": failed,
+            "reconnects": reconnects,
+            "pending": self._queue.qsize(),
+            "p50_ms": round(percentile(0.5), 3),
+            "p99_ms": round(percentile(0.99), 3),
+            "throughput_per_sec": round(published / elapsed, 2) if elapsed else 0.0,
+        }
+
+    def _connect(self):
+        """建立连接与 confirm 模式的 channel，失败时按指数退避重试直到成功或停止"""
+        backoff = self._initial_backoff
+        while True:
+            try:
+                connection = self._connection_factory()
+                channel = connection.channel()
+                channel.confirm_delivery()
+                if self._setup_channel:
+                    self._setup_channel(channel)
+                return connection, channel
+            except Exception as exc:
+                if self._stopping.is_set() and self._queue.empty():
+                    return None, None
+                with self._stats_lock:
+                    self._reconnects += 1
+                logger.warning(f"RabbitMQ 发布连接失败: {exc}，{backoff:.1f}秒后重试")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self._max_backoff)
+
+    def _next_batch(self) -> tuple[list[_Message], bool]:
+        """阻塞获取下一批消息；返回 (消息列表, 是否收到停止信号)"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        stop = False
+        while len(batch) < self._batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        connection, channel = None, None
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                # 调用方已取消（例如等待超时）的消息不再发布
+                batch = [m for m in batch if m.future.set_running_or_notify_cancel()]
+                while batch:
+                    if channel is None or connection.is_closed:
+                        connection, channel = self._connect()
+                        if channel is None:
+                            for message in batch:
+                                message.future.set_exception(
+                                    RuntimeError("发布器已停止")
+                                )
+                            return
+                    batch = self._publish_batch(channel, batch)
+                    if batch:
+                        # 连接或 channel 异常：丢弃当前连接，重连后重新发布剩余消息
+                        self._close(connection)
+                        connection, channel = None, None
+                self._maybe_report()
+                if stop:
+                    return
+        finally:
+            self._close(connection)
+
+    def _publish_batch(self, channel, batch: list[_Message]) -> list[_Message]:
+        """发布一批消息，返回因连接异常而需要重新发布的消息"""
+        for index, message in enumerate(batch):
+            try:
+                channel.basic_publish(
+                    exchange=message.exchange,
+                    routing_key=message.routing_key,
+                    body=message.body,
+                    properties=message.properties,
+                    mandatory=True,
+                )
+            except (pika.exceptions.UnroutableError, pika.exceptions.NackError) as exc:
+                # 消息被 Broker 拒绝或无法路由：不重试，直接通知调用方
+                with self._stats_lock:
+                    self._failed += 1
+                message.future.set_exception(exc)
+                continue
+            except Exception as exc:
+                logger.warning(f"发布消息失败: {exc}，重连后重试")
+                return batch[index:]
+            latency = time.perf_counter() - message.enqueued_at
+            with self._stats_lock:
+                self._published += 1
+                self._latencies.append(latency)
+            message.future.set_result(latency)
+        return []
+
+    def _maybe_report(self):
+        if self._report_interval <= 0:
+            return
+        now = time.monotonic()
+        with self._stats_lock:
+            if now - self._last_report < self._report_interval:
+                return
+            self._last_report = now
+        logger.info(f"RabbitMQ 发布统计: {self.stats()}")
+
+    @staticmethod
+    def _close(connection):
+        try:
+            if connection is not None and not connection.is_closed:
+                connection.close()
+        except Exception:
+            pass
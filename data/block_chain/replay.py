@@ -0,0 +1,595 @@
+"""
+历史行情回放引擎（事件驱动的回测）
+
+- 把 binance_trades 与 uniswap_swaps 按时间归并为一条事件流，按 chunk_seconds 分段读取：
+  数据源可以是 Postgres（COPY 导出）、Parquet 镜像（DuckDB）或内存映射的逐笔数组（tickstore），
+  内存占用只取决于分段长度，与回放的总时间跨度无关；
+- 机会检测复用 streaming.StreamingDetector（延迟窗口均价、10 分钟成交量、滚动波动率与 analyse.evaluate_pair）；
+- 策略是事件驱动的回调（ReplayStrategy）：按时间顺序收到机会，可以预约定时回调（执行延迟、资金结算），
+  回调触发时的 Binance 均价只包含该时刻之前的成交，不会用到未来数据；
+- 引擎本身不保存机会与成交明细，策略需要时自行汇总。
+
+定时回调在 Binance 时钟越过其时间后触发（同一时刻的成交先处理），
+同一时刻的机会先于定时回调交给策略。
+"""
+
+import argparse
+import heapq
+import io
+import itertools
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import yaml
+from loguru import logger
+
+from . import analyse, symbols
+from .columnar import ColumnarStore, _utc_naive
+from .streaming import BINANCE, UNISWAP, StreamingDetector
+from .tickstore import TICK_SOURCES, TickStore
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+REPLAY_CONFIG = config.get("replay", {}) or {}
+DEFAULT_CHUNK_SECONDS = float(REPLAY_CONFIG.get("chunk_seconds", 900))
+
+_NS_PER_SECOND = 1_000_000_000
+
+# Parquet 镜像中各数据源的表与字段表达式（与 tickstore 的字段一致）
+_PARQUET_SOURCES = {
+    "binance": {
+        "table": "binance_trades",
+        "time_column": "trade_time",
+        "fields": {"price": "price", "volume": "qty"},
+    },
+    "uniswap": {
+        "table": "uniswap_swaps",
+        "time_column": "block_time",
+        "fields": {"price": "price", "volume": "ABS(amount_eth)", "gas": "gas_price"},
+    },
+}
+
+
+def _to_ns(value) -> Optional[int]:
+    value = _utc_naive(value)
+    return None if value is None else pd.Timestamp(value).value
+
+
+def _empty(source: str) -> dict[str, np.ndarray]:
+    fields = ["time", *TICK_SOURCES[source]["fields"]]
+    return {
+        field: np.empty(0, dtype=np.int64 if field == "time" else np.float64)
+        for field in fields
+    }
+
+
+class TickStoreReader:
+    """从内存映射的逐笔数组读取（零拷贝，最快）"""
+
+    def __init__(self, store: TickStore):
+        self.store = store
+
+    def read(self, source: str, lo: int, hi: int) -> dict[str, np.ndarray]:
+        """[lo, hi) 内按时间排序的字段数组"""
+        return self.store.load(source, lo, hi - 1)
+
+    def bounds(self) -> tuple[Optional[int], Optional[int]]:
+        times = [self.store.load(source)["time"] for source in TICK_SOURCES]
+        times = [t for t in times if len(t)]
+        if not times:
+            return None, None
+        return min(int(t[0]) for t in times), max(int(t[-1]) for t in times)
+
+
+class ParquetReader:
+    """从按天分区的 Parquet 镜像读取（DuckDB）"""
+
+    def __init__(self, store: ColumnarStore):
+        self.store = store
+
+    def read(self, source: str, lo: int, hi: int) -> dict[str, np.ndarray]:
+        spec = _PARQUET_SOURCES[source]
+        time_column = spec["time_column"]
+        # Parquet 中的时间列为不带时区的 UTC 时间
+        lo_dt = pd.Timestamp(lo).to_pydatetime(warn=False)
+        hi_dt = pd.Timestamp(hi).to_pydatetime(warn=False)
+        columns = ", ".join(
+            [f"epoch_ns({time_column}) AS time"]
+            + [f"{expr}::DOUBLE AS {name}" for name, expr in spec["fields"].items()]
+        )
+        arrays = self.store._duck.execute(
+            f"SELECT {columns} FROM {self.store._source(spec['table'], lo_dt, hi_dt)}"
+            f" WHERE {time_column} >= $1 AND {time_column} < $2 ORDER BY {time_column}",
+            [lo_dt, hi_dt],
+        ).fetchnumpy()
+        if not len(arrays["time"]):
+            return _empty(source)
+        return {
+            name: np.asarray(values, dtype=np.int64 if name == "time" else np.float64)
+            for name, values in arrays.items()
+        }
+
+    def bounds(self) -> tuple[Optional[int], Optional[int]]:
+        lows, highs = [], []
+        for source, spec in _PARQUET_SOURCES.items():
+            files = self.store._source(spec["table"], None, None)
+            low, high = self.store._duck.execute(
+                f"SELECT epoch_ns(MIN({spec['time_column']})),"
+                f" epoch_ns(MAX({spec['time_column']})) FROM {files}"
+            ).fetchone()
+            if low is not None:
+                lows.append(low)
+                highs.append(high)
+        return (min(lows), max(highs)) if lows else (None, None)
+
+
+class PostgresReader:
+    """从原始表分段读取（COPY 文本直接解析为定长数组，不经过 Decimal）"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        # 升级前的数据库可能还没有 symbol 列
+        symbols.ensure_symbol_columns(conn)
+
+    def read(self, source: str, lo: int, hi: int) -> dict[str, np.ndarray]:
+        spec = TICK_SOURCES[source]
+        time_column = spec["time_column"]
+        columns = ", ".join(
+            [f"floor(extract(epoch from {time_column}) * 1000000)::bigint"]
+            + list(spec["fields"].values())
+        )
+        buffer = io.StringIO()
+        with self.conn.cursor() as cur:
+            select = cur.mogrify(
+                f"SELECT {columns} FROM {spec['table']}"
+                f" WHERE {time_column} >= %s AND {time_column} < %s"
+                f" AND {symbols.DEFAULT_SYMBOL_FILTER}"
+                f" ORDER BY {time_column}",
+                (
+                    pd.Timestamp(lo, tz="UTC").to_pydatetime(warn=False),
+                    pd.Timestamp(hi, tz="UTC").to_pydatetime(warn=False),
+                ),
+            ).decode()
+            cur.copy_expert(f"COPY ({select}) TO STDOUT WITH (FORMAT CSV)", buffer)
+        self.conn.rollback()
+        if not buffer.tell():
+            return _empty(source)
+        buffer.seek(0)
+        fields = list(spec["fields"])
+        frame = pd.read_csv(
+            buffer,
+            header=None,
+            names=["time", *fields],
+            dtype={"time": np.int64, **{field: np.float64 for field in fields}},
+            engine="c",
+        )
+        arrays = {field: frame[field].to_numpy() for field in fields}
+        arrays["time"] = frame["time"].to_numpy() * 1000
+        return arrays
+
+    def bounds(self) -> tuple[Optional[int], Optional[int]]:
+        lows, highs = [], []
+        with self.conn.cursor() as cur:
+            for spec in TICK_SOURCES.values():
+                cur.execute(
+                    f"SELECT MIN({spec['time_column']}), MAX({spec['time_column']})"
+                    f" FROM {spec['table']} WHERE {symbols.DEFAULT_SYMBOL_FILTER}"
+                )
+                low, high = cur.fetchone()
+                if low is not None:
+                    lows.append(_to_ns(low))
+                    highs.append(_to_ns(high))
+        self.conn.rollback()
+        return (min(lows), max(highs)) if lows else (None, None)
+
+
+def merge_chunk(
+    binance: dict[str, np.ndarray], uniswap: dict[str, np.ndarray]
+) -> list[tuple]:
+    """
+    描述：把一段 Binance 成交与 Uniswap Swap 归并为按时间排序的事件（同一时刻 Binance 在前）
+    返回值：[(time_ns, kind, price, gas_price, amount), ...]，与 streaming 的事件格式一致
+    """
+    n_b, n_u = len(binance["time"]), len(uniswap["time"])
+    times = np.concatenate((binance["time"], uniswap["time"]))
+    kinds = np.concatenate(
+        (np.full(n_b, BINANCE, dtype=np.int8), np.full(n_u, UNISWAP, dtype=np.int8))
+    )
+    order = np.lexsort((kinds, times))
+    prices = np.concatenate((binance["price"], uniswap["price"]))[order]
+    gas = np.concatenate((np.zeros(n_b), uniswap["gas"]))[order]
+    volume = np.concatenate((binance["volume"], uniswap["volume"]))[order]
+    return list(
+        zip(
+            times[order].tolist(),
+            kinds[order].tolist(),
+            prices.tolist(),
+            gas.tolist(),
+            volume.tolist(),
+        )
+    )
+
+
+def chunked_events(
+    reader, start_ns: int, end_ns: int, chunk_ns: int
+) -> Iterator[list[tuple]]:
+    """按 [start_ns, end_ns) 分段读取并归并事件，每次只在内存中保留一段"""
+    lo = start_ns
+    while lo < end_ns:
+        hi = min(lo + chunk_ns, end_ns)
+        events = merge_chunk(
+            reader.read("binance", lo, hi), reader.read("uniswap", lo, hi)
+        )
+        if events:
+            yield events
+        lo = hi
+
+
+class ReplayStrategy:
+    """回放策略的基类：按时间顺序收到机会与定时回调，子类覆盖需要的方法"""
+
+    def on_start(self, engine: "ReplayEngine") -> None:
+        pass
+
+    def on_opportunity(self, engine: "ReplayEngine", opp: dict[str, Any]) -> None:
+        pass
+
+    def on_finish(self, engine: "ReplayEngine") -> None:
+        pass
+
+    def result(self) -> dict[str, Any]:
+        """回放结束后汇总到引擎结果中的指标"""
+        return {}
+
+
+class CapitalLockStrategy(ReplayStrategy):
+    """
+    资金占用与执行延迟：每个机会占用 initial_investment，检测到后经过 execution_delay_seconds 在 Binance 成交
+    （按届时的 Binance 窗口均价重新计算利润，Uniswap 一侧按机会中的价格），
+    再经过 settlement_seconds 资金与利润才回到可用资金；可用资金不足时放弃该机会。
+    """
+
+    def __init__(
+        self,
+        capital: float,
+        execution_delay_seconds: float = 0.0,
+        settlement_seconds: float = 0.0,
+    ):
+        self.cash = float(capital)
+        self.capital = float(capital)
+        self.execution_delay = float(execution_delay_seconds)
+        self.settlement = float(settlement_seconds)
+        self.locked = 0.0
+        self.max_locked = 0.0
+        self.realized_pnl = 0.0
+        self.trades = 0
+        self.losing_trades = 0
+        self.skipped = 0
+
+    def on_opportunity(self, engine, opp):
+        investment = float(engine.strategy["initial_investment"])
+        if self.cash < investment:
+            self.skipped += 1
+            return
+        self.cash -= investment
+        self.locked += investment
+        self.max_locked = max(self.max_locked, self.locked)
+        gas_price = engine.detector.last_swap[2]
+        engine.after(
+            self.execution_delay,
+            lambda: self._execute(engine, opp, investment, gas_price),
+        )
+
+    def _execute(self, engine, opp, investment, gas_price):
+        binance_price = engine.binance_price()
+        if opp["buy_platform"] != "Uniswap":
+            uniswap_price = opp["sell_price"]
+            binance_price = binance_price or opp["buy_price"]
+            profit = analyse.calculate_profit_buy_cex_sell_dex(
+                engine.strategy, binance_price, uniswap_price, gas_price
+            )
+        else:
+            uniswap_price = opp["buy_price"]
+            binance_price = binance_price or opp["sell_price"]
+            profit = analyse.calculate_profit_buy_dex_sell_cex(
+                engine.strategy, uniswap_price, binance_price, gas_price
+            )
+        self.trades += 1
+        self.losing_trades += profit <= 0
+        engine.after(self.settlement, lambda: self._settle(investment, profit))
+
+    def _settle(self, investment, profit):
+        self.locked -= investment
+        self.cash += investment + profit
+        self.realized_pnl += profit
+
+    def result(self):
+        return {
+            "trades": self.trades,
+            "losing_trades": self.losing_trades,
+            "skipped_no_capital": self.skipped,
+            "realized_pnl": round(self.realized_pnl, 6),
+            "max_locked": self.max_locked,
+            "final_equity": round(self.cash + self.locked, 6),
+        }
+
+
+class ReplayEngine:
+    """按时间顺序回放历史行情，驱动检测器与策略回调"""
+
+    def __init__(
+        self,
+        strategy: dict[str, Any],
+        handler: Optional[ReplayStrategy] = None,
+        chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+    ):
+        """
+        描述：初始化回放引擎
+        参数：strategy: 策略参数（与 analyse 相同）, handler: 事件驱动的策略回调,
+            chunk_seconds: 每次读取的时间段长度（秒），决定内存上限
+        """
+        self.handler = handler or ReplayStrategy()
+        self.detector = StreamingDetector(strategy, on_opportunity=self._on_opportunity)
+        self.strategy = self.detector.strategy
+        self.chunk_ns = int(float(chunk_seconds) * _NS_PER_SECOND)
+        self._window_ns = int(float(self.strategy["window_seconds"]) * _NS_PER_SECOND)
+        # 定时回调：(时间, 序号, 回调)，序号保证同一时刻按预约顺序触发
+        self._timers: list[tuple] = []
+        self._seq = itertools.count()
+        self.now = -1
+
+    def schedule(self, at_ns: int, callback: Callable[[], None]) -> None:
+        """预约在 at_ns（纳秒）触发的回调：该时刻及之前的成交处理完之后触发"""
+        heapq.heappush(self._timers, (int(at_ns), next(self._seq), callback))
+        self._retain()
+
+    def after(self, seconds: float, callback: Callable[[], None]) -> None:
+        """预约在当前时间之后 seconds 秒触发的回调"""
+        self.schedule(self.now + int(float(seconds) * _NS_PER_SECOND), callback)
+
+    def binance_price(self, at_ns: Optional[int] = None) -> Optional[float]:
+        """at_ns（默认当前时间）之前一个 window_seconds 内的 Binance 成交均价，没有成交时为 None"""
+        at_ns = self.now if at_ns is None else at_ns
+        return self.detector.binance_average(at_ns - self._window_ns, at_ns)
+
+    def _retain(self) -> None:
+        # 未触发的定时回调还需要查询其时刻之前一个窗口的成交
+        self.detector.retain_from = (
+            self._timers[0][0] - self._window_ns if self._timers else None
+        )
+
+    def _fire_until(self, clock: int, inclusive: bool = False) -> None:
+        timers = self._timers
+        while timers and (timers[0][0] <= clock if inclusive else timers[0][0] < clock):
+            at, _, callback = heapq.heappop(timers)
+            self.now = at
+            callback()
+        self._retain()
+
+    def _on_opportunity(self, opp: dict[str, Any]) -> None:
+        clock = self.detector.binance_clock
+        self._fire_until(clock)
+        self.now = clock
+        self.handler.on_opportunity(self, opp)
+
+    def run(self, chunks) -> dict[str, Any]:
+        """
+        描述：回放事件段并返回统计
+        参数：chunks: 按时间排序的事件段（chunked_events 或 streaming.replay_events 的输出）
+        返回值：包含检测统计、回放的时间跨度、墙钟耗时、相对实时的倍数与策略指标的字典
+        """
+        began = time.perf_counter()
+        first = last = None
+        self.handler.on_start(self)
+        for events in chunks:
+            if first is None:
+                first = events[0][0]
+            last = events[-1][0]
+            self.detector.process_many(events)
+            self._fire_until(self.detector.binance_clock)
+        self.detector.flush()
+        self._fire_until(max(self.now, self.detector.binance_clock), inclusive=True)
+        # 数据结束后仍未触发的回调（如结算）按时间顺序全部触发
+        while self._timers:
+            self._fire_until(self._timers[0][0], inclusive=True)
+        self.handler.on_finish(self)
+
+        elapsed = time.perf_counter() - began
+        stats = self.detector.stats()
+        span = (last - first) / _NS_PER_SECOND if first is not None else 0.0
+        return {
+            **stats,
+            "events_per_sec": round(stats["events"] / elapsed, 1) if elapsed else 0.0,
+            "span_seconds": span,
+            "elapsed_seconds": round(elapsed, 3),
+            "speedup": round(span / elapsed, 1) if elapsed else 0.0,
+            **self.handler.result(),
+        }
+
+
+def replay(
+    reader,
+    strategy: dict[str, Any],
+    handler: Optional[ReplayStrategy] = None,
+    start=None,
+    end=None,
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+) -> dict[str, Any]:
+    """
+    描述：回放 [start, end) 内的历史行情（未指定时使用数据源的完整范围）
+    参数：reader: TickStoreReader / ParquetReader / PostgresReader, strategy: 策略参数,
+        handler: 策略回调, start / end: 时间范围, chunk_seconds: 分段长度（秒）
+    返回值：ReplayEngine.run 的统计
+    """
+    start_ns, end_ns = _to_ns(start), _to_ns(end)
+    if start_ns is None or end_ns is None:
+        low, high = reader.bounds()
+        if low is None:
+            logger.warning("回放数据源为空")
+            return ReplayEngine(strategy, handler, chunk_seconds).run([])
+        start_ns = low if start_ns is None else start_ns
+        end_ns = high + 1 if end_ns is None else end_ns
+    engine = ReplayEngine(strategy, handler, chunk_seconds)
+    result = engine.run(chunked_events(reader, start_ns, end_ns, engine.chunk_ns))
+    logger.info(f"回放完成: {result}")
+    return result
+
+
+def write_synthetic_ticks(
+    store: TickStore,
+    hours: float,
+    trades_per_second: float = 5.0,
+    start: str = "2025-09-01",
+    seed: int = 0,
+) -> int:
+    """
+    描述：按天写入基准用的合成逐笔数组：Binance 随机游走、每 12 秒一笔 Swap
+    返回值：写入的事件数
+    """
+    rng = np.random.default_rng(seed)
+    start_ns = pd.Timestamp(start, tz="UTC").value
+    end_ns = start_ns + int(hours * 3600) * _NS_PER_SECOND
+    day_ns = 86400 * _NS_PER_SECOND
+    price = 3000.0
+    total = 0
+    for day_start in range(start_ns, end_ns, day_ns):
+        day_end = min(day_start + day_ns, end_ns)
+        seconds = (day_end - day_start) // _NS_PER_SECOND
+        n_b = int(seconds * trades_per_second)
+        b_time = day_start + np.sort(rng.integers(0, day_end - day_start, n_b))
+        b_price = price + np.cumsum(rng.normal(0, 0.3, n_b))
+        price = float(b_price[-1]) if n_b else price
+        u_time = np.arange(day_start, day_end, 12 * _NS_PER_SECOND)
+        index = np.clip(np.searchsorted(b_time, u_time), 0, max(n_b - 1, 0))
+        u_price = (b_price[index] if n_b else price) + rng.normal(0, 8, len(u_time))
+        day = pd.Timestamp(day_start, tz="UTC").date()
+        store.write_day(
+            "binance",
+            day,
+            {"time": b_time, "price": b_price, "volume": rng.uniform(0.01, 2, n_b)},
+        )
+        store.write_day(
+            "uniswap",
+            day,
+            {
+                "time": u_time,
+                "price": u_price,
+                "volume": rng.uniform(0.1, 5, len(u_time)),
+                "gas": rng.uniform(5e9, 3e10, len(u_time)),
+            },
+        )
+        total += n_b + len(u_time)
+    return total
+
+
+def benchmark(
+    hours: float = 24.0,
+    trades_per_second: float = 5.0,
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+) -> dict[str, Any]:
+    """
+    描述：在合成逐笔数组上回放 hours 小时的行情，测量吞吐（events/sec）、相对实时的倍数，
+        并在第二次回放中用 tracemalloc 记录 Python 堆内存峰值（不含内存映射的数组）
+    返回值：回放统计，附加 peak_mb
+    """
+    root = tempfile.mkdtemp(prefix="bench_replay_")
+    try:
+        store = TickStore(root=root)
+        write_synthetic_ticks(store, hours, trades_per_second)
+        reader = TickStoreReader(store)
+        strategy = {"profit_threshold": 1}
+
+        def handler():
+            return CapitalLockStrategy(
+                capital=10_000, execution_delay_seconds=2, settlement_seconds=600
+            )
+
+        result = replay(reader, strategy, handler(), chunk_seconds=chunk_seconds)
+        tracemalloc.start()
+        try:
+            replay(reader, strategy, handler(), chunk_seconds=chunk_seconds)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_mb"] = round(peak / (1 << 20), 2)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    logger.info(f"回放基准（{hours} 小时）: {result}")
+    return result
+
+
+def _open_reader(source: str):
+    if source == "tickstore":
+        return TickStoreReader(TickStore()), None
+    if source == "duckdb":
+        store = ColumnarStore()
+        return ParquetReader(store), store
+    db_config = config.get("db", {})
+    conn = psycopg2.connect(
+        host=db_config["host"],
+        port=db_config["port"],
+        dbname=db_config["database"],
+        user=db_config["username"],
+        password=db_config["password"],
+    )
+    return PostgresReader(conn), conn
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="历史行情回放")
+    parser.add_argument("--benchmark", action="store_true", help="回放合成行情测量吞吐")
+    parser.add_argument(
+        "--hours", type=float, default=24.0, help="基准的行情时长（小时）"
+    )
+    parser.add_argument(
+        "--source",
+        choices=("postgres", "duckdb", "tickstore"),
+        default="tickstore",
+        help="回放数据源",
+    )
+    parser.add_argument("--start", help="回放起始时间（UTC）")
+    parser.add_argument("--end", help="回放结束时间（UTC，不含）")
+    parser.add_argument(
+        "--capital", type=float, default=10_000, help="可用资金（USDT）"
+    )
+    parser.add_argument(
+        "--execution-delay",
+        type=float,
+        default=2.0,
+        help="检测到机会后的成交延迟（秒）",
+    )
+    parser.add_argument(
+        "--settlement", type=float, default=600.0, help="资金回到可用余额所需时间（秒）"
+    )
+    parser.add_argument(
+        "--chunk-seconds",
+        type=float,
+        default=DEFAULT_CHUNK_SECONDS,
+        help="分段长度（秒）",
+    )
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.hours, chunk_seconds=args.chunk_seconds)
+    else:
+        reader, resource = _open_reader(args.source)
+        try:
+            replay(
+                reader,
+                analyse.DEFAULT_STRATEGY,
+                CapitalLockStrategy(
+                    args.capital, args.execution_delay, args.settlement
+                ),
+                start=pd.Timestamp(args.start, tz="UTC") if args.start else None,
+                end=pd.Timestamp(args.end, tz="UTC") if args.end else None,
+                chunk_seconds=args.chunk_seconds,
+            )
+        finally:
+            if resource is not None:
+                resource.close()
@@ -0,0 +1,171 @@
+"""
+增量滚动统计（批量、分段与流式分析共用）
+
+- RollingMeanStd：最近 size 个值的均值与样本标准差（Welford 增量更新，每个值 O(1)），
+  语义与 pandas 的 rolling(size).mean() / .std() 一致：不足 size 个值或窗口内有 NaN 时结果为 NaN；
+- TimeWindowSum：时间窗口 [t - window, t] 内的累计和（双端队列，每个值均摊 O(1)），
+  语义与 SQL 的 SUM(...) OVER (ORDER BY t RANGE BETWEEN window PRECEDING AND CURRENT ROW) 一致，
+  同一时刻的对等行得到相同的值；
+- 两者都只保存窗口内的数据，可以跨分段 / 跨批次保留状态继续计算。
+
+浮点增量更新会累积舍入误差，两个类都定期按窗口内的数据重新求和校正（均摊后仍为 O(1)）。
+"""
+
+import datetime
+import math
+from collections import deque
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+# 与 analyze_opportunities 中的滚动波动率窗口一致（价格点数）
+VOLATILITY_POINTS = 10
+# 与 fetch_price_pairs 的 10 分钟累计成交量窗口一致
+VOLUME_WINDOW = datetime.timedelta(minutes=10)
+
+# 每更新这么多次按窗口内的数据重新校正一次
+_RESYNC_EVERY = 100_000
+
+
+class RollingMeanStd:
+    """最近 size 个值的滚动均值与样本标准差（环形缓冲 + Welford 增量更新）"""
+
+    __slots__ = ("size", "_values", "_next", "_n", "_nan", "_mean", "_m2", "_updates")
+
+    def __init__(self, size: int = VOLATILITY_POINTS):
+        self.size = int(size)
+        self._values: list[float] = []
+        self._next = 0
+        # 窗口内非 NaN 值的个数、NaN 的个数、均值与偏差平方和
+        self._n = 0
+        self._nan = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._updates = 0
+
+    def _add(self, x: float) -> None:
+        if x != x:
+            self._nan += 1
+            return
+        self._n += 1
+        delta = x - self._mean
+        self._mean += delta / self._n
+        self._m2 += delta * (x - self._mean)
+
+    def _remove(self, x: float) -> None:
+        if x != x:
+            self._nan -= 1
+            return
+        self._n -= 1
+        if not self._n:
+            self._mean = self._m2 = 0.0
+            return
+        delta = x - self._mean
+        self._mean -= delta / self._n
+        self._m2 -= delta * (x - self._mean)
+
+    def _resync(self) -> None:
+        finite = [x for x in self._values if x == x]
+        self._n = len(finite)
+        self._nan = len(self._values) - self._n
+        self._mean = math.fsum(finite) / self._n if finite else 0.0
+        self._m2 = math.fsum((x - self._mean) ** 2 for x in finite)
+        self._updates = 0
+
+    def push(self, x: float) -> None:
+        """追加一个值，窗口已满时移出最早的值"""
+        x = float(x)
+        if len(self._values) < self.size:
+            self._values.append(x)
+        else:
+            self._remove(self._values[self._next])
+            self._values[self._next] = x
+            self._next = (self._next + 1) % self.size
+        self._add(x)
+        self._updates += 1
+        if self._updates >= _RESYNC_EVERY:
+            self._resync()
+
+    @property
+    def ready(self) -> bool:
+        """窗口已满且没有 NaN"""
+        return self._n == self.size
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self.ready else math.nan
+
+    @property
+    def std(self) -> float:
+        """样本标准差（ddof=1）"""
+        if not self.ready or self.size < 2:
+            return math.nan
+        return math.sqrt(max(self._m2, 0.0) / (self.size - 1))
+
+    def coefficient_of_variation(self) -> float:
+        """std / mean（即滚动波动率），窗口未满、有 NaN 或均值为 0 时为 NaN"""
+        mean = self.mean
+        if mean != mean or not mean:
+            return math.nan
+        return self.std / mean
+
+
+def rolling_volatility(values: Iterable[float], size: int = VOLATILITY_POINTS):
+    """
+    描述：逐点计算滚动波动率 std / mean（与 rolling(size).std() / rolling(size).mean() 一致）
+    返回值：float64 数组，不足 size 个点或窗口内有 NaN 时为 NaN
+    """
+    stats = RollingMeanStd(size)
+    out = []
+    for x in values:
+        stats.push(x)
+        out.append(stats.coefficient_of_variation())
+    return np.asarray(out, dtype=np.float64)
+
+
+class TimeWindowSum:
+    """时间窗口 [t - window, t] 内的累计和；时间可以是 datetime（window 为 timedelta）或整数（window 同单位）"""
+
+    __slots__ = ("window", "_items", "total", "_updates")
+
+    def __init__(self, window: Any = VOLUME_WINDOW):
+        self.window = window
+        self._items: deque = deque()
+        self.total = 0.0
+        self._updates = 0
+
+    def push(self, t: Any, value: float) -> float:
+        """
+        描述：追加 t 时刻的值（t 不能早于上一次追加的时间）
+        返回值：追加后窗口 [t - window, t] 内的和（不包含之后才追加的同一时刻的值）
+        """
+        items = self._items
+        lower = t - self.window
+        while items and items[0][0] < lower:
+            self.total -= items.popleft()[1]
+        value = float(value)
+        items.append((t, value))
+        self.total += value
+        self._updates += 1
+        if self._updates >= _RESYNC_EVERY:
+            self.total = math.fsum(v for _, v in items)
+            self._updates = 0
+        return self.total
+
+    def update(self, times: Sequence[Any], values: Iterable[float]) -> list[float]:
+        """
+        描述：按时间顺序追加一段值，返回每个值对应的窗口和（同一时刻的对等行取相同的值）
+            同一时刻的值需要在同一次调用中传入，分段读取时由调用方保证对等行不跨段
+        返回值：与 times 等长的列表
+        """
+        out: list[float] = []
+        last = len(times) - 1
+        for i, value in enumerate(values):
+            t = times[i]
+            total = self.push(t, value)
+            if i == last or times[i + 1] != t:
+                out.extend([total] * (i + 1 - len(out)))
+        return out
+
+    def __len__(self) -> int:
+        return len(self._items)
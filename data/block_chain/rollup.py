@@ -0,0 +1,316 @@
+"""
+增量物化的 OHLCV K 线
+
+- 采集任务提交后，只重新计算受影响时间桶的基础 K 线（BASE_INTERVAL_SECONDS 粒度），写入 ohlcv_bars；
+- 更粗的粒度（5m / 15m / 1h / 4h / 1d）由基础 K 线汇总得到，不再扫描原始成交；
+- ohlcv_coverage 按 (数据源, UTC 日期) 记录已完整物化的日期，聚合任务据此判断某个区间能否直接使用 K 线。
+  某一天第一次被物化时会整天重算，之后同一天的新数据只重算受影响的时间桶。
+"""
+
+import datetime
+from typing import Any, Optional
+
+import pandas as pd
+from loguru import logger
+
+from . import symbols
+
+# 基础 K 线粒度（秒），所有 interval_map 中的粒度都是它的整数倍
+BASE_INTERVAL_SECONDS = 60
+
+# 数据源 -> 原始成交表的列映射
+SOURCES = {
+    "Binance": {
+        "table": "binance_trades",
+        "time_column": "trade_time",
+        "volume": "qty",
+        "quote_volume": "quote_qty",
+        "order_by": "trade_time, id",
+        "order_by_desc": "trade_time DESC, id DESC",
+    },
+    "Uniswap": {
+        "table": "uniswap_swaps",
+        "time_column": "block_time",
+        "volume": "ABS(amount_eth)",
+        "quote_volume": "ABS(amount_usdt)",
+        "order_by": "block_time, id",
+        "order_by_desc": "block_time DESC, id DESC",
+    },
+}
+
+ROLLUP_TABLES_DDL = """
+CREATE TABLE IF NOT EXISTS ohlcv_bars (
+    source text NOT NULL,
+    bucket_start timestamptz NOT NULL,
+    open numeric NOT NULL,
+    high numeric NOT NULL,
+    low numeric NOT NULL,
+    close numeric NOT NULL,
+    volume numeric NOT NULL,
+    quote_volume numeric NOT NULL,
+    vwap numeric,
+    trade_count bigint NOT NULL,
+    price_sum numeric NOT NULL,
+    PRIMARY KEY (source, bucket_start)
+);
+CREATE TABLE IF NOT EXISTS ohlcv_coverage (
+    source text NOT NULL,
+    day date NOT NULL,
+    refreshed_at timestamptz NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (source, day)
+);
+"""
+
+# 重算 [start, end) 内的基础 K 线；原始成交只增不减，因此 upsert 即可
+_REFRESH_SQL = """
+INSERT INTO ohlcv_bars (
+    source, bucket_start, open, high, low, close,
+    volume, quote_volume, vwap, trade_count, price_sum
+)
+SELECT
+    %(source)s,
+    date_bin(%(base)s * INTERVAL '1 second', {time_column}, TIMESTAMPTZ '1970-01-01 00:00:00+00') AS bucket_start,
+    (array_agg(price ORDER BY {order_by}))[1],
+    MAX(price),
+    MIN(price),
+    (array_agg(price ORDER BY {order_by_desc}))[1],
+    SUM({volume}),
+    SUM({quote_volume}),
+    SUM(price * {volume}) / NULLIF(SUM({volume}), 0),
+    COUNT(*),
+    SUM(price)
+FROM {table}
+WHERE {time_column} >= %(start)s AND {time_column} < %(end)s AND {symbol_filter}
+GROUP BY 2
+ON CONFLICT (source, bucket_start) DO UPDATE SET
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    volume = EXCLUDED.volume,
+    quote_volume = EXCLUDED.quote_volume,
+    vwap = EXCLUDED.vwap,
+    trade_count = EXCLUDED.trade_count,
+    price_sum = EXCLUDED.price_sum
+"""
+
+# 由基础 K 线汇总出与 process_prices.sql_query 相同结构的 (time_bucket, source, average_price)
+# SUM(price_sum) / SUM(trade_count) 与直接对原始成交 AVG(price) 完全一致
+bars_average_query = """
+SELECT
+    date_bin(%s * INTERVAL '1 second', bucket_start, TIMESTAMPTZ '1970-01-01 00:00:00+00') AS time_bucket,
+    source,
+    SUM(price_sum) / SUM(trade_count) AS average_price
+FROM ohlcv_bars
+WHERE bucket_start >= %s AND bucket_start < %s
+GROUP BY 1, 2
+"""
+
+# 由基础 K 线汇总出任意粗粒度的 OHLCV
+_ROLLUP_OHLCV_SQL = """
+SELECT
+    date_bin(%(interval)s * INTERVAL '1 second', bucket_start, TIMESTAMPTZ '1970-01-01 00:00:00+00') AS time_bucket,
+    (array_agg(open ORDER BY bucket_start))[1] AS open,
+    MAX(high) AS high,
+    MIN(low) AS low,
+    (array_agg(close ORDER BY bucket_start DESC))[1] AS close,
+    SUM(volume) AS volume,
+    SUM(quote_volume) AS quote_volume,
+    SUM(vwap * volume) / NULLIF(SUM(volume), 0) AS vwap,
+    SUM(trade_count) AS trade_count
+FROM ohlcv_bars
+WHERE source = %(source)s AND bucket_start >= %(start)s AND bucket_start < %(end)s
+GROUP BY 1
+ORDER BY 1
+"""
+
+OHLCV_COLUMNS = [
+    "time_bucket",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "quote_volume",
+    "vwap",
+    "trade_count",
+]
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def _floor_day(value: datetime.datetime) -> datetime.datetime:
+    return datetime.datetime(
+        value.year, value.month, value.day, tzinfo=datetime.timezone.utc
+    )
+
+
+def _floor_bucket(value: datetime.datetime) -> datetime.datetime:
+    epoch = int(value.timestamp()) // BASE_INTERVAL_SECONDS * BASE_INTERVAL_SECONDS
+    return datetime.datetime.fromtimestamp(epoch, tz=datetime.timezone.utc)
+
+
+def ensure_rollup_tables(conn) -> None:
+    """创建 K 线表与覆盖记录表（幂等）"""
+    with conn.cursor() as cur:
+        cur.execute(ROLLUP_TABLES_DDL)
+
+
+def refresh_bars(
+    conn, source: str, start: datetime.datetime, end: datetime.datetime
+) -> int:
+    """
+    描述：重算 [start, end] 内受影响时间桶的基础 K 线，并记录完整物化的日期
+        尚未物化过的首尾两天会扩展为整天重算，以便标记为已覆盖。调用方负责提交事务。
+    参数：conn: 数据库连接, source: 数据源（SOURCES 的键）, start / end: 新写入数据的时间范围（含）
+    返回值：写入或更新的 K 线数量
+    """
+    spec = SOURCES[source]
+    start = start.astimezone(datetime.timezone.utc)
+    end = end.astimezone(datetime.timezone.utc)
+    first_day = _floor_day(start)
+    last_day = _floor_day(end)
+
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT day FROM ohlcv_coverage WHERE source = %s AND day IN (%s, %s)",
+            (source, first_day.date(), last_day.date()),
+        )
+        covered = {row[0] for row in cur.fetchall()}
+
+        range_start = _floor_bucket(start) if first_day.date() in covered else first_day
+        range_end = (
+            _floor_bucket(end) + datetime.timedelta(seconds=BASE_INTERVAL_SECONDS)
+            if last_day.date() in covered
+            else last_day + _ONE_DAY
+        )
+
+        cur.execute(
+            _REFRESH_SQL.format(**spec, symbol_filter=symbols.DEFAULT_SYMBOL_FILTER),
+            {
+                "source": source,
+                "base": BASE_INTERVAL_SECONDS,
+                "start": range_start,
+                "end": range_end,
+            },
+        )
+        refreshed = max(cur.rowcount, 0)
+
+        # 只标记被整天重算（或此前已覆盖）的日期
+        days = []
+        day = _floor_day(range_start)
+        if day < range_start:
+            day += _ONE_DAY
+        while day + _ONE_DAY <= range_end:
+            days.append((source, day.date()))
+            day += _ONE_DAY
+        if days:
+            cur.executemany(
+                """
+                INSERT INTO ohlcv_coverage (source, day) VALUES (%s, %s)
+                ON CONFLICT (source, day) DO UPDATE SET refreshed_at = NOW()
+                """,
+                days,
+            )
+
+    logger.info(f"{source} K 线已刷新: {range_start} - {range_end}，共 {refreshed} 根")
+    return refreshed
+
+
+def refresh_after_ingest(
+    conn,
+    source: str,
+    start: Optional[datetime.datetime],
+    end: Optional[datetime.datetime],
+) -> Optional[int]:
+    """
+    描述：采集任务提交后调用：在独立事务中刷新受影响的 K 线
+        K 线只是派生数据，刷新失败只记录警告并清除受影响日期的覆盖记录，不影响采集任务本身的结果
+    返回值：刷新的 K 线数量；没有数据或刷新失败时返回 None
+    """
+    if start is None or end is None:
+        return None
+    try:
+        symbols.ensure_symbol_columns(conn)
+        ensure_rollup_tables(conn)
+        refreshed = refresh_bars(conn, source, start, end)
+        conn.commit()
+        return refreshed
+    except Exception as exc:
+        logger.warning(f"刷新 {source} K 线失败: {exc}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        _invalidate_coverage(conn, source, start, end)
+        return None
+
+
+def _invalidate_coverage(
+    conn, source: str, start: datetime.datetime, end: datetime.datetime
+) -> None:
+    """
+    描述：K 线刷新失败时删除受影响日期的覆盖记录：这些日期的 K 线已经过期，
+        聚合任务改为直接读取原始成交，直到下次刷新成功重新整天物化
+    """
+    first_day = _floor_day(start.astimezone(datetime.timezone.utc)).date()
+    last_day = _floor_day(end.astimezone(datetime.timezone.utc)).date()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM ohlcv_coverage WHERE source = %s AND day >= %s AND day <= %s",
+                (source, first_day, last_day),
+            )
+        conn.commit()
+        logger.warning(f"{source} {first_day} - {last_day} 的 K 线覆盖记录已清除")
+    except Exception as exc:
+        logger.error(f"清除 {source} K 线覆盖记录失败: {exc}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+
+def is_covered(
+    cur, start: datetime.datetime, end: datetime.datetime, interval_seconds: int
+) -> bool:
+    """
+    描述：判断 [start, end)（UTC 零点对齐）内所有数据源是否都已完整物化，且粒度可由基础 K 线汇总
+    """
+    if interval_seconds % BASE_INTERVAL_SECONDS:
+        return False
+    days = (end - start) // _ONE_DAY
+    cur.execute(
+        "SELECT COUNT(*) FROM ohlcv_coverage WHERE day >= %s AND day < %s",
+        (start.date(), end.date()),
+    )
+    row = cur.fetchone()
+    return bool(row) and row[0] == days * len(SOURCES)
+
+
+def fetch_ohlcv(
+    conn,
+    source: str,
+    interval_seconds: int,
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> pd.DataFrame:
+    """
+    描述：由基础 K 线汇总出指定粒度的 OHLCV
+    参数：conn: 数据库连接, source: 数据源, interval_seconds: 粒度（BASE_INTERVAL_SECONDS 的整数倍）, start / end: 左闭右开区间
+    返回值：按时间排序的 DataFrame，列见 OHLCV_COLUMNS
+    """
+    if interval_seconds % BASE_INTERVAL_SECONDS:
+        raise ValueError(
+            f"粒度 {interval_seconds}s 不是基础粒度 {BASE_INTERVAL_SECONDS}s 的整数倍"
+        )
+    params: dict[str, Any] = {
+        "interval": interval_seconds,
+        "source": source,
+        "start": start,
+        "end": end,
+    }
+    with conn.cursor() as cur:
+        cur.execute(_ROLLUP_OHLCV_SQL, params)
+        rows = cur.fetchall()
+    return pd.DataFrame(rows, columns=OHLCV_COLUMNS)
@@ -0,0 +1,482 @@
+"""
+多跳套利路径搜索（三角套利等）
+
+- 把各市场（Uniswap 池子、中心化交易所的交易对）看成资产之间的有向边：交易对 BASE/QUOTE 的价格为 p、
+  手续费为 f 时，BASE -> QUOTE 的兑换率为 p × (1 - f)，QUOTE -> BASE 为 (1 / p) × (1 - f)，
+  边权为 -log(兑换率)，一条回到起点的路径兑换率之积大于 1（扣除手续费后有利润）当且仅当它是负权环；
+- PriceGraph 的节点与边只在出现新的市场时追加，之后每个时刻只原地更新价格变化的市场的两条边权，
+  不为每个时刻重建图；
+- find_cycle 用 SPFA（队列优化的 Bellman-Ford，所有节点初始距离为 0，相当于虚拟源点连到每个节点）
+  检测负权环，沿前驱边取出环上的路径；
+- scan 按时间顺序回放各市场的价格（同一时刻的更新先全部应用再搜索一次），价格没有变化的时刻跳过搜索。
+
+利润率只扣除了各市场的手续费，没有扣除 Gas（结果中的 dex_hops 为路径上 Uniswap 兑换的次数，
+调用者可以按 gas_index 另行扣除）。
+"""
+
+import argparse
+import math
+import time
+from collections import deque
+from typing import Any, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import yaml
+from loguru import logger
+
+from . import symbols, venues
+from .analyse import DEFAULT_STRATEGY
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+ROUTES_CONFIG = config.get("routes", {}) or {}
+
+DEX_VENUE = "uniswap"
+# 拆分交易对时识别的计价资产（按长度从长到短匹配后缀），路径也优先从这些资产开始展示
+QUOTE_ASSETS = tuple(
+    str(asset).upper()
+    for asset in (
+        ROUTES_CONFIG.get("quote_assets") or ("USDT", "USDC", "DAI", "BTC", "ETH")
+    )
+)
+DEFAULT_MIN_PROFIT_RATE = float(ROUTES_CONFIG.get("min_profit_rate", 0.0005))
+DEFAULT_MAX_HOPS = int(ROUTES_CONFIG.get("max_hops", 4))
+
+# 松弛时忽略的浮点误差，避免价格几乎相等的市场之间反复松弛
+_EPSILON = 1e-12
+_NS_PER_SECOND = 1_000_000_000
+
+
+class Market(NamedTuple):
+    """一个可交易的市场：交易所（uniswap 或 CEX 名称）、交易对与单边手续费率"""
+
+    venue: str
+    symbol: str
+    base: str
+    quote: str
+    fee: float
+
+    @property
+    def label(self) -> str:
+        name = "Uniswap" if self.venue == DEX_VENUE else venues.display_name(self.venue)
+        return f"{name}:{self.symbol}"
+
+
+def split_symbol(symbol: str) -> tuple[str, str]:
+    """
+    描述：把交易对拆成 (基础资产, 计价资产)，如 ETHUSDT -> (ETH, USDT)、ETHBTC -> (ETH, BTC)
+        计价资产按 QUOTE_ASSETS 匹配后缀，无法识别时抛出 ValueError
+    """
+    symbol = symbols.normalize_symbol(symbol)
+    for quote in sorted(QUOTE_ASSETS, key=len, reverse=True):
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[: -len(quote)], quote
+    raise ValueError(f"无法识别交易对 {symbol} 的计价资产（routes.quote_assets）")
+
+
+def make_market(
+    venue: str, symbol: str, strategy: Optional[dict[str, Any]] = None, fee=None
+) -> Market:
+    """
+    描述：构造市场，未指定手续费时 Uniswap 使用 uniswap_fee_rate，中心化交易所使用 binance_fee_rate
+    """
+    strategy = {**DEFAULT_STRATEGY, **(strategy or {})}
+    venue = str(venue).strip().lower()
+    if venue != DEX_VENUE:
+        venue = venues.get_adapter(venue).name
+    if fee is None:
+        fee = strategy["uniswap_fee_rate" if venue == DEX_VENUE else "binance_fee_rate"]
+    base, quote = split_symbol(symbol)
+    return Market(venue, symbols.normalize_symbol(symbol), base, quote, float(fee))
+
+
+def configured_markets(strategy: Optional[dict[str, Any]] = None) -> list[Market]:
+    """
+    描述：参与搜索的市场：routes.markets（"<交易所>:<交易对>" 或带 fee 的字典），
+        为空时为默认交易对与 symbols.pools 中各交易对的 Uniswap 池子与 Binance 交易对
+    """
+    specs = ROUTES_CONFIG.get("markets") or [
+        f"{venue}:{symbol}"
+        for symbol in dict.fromkeys(
+            [symbols.DEFAULT_SYMBOL, *symbols.POOL_SYMBOLS.values()]
+        )
+        for venue in (DEX_VENUE, venues.DEFAULT_VENUE)
+    ]
+    markets = []
+    for spec in specs:
+        if isinstance(spec, str):
+            venue, symbol = spec.split(":", 1)
+            markets.append(make_market(venue, symbol, strategy))
+        else:
+            markets.append(
+                make_market(spec["venue"], spec["symbol"], strategy, spec.get("fee"))
+            )
+    return list(dict.fromkeys(markets))
+
+
+class PriceGraph:
+    """
+    资产之间的兑换图：每个市场两条有向边（第 2i 条为 BASE -> QUOTE，第 2i+1 条为 QUOTE -> BASE）
+    边与邻接表只在 add_market 时追加；没有价格的市场边权为 +inf，不参与松弛
+    """
+
+    def __init__(self, markets: Sequence[Market] = ()):
+        self.markets: list[Market] = []
+        self.assets: list[str] = []
+        self._asset_index: dict[str, int] = {}
+        self._market_index: dict[tuple[str, str], int] = {}
+        self._src: list[int] = []
+        self._dst: list[int] = []
+        self._weights: list[float] = []
+        # -log(1 - fee)，每个市场一个
+        self._fee_weights: list[float] = []
+        self._log_prices: list[float] = []
+        self._adjacency: list[list[int]] = []
+        for market in markets:
+            self.add_market(market)
+
+    def __len__(self) -> int:
+        return len(self.markets)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._weights)
+
+    def _node(self, asset: str) -> int:
+        index = self._asset_index.get(asset)
+        if index is None:
+            index = len(self.assets)
+            self._asset_index[asset] = index
+            self.assets.append(asset)
+            self._adjacency.append([])
+        return index
+
+    def add_market(self, market: Market) -> int:
+        """追加市场（已存在时返回原来的下标），新市场在第一次 update 之前不参与搜索"""
+        key = (market.venue, market.symbol)
+        if key in self._market_index:
+            return self._market_index[key]
+        index = len(self.markets)
+        self._market_index[key] = index
+        self.markets.append(market)
+        base, quote = self._node(market.base), self._node(market.quote)
+        for src, dst in ((base, quote), (quote, base)):
+            self._adjacency[src].append(len(self._src))
+            self._src.append(src)
+            self._dst.append(dst)
+            self._weights.append(math.inf)
+        self._fee_weights.append(-math.log1p(-market.fee))
+        self._log_prices.append(math.nan)
+        return index
+
+    def market_index(self, venue: str, symbol: str) -> int:
+        return self._market_index[(venue, symbols.normalize_symbol(symbol))]
+
+    def update(self, market: int, price: float) -> bool:
+        """更新市场价格（QUOTE / BASE），返回边权是否变化"""
+        return self._set_log_price(market, math.log(price))
+
+    def _set_log_price(self, market: int, log_price: float) -> bool:
+        if self._log_prices[market] == log_price or not math.isfinite(log_price):
+            return False
+        self._log_prices[market] = log_price
+        fee_weight = self._fee_weights[market]
+        self._weights[2 * market] = fee_weight - log_price
+        self._weights[2 * market + 1] = fee_weight + log_price
+        return True
+
+    def find_cycle(self) -> Optional[list[int]]:
+        """
+        描述：SPFA 检测负权环：某个节点的最短路径边数达到节点数时，前驱边中必然有环且为负权环
+        返回值：环上的边（按兑换顺序），没有负权环时返回 None
+        """
+        n = len(self.assets)
+        dist = [0.0] * n
+        hops = [0] * n
+        pred = [-1] * n
+        in_queue = [True] * n
+        queue = deque(range(n))
+        weights, dst, adjacency = self._weights, self._dst, self._adjacency
+        while queue:
+            u = queue.popleft()
+            in_queue[u] = False
+            du = dist[u]
+            for e in adjacency[u]:
+                candidate = du + weights[e]
+                v = dst[e]
+                if candidate < dist[v] - _EPSILON:
+                    dist[v] = candidate
+                    pred[v] = e
+                    hops[v] = hops[u] + 1
+                    if hops[v] >= n:
+                        return self._cycle_through(v, pred)
+                    if not in_queue[v]:
+                        in_queue[v] = True
+                        queue.append(v)
+        return None
+
+    def _cycle_through(self, v: int, pred: list[int]) -> list[int]:
+        # 沿前驱走 n 步后一定落在环上
+        for _ in range(len(self.assets)):
+            v = self._src[pred[v]]
+        start, edges = v, []
+        while True:
+            e = pred[v]
+            edges.append(e)
+            v = self._src[e]
+            if v == start:
+                break
+        edges.reverse()
+        # 从计价资产开始展示
+        ranks = [
+            (
+                QUOTE_ASSETS.index(self.assets[self._src[e]])
+                if self.assets[self._src[e]] in QUOTE_ASSETS
+                else len(QUOTE_ASSETS)
+            )
+            for e in edges
+        ]
+        first = ranks.index(min(ranks))
+        return edges[first:] + edges[:first]
+
+    def describe(self, edges: list[int]) -> dict[str, Any]:
+        """把环上的边整理为路径：资产序列、每一跳的市场与方向、扣除手续费后的利润率"""
+        path = [self.assets[self._src[edges[0]]]]
+        legs = []
+        for e in edges:
+            market = self.markets[e // 2]
+            path.append(self.assets[self._dst[e]])
+            legs.append(f"{market.label} {'sell' if e % 2 == 0 else 'buy'}")
+        total = sum(self._weights[e] for e in edges)
+        return {
+            "path": path,
+            "legs": legs,
+            "hops": len(edges),
+            "dex_hops": sum(self.markets[e // 2].venue == DEX_VENUE for e in edges),
+            "profit_rate": math.expm1(-total),
+        }
+
+    def scan(
+        self,
+        times_ns: np.ndarray,
+        market_ids: np.ndarray,
+        prices: np.ndarray,
+        min_profit_rate: float = DEFAULT_MIN_PROFIT_RATE,
+        max_hops: int = DEFAULT_MAX_HOPS,
+    ) -> list[dict[str, Any]]:
+        """
+        描述：按时间顺序应用各市场的价格，每个有价格变化的时刻搜索一次负权环
+        参数：times_ns: 时间（纳秒）, market_ids: 市场下标, prices: 价格（QUOTE / BASE），三者等长；
+            min_profit_rate: 最低利润率, max_hops: 最多跳数（更长的环不报告）
+        返回值：路径机会列表（block_time、path、legs、hops、dex_hops、profit_rate）
+        """
+        times_ns = np.asarray(times_ns, dtype=np.int64)
+        order = np.argsort(times_ns, kind="stable")
+        times_ns = times_ns[order]
+        ids = np.asarray(market_ids, dtype=np.int64)[order].tolist()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_prices = np.log(np.asarray(prices, dtype=np.float64)[order]).tolist()
+        # 同一时刻的更新为一组
+        bounds = np.flatnonzero(np.diff(times_ns)) + 1
+        starts = [0, *bounds.tolist()]
+        ends = [*bounds.tolist(), len(times_ns)]
+
+        found = []
+        for start, end in zip(starts, ends):
+            changed = False
+            for k in range(start, end):
+                changed |= self._set_log_price(ids[k], log_prices[k])
+            if not changed:
+                continue
+            edges = self.find_cycle()
+            if edges is None or len(edges) > max_hops:
+                continue
+            route = self.describe(edges)
+            if route["profit_rate"] >= min_profit_rate:
+                route["block_time"] = pd.Timestamp(int(times_ns[start]), tz="UTC")
+                found.append(route)
+        return found
+
+
+def fetch_market_prices(
+    conn, markets: Sequence[Market], start: pd.Timestamp, end: pd.Timestamp
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    描述：在数据库中按秒汇总各市场在 [start, end) 内的均价
+        Uniswap 市场读取 uniswap_swaps 中该交易对的 Swap，中心化交易所读取其成交表
+    返回值：(时间（纳秒）, 市场下标, 价格)，未排序
+    """
+    times, ids, prices = [], [], []
+    with conn.cursor() as cur:
+        for index, market in enumerate(markets):
+            if market.venue == DEX_VENUE:
+                table, time_column = "uniswap_swaps", "block_time"
+            else:
+                table, time_column = venues.venue_table(market.venue), "trade_time"
+            cur.execute(
+                f"""
+                SELECT EXTRACT(EPOCH FROM date_trunc('second', {time_column}))::bigint,
+                       AVG(price)
+                FROM {table}
+                WHERE symbol = %s AND {time_column} >= %s AND {time_column} < %s
+                GROUP BY 1
+                """,
+                (market.symbol, start.to_pydatetime(), end.to_pydatetime()),
+            )
+            rows = cur.fetchall()
+            times.extend(int(row[0]) * _NS_PER_SECOND for row in rows)
+            prices.extend(float(row[1]) for row in rows)
+            ids.extend([index] * len(rows))
+    return (
+        np.asarray(times, dtype=np.int64),
+        np.asarray(ids, dtype=np.int64),
+        np.asarray(prices, dtype=np.float64),
+    )
+
+
+def scan_routes(
+    conn,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    markets: Optional[Sequence[Market]] = None,
+    strategy: Optional[dict[str, Any]] = None,
+) -> list[dict[str, Any]]:
+    """
+    描述：搜索 [start, end) 内各市场之间的多跳套利路径
+    返回值：路径机会列表
+    """
+    strategy = strategy or {}
+    markets = list(markets or configured_markets(strategy))
+    graph = PriceGraph(markets)
+    times_ns, ids, prices = fetch_market_prices(conn, markets, start, end)
+    logger.info(
+        f"路径搜索：{len(markets)} 个市场、{len(graph.assets)} 种资产，{len(times_ns)} 条按秒价格"
+    )
+    return graph.scan(
+        times_ns,
+        ids,
+        prices,
+        min_profit_rate=float(
+            strategy.get("route_min_profit_rate", DEFAULT_MIN_PROFIT_RATE)
+        ),
+        max_hops=int(strategy.get("route_max_hops", DEFAULT_MAX_HOPS)),
+    )
+
+
+def synthetic_markets(
+    assets: int = 12, markets: int = 50, seed: int = 0
+) -> tuple[list[Market], np.ndarray, np.ndarray]:
+    """
+    描述：生成合成市场：assets 种资产（第一种为 USDT），markets 个随机交易对分布在 Uniswap 与 Binance 上
+    返回值：(市场列表, 每个市场的基础资产下标, 计价资产下标)
+    """
+    rng = np.random.default_rng(seed)
+    names = ["USDT"] + [f"A{k}" for k in range(1, assets)]
+    result, base_ids, quote_ids = [], [], []
+    while len(result) < markets:
+        base, quote = rng.choice(assets, 2, replace=False)
+        venue = (DEX_VENUE, venues.DEFAULT_VENUE)[len(result) % 2]
+        fee = 0.0005 if venue == DEX_VENUE else 0.001
+        market = Market(
+            venue, f"{names[base]}{names[quote]}", names[base], names[quote], fee
+        )
+        if market in result:
+            continue
+        result.append(market)
+        base_ids.append(base)
+        quote_ids.append(quote)
+    return result, np.asarray(base_ids), np.asarray(quote_ids)
+
+
+def benchmark(
+    timestamps: int = 100_000,
+    markets: int = 50,
+    assets: int = 12,
+    updates_per_timestamp: int = 3,
+) -> dict[str, Any]:
+    """
+    描述：在合成市场（markets 个市场即 2 × markets 条边）上按时间回放随机游走的价格，
+        每个时刻更新 updates_per_timestamp 个市场的价格（围绕真实价格有少量噪声，偶尔出现套利环），
+        测量每个时刻的平均搜索耗时，并按每秒一个时刻估算扫描一个月所需的时间
+    """
+    market_list, base_ids, quote_ids = synthetic_markets(assets, markets)
+    rng = np.random.default_rng(1)
+    true_log = np.cumsum(
+        rng.normal(0, 1e-5, (timestamps, assets)), axis=0
+    ) + rng.uniform(0, 8, assets)
+    true_log[:, 0] = 0.0
+
+    count = timestamps * updates_per_timestamp
+    times_ns = np.repeat(np.arange(timestamps, dtype=np.int64), updates_per_timestamp)
+    times_ns *= _NS_PER_SECOND
+    ids = rng.integers(0, markets, count)
+    steps = times_ns // _NS_PER_SECOND
+    prices = np.exp(
+        true_log[steps, base_ids[ids]]
+        - true_log[steps, quote_ids[ids]]
+        + rng.normal(0, 3e-4, count)
+    )
+    # 先给所有市场一个价格
+    init_ns = np.full(markets, -_NS_PER_SECOND, dtype=np.int64)
+    init_prices = np.exp(true_log[0, base_ids] - true_log[0, quote_ids])
+
+    graph = PriceGraph(market_list)
+    graph.scan(init_ns, np.arange(markets), init_prices)
+    started = time.perf_counter()
+    found = graph.scan(times_ns, ids, prices)
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "edges": graph.edge_count,
+        "assets": len(graph.assets),
+        "timestamps": timestamps,
+        "routes": len(found),
+        "us_per_timestamp": round(elapsed / timestamps * 1e6, 1),
+        "month_minutes": round(elapsed / timestamps * 30 * 86400 / 60, 1),
+    }
+    logger.info(f"路径搜索基准: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多跳套利路径搜索")
+    parser.add_argument(
+        "--benchmark", action="store_true", help="在合成市场上测量每个时刻的搜索耗时"
+    )
+    parser.add_argument(
+        "--timestamps", type=int, default=100_000, help="基准回放的时刻数"
+    )
+    parser.add_argument(
+        "--markets", type=int, default=50, help="基准的市场数（边数为两倍）"
+    )
+    parser.add_argument("--start", help="搜索起始时间（UTC）")
+    parser.add_argument("--end", help="搜索结束时间（UTC，不含）")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.timestamps, args.markets)
+    else:
+        db_config = config.get("db", {})
+        cli_conn = psycopg2.connect(
+            host=db_config["host"],
+            port=db_config["port"],
+            dbname=db_config["database"],
+            user=db_config["username"],
+            password=db_config["password"],
+        )
+        try:
+            routes = scan_routes(
+                cli_conn,
+                pd.Timestamp(args.start, tz="UTC"),
+                pd.Timestamp(args.end, tz="UTC"),
+            )
+        finally:
+            cli_conn.close()
+        logger.info(f"找到 {len(routes)} 条路径机会")
+        for route in sorted(routes, key=lambda r: r["profit_rate"], reverse=True)[:20]:
+            logger.info(
+                f"{route['block_time']} {' -> '.join(route['path'])}"
+                f" ({'; '.join(route['legs'])}) 利润率 {route['profit_rate']:.4%}"
+            )
@@ -0,0 +1,539 @@
+"""
+流式套利检测（Worker 的常驻模式）
+
+- 事件源按批产出 Binance 成交与 Uniswap Swap 事件：测试与回放使用 replay_events（本地数据按时间归并），
+  常驻模式使用 PostgresTailSource（按 id 轮询两张原始表的新增行，作为实时行情的替身）；
+- Binance 成交放入按时间追加的窗口缓冲（价格前缀和 + 二分查找），每笔 Swap 在延迟窗口
+  [T - delay - window, T - delay + window] 内的 Binance 均价、10 分钟累计成交量与 10 个点的滚动波动率
+  都与 analyse.fetch_price_pairs / analyze_opportunities 的语义一致；
+- 利润与风险指标复用 analyse.evaluate_pair（即 calculate_profit_* 与 analyze_risk.calculate_risk_metrics_local）；
+- 一笔 Swap 在 Binance 时钟越过其窗口右端（且不早于 T）后立即评估，机会通过回调发出。
+
+事件为元组 (time_ns, kind, price, gas_price, amount)：kind 为 BINANCE / UNISWAP，
+Binance 成交的 gas_price 为 0、amount 为 qty，Uniswap Swap 的 amount 为 amount_eth。
+同一数据源内晚于该源时钟到达的乱序事件无法插入窗口，只计数并丢弃。
+"""
+
+import argparse
+import heapq
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import pandas as pd
+import psycopg2
+import yaml
+from loguru import logger
+
+from . import analyse, symbols
+from .rolling_stats import VOLATILITY_POINTS, RollingMeanStd
+from .tickstore import VOLUME_WINDOW_NS
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+STREAMING_CONFIG = config.get("streaming", {}) or {}
+# 轮询源补读晚提交的行的尾部窗口（id 个数）
+DEFAULT_TAIL_WINDOW = int(STREAMING_CONFIG.get("tail_window_ids", 10_000))
+
+BINANCE = 0
+UNISWAP = 1
+
+_NS_PER_SECOND = 1_000_000_000
+# 每处理这么多事件整理一次过期窗口数据
+_EVICT_EVERY = 4096
+_COMPACT_MIN = 4096
+
+
+class _TimeWindow:
+    """按时间追加的窗口缓冲：记录值的前缀和，任意闭区间 [lo, hi] 的和与个数为 O(log n)，过期数据整段丢弃"""
+
+    __slots__ = ("times", "prefix", "start", "base")
+
+    def __init__(self):
+        self.times: list[int] = []
+        # prefix[k] 为前 k 个 (value - base) 之和；以第一个值为基准减小长序列的舍入误差
+        self.prefix: list[float] = [0.0]
+        self.start = 0
+        self.base: Optional[float] = None
+
+    def append(self, t: int, value: float) -> None:
+        if self.base is None:
+            self.base = value
+        self.times.append(t)
+        self.prefix.append(self.prefix[-1] + (value - self.base))
+
+    def sum_count(self, lo: int, hi: int) -> tuple[float, int]:
+        i = bisect_left(self.times, lo, self.start)
+        j = bisect_right(self.times, hi, self.start)
+        n = j - i
+        if n <= 0:
+            return 0.0, 0
+        return self.prefix[j] - self.prefix[i] + self.base * n, n
+
+    def evict_before(self, t: int) -> None:
+        self.start = bisect_left(self.times, t, self.start)
+        if self.start > _COMPACT_MIN and self.start * 2 > len(self.times):
+            del self.times[: self.start]
+            del self.prefix[: self.start]
+            self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.times) - self.start
+
+
+class StreamingDetector:
+    """逐事件的套利检测器（单线程使用）"""
+
+    def __init__(
+        self,
+        strategy: dict[str, Any],
+        on_opportunity: Optional[Callable[[dict[str, Any]], None]] = None,
+    ):
+        """
+        描述：初始化检测器
+        参数：strategy: 策略参数（与 analyse 相同）, on_opportunity: 发现机会时的回调，默认收集到 self.opportunities
+        """
+        self.strategy = {**analyse.DEFAULT_STRATEGY, **strategy}
+        self.opportunities: list[dict[str, Any]] = []
+        self._emit = on_opportunity or self.opportunities.append
+        self._delay_ns = int(
+            float(self.strategy["time_delay_seconds"]) * _NS_PER_SECOND
+        )
+        self._window_ns = int(float(self.strategy["window_seconds"]) * _NS_PER_SECOND)
+        # Swap 在 Binance 时钟越过 max(T, T - delay + window) 后才能评估
+        self._ready_offset = max(0, self._window_ns - self._delay_ns)
+
+        self._binance = _TimeWindow()
+        self._volume = _TimeWindow()
+        self._prices = RollingMeanStd(VOLATILITY_POINTS)
+        # 等待 Binance 窗口闭合的 Swap：(time_ns, price, gas_price)
+        self._pending: deque = deque()
+        self._binance_clock = -1
+        self._uniswap_clock = -1
+        self._since_evict = 0
+        # 不整理该时间之后的 Binance 成交（回放引擎的定时回调还需要按时间查询窗口均价）
+        self.retain_from: Optional[int] = None
+        # 最近一次发出的机会对应的 Swap：(time_ns, price, gas_price)
+        self.last_swap: Optional[tuple] = None
+
+        self.events = 0
+        self.late_events = 0
+        self.emitted = 0
+        self.swaps = 0
+        self.matched = 0
+        self._latencies: deque = deque(maxlen=10000)
+        self._busy_seconds = 0.0
+
+    def process_many(self, events: Iterable[tuple]) -> int:
+        """
+        描述：按顺序处理一批事件，评估所有窗口已闭合的 Swap
+        返回值：本批发现的机会数量
+        """
+        # 延迟从这批事件开始处理算起（常驻模式下即轮询返回的时刻）
+        began = time.perf_counter()
+        before = self.emitted
+        binance_append = self._binance.append
+        volume_append = self._volume.append
+        pending = self._pending
+        count = 0
+        for t, kind, price, gas, amount in events:
+            count += 1
+            if kind == BINANCE:
+                if t < self._binance_clock:
+                    self.late_events += 1
+                    continue
+                self._binance_clock = t
+                binance_append(t, price)
+                if pending and t > pending[0][0] + self._ready_offset:
+                    self._evaluate_ready(began)
+            else:
+                if t < self._uniswap_clock:
+                    self.late_events += 1
+                    continue
+                self._uniswap_clock = t
+                volume_append(t, abs(amount))
+                pending.append((t, price, gas))
+                self.swaps += 1
+        # Uniswap 落后于 Binance 时，新到的 Swap 窗口可能已经闭合
+        if pending and self._binance_clock > pending[0][0] + self._ready_offset:
+            self._evaluate_ready(began)
+        self.events += count
+        self._since_evict += count
+        if self._since_evict >= _EVICT_EVERY:
+            self._evict()
+        self._busy_seconds += time.perf_counter() - began
+        return self.emitted - before
+
+    def flush(self) -> int:
+        """
+        描述：数据流结束时评估所有仍在等待的 Swap（窗口按已有数据计算，与批量 SQL 一致）
+        返回值：发现的机会数量
+        """
+        before = self.emitted
+        self._evaluate_ready(time.perf_counter(), force=True)
+        return self.emitted - before
+
+    def _evaluate_ready(self, arrived_at: float, force: bool = False) -> None:
+        pending = self._pending
+        clock = self._binance_clock
+        ready_offset = self._ready_offset
+        delay, window = self._delay_ns, self._window_ns
+        prices = self._prices
+        strategy = self.strategy
+        while pending and (force or clock > pending[0][0] + ready_offset):
+            t, price, gas = pending.popleft()
+            center = t - delay
+            total, n = self._binance.sum_count(center - window, center + window)
+            # 窗口内没有 Binance 成交的 Swap 与 SQL 的内连接一样被丢弃
+            if not n:
+                continue
+            self.matched += 1
+            binance_price = total / n
+            prices.push(price)
+            volatility = prices.coefficient_of_variation()
+            if volatility != volatility:
+                volatility = 0.0
+            if gas is None or gas != gas or price != price:
+                continue
+            market_volume, _ = self._volume.sum_count(t - VOLUME_WINDOW_NS, t)
+            opp = analyse.evaluate_pair(
+                strategy,
+                pd.Timestamp(t, tz="UTC"),
+                price,
+                gas,
+                binance_price,
+                volatility,
+                market_volume,
+            )
+            if opp:
+                self.emitted += 1
+                self.last_swap = (t, price, gas)
+                self._emit(opp)
+                self._latencies.append(time.perf_counter() - arrived_at)
+
+    def _evict(self) -> None:
+        self._since_evict = 0
+        oldest = self._pending[0][0] if self._pending else self._uniswap_clock
+        if oldest < 0:
+            return
+        boundary = oldest - self._delay_ns - self._window_ns
+        if self.retain_from is not None:
+            boundary = min(boundary, self.retain_from)
+        self._binance.evict_before(boundary)
+        self._volume.evict_before(oldest - VOLUME_WINDOW_NS)
+
+    @property
+    def binance_clock(self) -> int:
+        """已处理的最晚 Binance 成交时间（纳秒），尚未收到成交时为 -1"""
+        return self._binance_clock
+
+    def binance_average(self, lo: int, hi: int) -> Optional[float]:
+        """[lo, hi]（闭区间）内 Binance 成交的均价，没有成交时为 None"""
+        total, n = self._binance.sum_count(lo, hi)
+        return total / n if n else None
+
+    def stats(self) -> dict[str, Any]:
+        """
+        描述：返回检测统计
+        返回值：包含 events, swaps, matched, opportunities, late_events, pending, events_per_sec, p50_ms, p99_ms 的字典
+        """
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            index = min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))
+            return latencies[index] * 1000
+
+        return {
+            "events": self.events,
+            "swaps": self.swaps,
+            "matched": self.matched,
+            "opportunities": self.emitted,
+            "late_events": self.late_events,
+            "pending": len(self._pending),
+            "events_per_sec": (
+                round(self.events / self._busy_seconds, 1)
+                if self._busy_seconds
+                else 0.0
+            ),
+            "p50_ms": round(percentile(0.5), 3),
+            "p99_ms": round(percentile(0.99), 3),
+        }
+
+
+def replay_events(
+    binance: Iterable[tuple],
+    uniswap: Iterable[tuple],
+    batch_size: int = 10_000,
+) -> Iterator[list[tuple]]:
+    """
+    描述：本地回放源：按时间归并两个已排序的序列，按批产出事件
+    参数：binance: (time_ns, price, qty) 序列, uniswap: (time_ns, price, gas_price, amount_eth) 序列,
+        batch_size: 每批事件数
+    """
+    merged = heapq.merge(
+        ((t, BINANCE, price, 0, qty) for t, price, qty in binance),
+        ((t, UNISWAP, price, gas, amount) for t, price, gas, amount in uniswap),
+    )
+    batch = []
+    for event in merged:
+        batch.append(event)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def tickstore_events(
+    store, start_ns: Optional[int] = None, end_ns: Optional[int] = None
+) -> Iterator[list[tuple]]:
+    """从 tickstore 的内存映射数组回放 [start_ns, end_ns] 内的事件"""
+    binance = store.load("binance", start_ns, end_ns)
+    uniswap = store.load("uniswap", start_ns, end_ns)
+    return replay_events(
+        zip(
+            binance["time"].tolist(),
+            binance["price"].tolist(),
+            binance["volume"].tolist(),
+        ),
+        zip(
+            uniswap["time"].tolist(),
+            uniswap["price"].tolist(),
+            uniswap["gas"].tolist(),
+            uniswap["volume"].tolist(),
+        ),
+    )
+
+
+class PostgresTailSource:
+    """
+    实时行情的替身：按 id 轮询 binance_trades 与 uniswap_swaps 中默认交易对的新增行
+
+    id 不是按提交顺序分配的（并发导入的事务乱序提交），高水位之下晚提交的行在每次轮询时
+    于 tail_window 个 id 的尾部窗口内补读，已读取的 id 去重；更早区间的重新导入属于历史数据，
+    由 replay 回放
+    """
+
+    _SELECTS = {
+        BINANCE: (
+            "SELECT id, floor(extract(epoch from trade_time) * 1000000)::bigint,"
+            " price::float8, 0::float8, qty::float8"
+            f" FROM binance_trades WHERE {symbols.DEFAULT_SYMBOL_FILTER}"
+        ),
+        UNISWAP: (
+            "SELECT id, floor(extract(epoch from block_time) * 1000000)::bigint,"
+            " price::float8, gas_price::float8, amount_eth::float8"
+            f" FROM uniswap_swaps WHERE {symbols.DEFAULT_SYMBOL_FILTER}"
+        ),
+    }
+    _NEW_ROWS = " AND id > %s ORDER BY id LIMIT %s"
+    _LATE_ROWS = " AND id > %s AND id <= %s AND id <> ALL(%s) ORDER BY id"
+    _TABLES = {BINANCE: "binance_trades", UNISWAP: "uniswap_swaps"}
+
+    def __init__(
+        self,
+        conn,
+        batch_rows: int = 50_000,
+        from_start: bool = False,
+        tail_window: int = DEFAULT_TAIL_WINDOW,
+    ):
+        """
+        描述：初始化轮询源
+        参数：conn: 数据库连接, batch_rows: 每张表每次最多读取的新行数, from_start: 从头读取（默认只读取启动之后的新行）,
+            tail_window: 补读晚提交的行的尾部窗口（id 个数），0 表示不补读
+        """
+        self.conn = conn
+        self.batch_rows = batch_rows
+        self.tail_window = max(0, int(tail_window))
+        self._last_ids: dict[int, int] = {}
+        # 尾部窗口内已读取的 id
+        self._seen: dict[int, set[int]] = {kind: set() for kind in self._TABLES}
+        # 升级前的数据库可能还没有 symbol 列
+        symbols.ensure_symbol_columns(conn)
+        if not from_start:
+            with conn.cursor() as cur:
+                for kind, table in self._TABLES.items():
+                    cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+                    last_id = cur.fetchone()[0]
+                    self._last_ids[kind] = last_id
+                    if self.tail_window and last_id:
+                        # 启动前已经存在的行不算晚提交
+                        cur.execute(
+                            f"SELECT id FROM {table} WHERE {symbols.DEFAULT_SYMBOL_FILTER}"
+                            " AND id > %s AND id <= %s",
+                            (last_id - self.tail_window, last_id),
+                        )
+                        self._seen[kind].update(row[0] for row in cur.fetchall())
+            conn.rollback()
+
+    def poll(self) -> list[tuple]:
+        """读取两张表的新增行与尾部窗口内晚提交的行，每个数据源内按时间排序后返回"""
+        events = []
+        with self.conn.cursor() as cur:
+            for kind, select in self._SELECTS.items():
+                last_id = self._last_ids.get(kind, 0)
+                seen = self._seen[kind]
+                rows = []
+                if self.tail_window and last_id:
+                    cur.execute(
+                        select + self._LATE_ROWS,
+                        (last_id - self.tail_window, last_id, sorted(seen)),
+                    )
+                    rows = cur.fetchall()
+                    if rows:
+                        logger.info(
+                            f"{self._TABLES[kind]} 补读 {len(rows)} 行高水位之下晚提交的数据"
+                        )
+                cur.execute(select + self._NEW_ROWS, (last_id, self.batch_rows))
+                fresh = cur.fetchall()
+                if fresh:
+                    last_id = self._last_ids[kind] = fresh[-1][0]
+                rows.extend(fresh)
+                if not rows:
+                    continue
+                if self.tail_window:
+                    floor = last_id - self.tail_window
+                    seen.update(row[0] for row in rows)
+                    self._seen[kind] = {i for i in seen if i > floor}
+                batch = [
+                    (us * 1000, kind, price, gas, amount)
+                    for _, us, price, gas, amount in rows
+                ]
+                batch.sort(key=lambda event: event[0])
+                events.extend(batch)
+        self.conn.rollback()
+        return events
+
+
+def run_streaming(
+    source,
+    strategy: dict[str, Any],
+    on_flush: Callable[[list[dict[str, Any]]], None],
+    poll_interval: float = 0.2,
+    flush_interval: float = 1.0,
+    report_interval: float = 60.0,
+    stop_event: Optional[threading.Event] = None,
+) -> StreamingDetector:
+    """
+    描述：常驻检测循环：不断从轮询源读取事件，按 flush_interval 把新机会交给 on_flush
+    参数：source: 带 poll() 的事件源, strategy: 策略参数, on_flush: 写出一批机会的函数,
+        poll_interval: 没有新事件时的等待时间（秒）, flush_interval: 写出间隔（秒）,
+        report_interval: 统计日志间隔（秒）, stop_event: 停止信号
+    返回值：检测器（包含统计）
+    """
+    stop_event = stop_event or threading.Event()
+    buffer: list[dict[str, Any]] = []
+    detector = StreamingDetector(strategy, on_opportunity=buffer.append)
+    last_flush = last_report = time.monotonic()
+    while not stop_event.is_set():
+        events = source.poll()
+        if events:
+            detector.process_many(events)
+        now = time.monotonic()
+        if buffer and now - last_flush >= flush_interval:
+            on_flush(buffer[:])
+            buffer.clear()
+            last_flush = now
+        if report_interval > 0 and now - last_report >= report_interval:
+            logger.info(f"流式检测统计: {detector.stats()}")
+            last_report = now
+        if not events:
+            stop_event.wait(poll_interval)
+    if buffer:
+        on_flush(buffer[:])
+    return detector
+
+
+def run_streaming_worker(stop_event: Optional[threading.Event] = None) -> None:
+    """
+    描述：Worker 的流式模式入口（python server.py --stream）：轮询原始表，把机会追加到 streaming.batch_id 批次
+    """
+    db_config = config.get("db", {})
+    conn = psycopg2.connect(
+        host=db_config["host"],
+        port=db_config["port"],
+        dbname=db_config["database"],
+        user=db_config["username"],
+        password=db_config["password"],
+    )
+    conn.autocommit = False
+    batch_id = int(STREAMING_CONFIG.get("batch_id", 1))
+    strategy = {**analyse.DEFAULT_STRATEGY, **(STREAMING_CONFIG.get("strategy") or {})}
+    try:
+        analyse.ensure_batch_exists(conn, batch_id)
+        source = PostgresTailSource(
+            conn, batch_rows=int(STREAMING_CONFIG.get("batch_rows", 50_000))
+        )
+
+        def save(opportunities):
+            analyse.save_results(conn, opportunities, batch_id)
+            logger.info(f"流式检测写入 {len(opportunities)} 条机会到批次 {batch_id}")
+
+        logger.info(f"流式套利检测启动，批次 {batch_id}")
+        detector = run_streaming(
+            source,
+            strategy,
+            save,
+            poll_interval=float(STREAMING_CONFIG.get("poll_interval_seconds", 0.2)),
+            flush_interval=float(STREAMING_CONFIG.get("flush_interval_seconds", 1.0)),
+            report_interval=float(STREAMING_CONFIG.get("report_interval_seconds", 60)),
+            stop_event=stop_event,
+        )
+        logger.info(f"流式套利检测结束: {detector.stats()}")
+    finally:
+        conn.close()
+
+
+def synthetic_events(
+    swaps: int, trades_per_swap: int = 9, start_ns: int = 1_756_713_600 * _NS_PER_SECOND
+) -> tuple[list[tuple], list[tuple]]:
+    """
+    描述：生成基准用的合成行情：每 12 秒一笔 Swap，期间均匀分布 trades_per_swap 笔 Binance 成交
+    返回值：(binance, uniswap) 两个已排序的序列
+    """
+    block_ns = 12 * _NS_PER_SECOND
+    step = block_ns // trades_per_swap
+    binance, uniswap = [], []
+    for i in range(swaps):
+        base = start_ns + i * block_ns
+        mid = 3000.0 + 20.0 * math.sin(i / 50.0)
+        for j in range(trades_per_swap):
+            binance.append((base + j * step, mid + ((i * 7 + j) % 11 - 5) * 0.5, 0.1))
+        uniswap.append((base, mid + ((i * 13) % 17 - 8) * 2.0, 2e10, -1.5))
+    return binance, uniswap
+
+
+def benchmark(swaps: int = 100_000, trades_per_swap: int = 9) -> dict[str, Any]:
+    """
+    描述：单线程吞吐基准：回放合成行情（不含数据生成时间）
+    返回值：检测统计（events_per_sec 为纯处理吞吐）
+    """
+    binance, uniswap = synthetic_events(swaps, trades_per_swap)
+    batches = list(replay_events(binance, uniswap))
+    detector = StreamingDetector({"profit_threshold": 1})
+    for batch in batches:
+        detector.process_many(batch)
+    detector.flush()
+    result = detector.stats()
+    logger.info(f"流式检测基准（{result['events']} 个事件）: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式套利检测")
+    parser.add_argument("--benchmark", action="store_true", help="回放合成行情测量吞吐")
+    parser.add_argument("--swaps", type=int, default=100_000, help="基准 Swap 数")
+    parser.add_argument(
+        "--trades-per-swap", type=int, default=9, help="每笔 Swap 之间的 Binance 成交数"
+    )
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.swaps, args.trades_per_swap)
+    else:
+        run_streaming_worker()
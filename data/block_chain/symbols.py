@@ -0,0 +1,196 @@
+"""
+多交易对支持
+
+- binance_trades / uniswap_swaps 增加 symbol 列（旧数据默认为 symbols.default，即 ETHUSDT），
+  并建立以 symbol 开头的 (symbol, 时间) 索引，按交易对过滤时只扫描该交易对的时间区间；
+- 采集任务按任务参数 symbol（Uniswap 任务也可由 symbols.pools 中的池子地址推出）写入 symbol 列；
+- 套利分析任务可以通过 symbols 参数一次分析多个交易对：每个交易对在独立的数据库连接上并行取价格对并分析，
+  结果在一个事务中写入同一批次；
+- Parquet 镜像、逐笔数组、K 线、聚合价格、池子快照等派生数据只覆盖默认交易对，
+  其他交易对的分析在数据库中计算（analytics_backend=postgres）。
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+import yaml
+from loguru import logger
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+SYMBOLS_CONFIG = config.get("symbols", {}) or {}
+
+# 交易对只允许大写字母与数字（会直接拼入 SQL 与下载地址）
+_SYMBOL_PATTERN = re.compile(r"^[A-Z0-9]{2,32}$")
+
+
+def normalize_symbol(symbol: Any) -> str:
+    """
+    描述：把交易对统一为大写（如 ethusdt -> ETHUSDT），不合法时抛出 ValueError
+    """
+    normalized = str(symbol or "").strip().upper()
+    if not _SYMBOL_PATTERN.match(normalized):
+        raise ValueError(f"不合法的交易对: {symbol!r}")
+    return normalized
+
+
+DEFAULT_SYMBOL = normalize_symbol(SYMBOLS_CONFIG.get("default") or "ETHUSDT")
+# Uniswap 池子地址（小写） -> 交易对
+POOL_SYMBOLS = {
+    str(address).lower(): normalize_symbol(symbol)
+    for symbol, address in (SYMBOLS_CONFIG.get("pools") or {}).items()
+}
+# 一个分析任务内同时分析的交易对数（每个交易对占用一个数据库连接）
+DEFAULT_PARALLELISM = int(SYMBOLS_CONFIG.get("parallelism", 4))
+
+# 带 symbol 列的原始成交表 -> 时间列
+SYMBOL_TABLES = {"binance_trades": "trade_time", "uniswap_swaps": "block_time"}
+# 以 symbol 开头的索引：按交易对 + 时间范围过滤，Binance 一侧可以仅扫描索引计算均价
+SYMBOL_INDEXES = {
+    "binance_trades_symbol_time_idx": "binance_trades (symbol, trade_time) INCLUDE (price)",
+    "uniswap_swaps_symbol_time_idx": "uniswap_swaps (symbol, block_time)",
+}
+# 派生数据（镜像、K 线、聚合价格）读取原始表时使用的过滤条件：只覆盖默认交易对
+DEFAULT_SYMBOL_FILTER = f"symbol = '{DEFAULT_SYMBOL}'"
+
+# 补齐 symbol 列时等待表锁的上限
+DDL_LOCK_TIMEOUT = str(SYMBOLS_CONFIG.get("ddl_lock_timeout", "5s"))
+
+# 本进程中已确认有 symbol 列的表，避免每次任务都查询 information_schema
+_ensured_tables: set = set()
+
+
+def is_default(symbol: Optional[str]) -> bool:
+    """symbol 为空或等于默认交易对"""
+    return not symbol or normalize_symbol(symbol) == DEFAULT_SYMBOL
+
+
+def symbol_for_pool(pool_address: Optional[str], symbol: Optional[str] = None) -> str:
+    """
+    描述：Uniswap 采集任务写入的交易对：任务参数 symbol 优先，其次按池子地址查 symbols.pools，最后为默认交易对
+    """
+    if symbol:
+        return normalize_symbol(symbol)
+    return POOL_SYMBOLS.get(str(pool_address or "").lower(), DEFAULT_SYMBOL)
+
+
+def resolve_symbols(
+    task_config: dict[str, Any], strategy: Optional[dict[str, Any]] = None
+) -> list[str]:
+    """
+    描述：分析任务要分析的交易对：任务配置的 symbols（列表或逗号分隔的字符串）优先，
+        其次是 strategy 中的 symbol，最后为默认交易对；去重并保持顺序
+    """
+    value = task_config.get("symbols") or (strategy or {}).get("symbol")
+    if not value:
+        return [DEFAULT_SYMBOL]
+    if isinstance(value, str):
+        value = value.split(",")
+    return list(dict.fromkeys(normalize_symbol(s) for s in value if str(s).strip()))
+
+
+def ensure_symbol_columns(conn, tables: Iterable[str] = tuple(SYMBOL_TABLES)) -> None:
+    """
+    描述：为原始成交表补齐 symbol 列（常量默认值，PostgreSQL 11+ 只修改元数据，不重写表）
+        只在确实缺列时才执行 ALTER TABLE，并在独立的短事务中立即提交，排他锁不会延续到调用者的采集事务；
+        拿不到锁时按 DDL_LOCK_TIMEOUT 失败，而不是排在长查询之后阻塞所有读写。
+        会提交连接上已有的事务，必须在调用者开始写入之前调用；提交成功后才记为已确认
+    """
+    pending = [t for t in tables if t not in _ensured_tables]
+    if not pending:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT table_name FROM information_schema.columns"
+                " WHERE table_schema = current_schema() AND column_name = 'symbol'"
+                " AND table_name = ANY(%s)",
+                (pending,),
+            )
+            existing = {row[0] for row in cur.fetchall()}
+            missing = [t for t in pending if t not in existing]
+            if missing:
+                cur.execute(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'")
+            for table in missing:
+                logger.info(f"{table} 增加 symbol 列（已有数据视为 {DEFAULT_SYMBOL}）")
+                cur.execute(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS symbol text"
+                    f" NOT NULL DEFAULT '{DEFAULT_SYMBOL}'"
+                )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _ensured_tables.update(pending)
+
+
+def ensure_symbol_indexes(conn) -> list[str]:
+    """
+    描述：创建以 symbol 开头的索引（已存在则跳过）
+        使用 CREATE INDEX CONCURRENTLY，建索引期间不阻塞采集任务写入；需要临时切换为自动提交
+    返回值：本次新建的索引名
+    """
+    ensure_symbol_columns(conn)
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT indexname FROM pg_indexes"
+            " WHERE schemaname = current_schema() AND indexname = ANY(%s)",
+            (list(SYMBOL_INDEXES),),
+        )
+        existing = {row[0] for row in cur.fetchall()}
+    conn.rollback()
+    missing = [name for name in SYMBOL_INDEXES if name not in existing]
+    if not missing:
+        return []
+
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name in missing:
+                logger.info(f"正在创建交易对索引 {name} ...")
+                cur.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {SYMBOL_INDEXES[name]}"
+                )
+    finally:
+        conn.autocommit = autocommit
+    return missing
+
+
+def fan_out(
+    symbols: list[str],
+    work: Callable[[str], Any],
+    parallelism: int = DEFAULT_PARALLELISM,
+) -> dict[str, Any]:
+    """
+    描述：对每个交易对并行执行 work(symbol)（线程池；取价格对主要等待数据库，分析时 NumPy 释放 GIL）
+        任何一个交易对失败都会抛出异常，由调用者整体回滚
+    返回值：交易对 -> 结果，顺序与 symbols 相同
+    """
+    if len(symbols) <= 1 or parallelism <= 1:
+        return {symbol: work(symbol) for symbol in symbols}
+    with ThreadPoolExecutor(
+        max_workers=min(parallelism, len(symbols)), thread_name_prefix="symbol"
+    ) as executor:
+        futures = {symbol: executor.submit(work, symbol) for symbol in symbols}
+        return {symbol: future.result() for symbol, future in futures.items()}
+
+
+if __name__ == "__main__":
+    import psycopg2
+
+    db_config = config.get("db", {})
+    cli_conn = psycopg2.connect(
+        host=db_config["host"],
+        port=db_config["port"],
+        dbname=db_config["database"],
+        user=db_config["username"],
+        password=db_config["password"],
+    )
+    try:
+        created = ensure_symbol_indexes(cli_conn)
+        logger.info(f"交易对迁移完成，新建索引: {created}")
+    finally:
+        cli_conn.close()
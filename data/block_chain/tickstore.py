@@ -0,0 +1,298 @@
+"""
+内存映射的 NumPy 逐笔行情存储（分析热路径）
+
+- 每个 (数据源, UTC 日期) 一组定长 dtype 的 .npy 文件：time（int64，纳秒 UTC 时间戳）、price（float64）、
+  volume（float64，Binance 为 qty，Uniswap 为 |amount_eth|），Uniswap 另有 gas（float64）；
+- 分析时用 np.load(mmap_mode="r") 直接映射文件，不经过 Decimal -> float 转换，冷启动只受页缓存速度限制；
+- 延迟窗口内的 Binance 均价与 Uniswap 10 分钟累计成交量用前缀和 + searchsorted 向量化计算，
+  语义与 analyse.fetch_price_pairs 的 SQL 一致（窗口两端闭区间，RANGE 窗口包含同一时刻的对等行）。
+
+已结束且已构建的日期不再重复构建；当天的数据每次重新构建，refresh=True 时全部重新构建。
+"""
+
+import datetime
+import io
+import os
+import shutil
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+from loguru import logger
+
+from . import symbols
+from .columnar import _days, _utc_naive
+from .rolling_stats import VOLUME_WINDOW
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+DEFAULT_TICK_DIR = (config.get("analytics", {}) or {}).get("tick_dir", "./ticks")
+
+# 数据源 -> 原始表、时间列与导出字段（字段名 -> SQL 表达式）
+TICK_SOURCES = {
+    "binance": {
+        "table": "binance_trades",
+        "time_column": "trade_time",
+        "fields": {"price": "price", "volume": "qty"},
+    },
+    "uniswap": {
+        "table": "uniswap_swaps",
+        "time_column": "block_time",
+        "fields": {"price": "price", "volume": "ABS(amount_eth)", "gas": "gas_price"},
+    },
+}
+FIELD_DTYPES = {
+    "time": np.int64,
+    "price": np.float64,
+    "volume": np.float64,
+    "gas": np.float64,
+}
+# 与 fetch_price_pairs 的 10 分钟累计成交量窗口一致
+VOLUME_WINDOW_NS = int(VOLUME_WINDOW.total_seconds()) * 1_000_000_000
+PRICE_PAIR_COLUMNS = [
+    "block_time",
+    "uniswap_price",
+    "gas_price",
+    "window_volume",
+    "binance_price",
+]
+
+_NS_PER_SECOND = 1_000_000_000
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def _to_ns(value) -> Optional[int]:
+    value = _utc_naive(value)
+    if value is None:
+        return None
+    return pd.Timestamp(value).value
+
+
+def _window_sums(times: np.ndarray, values: np.ndarray, lower, upper):
+    """
+    描述：对按时间排序的序列，计算每个 [lower, upper]（闭区间）窗口内 values 的和与个数
+    返回值：(sums, counts)
+    """
+    # 以第一个值为基准累加偏差，减小长序列前缀和相减时的舍入误差
+    base = float(values[0]) if len(values) else 0.0
+    prefix = np.concatenate(([0.0], np.cumsum(values - base, dtype=np.float64)))
+    lo = np.searchsorted(times, lower, side="left")
+    hi = np.searchsorted(times, upper, side="right")
+    counts = hi - lo
+    return prefix[hi] - prefix[lo] + base * counts, counts
+
+
+class TickStore:
+    """按 (数据源, 日期) 存放的定长 NumPy 数组，分析时内存映射读取"""
+
+    def __init__(self, root: str = DEFAULT_TICK_DIR):
+        self.root = root
+
+    def day_dir(self, source: str, day: datetime.date) -> str:
+        return os.path.join(self.root, source, day.isoformat())
+
+    def _fields(self, source: str) -> list[str]:
+        return ["time", *TICK_SOURCES[source]["fields"]]
+
+    def has_day(self, source: str, day: datetime.date) -> bool:
+        day_dir = self.day_dir(source, day)
+        return all(
+            os.path.exists(os.path.join(day_dir, f"{field}.npy"))
+            for field in self._fields(source)
+        )
+
+    def write_day(self, source: str, day: datetime.date, arrays: dict[str, Any]):
+        """
+        描述：写入一天的数组（先写临时目录再整体替换，读者不会看到写了一半的文件）
+        参数：source: 数据源, day: UTC 日期, arrays: 字段 -> 数组（按时间排序）
+        """
+        day_dir = self.day_dir(source, day)
+        tmp_dir = day_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for field in self._fields(source):
+            data = np.ascontiguousarray(arrays[field], dtype=FIELD_DTYPES[field])
+            np.save(os.path.join(tmp_dir, f"{field}.npy"), data)
+        old_dir = day_dir + ".old"
+        if os.path.exists(day_dir):
+            os.replace(day_dir, old_dir)
+        os.replace(tmp_dir, day_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def load_day(self, source: str, day: datetime.date) -> dict[str, np.ndarray]:
+        """内存映射读取一天的数组（只读，零拷贝）"""
+        day_dir = self.day_dir(source, day)
+        return {
+            field: np.load(os.path.join(day_dir, f"{field}.npy"), mmap_mode="r")
+            for field in self._fields(source)
+        }
+
+    def load(
+        self,
+        source: str,
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        描述：读取 [start_ns, end_ns]（闭区间）内的数据
+            单日直接返回映射数组的切片；跨日时拼接各日的映射数组（一次顺序内存拷贝）
+        返回值：字段 -> 数组
+        """
+        source_dir = os.path.join(self.root, source)
+        if start_ns is None or end_ns is None:
+            names = sorted(os.listdir(source_dir)) if os.path.isdir(source_dir) else []
+            days = [
+                datetime.date.fromisoformat(name)
+                for name in names
+                if len(name) == 10 and not name.endswith((".tmp", ".old"))
+            ]
+        else:
+            days = _days(
+                pd.Timestamp(start_ns).to_pydatetime(warn=False),
+                pd.Timestamp(end_ns).to_pydatetime(warn=False),
+            )
+        parts = [
+            self.load_day(source, day) for day in days if self.has_day(source, day)
+        ]
+        fields = self._fields(source)
+        if not parts:
+            return {field: np.empty(0, dtype=FIELD_DTYPES[field]) for field in fields}
+        if len(parts) == 1:
+            merged = parts[0]
+        else:
+            merged = {
+                field: np.concatenate([p[field] for p in parts]) for field in fields
+            }
+
+        times = merged["time"]
+        lo = 0 if start_ns is None else np.searchsorted(times, start_ns, side="left")
+        hi = (
+            len(times)
+            if end_ns is None
+            else np.searchsorted(times, end_ns, side="right")
+        )
+        return {field: merged[field][lo:hi] for field in fields}
+
+    def _build_day(self, conn, source: str, day: datetime.date) -> int:
+        """从 Postgres 导出一天的数据（COPY 文本直接解析为定长数组，不经过 Decimal）"""
+        spec = TICK_SOURCES[source]
+        time_column = spec["time_column"]
+        day_start = datetime.datetime.combine(
+            day, datetime.time(), datetime.timezone.utc
+        )
+        columns = ", ".join(
+            [f"floor(extract(epoch from {time_column}) * 1000000)::bigint"]
+            + list(spec["fields"].values())
+        )
+        buffer = io.StringIO()
+        with conn.cursor() as cur:
+            select = cur.mogrify(
+                f"SELECT {columns} FROM {spec['table']}"
+                f" WHERE {time_column} >= %s AND {time_column} < %s"
+                f" AND {symbols.DEFAULT_SYMBOL_FILTER}"
+                f" ORDER BY {time_column}",
+                (day_start, day_start + _ONE_DAY),
+            ).decode()
+            cur.copy_expert(f"COPY ({select}) TO STDOUT WITH (FORMAT CSV)", buffer)
+        conn.rollback()
+        buffer.seek(0)
+
+        fields = list(spec["fields"])
+        frame = pd.read_csv(
+            buffer,
+            header=None,
+            names=["time", *fields],
+            dtype={"time": np.int64, **{field: np.float64 for field in fields}},
+            engine="c",
+        )
+        arrays = {field: frame[field].to_numpy() for field in fields}
+        arrays["time"] = frame["time"].to_numpy() * 1000
+        self.write_day(source, day, arrays)
+        return len(frame)
+
+    def sync(
+        self,
+        conn,
+        start: Optional[datetime.datetime],
+        end: Optional[datetime.datetime],
+        refresh: bool = False,
+    ) -> int:
+        """
+        描述：构建 [start, end] 覆盖日期的逐笔数组
+            已结束且已构建的日期跳过；当天与 refresh=True 时重新构建。未指定范围时使用原始表的最早 / 最晚时间。
+        返回值：本次构建的 (数据源, 日期) 数量
+        """
+        # 升级前的数据库可能还没有 symbol 列
+        symbols.ensure_symbol_columns(conn)
+        start, end = _utc_naive(start), _utc_naive(end)
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        built = 0
+        for source, spec in TICK_SOURCES.items():
+            source_start, source_end = start, end
+            if source_start is None or source_end is None:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"SELECT MIN({spec['time_column']}), MAX({spec['time_column']})"
+                        f" FROM {spec['table']} WHERE {symbols.DEFAULT_SYMBOL_FILTER}"
+                    )
+                    low, high = cur.fetchone()
+                conn.rollback()
+                if low is None:
+                    continue
+                source_start = source_start or _utc_naive(low)
+                source_end = source_end or _utc_naive(high)
+            for day in _days(source_start, source_end):
+                if not refresh and day < today and self.has_day(source, day):
+                    continue
+                self._build_day(conn, source, day)
+                built += 1
+        if built:
+            logger.info(f"已构建 {built} 组逐笔数组到 {self.root}")
+        return built
+
+    def price_pairs(
+        self,
+        strategy: dict[str, Any],
+        start_time=None,
+        end_time=None,
+    ) -> pd.DataFrame:
+        """
+        描述：在映射数组上计算与 analyse.fetch_price_pairs 相同的价格对
+        返回值：列为 PRICE_PAIR_COLUMNS 的 DataFrame（block_time 为 UTC 时间，其余为 float64），按时间排序
+        """
+        start_ns, end_ns = _to_ns(start_time), _to_ns(end_time)
+        delay_ns = int(float(strategy["time_delay_seconds"]) * _NS_PER_SECOND)
+        window_ns = int(float(strategy["window_seconds"]) * _NS_PER_SECOND)
+
+        uniswap = self.load("uniswap", start_ns, end_ns)
+        u_time = uniswap["time"]
+        # 先按时间过滤，再在过滤后的序列上计算累计成交量（与 SQL 的 WHERE + 窗口函数一致）
+        window_volume, _ = _window_sums(
+            u_time, uniswap["volume"], u_time - VOLUME_WINDOW_NS, u_time
+        )
+
+        binance = self.load(
+            "binance",
+            None if start_ns is None else start_ns - delay_ns - window_ns,
+            None if end_ns is None else end_ns - delay_ns + window_ns,
+        )
+        center = u_time - delay_ns
+        sums, counts = _window_sums(
+            binance["time"], binance["price"], center - window_ns, center + window_ns
+        )
+        # 窗口内没有 Binance 成交的事件与 SQL 的内连接一样被丢弃
+        matched = counts > 0
+        frame = pd.DataFrame(
+            {
+                "block_time": pd.to_datetime(u_time[matched], unit="ns", utc=True),
+                "uniswap_price": np.asarray(uniswap["price"][matched]),
+                "gas_price": np.asarray(uniswap["gas"][matched]),
+                "window_volume": window_volume[matched],
+                "binance_price": sums[matched] / counts[matched],
+            },
+            columns=PRICE_PAIR_COLUMNS,
+        )
+        logger.info(f"逐笔数组计算完成，共 {len(frame)} 对价格。")
+        return frame
@@ -0,0 +1,378 @@
+"""
+中心化交易所（CEX）成交数据的交易所适配层
+
+- 所有交易所的成交规范化为同一套字段 TRADE_COLUMNS（与 binance_trades 的列一致），
+  每个交易所一张结构相同的成交表：Binance 为 binance_trades，其他交易所为 <venue>_trades
+  （按 binance_trades 的结构与索引创建），相当于按交易所分区；
+- VenueAdapter 负责分块读取交易所的原始文件并规范化，写入统一走 copy_trades（COPY FROM STDIN），
+  采集流程（事务、取消、百分比导入）由 collect_binance 复用，不为每个交易所单独实现慢速的写入；
+- Binance 为第一个实现；CsvDumpAdapter 按列映射读取其他交易所的历史成交文件（内置 OKX / Bybit，
+  也可以在配置 venues 中增加或覆盖）；
+- 分析时 strategy 中的 venue 决定 fetch_price_pairs 读取的成交表与机会记录中的平台名称。
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import zipfile
+from typing import IO, Any, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+from loguru import logger
+
+from . import symbols
+
+with open("./config/config.yaml", "r", encoding="utf-8") as file:
+    config = yaml.safe_load(file)
+
+VENUES_CONFIG = config.get("venues", {}) or {}
+
+DEFAULT_VENUE = "binance"
+# 规范化后的成交字段（与成交表的列、COPY 的列顺序一致）
+TRADE_COLUMNS = (
+    "id",
+    "price",
+    "qty",
+    "quote_qty",
+    "trade_time",
+    "is_buyer_maker",
+    "is_best_match",
+    "symbol",
+)
+
+# Binance 成交文件（无表头）的列与类型
+BINANCE_COLUMN_NAMES = [
+    "id",
+    "price",
+    "qty",
+    "quoteQty",
+    "time",
+    "isBuyerMaker",
+    "isBestMatch",
+]
+BINANCE_DTYPE_MAP = {
+    "id": "int64",
+    "price": "float64",
+    "qty": "float64",
+    "quoteQty": "float64",
+    "time": "int64",
+    "isBuyerMaker": "bool",
+    "isBestMatch": "bool",
+}
+
+# 内置的历史成交文件格式：规范化字段 -> 文件中的列名；side 为主动成交方向（sell 表示买方挂单）
+DUMP_FORMATS = {
+    # https://www.okx.com/data-download 的逐笔成交：instrument_name,trade_id,side,price,size,created_time
+    "okx": {
+        "display_name": "OKX",
+        "columns": {
+            "id": "trade_id",
+            "price": "price",
+            "qty": "size",
+            "trade_time": "created_time",
+            "side": "side",
+        },
+        "time_unit": "ms",
+    },
+    # https://public.bybit.com/trading/ 的逐笔成交（.csv.gz）：timestamp 为带小数的秒，trdMatchID 为 UUID
+    "bybit": {
+        "display_name": "Bybit",
+        "columns": {
+            "id": "trdMatchID",
+            "price": "price",
+            "qty": "size",
+            "quote_qty": "foreignNotional",
+            "trade_time": "timestamp",
+            "side": "side",
+        },
+        "time_unit": "s",
+    },
+}
+
+
+def _stable_ids(values: pd.Series) -> np.ndarray:
+    """非数值的成交 ID（如 UUID）映射为稳定的 63 位整数，同一文件重复导入得到相同的 ID"""
+    hashed = pd.util.hash_pandas_object(values.astype(str), index=False).to_numpy()
+    return (hashed >> np.uint64(1)).astype(np.int64)
+
+
+# 与 pandas 按扩展名推断的压缩格式一致
+_DECOMPRESSORS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def open_raw(path: str) -> IO[bytes]:
+    """
+    描述：以二进制方式打开原始成交文件，压缩文件（.gz / .bz2 / .xz / 单文件 .zip）边读边解压
+    参数：path: 文件路径
+    返回值：按行迭代的二进制文件对象
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".zip":
+        archive = zipfile.ZipFile(path)
+        names = archive.namelist()
+        if len(names) != 1:
+            archive.close()
+            raise ValueError(f"压缩包 {path} 应只包含一个文件，实际为 {len(names)} 个")
+        return archive.open(names[0])
+    return _DECOMPRESSORS.get(suffix, open)(path, "rb")
+
+
+class VenueAdapter:
+    """
+    交易所适配器：分块读取原始成交文件，并规范化为 TRADE_COLUMNS
+    """
+
+    name = ""
+    display_name = ""
+    # 文件开头的表头行数（统计数据行数时扣除）
+    header_lines = 0
+
+    @property
+    def table(self) -> str:
+        return venue_table(self.name)
+
+    def read_chunks(self, path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """按 chunk_size 行分块读取原始文件（保持文件中的列名）"""
+        raise NotImplementedError
+
+    def trade_times(self, raw: pd.DataFrame) -> pd.Series:
+        """原始分块的成交时间（UTC，无法解析的为 NaT）"""
+        raise NotImplementedError
+
+    def normalize(
+        self, raw: pd.DataFrame, symbol: str = symbols.DEFAULT_SYMBOL
+    ) -> pd.DataFrame:
+        """
+        描述：把原始分块规范化为 TRADE_COLUMNS，去掉成交时间无法解析的行
+        """
+        raise NotImplementedError
+
+
+class BinanceAdapter(VenueAdapter):
+    """data.binance.vision 的逐笔成交文件（无表头，时间为微秒）"""
+
+    name = "binance"
+    display_name = "Binance"
+
+    def read_chunks(self, path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        return pd.read_csv(
+            path,
+            chunksize=chunk_size,
+            header=None,
+            names=BINANCE_COLUMN_NAMES,
+            usecols=BINANCE_COLUMN_NAMES,
+            dtype=BINANCE_DTYPE_MAP,
+            engine="c",
+            low_memory=False,
+            memory_map=True,
+            on_bad_lines="skip",
+        )
+
+    def trade_times(self, raw: pd.DataFrame) -> pd.Series:
+        return pd.to_datetime(raw["time"], unit="us", utc=True, errors="coerce")
+
+    def normalize(
+        self, raw: pd.DataFrame, symbol: str = symbols.DEFAULT_SYMBOL
+    ) -> pd.DataFrame:
+        chunk = raw.rename(
+            columns={
+                "time": "trade_time",
+                "quoteQty": "quote_qty",
+                "isBuyerMaker": "is_buyer_maker",
+                "isBestMatch": "is_best_match",
+            }
+        )
+        chunk["trade_time"] = self.trade_times(raw)
+        chunk = chunk.dropna(subset=["trade_time"])
+        chunk["symbol"] = symbol
+        return chunk[list(TRADE_COLUMNS)]
+
+
+class CsvDumpAdapter(VenueAdapter):
+    """
+    按列映射读取带表头的历史成交文件（压缩格式按扩展名推断）
+    """
+
+    header_lines = 1
+
+    def __init__(self, name: str, spec: dict[str, Any]):
+        """
+        描述：初始化适配器
+        参数：name: 交易所名称, spec: display_name / columns（规范化字段 -> 文件列名，至少包含 price、qty、
+            trade_time；可选 id、quote_qty、side、is_buyer_maker） / time_unit（s / ms / us / ns，
+            为空时按日期字符串解析）
+        """
+        self.name = name
+        self.display_name = spec.get("display_name") or name.upper()
+        self.columns = dict(spec["columns"])
+        missing = {"price", "qty", "trade_time"} - set(self.columns)
+        if missing:
+            raise ValueError(f"交易所 {name} 的列映射缺少 {sorted(missing)}")
+        self.time_unit = spec.get("time_unit")
+
+    def read_chunks(self, path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+        return pd.read_csv(
+            path,
+            chunksize=chunk_size,
+            header=0,
+            usecols=list(self.columns.values()),
+            engine="c",
+            low_memory=False,
+            on_bad_lines="skip",
+        )
+
+    def trade_times(self, raw: pd.DataFrame) -> pd.Series:
+        values = raw[self.columns["trade_time"]]
+        if self.time_unit:
+            return pd.to_datetime(
+                pd.to_numeric(values, errors="coerce"),
+                unit=self.time_unit,
+                utc=True,
+                errors="coerce",
+            )
+        return pd.to_datetime(values, utc=True, errors="coerce")
+
+    def normalize(
+        self, raw: pd.DataFrame, symbol: str = symbols.DEFAULT_SYMBOL
+    ) -> pd.DataFrame:
+        chunk = pd.DataFrame(index=raw.index)
+        chunk["trade_time"] = self.trade_times(raw)
+        chunk["price"] = pd.to_numeric(raw[self.columns["price"]], errors="coerce")
+        chunk["qty"] = pd.to_numeric(raw[self.columns["qty"]], errors="coerce").abs()
+        if "quote_qty" in self.columns:
+            chunk["quote_qty"] = pd.to_numeric(
+                raw[self.columns["quote_qty"]], errors="coerce"
+            ).abs()
+        else:
+            chunk["quote_qty"] = chunk["price"] * chunk["qty"]
+
+        if "id" in self.columns:
+            ids = raw[self.columns["id"]]
+            numeric = pd.to_numeric(ids, errors="coerce")
+            chunk["id"] = (
+                numeric.astype("int64") if numeric.notna().all() else _stable_ids(ids)
+            )
+        else:
+            # 没有成交 ID 时按时间、价格与数量生成
+            chunk["id"] = _stable_ids(
+                raw[
+                    [
+                        self.columns["trade_time"],
+                        self.columns["price"],
+                        self.columns["qty"],
+                    ]
+                ]
+                .astype(str)
+                .agg("|".join, axis=1)
+            )
+
+        if "is_buyer_maker" in self.columns:
+            chunk["is_buyer_maker"] = raw[self.columns["is_buyer_maker"]].astype(bool)
+        elif "side" in self.columns:
+            # 主动卖出时买方是挂单方
+            chunk["is_buyer_maker"] = (
+                raw[self.columns["side"]].astype(str).str.lower() == "sell"
+            )
+        else:
+            chunk["is_buyer_maker"] = False
+        # 历史文件没有最优撮合标记
+        chunk["is_best_match"] = True
+        chunk["symbol"] = symbol
+        chunk = chunk.dropna(subset=["trade_time", "price", "qty"])
+        return chunk[list(TRADE_COLUMNS)]
+
+
+def _build_adapters() -> dict[str, VenueAdapter]:
+    adapters: dict[str, VenueAdapter] = {DEFAULT_VENUE: BinanceAdapter()}
+    formats = {**DUMP_FORMATS, **VENUES_CONFIG}
+    for name, spec in formats.items():
+        name = normalize_venue(name)
+        if name == DEFAULT_VENUE:
+            continue
+        adapters[name] = CsvDumpAdapter(name, spec)
+    return adapters
+
+
+def normalize_venue(venue: Optional[str]) -> str:
+    """
+    描述：交易所名称统一为小写（会拼入成交表名），不合法时抛出 ValueError
+    """
+    name = str(venue or DEFAULT_VENUE).strip().lower()
+    if not name.isascii() or not name.isalnum():
+        raise ValueError(f"不合法的交易所: {venue!r}")
+    return name
+
+
+ADAPTERS = _build_adapters()
+
+# 本进程中已确认存在的交易所成交表
+_ensured_tables: set = set()
+
+
+def get_adapter(venue: Optional[str] = None) -> VenueAdapter:
+    """按名称取适配器，未知的交易所抛出 ValueError"""
+    name = normalize_venue(venue)
+    if name not in ADAPTERS:
+        raise ValueError(f"不支持的交易所: {venue}（可选: {', '.join(ADAPTERS)}）")
+    return ADAPTERS[name]
+
+
+def venue_table(venue: Optional[str] = None) -> str:
+    """交易所的成交表：binance_trades，或 <venue>_trades"""
+    name = normalize_venue(venue)
+    return "binance_trades" if name == DEFAULT_VENUE else f"{name}_trades"
+
+
+def display_name(venue: Optional[str] = None) -> str:
+    """机会记录中使用的平台名称（如 Binance / OKX）"""
+    name = normalize_venue(venue)
+    adapter = ADAPTERS.get(name)
+    return adapter.display_name if adapter is not None else name.upper()
+
+
+def is_default(venue: Optional[str]) -> bool:
+    """venue 为空或为 Binance（派生数据只覆盖 Binance）"""
+    return normalize_venue(venue) == DEFAULT_VENUE
+
+
+def ensure_venue_table(conn, venue: Optional[str] = None) -> str:
+    """
+    描述：确保交易所的成交表存在且有 symbol 列：其他交易所的表按 binance_trades 的结构、默认值与索引创建
+        与 symbols.ensure_symbol_columns 相同，在独立的短事务中执行并立即提交，必须在调用者开始写入之前调用
+    返回值：成交表名
+    """
+    table = venue_table(venue)
+    symbols.ensure_symbol_columns(conn, ["binance_trades"])
+    if table != "binance_trades" and table not in _ensured_tables:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table}"
+                    " (LIKE binance_trades INCLUDING DEFAULTS INCLUDING CONSTRAINTS"
+                    " INCLUDING INDEXES)"
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        _ensured_tables.add(table)
+        logger.info(f"交易所 {normalize_venue(venue)} 的成交写入 {table}")
+    return table
+
+
+def copy_trades(cursor, trades: pd.DataFrame, table: str) -> int:
+    """
+    描述：用一次 COPY FROM STDIN 写入规范化后的成交（所有交易所共用的写入路径）
+    参数：cursor: 游标, trades: TRADE_COLUMNS 列的 DataFrame, table: 成交表
+    返回值：写入的行数
+    """
+    csv_buffer = io.StringIO()
+    trades.to_csv(csv_buffer, index=False, header=False, columns=list(TRADE_COLUMNS))
+    csv_buffer.seek(0)
+    copy_sql = f"COPY {table} ({', '.join(TRADE_COLUMNS)}) FROM STDIN WITH (FORMAT CSV)"
+    cursor.copy_expert(sql=copy_sql, file=csv_buffer)
+    return len(trades)
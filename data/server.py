@@ -1,19 +1,36 @@
+import argparse
+import asyncio
 import datetime
+import functools
 import json
+import multiprocessing
 import os
 import sys
 import threading
 import time
 from concurrent import futures
 
+import asyncpg
 import grpc
+import grpc.aio
 import pika
 import pika.exceptions
 import psycopg2
 import yaml
 from loguru import logger
 
-from block_chain import analyse, collect_binance, collect_uniswap, process_prices
+from block_chain import (
+    analyse,
+    coalesce,
+    collect_binance,
+    collect_uniswap,
+    lease,
+    process_prices,
+    streaming,
+    symbols,
+    venues,
+)
+from block_chain.publisher import ConfirmedPublisher
 from block_chain.task import check_task
 
 # 导入生成的代码
@@ -30,9 +47,55 @@ with open(
 DB_CONFIG = CONFIG.get("db", {})
 RABBITMQ_CONFIG = CONFIG.get("rabbitmq", {})
 WORKER_PORT = str(CONFIG.get("worker_port", 50052))
-
-# 任务队列名称
-TASK_QUEUE_NAME = "task_queue"
+WORKER_CONFIG = CONFIG.get("worker", {})
+GRPC_CONFIG = CONFIG.get("grpc_server", {})
+# thread: 线程池版 gRPC 服务；aio: grpc.aio + asyncpg 的异步版本
+GRPC_MODE = GRPC_CONFIG.get("mode", "thread")
+HEARTBEAT_SECONDS = int(WORKER_CONFIG.get("heartbeat_seconds", 10))
+LEASE_SECONDS = int(WORKER_CONFIG.get("lease_seconds", 60))
+MAX_ATTEMPTS = int(WORKER_CONFIG.get("max_attempts", 3))
+# 参数相同的任务在执行中或完成后该时长内到达时直接合并，不再重复执行
+DEDUP_WINDOW_SECONDS = float(WORKER_CONFIG.get("dedup_window_seconds", 60))
+
+# 当前进程的 Worker 标识（子进程会重新导入本模块，因此各自拥有独立标识）
+WORKER_ID = lease.make_worker_id()
+
+# 任务交换机：按任务类型（routing key）路由到不同的优先级队列
+TASK_EXCHANGE_NAME = RABBITMQ_CONFIG.get("exchange", "task_exchange")
+MAX_PRIORITY = int(RABBITMQ_CONFIG.get("max_priority", 10))
+PUBLISHER_CONFIG = RABBITMQ_CONFIG.get("publisher", {})
+
+# 队列名 -> 绑定的任务类型与并发上限（每个消费者进程内的执行线程数，同时也是预取数量）
+# 交互式分析独占一组执行线程，不会被批量回填任务（如大批 ProcessPrices）饿死
+DEFAULT_TASK_QUEUES = {
+    "task_queue.interactive": {
+        "routing_keys": ["analyse"],
+        "concurrency": 2,
+    },
+    "task_queue.bulk": {
+        "routing_keys": [
+            "collect_binance",
+            "collect_binance_by_date",
+            "collect_uniswap",
+            "process_prices",
+        ],
+        "concurrency": 3,
+    },
+}
+TASK_QUEUES = RABBITMQ_CONFIG.get("queues") or DEFAULT_TASK_QUEUES
+
+# 任务类型的默认优先级（0 ~ MAX_PRIORITY，越大越先出队）
+DEFAULT_TASK_PRIORITIES = {
+    "analyse": 8,
+    "collect_uniswap": 4,
+    "collect_binance_by_date": 3,
+    "collect_binance": 2,
+    "process_prices": 2,
+}
+TASK_PRIORITIES = {
+    **DEFAULT_TASK_PRIORITIES,
+    **RABBITMQ_CONFIG.get("priorities", {}),
+}
 
 STATUS_LABELS = {
     TaskStatus.WAIT: "WAIT",
@@ -71,23 +134,36 @@ def log_task_event(task_id: str, level: str, message: str):
         logger.warning("写入任务日志失败: %s", exc)
 
 
-def mark_task_started(task_id: str):
-    """将任务状态更新为 RUNNING 并设置开始时间"""
+def claim_task_started(task_id: str, task_type: str, task_data: dict) -> bool:
+    """
+    描述：原子认领任务（WAIT -> RUNNING）并写入租约，多进程/多主机下保证只执行一次
+    参数：task_id: 任务ID, task_type: 任务类型, task_data: 任务消息体
+    返回值：是否认领成功
+    """
     if not task_id:
-        return
+        return False
     try:
-        with _get_db_connection() as conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                UPDATE tasks 
-                SET status = %s, started_at = COALESCE(started_at, NOW()) 
-                WHERE task_id = %s
-                """,
-                (STATUS_LABELS.get(TaskStatus.RUNNING), task_id),
+        with _get_db_connection() as conn:
+            attempts = lease.claim_task(
+                conn, task_id, WORKER_ID, task_type, task_data, LEASE_SECONDS
             )
-            conn.commit()
     except Exception as exc:
-        logger.warning("更新任务开始时间和状态失败: %s", exc)
+        logger.warning("认领任务失败: %s", exc)
+        return False
+    if attempts is None:
+        return False
+    if attempts > 1:
+        logger.info(f"任务 {task_id} 第 {attempts} 次执行（上一个 Worker 已失联）")
+    return True
+
+
+def release_task_lease(task_id: str):
+    """释放当前 Worker 持有的任务租约"""
+    try:
+        with _get_db_connection() as conn:
+            lease.release_task(conn, task_id, WORKER_ID)
+    except Exception as exc:
+        logger.warning("释放任务租约失败: %s", exc)
 
 
 def mark_task_waiting(task_id: str):
@@ -105,6 +181,34 @@ def mark_task_waiting(task_id: str):
         logger.warning("更新任务状态为 WAIT 失败: %s", exc)
 
 
+# 已结束的任务可以重新提交；仍处于 WAIT / RUNNING 的任务视为执行中
+FINISHED_STATUSES = tuple(
+    STATUS_LABELS[status]
+    for status in (TaskStatus.SUCCESS, TaskStatus.FAILED, TaskStatus.CANCELLED)
+)
+
+
+def requeue_finished_task(task_id: str) -> bool:
+    """
+    描述：把已结束的任务原子地重新置为 WAIT（用于去重窗口内重新提交失败或已完成的任务）
+    参数：task_id: 任务ID
+    返回值：是否重新置为 WAIT；任务仍在执行中、已被并发的相同请求重置或数据库不可用时返回 False
+    """
+    if not task_id:
+        return False
+    try:
+        with _get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "UPDATE tasks SET status = %s WHERE task_id = %s AND status IN %s",
+                (STATUS_LABELS[TaskStatus.WAIT], task_id, FINISHED_STATUSES),
+            )
+            conn.commit()
+            return cur.rowcount == 1
+    except Exception as exc:
+        logger.warning("重新提交任务失败: %s", exc)
+        return False
+
+
 def mark_task_finished(task_id: str, status: TaskStatus, summary: str | None = None):
     if not task_id:
         return
@@ -133,11 +237,17 @@ class RabbitMQManager:
     """RabbitMQ 连接和队列管理器（线程安全）"""
 
     def __init__(self):
-        self._publish_connection = None
-        self._publish_channel = None
-        self._publish_lock = threading.Lock()
-        self._consume_connection = None
-        self._consume_channel = None
+        self._publisher = ConfirmedPublisher(
+            connection_factory=self._new_connection,
+            setup_channel=self._declare_topology,
+            workers=int(PUBLISHER_CONFIG.get("workers", 2)),
+            batch_size=int(PUBLISHER_CONFIG.get("batch_size", 100)),
+            max_backoff=float(PUBLISHER_CONFIG.get("max_backoff_seconds", 30)),
+            report_interval=float(PUBLISHER_CONFIG.get("report_interval_seconds", 60)),
+        )
+        self._publish_timeout = float(
+            PUBLISHER_CONFIG.get("publish_timeout_seconds", 10)
+        )
 
     def _get_connection_parameters(self):
         """获取连接参数"""
@@ -152,14 +262,37 @@ class RabbitMQManager:
             blocked_connection_timeout=300,
         )
 
+    def _new_connection(self):
+        return pika.BlockingConnection(self._get_connection_parameters())
+
+    @staticmethod
+    def _declare_topology(channel):
+        """声明交换机、优先级队列及其路由绑定（持久化，幂等）"""
+        channel.exchange_declare(
+            exchange=TASK_EXCHANGE_NAME, exchange_type="direct", durable=True
+        )
+        for queue_name, queue_config in TASK_QUEUES.items():
+            channel.queue_declare(
+                queue=queue_name,
+                durable=True,
+                arguments={"x-max-priority": MAX_PRIORITY},
+            )
+            for routing_key in queue_config.get("routing_keys", []):
+                channel.queue_bind(
+                    queue=queue_name,
+                    exchange=TASK_EXCHANGE_NAME,
+                    routing_key=routing_key,
+                )
+
     def connect(self):
-        """连接到 RabbitMQ 服务器（初始化发布连接）"""
+        """连接到 RabbitMQ 服务器：声明队列拓扑并启动发布线程"""
         try:
-            parameters = self._get_connection_parameters()
-            self._publish_connection = pika.BlockingConnection(parameters)
-            self._publish_channel = self._publish_connection.channel()
-            # 声明队列（持久化）
-            self._publish_channel.queue_declare(queue=TASK_QUEUE_NAME, durable=True)
+            connection = self._new_connection()
+            try:
+                self._declare_topology(connection.channel())
+            finally:
+                connection.close()
+            self._publisher.start()
             logger.info("RabbitMQ 发布连接成功")
         except Exception as e:
             logger.error(f"RabbitMQ 连接失败: {e}")
@@ -168,69 +301,74 @@ class RabbitMQManager:
     def connect_consume(self):
         """创建用于消费的独立连接（线程安全）"""
         try:
-            parameters = self._get_connection_parameters()
-            connection = pika.BlockingConnection(parameters)
+            connection = self._new_connection()
             channel = connection.channel()
-            # 声明队列（持久化）
-            channel.queue_declare(queue=TASK_QUEUE_NAME, durable=True)
+            self._declare_topology(channel)
             return connection, channel
         except Exception as e:
             logger.error(f"创建消费连接失败: {e}")
             raise
 
-    def _ensure_publish_connection(self):
-        """确保发布连接可用"""
-        if not self._publish_connection or self._publish_connection.is_closed:
-            parameters = self._get_connection_parameters()
-            self._publish_connection = pika.BlockingConnection(parameters)
-            self._publish_channel = self._publish_connection.channel()
-            self._publish_channel.queue_declare(queue=TASK_QUEUE_NAME, durable=True)
-
-    def publish_task(self, task_type: str, task_data: dict):
-        """发布任务到队列（线程安全）"""
-        with self._publish_lock:
-            try:
-                self._ensure_publish_connection()
-
-                message = {
-                    "task_type": task_type,
-                    "task_data": task_data,
-                }
-                self._publish_channel.basic_publish(
-                    exchange="",
-                    routing_key=TASK_QUEUE_NAME,
-                    body=json.dumps(message),
-                    properties=pika.BasicProperties(
-                        delivery_mode=2,  # 使消息持久化
-                    ),
-                )
-                logger.info(
-                    f"任务已入队: task_type={task_type}, task_id={task_data.get('task_id')}"
-                )
-            except Exception as e:
-                logger.error(f"发布任务到队列失败: {e}")
-                # 尝试重新连接
-                try:
-                    self._ensure_publish_connection()
-                    # 重试一次
-                    self._publish_channel.basic_publish(
-                        exchange="",
-                        routing_key=TASK_QUEUE_NAME,
-                        body=json.dumps(message),
-                        properties=pika.BasicProperties(delivery_mode=2),
-                    )
-                    logger.info(
-                        f"任务已入队（重试成功）: task_type={task_type}, task_id={task_data.get('task_id')}"
-                    )
-                except Exception as retry_err:
-                    logger.error(f"发布任务重试失败: {retry_err}")
-                    raise
+    def publish_task_async(
+        self, task_type: str, task_data: dict, priority: int = None
+    ) -> futures.Future:
+        """
+        描述：异步发布任务到交换机，按任务类型路由到对应队列
+        参数：
+            task_type: 任务类型，同时作为 routing key
+            task_data: 任务消息体
+            priority: 消息优先级，默认取 TASK_PRIORITIES 中该任务类型的配置
+        返回值：Future，Broker 确认消息已持久化接收后完成
+        """
+        if priority is None:
+            priority = TASK_PRIORITIES.get(task_type, 0)
+        priority = max(0, min(int(priority), MAX_PRIORITY))
+        message = {
+            "task_type": task_type,
+            "task_data": task_data,
+        }
+        return self._publisher.publish(
+            exchange=TASK_EXCHANGE_NAME,
+            routing_key=task_type,
+            body=json.dumps(message).encode("utf-8"),
+            properties=pika.BasicProperties(
+                delivery_mode=2,  # 使消息持久化
+                priority=priority,
+            ),
+        )
+
+    def publish_task(self, task_type: str, task_data: dict, priority: int = None):
+        """
+        描述：发布任务并等待 Broker 确认（线程安全）
+        参数：同 publish_task_async
+        异常：超时未确认、消息被拒绝或无法路由时抛出异常
+        """
+        future = self.publish_task_async(task_type, task_data, priority)
+        try:
+            latency = future.result(timeout=self._publish_timeout)
+        except futures.TimeoutError:
+            # 尚未发出的消息直接撤回，避免调用方把任务标记失败后又被执行
+            future.cancel()
+            logger.error(
+                f"发布任务超时未确认: task_type={task_type}, task_id={task_data.get('task_id')}"
+            )
+            raise
+        except Exception as e:
+            logger.error(f"发布任务到队列失败: {e}")
+            raise
+        logger.info(
+            f"任务已入队: task_type={task_type}, task_id={task_data.get('task_id')}, "
+            f"confirm={latency * 1000:.1f}ms"
+        )
+
+    def publish_stats(self) -> dict:
+        """返回发布延迟与吞吐统计"""
+        return self._publisher.stats()
 
     def close(self):
-        """关闭所有连接"""
+        """关闭所有连接：等待已提交的消息发布完成"""
         try:
-            if self._publish_connection and not self._publish_connection.is_closed:
-                self._publish_connection.close()
+            self._publisher.stop()
         except Exception:
             pass
 
@@ -238,100 +376,184 @@ class RabbitMQManager:
 # 全局 RabbitMQ 管理器实例
 rabbitmq_manager = RabbitMQManager()
 
-# 任务执行线程池（支持5个任务并发执行）
-task_executor = futures.ThreadPoolExecutor(max_workers=5)
+# 每个队列独立的任务执行线程池，线程数即该队列在本进程内的并发上限
+queue_executors = {
+    queue_name: futures.ThreadPoolExecutor(
+        max_workers=int(queue_config.get("concurrency", 1)),
+        thread_name_prefix=queue_name,
+    )
+    for queue_name, queue_config in TASK_QUEUES.items()
+}
+
+
+# 执行端与请求入口共用的重复任务合并器
+task_coalescer = coalesce.TaskCoalescer(DEDUP_WINDOW_SECONDS)
+
+
+def shutdown_executors():
+    """关闭所有队列的执行线程池，等待正在执行的任务结束"""
+    for executor in queue_executors.values():
+        executor.shutdown(wait=True)
+
+
+class TaskCancelledError(Exception):
+    """执行过程中任务被取消"""
+
+    def __init__(self, task_id: str):
+        super().__init__(f"任务 {task_id} 已被取消")
+        self.task_id = task_id
 
 
-def execute_task(task_type: str, task_data: dict):
-    """执行任务的通用函数"""
+def _dispatch_task(task_type: str, task_id: str, task_data: dict):
+    """
+    描述：按任务类型调用具体的业务模块
+    参数：task_type: 任务类型, task_id: 执行任务使用的任务ID, task_data: 任务消息体
+    返回值：(任务结束摘要, 任务日志)
+    """
+    if task_type == "collect_binance":
+        symbol = symbols.normalize_symbol(
+            task_data.get("symbol") or symbols.DEFAULT_SYMBOL
+        )
+        venue = venues.normalize_venue(task_data.get("venue"))
+        # 任务未指定文件时使用服务目录下该交易所、该交易对的月度成交文件
+        file_prefix = "" if venues.is_default(venue) else f"{venue}-"
+        csv_path = task_data.get("csv_path") or os.path.join(
+            os.path.dirname(__file__), f"{file_prefix}{symbol}-trades-2025-09.csv"
+        )
+        collect_binance.collect_binance(
+            task_id=task_id,
+            csv_path=csv_path,
+            import_percentage=task_data.get("import_percentage", 100),
+            chunk_size=task_data.get("chunk_size", 1000000),
+            symbol=symbol,
+            venue=venue,
+        )
+        success_msg = f"{venues.display_name(venue)} 数据导入完成"
+        log_msg = f"收集 {venues.display_name(venue)} 数据完成"
+
+    elif task_type == "collect_binance_by_date":
+        collect_binance.collect_binance_by_date(
+            task_id=task_id,
+            start_ts=task_data.get("start_ts"),
+            end_ts=task_data.get("end_ts"),
+            symbol=task_data.get("symbol") or symbols.DEFAULT_SYMBOL,
+        )
+        success_msg = "Binance 数据按日期收集完成"
+        log_msg = "按日期收集 Binance 数据完成"
+
+    elif task_type == "collect_uniswap":
+        collect_uniswap.collect_uniswap(
+            task_id=task_id,
+            pool_address=task_data.get("pool_address"),
+            start_ts=task_data.get("start_ts"),
+            end_ts=task_data.get("end_ts"),
+            symbol=task_data.get("symbol"),
+        )
+        success_msg = "Uniswap 数据采集完成"
+        log_msg = "收集 Uniswap 数据完成"
+
+    elif task_type == "process_prices":
+        # 将时间戳转换为日期字符串
+        start_date_str = None
+        end_date_str = None
+        if task_data.get("start_date"):
+            dt = datetime.datetime.fromtimestamp(
+                task_data.get("start_date"), tz=datetime.timezone.utc
+            )
+            start_date_str = dt.isoformat()
+        if task_data.get("end_date"):
+            dt = datetime.datetime.fromtimestamp(
+                task_data.get("end_date"), tz=datetime.timezone.utc
+            )
+            end_date_str = dt.isoformat()
+
+        kwargs = {
+            "aggregation_interval": task_data.get("aggregation_interval", "minute"),
+            "overwrite": task_data.get("overwrite", False),
+            "start_date": start_date_str,
+            "end_date": end_date_str,
+        }
+        # 合并 db_overrides
+        db_overrides = task_data.get("db_overrides", {})
+        if db_overrides:
+            kwargs.update(db_overrides)
+
+        process_prices.run_process_prices(task_id=task_id, **kwargs)
+        success_msg = "价格数据处理完成"
+        log_msg = "处理价格数据完成"
+
+    elif task_type == "analyse":
+        # 解析策略参数
+        strategy_params = task_data.get("strategy_params", {})
+        kwargs = {
+            "strategy": strategy_params,
+            "batch_id": task_data.get("batch_id"),
+            "overwrite": task_data.get("overwrite", False),
+        }
+        if task_data.get("experiment_id") is not None:
+            kwargs["experiment_id"] = task_data.get("experiment_id")
+        # 一个任务并行分析多个交易对
+        if task_data.get("symbols"):
+            kwargs["symbols"] = task_data.get("symbols")
+        analyse.run_analyse(task_id=task_id, config_json=json.dumps(kwargs))
+        success_msg = "数据分析完成"
+        log_msg = "分析数据完成"
+
+    else:
+        raise ValueError(f"未知的任务类型: {task_type}")
+
+    return success_msg, log_msg
+
+
+def _run_leader(task_type: str, task_id: str, task_data: dict):
+    """作为 leader 实际执行任务；执行结束后被取消的任务不能把结果共享给合并的任务"""
+    result = _dispatch_task(task_type, task_id, task_data)
+    if check_task(task_id):
+        raise TaskCancelledError(task_id)
+    return result
+
+
+def execute_task(task_type: str, task_data: dict, on_claimed=None):
+    """
+    描述：执行任务的通用函数
+        参数完全相同的任务（忽略 task_id）在执行中或去重窗口内刚刚成功时会被合并，
+        只有第一个任务真正执行，其余任务复用其结果。
+    参数：
+        task_type: 任务类型
+        task_data: 任务消息体
+        on_claimed: 认领结束后（无论成功与否）的回调，用于确认队列消息
+    """
     task_id = task_data.get("task_id")
     if not task_id:
         logger.error("任务 ID 不能为空")
+        if on_claimed:
+            on_claimed()
+        return
+
+    claimed = claim_task_started(task_id, task_type, task_data)
+    if on_claimed:
+        on_claimed()
+    if not claimed:
+        logger.info(
+            f"任务 {task_id} 未处于 WAIT 状态（已被其他 Worker 认领或已取消），跳过"
+        )
         return
 
     try:
-        logger.info(f"开始执行任务 {task_id}: {task_type}")
-        mark_task_started(task_id)
+        logger.info(f"开始执行任务 {task_id}: {task_type} (worker={WORKER_ID})")
         log_task_event(task_id, "INFO", f"开始执行任务: {task_type}")
 
-        if task_type == "collect_binance":
-            csv_path = os.path.join(
-                os.path.dirname(__file__), "ETHUSDT-trades-2025-09.csv"
-            )
-            collect_binance.collect_binance(
-                task_id=task_id,
-                csv_path=csv_path,
-                import_percentage=task_data.get("import_percentage", 100),
-                chunk_size=task_data.get("chunk_size", 1000000),
-            )
-            success_msg = "Binance 数据导入完成"
-            log_msg = "收集 Binance 数据完成"
-
-        elif task_type == "collect_binance_by_date":
-            collect_binance.collect_binance_by_date(
-                task_id=task_id,
-                start_ts=task_data.get("start_ts"),
-                end_ts=task_data.get("end_ts"),
-            )
-            success_msg = "Binance 数据按日期收集完成"
-            log_msg = "按日期收集 Binance 数据完成"
-
-        elif task_type == "collect_uniswap":
-            collect_uniswap.collect_uniswap(
-                task_id=task_id,
-                pool_address=task_data.get("pool_address"),
-                start_ts=task_data.get("start_ts"),
-                end_ts=task_data.get("end_ts"),
+        fingerprint = coalesce.task_fingerprint(task_type, task_data)
+        (success_msg, log_msg), leader_id, is_leader = task_coalescer.run(
+            fingerprint,
+            task_id,
+            functools.partial(_run_leader, task_type, task_id, task_data),
+        )
+        if not is_leader:
+            logger.info(f"任务 {task_id} 与相同参数的任务 {leader_id} 合并")
+            log_task_event(
+                task_id, "INFO", f"与相同参数的任务 {leader_id} 合并，复用其执行结果"
             )
-            success_msg = "Uniswap 数据采集完成"
-            log_msg = "收集 Uniswap 数据完成"
-
-        elif task_type == "process_prices":
-            # 将时间戳转换为日期字符串
-            start_date_str = None
-            end_date_str = None
-            if task_data.get("start_date"):
-                dt = datetime.datetime.fromtimestamp(
-                    task_data.get("start_date"), tz=datetime.timezone.utc
-                )
-                start_date_str = dt.isoformat()
-            if task_data.get("end_date"):
-                dt = datetime.datetime.fromtimestamp(
-                    task_data.get("end_date"), tz=datetime.timezone.utc
-                )
-                end_date_str = dt.isoformat()
-
-            kwargs = {
-                "aggregation_interval": task_data.get("aggregation_interval", "minute"),
-                "overwrite": task_data.get("overwrite", False),
-                "start_date": start_date_str,
-                "end_date": end_date_str,
-            }
-            # 合并 db_overrides
-            db_overrides = task_data.get("db_overrides", {})
-            if db_overrides:
-                kwargs.update(db_overrides)
-
-            process_prices.run_process_prices(task_id=task_id, **kwargs)
-            success_msg = "价格数据处理完成"
-            log_msg = "处理价格数据完成"
-
-        elif task_type == "analyse":
-            # 解析策略参数
-            strategy_params = task_data.get("strategy_params", {})
-            kwargs = {
-                "strategy": strategy_params,
-                "batch_id": task_data.get("batch_id"),
-                "overwrite": task_data.get("overwrite", False),
-            }
-            if task_data.get("experiment_id") is not None:
-                kwargs["experiment_id"] = task_data.get("experiment_id")
-            analyse.run_analyse(task_id=task_id, config_json=json.dumps(kwargs))
-            success_msg = "数据分析完成"
-            log_msg = "分析数据完成"
-
-        else:
-            raise ValueError(f"未知的任务类型: {task_type}")
 
         # 检查任务是否被取消
         if check_task(task_id):
@@ -343,61 +565,80 @@ def execute_task(task_type: str, task_data: dict):
             log_task_event(task_id, "INFO", log_msg)
             mark_task_finished(task_id, TaskStatus.SUCCESS, success_msg)
 
+    except TaskCancelledError as e:
+        if e.task_id == task_id:
+            logger.info(f"任务 {task_id} 已被取消")
+            log_task_event(task_id, "INFO", "任务被取消")
+            mark_task_finished(task_id, TaskStatus.CANCELLED, "任务被取消")
+        else:
+            summary = f"合并执行的任务 {e.task_id} 已被取消，请重新提交"
+            log_task_event(task_id, "ERROR", summary)
+            mark_task_finished(task_id, TaskStatus.FAILED, summary)
     except Exception as e:
         logger.error(f"任务 {task_id} 执行失败: {e}")
         log_task_event(task_id, "ERROR", f"任务执行失败: {e}")
         mark_task_finished(task_id, TaskStatus.FAILED, str(e))
+    finally:
+        release_task_lease(task_id)
 
 
 def consume_tasks():
-    """从队列中消费任务并并发执行（支持5个任务并发）"""
-
-    def callback(ch, method, properties, body):
-        try:
-            message = json.loads(body)
-            task_type = message.get("task_type")
-            task_data = message.get("task_data")
+    """
+    描述：从各优先级队列中消费任务，并在队列各自的线程池中并发执行
+    消息在任务被认领（或确认无需执行）后才确认：进程崩溃时尚未开始的消息会由 RabbitMQ 重新投递，
+    已开始的任务由租约过期机制重新入队。
+    """
+
+    def make_callback(executor):
+        def callback(ch, method, properties, body):
+            ack = functools.partial(_ack_threadsafe, ch, method.delivery_tag)
+            try:
+                message = json.loads(body)
+                task_type = message.get("task_type")
+                task_data = message.get("task_data")
 
-            if not task_type or not task_data:
-                logger.error(f"无效的任务消息: {message}")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                return
+                if not task_type or not task_data:
+                    logger.error(f"无效的任务消息: {message}")
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                    return
 
-            # 在线程池中异步执行任务
-            # 注意：我们在任务提交到线程池后立即确认消息
-            # 因为任务状态已经在数据库中记录，即使任务失败也不应该重复处理
-            task_executor.submit(execute_task, task_type, task_data)
+                # 在线程池中异步执行任务，认领后再确认消息
+                executor.submit(execute_task, task_type, task_data, ack)
 
-            # 立即确认消息（任务已提交到线程池，状态会在数据库中记录）
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            except Exception as e:
+                logger.error(f"处理队列消息失败: {e}")
+                # 发生异常时立即确认消息，避免重复处理
+                try:
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                except Exception:
+                    pass
 
-        except Exception as e:
-            logger.error(f"处理队列消息失败: {e}")
-            # 发生异常时立即确认消息，避免重复处理
-            try:
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-            except Exception:
-                pass
+        return callback
 
     # 持续监听队列
     while True:
         connection = None
-        channel = None
         try:
             # 创建独立的消费连接（与发布连接分离，保证线程安全）
-            connection, channel = rabbitmq_manager.connect_consume()
-
-            # 设置 QoS，每个消费者可以预取5个任务，支持并发执行
-            channel.basic_qos(prefetch_count=5)
-            # 开始消费
-            channel.basic_consume(
-                queue=TASK_QUEUE_NAME,
-                on_message_callback=callback,
-            )
+            connection, _ = rabbitmq_manager.connect_consume()
+
+            # 每个队列使用独立的 channel：预取数量与该队列的并发上限一致，
+            # 本进程最多只持有这么多尚未开始的任务，其余消息留在队列中供其他消费者进程领取
+            for queue_name, queue_config in TASK_QUEUES.items():
+                concurrency = int(queue_config.get("concurrency", 1))
+                channel = connection.channel()
+                channel.basic_qos(prefetch_count=concurrency)
+                channel.basic_consume(
+                    queue=queue_name,
+                    on_message_callback=make_callback(queue_executors[queue_name]),
+                )
+                logger.info(
+                    f"开始监听任务队列 {queue_name}（worker={WORKER_ID}，并发上限 {concurrency}）..."
+                )
 
-            logger.info("开始监听任务队列（支持5个任务并发执行）...")
-            # start_consuming() 会阻塞，直到连接关闭或出现异常
-            channel.start_consuming()
+            # 阻塞处理所有 channel 的消息，直到连接关闭或出现异常
+            while True:
+                connection.process_data_events(time_limit=None)
         except (pika.exceptions.ConnectionClosed, pika.exceptions.ChannelClosed) as e:
             logger.warning(f"RabbitMQ 消费连接关闭: {e}，5秒后重试...")
             try:
@@ -416,241 +657,434 @@ def consume_tasks():
             time.sleep(5)
 
 
+def _ack_threadsafe(channel, delivery_tag):
+    """在执行线程中确认消息：pika 连接不是线程安全的，需要投递回连接所在线程执行"""
+    try:
+        channel.connection.add_callback_threadsafe(
+            functools.partial(channel.basic_ack, delivery_tag=delivery_tag)
+        )
+    except Exception as exc:
+        # 连接已断开时消息会被重新投递，重复的投递会因认领失败而被跳过
+        logger.warning(f"确认消息失败: {exc}")
+
+
+def _republish_task(item: dict):
+    """重新发布租约过期的任务；抛出异常时回收方保留租约，下一轮再次尝试"""
+    rabbitmq_manager.publish_task(item["task_type"], item["task_data"])
+
+
+def maintain_leases(stop_event: threading.Event):
+    """
+    描述：后台维持租约：定期上报心跳、续约本 Worker 的任务，并回收其他失联 Worker 的任务
+    参数：stop_event: 停止信号
+    """
+    try:
+        with _get_db_connection() as conn:
+            lease.ensure_lease_tables(conn)
+    except Exception as exc:
+        logger.warning(f"初始化租约表失败: {exc}")
+
+    while not stop_event.wait(HEARTBEAT_SECONDS):
+        try:
+            with _get_db_connection() as conn:
+                lease.heartbeat(conn, WORKER_ID, LEASE_SECONDS)
+                requeue, failed = lease.reap_expired_leases(
+                    conn, MAX_ATTEMPTS, _republish_task
+                )
+        except Exception as exc:
+            logger.warning(f"维护任务租约失败: {exc}")
+            continue
+        for task_id in failed:
+            log_task_event(task_id, "ERROR", "Worker 失联且超过最大重试次数，任务失败")
+        for item in requeue:
+            log_task_event(item["task_id"], "WARNING", "Worker 失联，任务重新入队")
+
+
+def run_consumer_process():
+    """消费者进程入口：维持租约并持续消费队列（用于多进程/多主机横向扩展）"""
+    stop_event = threading.Event()
+    threading.Thread(target=maintain_leases, args=(stop_event,), daemon=True).start()
+    logger.info(f"消费者进程已启动: worker={WORKER_ID}")
+    try:
+        consume_tasks()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        shutdown_executors()
+        rabbitmq_manager.close()
+
+
+def start_consumer_processes(num_processes: int) -> list:
+    """
+    描述：启动多个独立的消费者进程，各自拥有连接、线程池与 Worker 标识
+    参数：num_processes: 进程数
+    返回值：进程列表
+    """
+    # 使用 spawn 避免把父进程中的连接和线程状态复制到子进程
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(num_processes):
+        process = ctx.Process(target=run_consumer_process, daemon=True)
+        process.start()
+        processes.append(process)
+    logger.info(f"已启动 {num_processes} 个消费者进程")
+    return processes
+
+
+class InvalidTaskRequest(ValueError):
+    """请求参数无效，任务直接标记为失败"""
+
+
+def build_collect_binance_task(request):
+    """收集币安数据请求 -> (任务类型, 任务消息体, 优先级)"""
+    logger.info(
+        f"收到收集币安数据请求: task_id={request.task_id}, "
+        f"import_percentage={request.import_percentage}, chunk_size={request.chunk_size}"
+    )
+    task_data = {
+        "task_id": request.task_id,
+        "import_percentage": request.import_percentage,
+        "chunk_size": request.chunk_size,
+    }
+    return "collect_binance", task_data, None
+
+
+def build_collect_binance_by_date_task(request):
+    """按日期收集币安数据请求 -> (任务类型, 任务消息体, 优先级)"""
+    logger.info(
+        f"收到按日期收集币安数据请求: task_id={request.task_id}, "
+        f"start_ts={request.start_ts}, end_ts={request.end_ts}"
+    )
+    task_data = {
+        "task_id": request.task_id,
+        "start_ts": request.start_ts,
+        "end_ts": request.end_ts,
+    }
+    return "collect_binance_by_date", task_data, None
+
+
+def build_collect_uniswap_task(request):
+    """收集 Uniswap 数据请求 -> (任务类型, 任务消息体, 优先级)"""
+    logger.info(
+        f"收到收集 Uniswap 数据请求: task_id={request.task_id}, "
+        f"pool_address={request.pool_address}, start_ts={request.start_ts}, end_ts={request.end_ts}"
+    )
+    task_data = {
+        "task_id": request.task_id,
+        "pool_address": request.pool_address,
+        "start_ts": request.start_ts,
+        "end_ts": request.end_ts,
+    }
+    return "collect_uniswap", task_data, None
+
+
+def build_process_prices_task(request):
+    """处理价格数据请求 -> (任务类型, 任务消息体, 优先级)"""
+    logger.info(
+        f"收到处理价格数据请求: task_id={request.task_id}, "
+        f"start_date={request.start_date}, end_date={request.end_date}, "
+        f"aggregation_interval={request.aggregation_interval}, overwrite={request.overwrite}"
+    )
+    task_data = {
+        "task_id": request.task_id,
+        "start_date": request.start_date,
+        "end_date": request.end_date,
+        "aggregation_interval": request.aggregation_interval,
+        "overwrite": request.overwrite,
+        "db_overrides": dict(request.db_overrides),
+    }
+    return "process_prices", task_data, None
+
+
+def build_analyse_task(request):
+    """
+    分析数据请求 -> (任务类型, 任务消息体, 优先级)
+    策略 JSON 无效时抛出 InvalidTaskRequest
+    """
+    logger.info(
+        f"收到分析数据请求: task_id={request.task_id}, "
+        f"batch_id={request.batch_id}, overwrite={request.overwrite}"
+    )
+
+    # 解析策略 JSON（允许携带 experiment_id 等元信息）
+    strategy_params = {}
+    experiment_id = None
+    if request.strategy_json:
+        try:
+            strategy_params = json.loads(request.strategy_json)
+        except json.JSONDecodeError as e:
+            logger.error(f"解析策略 JSON 失败: {e}")
+            raise InvalidTaskRequest(f"无效的策略 JSON: {e}") from e
+    if isinstance(strategy_params, dict) and "experiment_id" in strategy_params:
+        experiment_id = strategy_params.pop("experiment_id")
+    # 允许通过策略 JSON 指定队列优先级（例如批量实验可以降低优先级）
+    priority = None
+    if isinstance(strategy_params, dict) and "priority" in strategy_params:
+        priority = strategy_params.pop("priority")
+
+    task_data = {
+        "task_id": request.task_id,
+        "batch_id": request.batch_id,
+        "overwrite": request.overwrite,
+        "strategy_params": strategy_params,
+    }
+    if experiment_id is not None:
+        task_data["experiment_id"] = experiment_id
+    return "analyse", task_data, priority
+
+
 class TaskService(TaskServiceServicer):
-    """实现 TaskService 的 gRPC 服务"""
+    """实现 TaskService 的 gRPC 服务（线程池版本）"""
 
-    def CollectBinance(self, request, context):
+    def _enqueue(self, build_task, request):
         """
-        收集币安数据
-        将任务放入队列，立即返回等待状态
+        将任务状态设置为 WAIT 并放入队列，立即返回等待状态
+        去重窗口内完全相同的请求（包括 task_id）在任务执行中只入队一次；
+        任务已结束（成功、失败或取消）时重新提交会再次入队
         """
         task_id = request.task_id
-        import_percentage = request.import_percentage
-        chunk_size = request.chunk_size
-
-        logger.info(
-            f"收到收集币安数据请求: task_id={task_id}, "
-            f"import_percentage={import_percentage}, chunk_size={chunk_size}"
-        )
-
-        # 将任务状态设置为 WAIT
-        mark_task_waiting(task_id)
+        try:
+            task_type, task_data, priority = build_task(request)
+        except InvalidTaskRequest as e:
+            mark_task_finished(task_id, TaskStatus.FAILED, str(e))
+            return TaskResponse(task_id=task_id, status=TaskStatus.FAILED)
+
+        request_key = coalesce.task_fingerprint(task_type, task_data, exclude=())
+        if task_coalescer.admit(request_key):
+            # 将任务状态设置为 WAIT
+            mark_task_waiting(task_id)
+        elif not requeue_finished_task(task_id):
+            logger.info(f"重复请求已合并: task_type={task_type}, task_id={task_id}")
+            return TaskResponse(task_id=task_id, status=TaskStatus.WAIT)
         log_task_event(task_id, "INFO", "任务已入队，等待执行")
 
         # 将任务放入队列
-        task_data = {
-            "task_id": task_id,
-            "import_percentage": import_percentage,
-            "chunk_size": chunk_size,
-        }
         try:
-            rabbitmq_manager.publish_task("collect_binance", task_data)
+            rabbitmq_manager.publish_task(task_type, task_data, priority=priority)
         except Exception as e:
             logger.error(f"将任务放入队列失败: {e}")
+            task_coalescer.forget(request_key)
             mark_task_finished(task_id, TaskStatus.FAILED, f"任务入队失败: {e}")
-            return TaskResponse(
-                task_id=task_id,
-                status=TaskStatus.FAILED,
-            )
+            return TaskResponse(task_id=task_id, status=TaskStatus.FAILED)
 
         # 返回等待状态
-        return TaskResponse(
-            task_id=task_id,
-            status=TaskStatus.WAIT,
-        )
+        return TaskResponse(task_id=task_id, status=TaskStatus.WAIT)
+
+    def CollectBinance(self, request, context):
+        """
+        收集币安数据
+        将任务放入队列，立即返回等待状态
+        """
+        return self._enqueue(build_collect_binance_task, request)
 
     def CollectBinanceByDate(self, request, context):
         """
         按日期收集币安数据
         将任务放入队列，立即返回等待状态
         """
-        task_id = request.task_id
-        start_ts = request.start_ts
-        end_ts = request.end_ts
-
-        logger.info(
-            f"收到按日期收集币安数据请求: task_id={task_id}, "
-            f"start_ts={start_ts}, end_ts={end_ts}"
-        )
-
-        # 将任务状态设置为 WAIT
-        mark_task_waiting(task_id)
-        log_task_event(task_id, "INFO", "任务已入队，等待执行")
-
-        # 将任务放入队列
-        task_data = {
-            "task_id": task_id,
-            "start_ts": start_ts,
-            "end_ts": end_ts,
-        }
-        try:
-            rabbitmq_manager.publish_task("collect_binance_by_date", task_data)
-        except Exception as e:
-            logger.error(f"将任务放入队列失败: {e}")
-            mark_task_finished(task_id, TaskStatus.FAILED, f"任务入队失败: {e}")
-            return TaskResponse(
-                task_id=task_id,
-                status=TaskStatus.FAILED,
-            )
-
-        # 返回等待状态
-        return TaskResponse(
-            task_id=task_id,
-            status=TaskStatus.WAIT,
-        )
+        return self._enqueue(build_collect_binance_by_date_task, request)
 
     def CollectUniswap(self, request, context):
         """
         收集 Uniswap 数据
         将任务放入队列，立即返回等待状态
         """
-        task_id = request.task_id
-        pool_address = request.pool_address
-        start_ts = request.start_ts
-        end_ts = request.end_ts
-
-        logger.info(
-            f"收到收集 Uniswap 数据请求: task_id={task_id}, "
-            f"pool_address={pool_address}, start_ts={start_ts}, end_ts={end_ts}"
-        )
-
-        # 将任务状态设置为 WAIT
-        mark_task_waiting(task_id)
-        log_task_event(task_id, "INFO", "任务已入队，等待执行")
-
-        # 将任务放入队列
-        task_data = {
-            "task_id": task_id,
-            "pool_address": pool_address,
-            "start_ts": start_ts,
-            "end_ts": end_ts,
-        }
-        try:
-            rabbitmq_manager.publish_task("collect_uniswap", task_data)
-        except Exception as e:
-            logger.error(f"将任务放入队列失败: {e}")
-            mark_task_finished(task_id, TaskStatus.FAILED, f"任务入队失败: {e}")
-            return TaskResponse(
-                task_id=task_id,
-                status=TaskStatus.FAILED,
-            )
-
-        # 返回等待状态
-        return TaskResponse(
-            task_id=task_id,
-            status=TaskStatus.WAIT,
-        )
+        return self._enqueue(build_collect_uniswap_task, request)
 
     def ProcessPrices(self, request, context):
         """
         处理价格数据
         将任务放入队列，立即返回等待状态
         """
-        task_id = request.task_id
-        start_date = request.start_date
-        end_date = request.end_date
-        aggregation_interval = request.aggregation_interval
-        overwrite = request.overwrite
-        db_overrides = dict(request.db_overrides)
+        return self._enqueue(build_process_prices_task, request)
 
-        logger.info(
-            f"收到处理价格数据请求: task_id={task_id}, "
-            f"start_date={start_date}, end_date={end_date}, "
-            f"aggregation_interval={aggregation_interval}, overwrite={overwrite}"
+    def Analyse(self, request, context):
+        """
+        分析数据
+        将任务放入队列，立即返回等待状态
+        """
+        return self._enqueue(build_analyse_task, request)
+
+
+# 一次往返完成“置为 WAIT + 写入任务日志”
+_ASYNC_MARK_WAITING_SQL = """
+WITH waiting AS (
+    UPDATE tasks SET status = $2 WHERE task_id = $1 RETURNING id
+)
+INSERT INTO task_logs (task_id, timestamp, level, message)
+SELECT id, NOW(), 'INFO', $3 FROM waiting
+"""
+
+# 只重置已结束的任务，返回 NULL 表示任务仍在执行中（或已被并发的相同请求重置）
+_ASYNC_REQUEUE_SQL = """
+WITH waiting AS (
+    UPDATE tasks SET status = $2
+    WHERE task_id = $1 AND status = ANY($4::text[])
+    RETURNING id
+)
+INSERT INTO task_logs (task_id, timestamp, level, message)
+SELECT id, NOW(), 'INFO', $3 FROM waiting
+RETURNING task_id
+"""
+
+_ASYNC_MARK_FAILED_SQL = """
+UPDATE tasks
+SET status = $2,
+    finished_at = NOW(),
+    duration_seconds = EXTRACT(EPOCH FROM NOW() - COALESCE(started_at, queued_at)),
+    log_summary = COALESCE($3, log_summary)
+WHERE task_id = $1
+"""
+
+
+class AsyncTaskService(TaskServiceServicer):
+    """
+    基于 grpc.aio 的 TaskService：数据库访问走 asyncpg 连接池，
+    发布通过发布线程池的 Future 异步等待，单个事件循环即可承载大量并发请求
+    """
+
+    def __init__(self, db_pool):
+        self._db_pool = db_pool
+        self._publish_timeout = float(
+            PUBLISHER_CONFIG.get("publish_timeout_seconds", 10)
         )
 
-        # 将任务状态设置为 WAIT
-        mark_task_waiting(task_id)
-        log_task_event(task_id, "INFO", "任务已入队，等待执行")
-
-        # 将任务放入队列
-        task_data = {
-            "task_id": task_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "aggregation_interval": aggregation_interval,
-            "overwrite": overwrite,
-            "db_overrides": db_overrides,
-        }
+    async def _mark_failed(self, task_id: str, summary: str):
         try:
-            rabbitmq_manager.publish_task("process_prices", task_data)
-        except Exception as e:
-            logger.error(f"将任务放入队列失败: {e}")
-            mark_task_finished(task_id, TaskStatus.FAILED, f"任务入队失败: {e}")
-            return TaskResponse(
-                task_id=task_id,
-                status=TaskStatus.FAILED,
+            await self._db_pool.execute(
+                _ASYNC_MARK_FAILED_SQL,
+                task_id,
+                STATUS_LABELS[TaskStatus.FAILED],
+                summary,
             )
+        except Exception as exc:
+            logger.warning("更新任务结束状态失败: %s", exc)
 
-        # 返回等待状态
-        return TaskResponse(
-            task_id=task_id,
-            status=TaskStatus.WAIT,
-        )
+    async def _requeue_finished(self, task_id: str) -> bool:
+        """与 requeue_finished_task 相同，置为 WAIT 与写入任务日志在一次往返内完成"""
+        try:
+            requeued = await self._db_pool.fetchval(
+                _ASYNC_REQUEUE_SQL,
+                task_id,
+                STATUS_LABELS[TaskStatus.WAIT],
+                "任务已入队，等待执行",
+                list(FINISHED_STATUSES),
+            )
+        except Exception as exc:
+            logger.warning("重新提交任务失败: %s", exc)
+            return False
+        return requeued is not None
 
-    def Analyse(self, request, context):
-        """
-        分析数据
-        将任务放入队列，立即返回等待状态
-        """
+    async def _enqueue(self, build_task, request):
+        """与 TaskService._enqueue 相同的语义，全程不阻塞事件循环"""
         task_id = request.task_id
-        batch_id = request.batch_id
-        overwrite = request.overwrite
-        strategy_json = request.strategy_json
-
-        logger.info(
-            f"收到分析数据请求: task_id={task_id}, "
-            f"batch_id={batch_id}, overwrite={overwrite}"
-        )
+        try:
+            task_type, task_data, priority = build_task(request)
+        except InvalidTaskRequest as e:
+            await self._mark_failed(task_id, str(e))
+            return TaskResponse(task_id=task_id, status=TaskStatus.FAILED)
 
-        # 解析策略 JSON（允许携带 experiment_id 等元信息）
-        strategy_params = {}
-        experiment_id = None
-        if strategy_json:
+        request_key = coalesce.task_fingerprint(task_type, task_data, exclude=())
+        if task_coalescer.admit(request_key):
             try:
-                strategy_params = json.loads(strategy_json)
-            except json.JSONDecodeError as e:
-                logger.error(f"解析策略 JSON 失败: {e}")
-                mark_task_finished(task_id, TaskStatus.FAILED, f"无效的策略 JSON: {e}")
-                return TaskResponse(
-                    task_id=task_id,
-                    status=TaskStatus.FAILED,
+                await self._db_pool.execute(
+                    _ASYNC_MARK_WAITING_SQL,
+                    task_id,
+                    STATUS_LABELS[TaskStatus.WAIT],
+                    "任务已入队，等待执行",
                 )
-        if isinstance(strategy_params, dict) and "experiment_id" in strategy_params:
-            experiment_id = strategy_params.pop("experiment_id")
-
-        # 将任务状态设置为 WAIT
-        mark_task_waiting(task_id)
-        log_task_event(task_id, "INFO", "任务已入队，等待执行")
-
-        # 将任务放入队列
-        task_data = {
-            "task_id": task_id,
-            "batch_id": batch_id,
-            "overwrite": overwrite,
-            "strategy_params": strategy_params,
-        }
-        if experiment_id is not None:
-            task_data["experiment_id"] = experiment_id
+            except Exception as exc:
+                logger.warning("更新任务状态为 WAIT 失败: %s", exc)
+        elif not await self._requeue_finished(task_id):
+            logger.info(f"重复请求已合并: task_type={task_type}, task_id={task_id}")
+            return TaskResponse(task_id=task_id, status=TaskStatus.WAIT)
+
+        future = rabbitmq_manager.publish_task_async(
+            task_type, task_data, priority=priority
+        )
         try:
-            rabbitmq_manager.publish_task("analyse", task_data)
-        except Exception as e:
-            logger.error(f"将任务放入队列失败: {e}")
-            mark_task_finished(task_id, TaskStatus.FAILED, f"任务入队失败: {e}")
-            return TaskResponse(
-                task_id=task_id,
-                status=TaskStatus.FAILED,
+            await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=self._publish_timeout
             )
+        except Exception as e:
+            # 超时时撤回尚未发出的消息
+            future.cancel()
+            logger.error(f"将任务放入队列失败: {e!r}")
+            task_coalescer.forget(request_key)
+            await self._mark_failed(task_id, f"任务入队失败: {e!r}")
+            return TaskResponse(task_id=task_id, status=TaskStatus.FAILED)
 
-        # 返回等待状态
-        return TaskResponse(
-            task_id=task_id,
-            status=TaskStatus.WAIT,
-        )
+        return TaskResponse(task_id=task_id, status=TaskStatus.WAIT)
+
+    async def CollectBinance(self, request, context):
+        return await self._enqueue(build_collect_binance_task, request)
 
+    async def CollectBinanceByDate(self, request, context):
+        return await self._enqueue(build_collect_binance_by_date_task, request)
+
+    async def CollectUniswap(self, request, context):
+        return await self._enqueue(build_collect_uniswap_task, request)
+
+    async def ProcessPrices(self, request, context):
+        return await self._enqueue(build_process_prices_task, request)
+
+    async def Analyse(self, request, context):
+        return await self._enqueue(build_analyse_task, request)
+
+
+async def serve_aio():
+    """
+    描述：启动 grpc.aio 版本的 gRPC 服务并阻塞直到退出
+    """
+    db_pool = await asyncpg.create_pool(
+        host=DB_CONFIG.get("host"),
+        port=DB_CONFIG.get("port"),
+        database=DB_CONFIG.get("database"),
+        user=DB_CONFIG.get("username"),
+        password=DB_CONFIG.get("password"),
+        min_size=int(GRPC_CONFIG.get("db_pool_min", 2)),
+        max_size=int(GRPC_CONFIG.get("db_pool_max", 20)),
+    )
+    max_concurrent_rpcs = GRPC_CONFIG.get("max_concurrent_rpcs")
+    server = grpc.aio.server(
+        maximum_concurrent_rpcs=(
+            int(max_concurrent_rpcs) if max_concurrent_rpcs else None
+        ),
+    )
+    add_TaskServiceServicer_to_server(AsyncTaskService(db_pool), server)
+    server.add_insecure_port(f"[::]:{WORKER_PORT}")
+    await server.start()
+    print(f"gRPC Task Service (aio) started on port {WORKER_PORT}...")
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(0)
+        await db_pool.close()
+
+
+def serve(
+    consumer_processes: int = 1, consumer_only: bool = False, grpc_mode: str = None
+):
+    """
+    描述：启动 gRPC 服务器和 RabbitMQ 消费者
+    参数：
+        consumer_processes: 消费者进程数；为 1 时在当前进程内以后台线程消费
+        consumer_only: 只启动消费者（用于在其他主机上横向扩展），不启动 gRPC 服务
+        grpc_mode: gRPC 服务模式，thread 或 aio，默认读取 grpc_server.mode
+    """
+    if consumer_only:
+        if consumer_processes <= 1:
+            run_consumer_process()
+            return
+        processes = start_consumer_processes(consumer_processes)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            logger.info("正在关闭消费者进程...")
+        return
 
-def serve():
-    """启动 gRPC 服务器和 RabbitMQ 消费者"""
     # 初始化 RabbitMQ 连接
     try:
         rabbitmq_manager.connect()
@@ -659,10 +1093,33 @@ def serve():
         logger.error(f"RabbitMQ 连接初始化失败: {e}")
         logger.warning("继续启动 gRPC 服务器，但任务队列功能可能不可用")
 
-    # 启动消费者线程（后台线程）
-    consumer_thread = threading.Thread(target=consume_tasks, daemon=True)
-    consumer_thread.start()
-    logger.info("任务消费者线程已启动")
+    stop_event = threading.Event()
+    processes = []
+    if consumer_processes <= 1:
+        # 启动消费者线程与租约维护线程（后台线程）
+        threading.Thread(
+            target=maintain_leases, args=(stop_event,), daemon=True
+        ).start()
+        consumer_thread = threading.Thread(target=consume_tasks, daemon=True)
+        consumer_thread.start()
+        logger.info("任务消费者线程已启动")
+    else:
+        processes = start_consumer_processes(consumer_processes)
+
+    if (grpc_mode or GRPC_MODE) == "aio":
+        try:
+            asyncio.run(serve_aio())
+        except KeyboardInterrupt:
+            logger.info("正在关闭服务器...")
+        finally:
+            stop_event.set()
+            shutdown_executors()
+            for process in processes:
+                process.terminate()
+            logger.info(f"RabbitMQ 发布统计: {rabbitmq_manager.publish_stats()}")
+            rabbitmq_manager.close()
+            print("gRPC Server stopped.")
+        return
 
     # 创建线程池执行器
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
@@ -683,11 +1140,49 @@ def serve():
     except KeyboardInterrupt:
         logger.info("正在关闭服务器...")
         server.stop(0)
+        stop_event.set()
         # 关闭任务执行线程池
-        task_executor.shutdown(wait=True)
+        shutdown_executors()
+        for process in processes:
+            process.terminate()
+        logger.info(f"RabbitMQ 发布统计: {rabbitmq_manager.publish_stats()}")
         rabbitmq_manager.close()
         print("gRPC Server stopped.")
 
 
 if __name__ == "__main__":
-    serve()
+    parser = argparse.ArgumentParser(description="Etrade 数据处理 Worker")
+    parser.add_argument(
+        "--consumers",
+        type=int,
+        default=int(WORKER_CONFIG.get("consumer_processes", 1)),
+        help="消费者进程数（默认读取 worker.consumer_processes）",
+    )
+    parser.add_argument(
+        "--consumer-only",
+        action="store_true",
+        help="只启动消费者进程，不启动 gRPC 服务（用于横向扩展）",
+    )
+    parser.add_argument(
+        "--grpc-mode",
+        choices=("thread", "aio"),
+        default=GRPC_MODE,
+        help="gRPC 服务模式：thread 为线程池版本，aio 为 grpc.aio + asyncpg 异步版本",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="常驻流式套利检测（读取 streaming 配置），不启动 gRPC 服务与消费者",
+    )
+    args = parser.parse_args()
+    if args.stream:
+        try:
+            streaming.run_streaming_worker()
+        except KeyboardInterrupt:
+            logger.info("正在关闭流式检测...")
+    else:
+        serve(
+            consumer_processes=args.consumers,
+            consumer_only=args.consumer_only,
+            grpc_mode=args.grpc_mode,
+        )
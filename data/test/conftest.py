@@ -2,12 +2,26 @@
 测试配置文件和共享fixtures
 """
 
+import os
+import uuid
 from unittest.mock import MagicMock, Mock
 
 import pandas as pd
+import psycopg2
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def symbol_columns_ensured(monkeypatch):
+    """
+    默认视为各表的 symbol 列已经存在，使结果与用例的执行顺序无关（symbols 按进程缓存已检查的表）；
+    测试建列语句的用例自行把缓存清空
+    """
+    from block_chain import symbols
+
+    monkeypatch.setattr(symbols, "_ensured_tables", set(symbols.SYMBOL_TABLES))
+
+
 @pytest.fixture
 def mock_db_connection():
     """
@@ -28,6 +42,38 @@ def mock_db_connection():
     return mock_conn, mock_cursor
 
 
+@pytest.fixture
+def pg_connect():
+    """
+    连接真实 PostgreSQL 的工厂：连接串取环境变量 ETRADE_TEST_DATABASE_URL，
+    每个测试使用独立的临时 schema，结束后删除；未配置或连接失败时跳过
+    """
+    dsn = os.environ.get("ETRADE_TEST_DATABASE_URL")
+    if not dsn:
+        pytest.skip("未设置 ETRADE_TEST_DATABASE_URL")
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    try:
+        admin = psycopg2.connect(dsn, connect_timeout=5)
+    except psycopg2.OperationalError as exc:
+        pytest.skip(f"PostgreSQL 不可用: {exc}")
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+    connections = []
+
+    def connect():
+        conn = psycopg2.connect(dsn, options=f"-c search_path={schema}")
+        connections.append(conn)
+        return conn
+
+    yield connect
+    for conn in connections:
+        conn.close()
+    with admin.cursor() as cur:
+        cur.execute(f"DROP SCHEMA {schema} CASCADE")
+    admin.close()
+
+
 @pytest.fixture
 def sample_price_pairs():
     """
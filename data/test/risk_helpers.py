@@ -0,0 +1,29 @@
+"""
+风险指标测试的共享断言（批量计算与逐条计算逐位一致）
+"""
+
+import math
+
+from block_chain.analyze_risk import RISK_METRIC_DIGITS, calculate_risk_metrics_local
+
+
+def assert_matches_scalar(
+    batch, buy_price, profit, volatility, market_volume, investment
+):
+    """逐个比较浮点数的类型与位模式：两边都是 NaN，或数值完全相等"""
+    expected = [
+        calculate_risk_metrics_local(
+            {"buy_price": p, "profit_usdt": pr}, v, mv, investment
+        )
+        for p, pr, v, mv in zip(buy_price, profit, volatility, market_volume)
+    ]
+    assert list(batch.columns) == list(RISK_METRIC_DIGITS)
+    for row, want in zip(batch.to_dict("records"), expected):
+        assert list(row) == list(want)
+        for key, value in want.items():
+            got = row[key]
+            assert type(got) is type(value), (key, got, value)
+            if math.isnan(value):
+                assert math.isnan(got), key
+            else:
+                assert got == value, (key, got, value)
@@ -570,15 +570,155 @@ class TestSaveResults:
             },
         ]
 
-        with patch("block_chain.analyse.execute_values") as mock_execute_values:
-            save_results(mock_conn, results, batch_id=1, overwrite=True)
-
-            # 验证执行了DROP TABLE和CREATE TABLE
-            assert mock_cur.execute.call_count >= 2
-            # 验证调用了execute_values
-            assert mock_execute_values.called
-            # 验证提交了事务
-            assert mock_conn.commit.called
+        copied = []
+        mock_cur.copy_expert.side_effect = lambda sql, stream, size=8192: copied.append(
+            (sql, stream.read())
+        )
+
+        save_results(mock_conn, results, batch_id=1, overwrite=True)
+
+        # 验证执行了CREATE TABLE和DELETE
+        assert mock_cur.execute.call_count >= 2
+        # 验证一次COPY写入全部记录，JSON为紧凑编码
+        assert len(copied) == 1
+        sql, payload = copied[0]
+        assert sql.startswith("COPY arbitrage_opportunities (batch_id,")
+        assert payload == (
+            "1,Binance,Uniswap,2900.0,3100.0,100.0,"
+            '"{""block_time"":""2025-09-01T10:00:00+00:00"",""experiment_id"":null}",{},'
+            "2025-09-01T10:00:00+00:00,,,,,,,,ETHUSDT\n"
+        )
+        # 验证提交了事务
+        assert mock_conn.commit.called
+
+    def test_save_results_streams_in_batches(self):
+        """
+        测试：记录按块编码后分多次读取，NumPy 标量与 NaN 可以编码，引号被转义
+        """
+        from block_chain import analyse
+
+        rows = analyse._opportunity_rows(
+            [
+                {
+                    "block_time": None,
+                    "buy_platform": "Uniswap",
+                    "sell_platform": "Binance",
+                    "buy_price": np.float64(3000.5),
+                    "sell_price": 3001.0,
+                    "profit_usdt": 0.5,
+                    "risk_metrics": {
+                        "volatility": np.float64(0.25),
+                        "risk_score": float("nan"),
+                        "note": 'say "hi"',
+                    },
+                }
+            ]
+            * 5,
+            batch_id=9,
+            experiment_id=3,
+        )
+        stream = analyse._CsvStream(rows, batch_rows=2)
+        chunks = []
+        while True:
+            chunk = stream.read(16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+        lines = "".join(chunks).splitlines()
+        assert stream.rows == 5
+        assert len(lines) == 5
+        assert lines[0] == (
+            "9,Uniswap,Binance,3000.5,3001.0,0.5,"
+            '"{""block_time"":null,""experiment_id"":3}",'
+            '"{""volatility"":0.25,""risk_score"":null,""note"":""say \\""hi\\""""}",'
+            # 类型化列：block_time, experiment_id, risk_score（NaN 写为 NULL）, volatility, ..., symbol
+            ",3,,0.25,,,,,ETHUSDT"
+        )
+
+    def test_save_results_defers_indexes(self):
+        """
+        测试：记录数达到阈值时先删除辅助索引，COPY 之后再创建；未达到阈值时只在 COPY 之后补建
+        """
+        results = [
+            {
+                "block_time": pd.Timestamp("2025-09-01 10:00:00", tz="UTC"),
+                "buy_platform": "Binance",
+                "sell_platform": "Uniswap",
+                "buy_price": 2900.0,
+                "sell_price": 3100.0,
+                "profit_usdt": 100.0,
+                "risk_metrics": {},
+            },
+        ] * 3
+
+        def run(threshold):
+            events = []
+            cur = MagicMock()
+            cur.execute.side_effect = lambda sql, *args: events.append(
+                sql.split()[0] + " " + sql.split()[1]
+            )
+            cur.copy_expert.side_effect = lambda *args, **kwargs: events.append("COPY")
+            conn = MagicMock()
+            conn.cursor.return_value.__enter__ = lambda x: cur
+            conn.cursor.return_value.__exit__ = lambda *args: None
+            save_results(conn, results, batch_id=1, defer_index_min_rows=threshold)
+            return events
+
+        deferred = run(3)
+        assert deferred.index("DROP INDEX") < deferred.index("COPY")
+        assert deferred.index("COPY") < deferred.index("CREATE INDEX")
+
+        inline = run(4)
+        assert "DROP INDEX" not in inline
+        assert inline.index("COPY") < inline.index("CREATE INDEX")
+
+    def test_existing_table_gets_missing_typed_columns(self):
+        """
+        测试：旧版本创建的表只补齐缺失的类型化列，列齐全时不执行 ALTER TABLE
+        """
+        from block_chain.analyse import TYPED_COLUMNS, ensure_opportunities_table
+
+        cur = MagicMock()
+        cur.fetchall.return_value = [("id",), ("batch_id",), ("block_time",)]
+        ensure_opportunities_table(cur)
+
+        alter = cur.execute.call_args_list[-1][0][0]
+        assert alter.startswith("ALTER TABLE arbitrage_opportunities")
+        assert "block_time" not in alter
+        assert "ADD COLUMN IF NOT EXISTS risk_score double precision" in alter
+
+        cur = MagicMock()
+        cur.fetchall.return_value = [(name,) for name in TYPED_COLUMNS]
+        ensure_opportunities_table(cur)
+        assert not any(
+            "ALTER TABLE" in call[0][0] for call in cur.execute.call_args_list
+        )
+
+    def test_backfill_typed_columns_in_id_batches(self, mock_db_connection):
+        """
+        测试：回填按 id 区间分批执行并逐批提交，最后创建辅助索引
+        """
+        from block_chain.analyse import backfill_typed_columns
+
+        conn, cur = mock_db_connection
+        cur.fetchone.return_value = (1, 250)
+        cur.fetchall.return_value = []
+        cur.rowcount = 100
+
+        updated = backfill_typed_columns(conn, batch_rows=100)
+
+        updates = [
+            call[0][1]
+            for call in cur.execute.call_args_list
+            if call[0][0].startswith("UPDATE arbitrage_opportunities")
+        ]
+        assert updates == [(1, 101), (101, 201), (201, 301)]
+        assert updated == 300
+        assert conn.commit.call_count == 5
+        sqls = [call[0][0] for call in cur.execute.call_args_list]
+        assert any("(details_json->>'block_time')::timestamptz" in q for q in sqls)
+        assert any(q.startswith("CREATE INDEX IF NOT EXISTS") for q in sqls)
 
     def test_save_results_empty(self):
         """
@@ -765,6 +905,45 @@ class TestRunAnalyse:
         mock_save_results.assert_called_once()
         mock_update_status.assert_called_once_with("test_task", 1)
 
+    @patch("block_chain.analyse.fetch_price_pairs_columnar")
+    @patch("block_chain.analyse.fetch_price_pairs")
+    @patch("block_chain.analyse.analyze_opportunities", return_value=[])
+    @patch("block_chain.analyse.save_results")
+    @patch("block_chain.analyse.ensure_batch_exists")
+    @patch("block_chain.analyse.check_task", return_value=False)
+    @patch("block_chain.analyse.update_task_status")
+    @patch("block_chain.analyse.psycopg2.connect")
+    def test_run_analyse_duckdb_backend(
+        self,
+        mock_connect,
+        mock_update_status,
+        mock_check_task,
+        mock_ensure_batch,
+        mock_save_results,
+        mock_analyze,
+        mock_fetch,
+        mock_fetch_columnar,
+    ):
+        """
+        测试：策略中选择 analytics_backend=duckdb 时在本地列式引擎中计算价格对
+        """
+        from block_chain.analyse import run_analyse
+
+        mock_connect.return_value = MagicMock()
+        mock_fetch_columnar.return_value = []
+
+        config_json = (
+            '{"strategy": {"analytics_backend": "duckdb"}, "batch_id": 1, '
+            '"mirror_refresh": true}'
+        )
+
+        run_analyse("test_task", config_json)
+
+        mock_fetch.assert_not_called()
+        mock_fetch_columnar.assert_called_once()
+        assert mock_fetch_columnar.call_args.kwargs["refresh"] is True
+        mock_update_status.assert_called_once_with("test_task", 1)
+
     @patch("block_chain.analyse.update_task_status")
     @patch("block_chain.analyse.psycopg2.connect")
     def test_run_analyse_invalid_time_range(
@@ -0,0 +1,81 @@
+"""
+analyze_risk.py 的单元测试（逐条与批量计算的一致性）
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from risk_helpers import assert_matches_scalar
+
+from block_chain.analyze_risk import (
+    _round_half_even,
+    calculate_risk_metrics_batch,
+)
+
+
+class TestRiskMetricsBatch:
+    """
+    测试 calculate_risk_metrics_batch 函数
+    """
+
+    def test_matches_scalar_on_edge_cases(self):
+        """
+        测试：非正价格、非正成交量、亏损、滑点封顶、NaN 等分支与逐条计算完全一致
+        """
+        buy_price = [3000.0, 0.0, -1.0, 3000.0, 3000.0, 3000.0, math.nan, 3000.0]
+        profit = [25.0, 25.0, 25.0, -3.0, 0.0, 1e-9, 25.0, math.nan]
+        volatility = [0.002, 0.002, 0.002, 0.002, 0.5, 0.002, 0.002, math.nan]
+        market_volume = [120.5, 0.0, -5.0, 120.5, 1e-6, math.inf, 120.5, 120.5]
+
+        batch = calculate_risk_metrics_batch(
+            buy_price, profit, volatility, market_volume, 100000.0
+        )
+
+        assert_matches_scalar(
+            batch, buy_price, profit, volatility, market_volume, 100000.0
+        )
+        # 价格为 0 时交易规模为 0，成交量非正时滑点封顶为 100%
+        assert batch["trade_size_eth"][1] == 0.0
+        assert batch["estimated_slippage_pct"][1] == 100.0
+
+    def test_matches_scalar_on_random_inputs(self):
+        """
+        测试：大量随机输入（含量级跨度很大的值）与逐条计算逐位一致
+        """
+        rng = np.random.default_rng(11)
+        n = 20000
+        buy_price = rng.uniform(1000, 5000, n)
+        profit = rng.lognormal(2, 2, n) * rng.choice([1, 1, 1, -1], n)
+        volatility = rng.uniform(0, 0.05, n)
+        market_volume = rng.lognormal(3, 3, n)
+
+        batch = calculate_risk_metrics_batch(
+            buy_price, profit, volatility, market_volume, 100000.0
+        )
+
+        assert_matches_scalar(
+            batch, buy_price, profit, volatility, market_volume, 100000.0
+        )
+
+    def test_round_half_even_matches_builtin_round(self):
+        """
+        测试：恰好落在 .5 附近的值（乘以 10^n 会产生舍入误差）与内置 round 一致
+        """
+        values = np.array(
+            [0.125, 0.375, 2.675, 1.005, 0.285, -0.125, -2.675, 1e17, 5e-324, 0.0]
+        )
+        for digits in (1, 2, 4, 6):
+            assert _round_half_even(values, digits).tolist() == [
+                round(float(v), digits) for v in values
+            ]
@@ -0,0 +1,77 @@
+"""
+analyze_risk.py 的基于性质的测试（hypothesis 生成任意输入，检查批量与逐条计算一致）
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+pytest.importorskip("hypothesis")
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+from risk_helpers import assert_matches_scalar
+
+from block_chain.analyze_risk import (
+    RISK_METRIC_DIGITS,
+    _round_half_even,
+    calculate_risk_metrics_batch,
+)
+
+_nan = st.just(math.nan)
+
+
+def _floats_or_nan(low, high):
+    return st.one_of(st.floats(min_value=low, max_value=high), _nan)
+
+
+@settings(max_examples=300, deadline=None)
+@given(
+    st.lists(
+        st.tuples(
+            _floats_or_nan(-10, 1e6),
+            st.one_of(st.floats(allow_infinity=False), st.floats(-100, 1e4)),
+            _floats_or_nan(0, 10),
+            st.one_of(_floats_or_nan(-10, 1e9), st.just(0.0)),
+        ),
+        min_size=1,
+        max_size=50,
+    ),
+    st.floats(min_value=1, max_value=1e7),
+)
+def test_batch_parity_property(rows, investment):
+    """
+    测试（基于性质）：任意输入下批量计算与逐条计算的每个字段逐位一致
+    """
+    buy_price, profit, volatility, market_volume = (list(col) for col in zip(*rows))
+    batch = calculate_risk_metrics_batch(
+        buy_price, profit, volatility, market_volume, investment
+    )
+
+    assert_matches_scalar(
+        batch, buy_price, profit, volatility, market_volume, investment
+    )
+
+
+@settings(max_examples=500, deadline=None)
+@given(
+    st.lists(st.floats(allow_nan=True, allow_infinity=True), min_size=1),
+    st.sampled_from(sorted(set(RISK_METRIC_DIGITS.values()))),
+)
+def test_round_half_even_property(values, digits):
+    """
+    测试（基于性质）：向量化取整与内置 round 逐位一致
+    """
+    got = _round_half_even(np.asarray(values, dtype=np.float64), digits).tolist()
+    want = [round(v, digits) for v in values]
+    assert [repr(float(v)) for v in got] == [repr(float(v)) for v in want]
@@ -0,0 +1,302 @@
+"""
+coalesce.py 的单元测试
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain.coalesce import TaskCoalescer, task_fingerprint
+
+
+class TestTaskFingerprint:
+    """
+    测试 task_fingerprint 函数
+    """
+
+    def test_ignores_task_id_and_key_order(self):
+        """
+        测试：默认忽略 task_id，且与字段顺序无关
+        """
+        a = task_fingerprint(
+            "process_prices",
+            {"task_id": "a", "start_date": 1, "db_overrides": {"x": 1, "y": 2}},
+        )
+        b = task_fingerprint(
+            "process_prices",
+            {"db_overrides": {"y": 2, "x": 1}, "start_date": 1, "task_id": "b"},
+        )
+
+        assert a == b
+
+    def test_task_type_and_params_matter(self):
+        """
+        测试：任务类型或参数不同则指纹不同
+        """
+        base = task_fingerprint("process_prices", {"start_date": 1})
+
+        assert base != task_fingerprint("analyse", {"start_date": 1})
+        assert base != task_fingerprint("process_prices", {"start_date": 2})
+
+    def test_include_task_id(self):
+        """
+        测试：exclude 为空时 task_id 参与指纹计算
+        """
+        a = task_fingerprint("analyse", {"task_id": "a"}, exclude=())
+        b = task_fingerprint("analyse", {"task_id": "b"}, exclude=())
+
+        assert a != b
+
+
+class TestTaskCoalescer:
+    """
+    测试 TaskCoalescer 类
+    """
+
+    def test_in_flight_duplicates_share_result(self):
+        """
+        测试：leader 执行期间到达的重复任务等待并复用结果，只执行一次
+        """
+        coalescer = TaskCoalescer(window_seconds=60)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "done"
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(coalescer.run("k", "t1", work))
+        )
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(
+                target=lambda i=i: results.append(coalescer.run("k", f"f{i}", work))
+            )
+            for i in range(5)
+        ]
+        for t in followers:
+            t.start()
+        release.set()
+        for t in [leader, *followers]:
+            t.join(5)
+
+        assert len(calls) == 1
+        assert len(results) == 6
+        assert all(r[0] == "done" and r[1] == "t1" for r in results)
+        assert sum(1 for r in results if r[2]) == 1
+
+    def test_recent_success_reused_within_window(self):
+        """
+        测试：去重窗口内刚刚成功的任务直接复用结果
+        """
+        coalescer = TaskCoalescer(window_seconds=60)
+
+        first = coalescer.run("k", "t1", lambda: 1)
+        second = coalescer.run("k", "t2", lambda: 2)
+
+        assert first == (1, "t1", True)
+        assert second == (1, "t1", False)
+
+    def test_expired_window_reruns(self):
+        """
+        测试：超过去重窗口后重新执行
+        """
+        coalescer = TaskCoalescer(window_seconds=0)
+
+        coalescer.run("k", "t1", lambda: 1)
+        time.sleep(0.01)
+
+        assert coalescer.run("k", "t2", lambda: 2) == (2, "t2", True)
+
+    def test_failure_not_cached(self):
+        """
+        测试：leader 失败时异常向上抛出，且失败结果不被缓存
+        """
+        coalescer = TaskCoalescer(window_seconds=60)
+
+        def fail():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            coalescer.run("k", "t1", fail)
+
+        assert coalescer.run("k", "t2", lambda: "ok") == ("ok", "t2", True)
+
+    def test_admit_and_forget(self):
+        """
+        测试：请求入口去重，forget 后允许重新入队
+        """
+        coalescer = TaskCoalescer(window_seconds=60)
+
+        assert coalescer.admit("req") is True
+        assert coalescer.admit("req") is False
+        coalescer.forget("req")
+        assert coalescer.admit("req") is True
+
+
+class TestEnqueueDedup:
+    """
+    测试 gRPC 入口的重复请求合并
+    """
+
+    def _enqueue(self, service_module, request):
+        return service_module.TaskService()._enqueue(
+            lambda r: ("analyse", {"task_id": r.task_id}, None), request
+        )
+
+    def test_finished_task_can_be_resubmitted(self, monkeypatch):
+        """
+        测试：执行中的重复请求只入队一次；任务结束（例如失败）后在去重窗口内重新提交会再次入队
+        """
+        import server
+
+        monkeypatch.setattr(server, "task_coalescer", TaskCoalescer(60))
+        request = MagicMock(task_id="t1")
+        with patch.object(server, "mark_task_waiting"), patch.object(
+            server, "log_task_event"
+        ), patch.object(server, "rabbitmq_manager") as manager, patch.object(
+            server, "requeue_finished_task", side_effect=[False, True]
+        ) as requeue:
+            self._enqueue(server, request)
+            # 任务仍在执行中：合并，不再入队
+            self._enqueue(server, request)
+            # 任务已失败：重新入队
+            self._enqueue(server, request)
+
+        assert manager.publish_task.call_count == 2
+        assert requeue.call_count == 2
+
+    def test_requeue_only_finished_task(self, mock_db_connection):
+        """
+        测试：只有已结束的任务会被原子地重新置为 WAIT，WAIT / RUNNING 的任务不受影响
+        """
+        import server
+
+        conn, cur = mock_db_connection
+        with patch.object(server, "_get_db_connection", return_value=conn):
+            cur.rowcount = 1
+            assert server.requeue_finished_task("t1") is True
+            cur.rowcount = 0
+            assert server.requeue_finished_task("t1") is False
+
+        sql, params = cur.execute.call_args[0]
+        assert "status IN %s" in sql
+        assert params == ("WAIT", "t1", ("SUCCESS", "FAILED", "CANCELLED"))
+
+
+class _FakePool:
+    """记录调用的 asyncpg 连接池替身；fetchval 依次返回 fetchval_results"""
+
+    def __init__(self, fetchval_results=()):
+        self.executed = []
+        self.fetched = []
+        self._fetchval_results = list(fetchval_results)
+
+    async def execute(self, sql, *args):
+        self.executed.append((sql, args))
+
+    async def fetchval(self, sql, *args):
+        self.fetched.append((sql, args))
+        return self._fetchval_results.pop(0)
+
+
+def _published(error=None):
+    """发布线程池返回的已完成 Future"""
+    future = Future()
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+    return future
+
+
+class TestAsyncEnqueueDedup:
+    """
+    测试 grpc.aio 入口（AsyncTaskService）的重复请求合并
+    """
+
+    def _enqueue(self, service, request):
+        return asyncio.run(
+            service._enqueue(
+                lambda r: ("analyse", {"task_id": r.task_id}, None), request
+            )
+        )
+
+    def test_finished_task_can_be_resubmitted(self, monkeypatch):
+        """
+        测试：首个请求置为 WAIT 并入队；执行中的重复请求被合并；任务结束后重新提交会再次入队
+        """
+        import server
+
+        monkeypatch.setattr(server, "task_coalescer", TaskCoalescer(60))
+        pool = _FakePool(fetchval_results=[None, 1])
+        service = server.AsyncTaskService(pool)
+        request = MagicMock(task_id="t1")
+        with patch.object(server, "rabbitmq_manager") as manager:
+            manager.publish_task_async.side_effect = lambda *a, **k: _published()
+            admitted = self._enqueue(service, request)
+            # 任务仍在执行中：合并，不再入队
+            merged = self._enqueue(service, request)
+            # 任务已失败：重新入队
+            requeued = self._enqueue(service, request)
+
+        assert [r.status for r in (admitted, merged, requeued)] == [
+            server.TaskStatus.WAIT
+        ] * 3
+        assert manager.publish_task_async.call_count == 2
+        assert manager.publish_task_async.call_args == (
+            ("analyse", {"task_id": "t1"}),
+            {"priority": None},
+        )
+        assert [sql for sql, _ in pool.executed] == [server._ASYNC_MARK_WAITING_SQL]
+        assert [args for _, args in pool.fetched] == [
+            ("t1", "WAIT", "任务已入队，等待执行", ["SUCCESS", "FAILED", "CANCELLED"])
+        ] * 2
+
+    def test_publish_failure_forgets_request(self, monkeypatch):
+        """
+        测试：入队失败时任务标记为 FAILED 并撤销合并记录，相同请求可以立即重新入队
+        """
+        import server
+
+        monkeypatch.setattr(server, "task_coalescer", TaskCoalescer(60))
+        pool = _FakePool()
+        service = server.AsyncTaskService(pool)
+        request = MagicMock(task_id="t1")
+        with patch.object(server, "rabbitmq_manager") as manager:
+            manager.publish_task_async.side_effect = [
+                _published(ConnectionError("broker down")),
+                _published(),
+            ]
+            failed = self._enqueue(service, request)
+            retried = self._enqueue(service, request)
+
+        assert failed.status == server.TaskStatus.FAILED
+        assert retried.status == server.TaskStatus.WAIT
+        assert manager.publish_task_async.call_count == 2
+        assert [sql for sql, _ in pool.executed] == [
+            server._ASYNC_MARK_WAITING_SQL,
+            server._ASYNC_MARK_FAILED_SQL,
+            server._ASYNC_MARK_WAITING_SQL,
+        ]
+        assert pool.executed[1][1][1] == "FAILED"
+        assert pool.fetched == []
@@ -2,8 +2,11 @@
 collect_binance.py 的单元测试
 """
 
+import bz2
+import gzip
 import os
 import sys
+import zipfile
 from unittest.mock import MagicMock, Mock, mock_open, patch
 
 import pandas as pd
@@ -33,7 +36,7 @@ class TestCountLines:
     测试文件行数统计函数
     """
 
-    @patch("builtins.open", new_callable=mock_open, read_data="line1\nline2\nline3\n")
+    @patch("builtins.open", new_callable=mock_open, read_data=b"line1\nline2\nline3\n")
     @patch("block_chain.collect_binance.check_task", return_value=False)
     def test_count_lines_success(self, mock_check_task, mock_file):
         """
@@ -43,7 +46,32 @@ class TestCountLines:
         result = count_lines("test_task", "test.csv")
 
         assert result == 3
-        mock_file.assert_called_once_with("test.csv", "r", encoding="utf-8")
+        mock_file.assert_called_once_with("test.csv", "rb")
+
+    @pytest.mark.parametrize("suffix", [".csv", ".csv.gz", ".csv.bz2", ".zip"])
+    @patch("block_chain.collect_binance.check_task", return_value=False)
+    def test_count_lines_compressed_dump(self, mock_check_task, tmp_path, suffix):
+        """
+        测试：带表头的交易所文件（包括压缩文件）边解压边统计，不计入表头
+        """
+        content = (
+            "timestamp,side,size,price\n"
+            "1756720800.25,Buy,0.5,3000.0\n"
+            "1756720801.5,Sell,1.0,3001.0\n"
+        ).encode()
+        path = tmp_path / f"ETHUSDT2025-09-01{suffix}"
+        if suffix == ".csv.gz":
+            path.write_bytes(gzip.compress(content))
+        elif suffix == ".csv.bz2":
+            path.write_bytes(bz2.compress(content))
+        elif suffix == ".zip":
+            with zipfile.ZipFile(path, "w") as archive:
+                archive.writestr("ETHUSDT2025-09-01.csv", content)
+        else:
+            path.write_bytes(content)
+
+        assert count_lines("test_task", str(path), "bybit") == 2
+        assert count_lines("test_task", str(path)) == 3
 
     @patch("builtins.open", side_effect=FileNotFoundError)
     @patch("block_chain.collect_binance.update_task_status")
@@ -398,7 +426,17 @@ class TestImportDataToDatabase:
         mock_read_csv.return_value = [sample_chunk]
 
         # process_chunk 会修改 rows_counter，所以我们需要让它实际执行
-        def side_effect(task_id, chunk, idx, counter, target, conn=None):
+        def side_effect(
+            task_id,
+            chunk,
+            idx,
+            counter,
+            target,
+            conn=None,
+            sink=None,
+            symbol=None,
+            venue=None,
+        ):
             counter[0] += len(chunk)
             counter[1] += len(chunk)
             return (True, len(chunk), len(chunk), False)
@@ -444,7 +482,17 @@ class TestImportDataToDatabase:
         mock_read_csv.return_value = [sample_chunk]
 
         # 第一个chunk达到目标行数
-        def side_effect(task_id, chunk, idx, counter, target, conn=None):
+        def side_effect(
+            task_id,
+            chunk,
+            idx,
+            counter,
+            target,
+            conn=None,
+            sink=None,
+            symbol=None,
+            venue=None,
+        ):
             counter[0] += len(chunk)
             counter[1] += len(chunk)
             should_stop = counter[0] >= target if target else False
@@ -535,7 +583,17 @@ class TestImportDataToDatabase:
         )
         mock_read_csv.return_value = [chunk1, chunk2]
 
-        def side_effect(task_id, chunk, idx, counter, target, conn=None):
+        def side_effect(
+            task_id,
+            chunk,
+            idx,
+            counter,
+            target,
+            conn=None,
+            sink=None,
+            symbol=None,
+            venue=None,
+        ):
             counter[0] += len(chunk)
             counter[1] += len(chunk)
             return (True, len(chunk), len(chunk), False)
@@ -594,7 +652,17 @@ class TestImportDataToDatabase:
         mock_read_csv.return_value = [chunk1, chunk2]
 
         # 第一个chunk达到目标行数，返回 should_stop=True
-        def side_effect(task_id, chunk, idx, counter, target, conn=None):
+        def side_effect(
+            task_id,
+            chunk,
+            idx,
+            counter,
+            target,
+            conn=None,
+            sink=None,
+            symbol=None,
+            venue=None,
+        ):
             counter[0] += len(chunk)
             counter[1] += len(chunk)
             should_stop = counter[0] >= target if target else False
@@ -317,6 +317,44 @@ class TestProcessAndStoreUniswapData:
         call_args = mock_execute_values.call_args
         assert call_args is not None
 
+    @patch("block_chain.collect_uniswap.execute_values")
+    def test_process_and_store_uniswap_data_writes_sink(
+        self, mock_execute_values, mock_db_connection
+    ):
+        """
+        测试：提供 Parquet 镜像写入器时写入与数据库相同的记录
+        """
+        mock_conn, _ = mock_db_connection
+        sink = MagicMock()
+
+        swaps_data = [
+            {
+                "id": "0x1",
+                "timestamp": "1725187200",
+                "amount0": "-2.0",
+                "amount1": "6000.0",
+                "transaction": {"id": "0xtx1", "gasPrice": "50000000000"},
+            },
+        ]
+
+        process_and_store_uniswap_data(
+            "test_task", swaps_data, conn=mock_conn, sink=sink
+        )
+
+        frame = sink.write.call_args[0][0]
+        assert list(frame.columns) == [
+            "block_time",
+            "price",
+            "amount_eth",
+            "amount_usdt",
+            "gas_price",
+            "tx_hash",
+            "symbol",
+        ]
+        assert frame.iloc[0]["price"] == 3000.0
+        assert frame.iloc[0]["symbol"] == "ETHUSDT"
+        assert frame.iloc[0]["amount_eth"] == -2.0
+
 
 class TestCollectUniswap:
     """
@@ -520,3 +558,45 @@ class TestCollectUniswap:
         collect_uniswap("test_task", "0x123", 1725187200, 1725187260)
 
         mock_conn.close.assert_called_once()
+
+    @patch("block_chain.collect_uniswap.columnar.open_ingest_sink")
+    @patch("block_chain.collect_uniswap.fetch_all_swaps")
+    @patch("block_chain.collect_uniswap.check_task")
+    @patch("block_chain.collect_uniswap.process_and_store_uniswap_data")
+    @patch("block_chain.collect_uniswap.psycopg2.connect")
+    def test_collect_uniswap_mirror_promoted_only_on_commit(
+        self,
+        mock_connect,
+        mock_process_data,
+        mock_check_task,
+        mock_fetch_swaps,
+        mock_open_sink,
+        mock_db_connection,
+    ):
+        """
+        测试：Parquet 镜像在事务提交后才提交，取消回滚时被丢弃
+        """
+        from block_chain.collect_uniswap import collect_uniswap
+
+        mock_conn, _ = mock_db_connection
+        mock_connect.return_value = mock_conn
+        mock_fetch_swaps.return_value = []
+        mock_process_data.return_value = 1
+        sink = mock_open_sink.return_value
+        events = []
+        mock_conn.commit.side_effect = lambda: events.append("db_commit")
+        sink.commit.side_effect = lambda: events.append("mirror_commit")
+
+        mock_check_task.return_value = False
+        collect_uniswap("test_task", "0x123", 1725187200, 1725187260)
+
+        # 之后的提交来自 K 线刷新
+        assert events[:2] == ["db_commit", "mirror_commit"]
+        assert mock_process_data.call_args.kwargs["sink"] is sink
+
+        sink.reset_mock()
+        mock_check_task.side_effect = [False, True]
+        collect_uniswap("test_task", "0x123", 1725187200, 1725187260)
+
+        sink.commit.assert_not_called()
+        sink.abort.assert_called_once()
@@ -0,0 +1,329 @@
+"""
+columnar.py 的单元测试（使用真实的 DuckDB 与临时目录中的 Parquet 镜像）
+"""
+
+import datetime
+import os
+import sys
+
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+pytest.importorskip("duckdb")
+
+import pandas as pd
+
+from block_chain.columnar import (
+    ColumnarStore,
+    ParquetSink,
+    promote_after_commit,
+    read_manifest,
+    resolve_backend,
+)
+
+UTC = datetime.timezone.utc
+
+BINANCE_CSV = (
+    "id,trade_time,price,qty,quote_qty\n"
+    "1,2025-09-01 09:59:56+00,2990,1,2990\n"
+    "2,2025-09-01 09:59:58+00,3010,1,3010\n"
+    "3,2025-09-01 10:00:30+00,3100,2,6200\n"
+)
+UNISWAP_CSV = (
+    "id,block_time,price,amount_eth,amount_usdt,gas_price\n"
+    "1,2025-09-01 10:00:00+00,3050,-1.5,4575,50000000000\n"
+    "2,2025-09-01 10:00:33+00,3150,2,6300,50000000000\n"
+)
+
+
+def _mock_export(mock_db_connection, tables):
+    """让 copy_expert 按表名写出给定的 CSV（没有的表只有表头）"""
+    conn, cursor = mock_db_connection
+    exported = []
+
+    def mogrify(sql, params):
+        return sql.encode()
+
+    def copy_expert(sql, f):
+        table = "binance_trades" if "FROM binance_trades" in sql else "uniswap_swaps"
+        exported.append(table)
+        body = tables.get(table)
+        if body is None:
+            header = BINANCE_CSV if table == "binance_trades" else UNISWAP_CSV
+            body = header.splitlines()[0] + "\n"
+        f.write(body)
+
+    cursor.mogrify.side_effect = mogrify
+    cursor.copy_expert.side_effect = copy_expert
+    return conn, exported
+
+
+@pytest.fixture
+def store(tmp_path, mock_db_connection):
+    conn, _ = _mock_export(
+        mock_db_connection,
+        {"binance_trades": BINANCE_CSV, "uniswap_swaps": UNISWAP_CSV},
+    )
+    with ColumnarStore(root=str(tmp_path), threads=2) as s:
+        s.sync(
+            conn,
+            datetime.datetime(2025, 9, 1, tzinfo=UTC),
+            datetime.datetime(2025, 9, 1, 23, tzinfo=UTC),
+        )
+        yield s
+
+
+class TestResolveBackend:
+    """
+    测试 resolve_backend 函数
+    """
+
+    def test_default_and_explicit(self):
+        """
+        测试：未指定时使用配置的默认后端，大小写不敏感
+        """
+        assert resolve_backend(None) == "postgres"
+        assert resolve_backend("DuckDB") == "duckdb"
+
+    def test_unknown_backend(self):
+        """
+        测试：未知后端抛出 ValueError
+        """
+        with pytest.raises(ValueError):
+            resolve_backend("spark")
+
+
+class TestColumnarStore:
+    """
+    测试 ColumnarStore 类
+    """
+
+    def test_sync_writes_day_partitions(self, store):
+        """
+        测试：按天导出为 Parquet 分区，不留下临时文件
+        """
+        day = datetime.date(2025, 9, 1)
+        path = store.partition_path("binance_trades", day)
+
+        assert path.endswith(
+            os.path.join("binance_trades", "day=2025-09-01", "data.parquet")
+        )
+        assert os.path.exists(path)
+        assert os.listdir(os.path.dirname(path)) == ["data.parquet"]
+
+    def test_sync_skips_finished_days(self, tmp_path, mock_db_connection):
+        """
+        测试：已结束且已导出的日期不再重复导出，refresh=True 时重新导出
+        """
+        conn, exported = _mock_export(mock_db_connection, {})
+        start = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+        end = datetime.datetime(2025, 9, 2, 12, tzinfo=UTC)
+
+        with ColumnarStore(root=str(tmp_path)) as s:
+            assert s.sync(conn, start, end) == 4
+            assert s.sync(conn, start, end) == 0
+            assert s.sync(conn, start, end, refresh=True) == 4
+
+        assert len(exported) == 8
+
+    def test_aggregate_matches_sql_shape(self, store):
+        """
+        测试：时间桶均价与 process_prices.sql_query 结构一致（左闭右开）
+        """
+        day = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+
+        rows = store.aggregate(60, day, day + datetime.timedelta(days=1))
+
+        result = {(r[0], r[1]): r[2] for r in rows}
+        assert (
+            result[(datetime.datetime(2025, 9, 1, 9, 59, tzinfo=UTC), "Binance")]
+            == 3000
+        )
+        assert (
+            result[(datetime.datetime(2025, 9, 1, 10, 0, tzinfo=UTC), "Binance")]
+            == 3100
+        )
+        assert (
+            result[(datetime.datetime(2025, 9, 1, 10, 0, tzinfo=UTC), "Uniswap")]
+            == 3100
+        )
+        assert len(rows) == 3
+
+    def test_aggregate_missing_partitions(self, tmp_path):
+        """
+        测试：没有镜像数据的区间返回空结果
+        """
+        day = datetime.datetime(2025, 9, 5, tzinfo=UTC)
+
+        with ColumnarStore(root=str(tmp_path)) as s:
+            assert s.aggregate(60, day, day + datetime.timedelta(days=1)) == []
+
+    def test_price_pairs(self, store):
+        """
+        测试：延迟窗口内的 Binance 均价与 10 分钟累计成交量
+        """
+        strategy = {"time_delay_seconds": 3, "window_seconds": 5}
+
+        pairs = store.price_pairs(strategy)
+
+        first, second = pairs
+        # 10:00:00 的窗口为 [09:59:52, 10:00:02]
+        assert first[0] == datetime.datetime(2025, 9, 1, 10, 0, tzinfo=UTC)
+        assert first[1:] == (3050, 50e9, 1.5, 3000)
+        # 10:00:33 的窗口为 [10:00:25, 10:00:35]，累计成交量包含前一笔
+        assert second[3] == 3.5
+        assert second[4] == 3100
+
+    def test_price_pairs_time_filter(self, store):
+        """
+        测试：start / end 过滤 Uniswap 事件
+        """
+        strategy = {"time_delay_seconds": 3, "window_seconds": 5}
+
+        pairs = store.price_pairs(
+            strategy,
+            datetime.datetime(2025, 9, 1, 10, 0, 10, tzinfo=UTC),
+            datetime.datetime(2025, 9, 1, 11, tzinfo=UTC),
+        )
+
+        assert [p[0].second for p in pairs] == [33]
+        # 过滤后窗口成交量只计算范围内的事件
+        assert pairs[0][3] == 2
+
+
+def _binance_frame():
+    """与 collect_binance.process_chunk 写入数据库相同的规范化分块（跨两天）"""
+    return pd.DataFrame(
+        {
+            "id": [1, 2, 3],
+            "price": [3000.0, 3001.0, 3002.0],
+            "qty": [1.0, 2.0, 3.0],
+            "quote_qty": [3000.0, 6002.0, 9006.0],
+            "trade_time": pd.to_datetime(
+                ["2025-09-01 23:59:59", "2025-09-02 00:00:00", "2025-09-02 00:00:01"],
+                utc=True,
+            ),
+            "is_buyer_maker": [True, False, True],
+            "is_best_match": [True, True, True],
+        }
+    )
+
+
+class TestParquetSink:
+    """
+    测试 ParquetSink 类
+    """
+
+    def test_files_visible_only_after_commit(self, tmp_path):
+        """
+        测试：暂存文件在提交前不可见，提交后按天进入正式分区并登记到 manifest
+        """
+        root = str(tmp_path)
+        sink = ParquetSink("binance_trades", root=root)
+
+        assert sink.write(_binance_frame()) == 3
+        with ColumnarStore(root=root) as store:
+            day = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+            assert store.aggregate(60, day, day + datetime.timedelta(days=2)) == []
+
+        assert sink.commit() == 3
+
+        manifest = read_manifest(root, "binance_trades")
+        assert sorted(manifest["days"]) == ["2025-09-01", "2025-09-02"]
+        entry = manifest["days"]["2025-09-02"][0]
+        assert entry["kind"] == "ingest"
+        assert entry["rows"] == 2
+        assert entry["min_time"] == "2025-09-02T00:00:00"
+        assert not os.path.exists(
+            os.path.join(root, "binance_trades", "_staging", sink.batch_id)
+        )
+        with ColumnarStore(root=root) as store:
+            rows = store.aggregate(86400, day, day + datetime.timedelta(days=2))
+        assert sorted((r[0].day, r[2]) for r in rows) == [(1, 3000.0), (2, 3001.5)]
+
+    def test_typed_zstd_columns(self, tmp_path):
+        """
+        测试：只保留镜像列，类型固定，使用 zstd 压缩
+        """
+        import duckdb
+
+        root = str(tmp_path)
+        sink = ParquetSink("binance_trades", root=root)
+        sink.write(_binance_frame())
+        sink.commit()
+
+        path = os.path.join(
+            root, read_manifest(root, "binance_trades")["days"]["2025-09-01"][0]["file"]
+        )
+        meta = duckdb.execute(
+            "SELECT path_in_schema, compression FROM parquet_metadata(?)", [path]
+        ).fetchall()
+        assert [m[0] for m in meta] == ["id", "trade_time", "price", "qty", "quote_qty"]
+        assert {m[1] for m in meta} == {"ZSTD"}
+
+    def test_abort_discards_staged_files(self, tmp_path):
+        """
+        测试：回滚时丢弃暂存文件，manifest 不变
+        """
+        root = str(tmp_path)
+        sink = ParquetSink("uniswap_swaps", root=root)
+        sink.write(
+            pd.DataFrame(
+                {
+                    "block_time": pd.to_datetime(["2025-09-01 10:00:00"], utc=True),
+                    "price": [3000.0],
+                    "amount_eth": [-1.0],
+                    "amount_usdt": [3000.0],
+                    "gas_price": [50e9],
+                    "tx_hash": ["0xabc"],
+                }
+            )
+        )
+        sink.abort()
+        sink.abort()
+
+        assert read_manifest(root, "uniswap_swaps")["days"] == {}
+        assert not os.path.exists(
+            os.path.join(root, "uniswap_swaps", "_staging", sink.batch_id)
+        )
+
+    def test_promote_failure_is_not_fatal(self):
+        """
+        测试：镜像提交失败只记录警告并丢弃暂存文件
+        """
+        from unittest.mock import MagicMock
+
+        sink = MagicMock()
+        sink.commit.side_effect = OSError("disk full")
+
+        promote_after_commit(sink)
+        promote_after_commit(None)
+
+        sink.abort.assert_called_once()
+
+    def test_snapshot_supersedes_ingested_parts(self, tmp_path, mock_db_connection):
+        """
+        测试：导出整天快照后删除此前提交的采集文件，避免重复计数
+        """
+        root = str(tmp_path)
+        sink = ParquetSink("binance_trades", root=root)
+        sink.write(_binance_frame())
+        sink.commit()
+        conn, _ = _mock_export(mock_db_connection, {"binance_trades": BINANCE_CSV})
+
+        with ColumnarStore(root=root) as store:
+            store._export_day(conn, "binance_trades", datetime.date(2025, 9, 1))
+            day = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+            files = store._partition_files("binance_trades", day, day)
+
+        assert [os.path.basename(f) for f in files] == ["data.parquet"]
+        entries = read_manifest(root, "binance_trades")["days"]["2025-09-01"]
+        assert [(e["kind"], e["rows"]) for e in entries] == [("snapshot", 3)]
+        # 其他日期的采集文件不受影响
+        assert len(read_manifest(root, "binance_trades")["days"]["2025-09-02"]) == 1
@@ -0,0 +1,183 @@
+"""
+gas_index.py 的单元测试
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain import gas_index
+from block_chain.analyse import (
+    DEFAULT_STRATEGY,
+    analyze_opportunities,
+    calculate_profit_buy_cex_sell_dex,
+    calculate_profit_buy_dex_sell_cex,
+)
+from block_chain.gas_index import PERCENTILES, GasIndex
+
+SECOND = 1_000_000_000
+T0 = pd.Timestamp("2025-09-01 10:00:00", tz="UTC")
+T0_NS = T0.value
+
+
+class TestGasIndex:
+    """
+    测试 GasIndex 类
+    """
+
+    def test_summary_matches_numpy_percentiles(self):
+        """
+        测试：按秒汇总的基础费用为区块内最低 Gas 价格，优先费分位数与 np.percentile 一致，缺失的 Gas 价格被忽略
+        """
+        rng = np.random.default_rng(0)
+        seconds = rng.integers(0, 50, 2000)
+        gas = rng.uniform(5e9, 80e9, 2000)
+        gas[:10] = np.nan
+        times = T0_NS + seconds * SECOND + rng.integers(0, SECOND, 2000)
+
+        index = GasIndex.from_transactions(times, gas)
+
+        assert index.time.tolist() == sorted(set(index.time.tolist()))
+        for k, t in enumerate(index.time):
+            mask = (times // SECOND == t // SECOND) & ~np.isnan(gas)
+            values = gas[mask]
+            assert index.count[k] == len(values)
+            assert index.base_fee[k] == values.min()
+            np.testing.assert_allclose(
+                index.priority[k], np.percentile(values, PERCENTILES) - values.min()
+            )
+
+    def test_lookup_uses_latest_block_at_or_before(self):
+        """
+        测试：查询取该时刻之前（含）最近一个区块，没有更早的区块或超过 max_age_seconds 时为 NaN
+        """
+        index = GasIndex.from_transactions(
+            [T0_NS, T0_NS, T0_NS + 12 * SECOND],
+            [10e9, 30e9, 50e9],
+        )
+
+        got = index.gas_price(
+            [T0_NS - 1, T0_NS, T0_NS + 11 * SECOND, T0_NS + 12 * SECOND],
+            percentile=50,
+        )
+
+        assert np.isnan(got[0])
+        assert got[1:].tolist() == [20e9, 20e9, 50e9]
+        assert index.gas_price([T0_NS + 11 * SECOND], 90)[0] == pytest.approx(28e9)
+        stale = index.gas_price([T0_NS + 100 * SECOND], max_age_seconds=60)
+        assert np.isnan(stale[0])
+        with pytest.raises(ValueError):
+            index.gas_price([T0_NS], percentile=60)
+
+    def test_update_merges_and_overrides_seconds(self, tmp_path):
+        """
+        测试：并入保存的索引时按时间排序，同一秒以新的汇总为准；保存后可原样加载
+        """
+        path = str(tmp_path / "gas" / "index.npz")
+        gas_index.update(
+            GasIndex.from_transactions([T0_NS, T0_NS + 24 * SECOND], [10e9, 20e9]), path
+        )
+
+        merged = gas_index.update(
+            GasIndex.from_transactions([T0_NS + 12 * SECOND, T0_NS], [15e9, 11e9]),
+            path,
+        )
+
+        loaded = gas_index.load_gas_index(path)
+        assert loaded.time.tolist() == [T0_NS + k * 12 * SECOND for k in range(3)]
+        assert loaded.base_fee.tolist() == [11e9, 15e9, 20e9]
+        np.testing.assert_array_equal(loaded.priority, merged.priority)
+
+
+def test_update_after_ingest(tmp_path):
+    """
+    测试：采集提交后的更新默认关闭，开启后把 The Graph 的 Swap 并入索引
+    """
+    swaps = [
+        {"timestamp": str(T0_NS // SECOND), "transaction": {"gasPrice": "50000000000"}},
+        {"timestamp": str(T0_NS // SECOND), "transaction": {"gasPrice": "30000000000"}},
+    ]
+    path = str(tmp_path / "index.npz")
+
+    assert gas_index.update_after_ingest(swaps, path, enabled=False) is None
+    assert not os.path.exists(path)
+    index = gas_index.update_after_ingest(swaps, path, enabled=True)
+
+    assert index.base_fee.tolist() == [30e9]
+    assert index.count.tolist() == [2]
+    # 数据有误时只记录警告
+    assert gas_index.update_after_ingest([{}], path, enabled=True) is None
+
+
+def test_rebuild_from_db(tmp_path, mock_db_connection):
+    """
+    测试：由数据库按秒汇总的结果重建索引，分位数减去基础费用得到优先费
+    """
+    conn, cur = mock_db_connection
+    ts = T0_NS // SECOND
+    cur.fetchall.return_value = [
+        (ts, 10e9, [12e9, 15e9, 20e9, 30e9], 4),
+        (ts + 12, 8e9, [8e9, 8e9, 8e9, 8e9], 1),
+    ]
+
+    index = gas_index.rebuild_from_db(conn, str(tmp_path / "index.npz"))
+
+    sql = cur.execute.call_args[0][0]
+    assert "percentile_cont(ARRAY[0.25, 0.5, 0.75, 0.9])" in sql
+    assert index.time.tolist() == [T0_NS, T0_NS + 12 * SECOND]
+    assert index.priority[0].tolist() == [2e9, 5e9, 10e9, 20e9]
+    assert index.gas_price([T0_NS + 13 * SECOND])[0] == 8e9
+
+
+def test_analyze_opportunities_prices_gas_at_execution(tmp_path, monkeypatch):
+    """
+    测试：gas_model=index 时按执行时刻（Swap 时间 + 延迟）的索引 Gas 价格与按路线的 Gas 用量计算利润，
+    索引中没有可用区块的行回退到 Swap 自身的 gas_price
+    """
+    index = GasIndex.from_transactions(
+        [T0_NS + 2 * SECOND, T0_NS + 40 * SECOND], [40e9, 100e9]
+    )
+    monkeypatch.setattr(gas_index, "load_gas_index", lambda path=None: index)
+    route_gas = {"buy_cex_sell_dex": 120_000, "buy_dex_sell_cex": 160_000}
+    strategy = {
+        **DEFAULT_STRATEGY,
+        "gas_model": "index",
+        "route_gas_used": route_gas,
+        "profit_threshold": -1000,
+    }
+    pairs = [
+        # 执行时刻 T0-1s 之前没有区块：回退到 Swap 的 gas_price
+        (T0 - pd.Timedelta(seconds=4), 3100.0, 5e9, 10.0, 3000.0),
+        # 执行时刻 T0+3s：使用 T0+2s 区块的 40 Gwei
+        (T0, 3100.0, 5e9, 10.0, 3000.0),
+        # 执行时刻 T0+43s：使用 T0+40s 区块的 100 Gwei
+        (T0 + pd.Timedelta(seconds=40), 2900.0, 5e9, 10.0, 3000.0),
+    ]
+
+    opportunities = analyze_opportunities(pairs, strategy)
+
+    priced = {**strategy, "route_gas_used": route_gas}
+    assert [o["profit_usdt"] for o in opportunities] == pytest.approx(
+        [
+            calculate_profit_buy_cex_sell_dex(priced, 3000.0, 3100.0, 5e9),
+            calculate_profit_buy_cex_sell_dex(priced, 3000.0, 3100.0, 40e9),
+            calculate_profit_buy_dex_sell_cex(priced, 2900.0, 3000.0, 100e9),
+        ]
+    )
+    # 默认的 swap 模式保持原有的结果
+    baseline = analyze_opportunities(
+        pairs, {**DEFAULT_STRATEGY, "profit_threshold": -1000}
+    )
+    assert baseline[1]["profit_usdt"] == pytest.approx(
+        calculate_profit_buy_cex_sell_dex(DEFAULT_STRATEGY, 3000.0, 3100.0, 5e9)
+    )
@@ -0,0 +1,310 @@
+"""
+incremental.py 的单元测试
+"""
+
+import datetime
+import os
+import sys
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain import incremental
+from block_chain.incremental import (
+    RefreshPlan,
+    new_opportunities,
+    plan_refresh,
+    save_watermark,
+    strategy_hash,
+)
+
+UTC = datetime.timezone.utc
+CREATED = datetime.datetime(2025, 8, 1, tzinfo=UTC)
+WATERMARK = datetime.datetime(2025, 9, 1, 12, 0, tzinfo=UTC)
+STRATEGY = {"profit_threshold": 1, "time_delay_seconds": 3, "window_seconds": 5}
+
+
+def _ts(text):
+    return pd.Timestamp(text, tz="UTC")
+
+
+class TestStrategyHash:
+    """
+    测试 strategy_hash 函数
+    """
+
+    def test_ignores_time_range_and_backend(self):
+        """
+        测试：时间范围与计算后端不影响哈希，影响结果的参数会改变哈希
+        """
+        base = strategy_hash(STRATEGY)
+        extended = strategy_hash(
+            {**STRATEGY, "end": "2025-10-01", "analytics_backend": "duckdb"}
+        )
+        changed = strategy_hash({**STRATEGY, "profit_threshold": 2})
+
+        assert base == extended
+        assert base != changed
+
+
+class TestPlanRefresh:
+    """
+    测试 plan_refresh 函数
+    """
+
+    def test_full_without_watermark(self, mock_db_connection):
+        """
+        测试：批次没有水位线时整批计算，取数起点为任务的起始时间
+        """
+        conn, cur = mock_db_connection
+        cur.fetchone.side_effect = [(CREATED,), None]
+
+        plan = plan_refresh(conn, 1, STRATEGY, _ts("2025-09-01"))
+
+        assert plan.full
+        assert plan.fetch_start == _ts("2025-09-01")
+        assert plan.batch_created_at == CREATED
+
+    def test_full_when_strategy_changed_or_batch_recreated(self, mock_db_connection):
+        """
+        测试：策略参数变化或批次被重建时整批重新计算
+        """
+        conn, cur = mock_db_connection
+        cur.fetchone.side_effect = [(CREATED,), ("other", WATERMARK, CREATED)]
+        assert plan_refresh(conn, 1, STRATEGY, None).full
+
+        recreated = CREATED + datetime.timedelta(days=1)
+        cur.fetchone.side_effect = [
+            (recreated,),
+            (strategy_hash(STRATEGY), WATERMARK, CREATED),
+        ]
+        assert plan_refresh(conn, 1, STRATEGY, None).full
+
+    def test_incremental_with_warmup(self, mock_db_connection):
+        """
+        测试：水位线有效时从预热起点开始取数（10 分钟成交量窗口与 10 个价格对中更早的一个）
+        """
+        conn, cur = mock_db_connection
+        ninth_back = WATERMARK - datetime.timedelta(minutes=30)
+        cur.fetchone.side_effect = [
+            (CREATED,),
+            (strategy_hash(STRATEGY), WATERMARK, CREATED),
+            (ninth_back,),
+        ]
+
+        plan = plan_refresh(conn, 1, STRATEGY, None)
+
+        assert not plan.full
+        assert plan.watermark == pd.Timestamp(WATERMARK)
+        assert plan.fetch_start == pd.Timestamp(ninth_back)
+        warmup_sql, warmup_params = cur.execute.call_args_list[-1][0]
+        # 只计入延迟窗口内匹配到 Binance 成交的 Swap
+        assert "EXISTS" in warmup_sql and "binance_trades" in warmup_sql
+        assert "OFFSET %(offset)s LIMIT 1" in warmup_sql
+        assert warmup_params["symbol"] == "ETHUSDT"
+        assert warmup_params["delay"] == "3 seconds"
+        assert warmup_params["window"] == "5 seconds"
+        assert warmup_params["offset"] == incremental.VOLATILITY_POINTS - 1
+
+        # 价格点足够密集时由 10 分钟成交量窗口决定
+        cur.fetchone.side_effect = [
+            (CREATED,),
+            (strategy_hash(STRATEGY), WATERMARK, CREATED),
+            (WATERMARK - datetime.timedelta(seconds=30),),
+        ]
+        plan = plan_refresh(conn, 1, STRATEGY, None)
+        assert plan.fetch_start == pd.Timestamp(WATERMARK) - incremental.VOLUME_WINDOW
+
+    def test_start_time_bounds_warmup(self, mock_db_connection):
+        """
+        测试：任务指定的起始时间晚于预热起点时，从起始时间开始取数
+        """
+        conn, cur = mock_db_connection
+        cur.fetchone.side_effect = [
+            (CREATED,),
+            (strategy_hash(STRATEGY), WATERMARK, CREATED),
+            None,
+        ]
+
+        plan = plan_refresh(conn, 1, STRATEGY, _ts("2025-09-01 11:58"))
+
+        assert plan.fetch_start == _ts("2025-09-01 11:58")
+
+
+class TestWatermark:
+    """
+    测试机会过滤与水位线记录
+    """
+
+    def test_new_opportunities_after_watermark(self):
+        """
+        测试：预热区间（水位线及之前）的机会被去掉
+        """
+        opportunities = [
+            {"block_time": WATERMARK - datetime.timedelta(seconds=1)},
+            {"block_time": WATERMARK},
+            {"block_time": WATERMARK + datetime.timedelta(seconds=1)},
+        ]
+
+        assert new_opportunities(opportunities, _ts("2025-09-01 12:00")) == [
+            opportunities[2]
+        ]
+        assert new_opportunities(opportunities, None) == opportunities
+
+    def test_save_watermark_advances(self, mock_db_connection):
+        """
+        测试：水位线前进到本次分析的最晚时间，没有新数据时保持不变，并更新 last_refreshed_at
+        """
+        _, cur = mock_db_connection
+        plan = RefreshPlan(None, pd.Timestamp(WATERMARK), "h", CREATED)
+
+        save_watermark(cur, plan, 7, WATERMARK + datetime.timedelta(minutes=5))
+        upsert_params = cur.execute.call_args_list[0][0][1]
+        assert upsert_params[0] == 7
+        assert upsert_params[2] == WATERMARK + datetime.timedelta(minutes=5)
+        assert "last_refreshed_at" in cur.execute.call_args_list[1][0][0]
+
+        cur.reset_mock()
+        save_watermark(cur, plan, 7, None)
+        assert cur.execute.call_args_list[0][0][1][2] == WATERMARK
+
+
+class TestIncrementalRun:
+    """
+    测试 run_analyse 的增量模式
+    """
+
+    @patch("block_chain.analyse.save_results")
+    @patch("block_chain.analyse.fetch_price_pairs")
+    @patch("block_chain.analyse.ensure_batch_exists")
+    @patch("block_chain.analyse.check_task", return_value=False)
+    @patch("block_chain.analyse.update_task_status")
+    @patch("block_chain.analyse.psycopg2.connect")
+    def test_appends_only_new_opportunities(
+        self,
+        mock_connect,
+        mock_update_status,
+        mock_check_task,
+        mock_ensure_batch,
+        mock_fetch,
+        mock_save_results,
+        mock_db_connection,
+    ):
+        """
+        测试：只取预热起点之后的价格对，只追加水位线之后的机会，并记录新的水位线
+        """
+        from block_chain.analyse import DEFAULT_STRATEGY, run_analyse
+
+        conn, cur = mock_db_connection
+        mock_connect.return_value = conn
+        strategy = {**DEFAULT_STRATEGY, "profit_threshold": 1}
+        cur.fetchone.side_effect = [
+            (CREATED,),
+            (strategy_hash(strategy), WATERMARK, CREATED),
+            None,
+        ]
+        # 每一对都有明显价差：预热区间内与水位线之后各有一条机会
+        mock_fetch.return_value = [
+            (WATERMARK - datetime.timedelta(minutes=1), 3100.0, 1e9, 100.0, 3000.0),
+            (WATERMARK + datetime.timedelta(minutes=1), 3100.0, 1e9, 100.0, 3000.0),
+        ]
+
+        run_analyse(
+            "task",
+            '{"strategy": {"profit_threshold": 1}, "batch_id": 3, "incremental": true}',
+        )
+
+        fetch_start = mock_fetch.call_args[0][2]
+        assert fetch_start == pd.Timestamp(WATERMARK) - incremental.VOLUME_WINDOW
+        saved, batch_id, overwrite = mock_save_results.call_args[0][1:4]
+        assert batch_id == 3
+        assert overwrite is False
+        assert [opp["block_time"] for opp in saved] == [
+            WATERMARK + datetime.timedelta(minutes=1)
+        ]
+        upserts = [
+            call[0][1]
+            for call in cur.execute.call_args_list
+            if "INSERT INTO batch_watermarks" in call[0][0]
+        ]
+        assert upserts[0][2] == WATERMARK + datetime.timedelta(minutes=1)
+        locks = [
+            call[0][0]
+            for call in cur.execute.call_args_list
+            if "pg_advisory" in call[0][0]
+        ]
+        assert locks == [
+            "SELECT pg_advisory_lock(%s, %s)",
+            "SELECT pg_advisory_unlock(%s, %s)",
+        ]
+        mock_update_status.assert_called_once_with("task", 1)
+
+
+class TestWarmupParity:
+    """
+    测试增量刷新与整批重算的一致性
+    """
+
+    def test_incremental_matches_full_over_binance_gap(self, pg_connect):
+        """
+        测试（真实 PostgreSQL）：水位线之前 Binance 数据有缺口时，增量刷新的机会（含滚动波动率）与整批重算相同
+        """
+        from block_chain.analyse import (
+            DEFAULT_STRATEGY,
+            analyze_opportunities,
+            fetch_price_pairs,
+        )
+
+        conn = pg_connect()
+        with conn.cursor() as cur:
+            # 每 30 秒一笔 Swap；08:20 之后到 08:50 之前没有 Binance 成交
+            cur.execute("""
+                CREATE TABLE uniswap_swaps (
+                    block_time timestamptz, price numeric, gas_price numeric,
+                    amount_eth numeric, symbol text DEFAULT 'ETHUSDT'
+                );
+                CREATE TABLE binance_trades (
+                    trade_time timestamptz, price numeric, symbol text DEFAULT 'ETHUSDT'
+                );
+                INSERT INTO uniswap_swaps (block_time, price, gas_price, amount_eth)
+                SELECT '2025-09-01 08:00+00'::timestamptz + i * interval '30 seconds',
+                       3100 + (i % 7) * 3, 1e9, 1 + i % 3
+                FROM generate_series(0, 120) AS i;
+                INSERT INTO binance_trades (trade_time, price)
+                SELECT '2025-09-01 08:00+00'::timestamptz + i * interval '30 seconds'
+                       - interval '3 seconds', 3000
+                FROM generate_series(0, 120) AS i
+                WHERE i <= 40 OR i >= 100;
+                """)
+        conn.commit()
+        strategy = {**DEFAULT_STRATEGY, "symbol": "ETHUSDT"}
+        watermark = _ts("2025-09-01 08:52")
+
+        def analyse_from(start):
+            pairs = fetch_price_pairs(conn, strategy, start)
+            return new_opportunities(analyze_opportunities(pairs, strategy), watermark)
+
+        with conn.cursor() as cur:
+            fetch_start = incremental.warmup_start(cur, watermark, strategy)
+        full = analyse_from(None)
+        refreshed = analyse_from(fetch_start)
+
+        # 第 10 个价格对在缺口之前，按 Swap 计数只会回溯到 08:47:30
+        assert fetch_start == _ts("2025-09-01 08:18")
+        assert len(refreshed) == len(full) == 16
+        for got, want in zip(refreshed, full):
+            assert got["block_time"] == want["block_time"]
+            assert got["risk_metrics"] == pytest.approx(want["risk_metrics"])
+        # 只覆盖成交量窗口的预热区间会让缺口之后的波动率偏离整批重算
+        short = analyse_from(watermark - incremental.VOLUME_WINDOW)
+        assert short[0]["risk_metrics"]["volatility"] != pytest.approx(
+            full[0]["risk_metrics"]["volatility"]
+        )
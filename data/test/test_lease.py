@@ -0,0 +1,293 @@
+"""
+lease.py 的单元测试
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain.lease import (
+    CLAIM_SQL,
+    claim_task,
+    ensure_lease_tables,
+    heartbeat,
+    make_worker_id,
+    reap_expired_leases,
+    release_task,
+)
+
+
+def _unexpected_publish(item):
+    raise AssertionError(f"不应重新发布 {item}")
+
+
+class TestMakeWorkerId:
+    """
+    测试 make_worker_id 函数
+    """
+
+    def test_worker_id_contains_pid(self):
+        """
+        测试：Worker 标识包含主机名与进程号，且每次生成不同
+        """
+        worker_id = make_worker_id()
+        parts = worker_id.split(":")
+
+        assert len(parts) == 3
+        assert parts[1] == str(os.getpid())
+        assert make_worker_id() != worker_id
+
+
+class TestClaimTask:
+    """
+    测试 claim_task 函数
+    """
+
+    def test_claim_success(self, mock_db_connection):
+        """
+        测试：任务处于 WAIT 时认领成功，返回尝试次数
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchone.return_value = ("t1", 1)
+
+        attempts = claim_task(
+            conn, "t1", "host:1:abc", "analyse", {"task_id": "t1"}, 60
+        )
+
+        assert attempts == 1
+        sql, params = cursor.execute.call_args[0]
+        assert sql == CLAIM_SQL
+        assert params["task_id"] == "t1"
+        assert params["worker_id"] == "host:1:abc"
+        assert params["lease_seconds"] == 60
+        conn.commit.assert_called_once()
+
+    def test_claim_already_taken(self, mock_db_connection):
+        """
+        测试：任务已被其他 Worker 认领时返回 None
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchone.return_value = None
+
+        assert claim_task(conn, "t1", "host:1:abc", "analyse", {}, 60) is None
+
+    def test_claim_sql_is_atomic(self):
+        """
+        测试：认领语句只更新 WAIT 状态的任务
+        """
+        assert "status = 'WAIT'" in CLAIM_SQL
+        assert "RETURNING" in CLAIM_SQL
+
+
+class TestHeartbeat:
+    """
+    测试 heartbeat 与 release_task 函数
+    """
+
+    def test_heartbeat_renews_leases(self, mock_db_connection):
+        """
+        测试：心跳写入 worker_heartbeats 并续约本 Worker 的租约
+        """
+        conn, cursor = mock_db_connection
+        cursor.rowcount = 2
+
+        renewed = heartbeat(conn, "host:42:abc", 30)
+
+        assert renewed == 2
+        first_call, second_call = cursor.execute.call_args_list
+        assert first_call[0][1] == ("host:42:abc", "host", 42)
+        assert second_call[0][1] == (30, "host:42:abc")
+        conn.commit.assert_called_once()
+
+    def test_release_only_own_lease(self, mock_db_connection):
+        """
+        测试：释放租约时限定 worker_id
+        """
+        conn, cursor = mock_db_connection
+
+        release_task(conn, "t1", "host:1:abc")
+
+        sql, params = cursor.execute.call_args[0]
+        assert "worker_id" in sql
+        assert params == ("t1", "host:1:abc")
+
+
+class TestReapExpiredLeases:
+    """
+    测试 reap_expired_leases 函数
+    """
+
+    def test_requeue_expired_task(self, mock_db_connection):
+        """
+        测试：过期且未超过重试次数的任务重新入队
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = [("t1", "analyse", {"task_id": "t1"}, 1)]
+        cursor.rowcount = 1
+        published = []
+
+        requeue, failed = reap_expired_leases(conn, 3, published.append)
+
+        assert failed == []
+        assert (
+            requeue
+            == published
+            == [
+                {
+                    "task_id": "t1",
+                    "task_type": "analyse",
+                    "task_data": {"task_id": "t1"},
+                    "attempts": 1,
+                }
+            ]
+        )
+        conn.commit.assert_called_once()
+
+    def test_publish_failure_keeps_lease(self, mock_db_connection):
+        """
+        测试：重新发布失败时回滚到保存点（任务状态与租约都不变），下一轮回收会再次处理
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = [("t1", "analyse", {"task_id": "t1"}, 1)]
+        cursor.rowcount = 1
+
+        def fail(item):
+            raise ConnectionError("broker down")
+
+        requeue, failed = reap_expired_leases(conn, 3, fail)
+
+        assert (requeue, failed) == ([], [])
+        statements = [c[0][0] for c in cursor.execute.call_args_list]
+        assert statements[-1] == "ROLLBACK TO SAVEPOINT reap_requeue"
+        assert statements.index("SAVEPOINT reap_requeue") < next(
+            i for i, sql in enumerate(statements) if "status = 'WAIT'" in sql
+        )
+
+    def test_fail_after_max_attempts(self, mock_db_connection):
+        """
+        测试：超过最大重试次数的任务标记为失败
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = [("t1", "analyse", {}, 3)]
+
+        requeue, failed = reap_expired_leases(conn, 3, _unexpected_publish)
+
+        assert requeue == []
+        assert failed == ["t1"]
+
+    def test_cancelled_task_not_requeued(self, mock_db_connection):
+        """
+        测试：Worker 失联期间被取消的任务不重新入队，租约被删除
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = [("t1", "analyse", {}, 1)]
+        cursor.rowcount = 0
+
+        requeue, failed = reap_expired_leases(conn, 3, _unexpected_publish)
+
+        assert requeue == []
+        assert failed == []
+        statements = [c[0][0] for c in cursor.execute.call_args_list]
+        assert any("DELETE FROM task_leases" in sql for sql in statements)
+
+    def test_nothing_expired(self, mock_db_connection):
+        """
+        测试：没有过期租约
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = []
+
+        assert reap_expired_leases(conn, 3, _unexpected_publish) == ([], [])
+
+
+class TestLeaseOnPostgres:
+    """
+    在真实 PostgreSQL 上运行认领与回收语句（两个消费者各自持有连接）
+    """
+
+    def test_two_consumers_run_task_exactly_once(self, pg_connect):
+        """
+        测试：两个消费者同时认领只有一个成功；租约过期后另一个消费者回收，
+        发布失败时租约保留并在下一轮重新入队，回收期间第二个回收者跳过被锁定的租约，重新入队后只能认领一次
+        """
+        setup = pg_connect()
+        with setup.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE tasks (
+                    task_id varchar(64) PRIMARY KEY,
+                    status text NOT NULL,
+                    started_at timestamptz,
+                    finished_at timestamptz,
+                    log_summary text
+                );
+                INSERT INTO tasks (task_id, status) VALUES ('t1', 'WAIT');
+                """)
+        setup.commit()
+        ensure_lease_tables(setup)
+        consumers = {"a": pg_connect(), "b": pg_connect()}
+        payload = {"task_id": "t1"}
+
+        barrier = threading.Barrier(2)
+        claims = {}
+
+        def claim(name):
+            barrier.wait()
+            claims[name] = claim_task(
+                consumers[name], "t1", f"host:1:{name}", "analyse", payload, 60
+            )
+
+        threads = [threading.Thread(target=claim, args=(n,)) for n in consumers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        winner = next(name for name, attempts in claims.items() if attempts)
+        other = "b" if winner == "a" else "a"
+        assert sorted(claims.values(), key=str) == [1, None]
+
+        # 持有者失联：租约过期
+        with setup.cursor() as cur:
+            cur.execute(
+                "UPDATE task_leases SET lease_expires_at = NOW() - interval '1 second'"
+            )
+        setup.commit()
+
+        def fail(item):
+            raise ConnectionError("broker down")
+
+        assert reap_expired_leases(consumers[other], 3, fail) == ([], [])
+        with setup.cursor() as cur:
+            cur.execute("SELECT status FROM tasks")
+            assert cur.fetchone()[0] == "RUNNING"
+            cur.execute("SELECT worker_id FROM task_leases")
+            assert cur.fetchone()[0] == f"host:1:{winner}"
+        setup.commit()
+
+        published = []
+
+        def publish(item):
+            # 回收事务提交前，第二个回收者跳过被锁定的租约
+            assert reap_expired_leases(consumers[winner], 3, fail) == ([], [])
+            published.append(item["task_id"])
+
+        requeue, failed = reap_expired_leases(consumers[other], 3, publish)
+        assert [item["task_id"] for item in requeue] == published == ["t1"]
+        assert failed == []
+
+        assert (
+            claim_task(consumers[other], "t1", "host:1:c", "analyse", payload, 60) == 2
+        )
+        assert (
+            claim_task(consumers[winner], "t1", "host:1:d", "analyse", payload, 60)
+            is None
+        )
+        assert reap_expired_leases(consumers[winner], 3, fail) == ([], [])
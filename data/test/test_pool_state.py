@@ -0,0 +1,284 @@
+"""
+pool_state.py 的单元测试（使用本地 JSON 夹具与合成池子）
+"""
+
+import datetime
+import json
+import os
+import sys
+from decimal import Decimal, getcontext
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain import pool_state
+from block_chain.analyse import DEFAULT_STRATEGY, analyze_opportunities
+from block_chain.analyze_risk import (
+    calculate_risk_metrics_batch,
+    calculate_risk_metrics_local,
+)
+from block_chain.pool_state import (
+    MAX_SQRT_RATIO,
+    MAX_TICK,
+    MIN_SQRT_RATIO,
+    MIN_TICK,
+    PoolState,
+    build_pool_state,
+    get_sqrt_ratio_at_tick,
+    ingest,
+    load_fixture,
+    swap_exact_input,
+    synthetic_pool_data,
+)
+
+getcontext().prec = 80
+
+START_TS = 1756684800
+# 现价附近的 tick（约 3000 USDT/ETH），tick 间距 10
+TICK = -195240
+L1, L2 = 2 * 10**17, 5 * 10**16
+
+
+def _fixture():
+    """两个流动性区间：[TICK-100, TICK+100) 的 L1 与 [TICK-20, TICK+20) 的 L2"""
+    pool = {
+        "feeTier": "500",
+        "sqrtPrice": str(get_sqrt_ratio_at_tick(TICK) + 12345),
+        "tick": str(TICK),
+        "liquidity": str(L1 + L2),
+        "token0": {"decimals": "18"},
+        "token1": {"decimals": "6"},
+        "timestamp": START_TS,
+        "block": 100,
+    }
+    ticks = [
+        {"tickIdx": str(TICK - 100), "liquidityNet": str(L1)},
+        {"tickIdx": str(TICK - 20), "liquidityNet": str(L2)},
+        {"tickIdx": str(TICK + 20), "liquidityNet": str(-L2)},
+        {"tickIdx": str(TICK + 100), "liquidityNet": str(-L1)},
+    ]
+
+    def event(kind, block, log_index, **fields):
+        return {
+            "type": kind,
+            "timestamp": str(START_TS + 12 * (block - 100)),
+            "blockNumber": str(block),
+            "logIndex": str(log_index),
+            **{k: str(v) for k, v in fields.items()},
+        }
+
+    events = [
+        # 同一区块的两次 Swap 只保留最后的状态
+        event(
+            "swap",
+            101,
+            2,
+            sqrtPriceX96=get_sqrt_ratio_at_tick(TICK + 30),
+            tick=TICK + 30,
+        ),
+        event(
+            "swap", 101, 1, sqrtPriceX96=get_sqrt_ratio_at_tick(TICK + 5), tick=TICK + 5
+        ),
+        event("mint", 102, 0, tickLower=TICK + 20, tickUpper=TICK + 60, amount=L2),
+        event("swap", 103, 0, sqrtPriceX96=get_sqrt_ratio_at_tick(TICK) + 7, tick=TICK),
+        event("burn", 104, 3, tickLower=TICK - 20, tickUpper=TICK + 20, amount=L2),
+    ]
+    return {"pool": pool, "ticks": ticks, "events": events}
+
+
+def _decimal_swap(sqrt_price, liquidity_by_segment, amount_in, fee_pips, down):
+    """
+    逐段的高精度参考实现（不取整）：liquidity_by_segment 为 [(下一边界的 sqrtPriceX96, 该段流动性)]
+    """
+    q96 = Decimal(2**96)
+    x = Decimal(amount_in) * (1_000_000 - fee_pips) / 1_000_000
+    r = Decimal(sqrt_price) / q96
+    out = Decimal(0)
+    for boundary, liquidity in liquidity_by_segment:
+        b, L = Decimal(boundary) / q96, Decimal(liquidity)
+        need = L * (1 / b - 1 / r) if down else L * (b - r)
+        if x <= need:
+            end = L * r / (L + x * r) if down else r + x / L
+            return out + (L * (r - end) if down else L * (1 / r - 1 / end))
+        out += L * (r - b) if down else L * (1 / r - 1 / b)
+        x -= need
+        r = b
+    raise AssertionError("流动性不足")
+
+
+class TestSwapMath:
+    """
+    测试整数兑换模拟
+    """
+
+    def test_sqrt_ratio_at_tick(self):
+        """
+        测试：边界值与合约常量一致，各二进制位的系数与高精度计算一致
+        """
+        assert get_sqrt_ratio_at_tick(MIN_TICK) == MIN_SQRT_RATIO
+        assert get_sqrt_ratio_at_tick(MAX_TICK) == MAX_SQRT_RATIO
+        assert get_sqrt_ratio_at_tick(0) == 2**96
+        for bit in range(19):
+            for tick in (1 << bit, -(1 << bit)):
+                expected = (Decimal("1.0001") ** tick).sqrt() * 2**96
+                got = Decimal(get_sqrt_ratio_at_tick(tick))
+                assert abs(got - expected) <= max(1, expected * Decimal("1e-30"))
+
+    @pytest.mark.parametrize("down", [True, False])
+    def test_swap_crosses_ticks(self, down):
+        """
+        测试：跨越已初始化 tick 时按 liquidityNet 更新流动性，输出与逐段高精度计算只差取整
+        """
+        data = _fixture()
+        net = {int(t["tickIdx"]): int(t["liquidityNet"]) for t in data["ticks"]}
+        sqrt_price = int(data["pool"]["sqrtPrice"])
+        sign = -1 if down else 1
+        inner, outer = TICK + sign * 20, TICK + sign * 100
+        segments = [
+            (get_sqrt_ratio_at_tick(inner), L1 + L2),
+            (get_sqrt_ratio_at_tick(outer), L1),
+        ]
+        # 输入足以穿过 inner，但停在 outer 之前
+        amount_in = 3 * 10**18 if down else 8_000 * 10**6
+
+        used, amount_out = swap_exact_input(
+            sqrt_price, TICK, L1 + L2, sorted(net), net, 10, 500, amount_in, down
+        )
+
+        expected = _decimal_swap(sqrt_price, segments, amount_in, 500, down)
+        assert used == amount_in
+        assert abs(Decimal(amount_out) - expected) <= 3
+        single = _decimal_swap(
+            sqrt_price, [(segments[1][0], L1 + L2)], amount_in, 500, down
+        )
+        assert amount_out < single
+
+    def test_exhausted_liquidity_stops_at_limit(self):
+        """
+        测试：流动性耗尽时只消耗部分输入
+        """
+        net = {TICK - 10: 10**15, TICK + 10: -(10**15)}
+        used, amount_out = swap_exact_input(
+            get_sqrt_ratio_at_tick(TICK),
+            TICK,
+            10**15,
+            sorted(net),
+            net,
+            10,
+            500,
+            10**21,
+            True,
+        )
+
+        assert 0 < used < 10**21
+        assert amount_out > 0
+
+
+class TestPoolState:
+    """
+    测试快照构建、持久化与批量滑点
+    """
+
+    def test_build_from_fixture(self, tmp_path, monkeypatch):
+        """
+        测试：每个区块一条快照（区块内最后的状态），Mint / Burn 产生新的 tick 表版本并更新活跃流动性，保存后可原样加载
+        """
+        monkeypatch.setattr(pool_state, "TICK_CHECKPOINT_EVERY", 2)
+        fixture = tmp_path / "fixture.json"
+        fixture.write_text(json.dumps(_fixture()))
+
+        state = ingest(load_fixture(str(fixture)), str(tmp_path / "pool.npz"))
+
+        assert state.arrays["block"].tolist() == [100, 101, 102, 103, 104]
+        assert state.arrays["tick"].tolist()[1] == TICK + 30
+        assert [state.snapshot(i)[2] for i in range(5)] == [
+            L1 + L2,
+            L1,
+            L1 + L2,
+            L1 + L2,
+            L1,
+        ]
+        assert state.arrays["layout"].tolist() == [0, 0, 1, 1, 2]
+        ticks, net = state.tick_table(2)
+        assert ticks == [TICK - 100, TICK + 20, TICK + 60, TICK + 100]
+        assert net[TICK + 20] == L2
+
+        loaded = PoolState.load(str(tmp_path / "pool.npz"))
+        for i in range(len(state)):
+            assert loaded.snapshot(i) == state.snapshot(i)
+        assert loaded.tick_table(2) == state.tick_table(2)
+        # 时间在第一个快照之前为 -1，同一时刻取该区块的快照
+        assert loaded.index_at(
+            [(START_TS - 1) * 10**9, START_TS * 10**9, (START_TS + 13) * 10**9]
+        ).tolist() == [-1, 0, 1]
+
+    def test_batch_matches_exact_simulation(self):
+        """
+        测试：向量化的逐段穿越与逐个精确模拟一致（包括跨越多个 tick 与流动性耗尽的情况）
+        """
+        state = build_pool_state(*synthetic_pool_data(blocks=500, seed=3).values())
+        rng = np.random.default_rng(4)
+        n = 600
+        times = np.sort(rng.integers(state.time[0], state.time[-1], n))
+        down = rng.random(n) < 0.5
+        amounts = np.floor(np.where(down, 0.3e18, 1000e6) * rng.lognormal(0, 2.5, n))
+        amounts[:3] = [1e30, 1e30, 0]
+        down[:2] = [True, False]
+
+        got = state.slippage_batch(times, down, amounts)
+
+        expected = [
+            state.slippage(int(t), bool(d), int(a))
+            for t, d, a in zip(times, down, amounts)
+        ]
+        # 精确模拟逐步向下取整，差别小于风险指标保留的精度（滑点百分比 4 位小数）
+        np.testing.assert_allclose(got, expected, rtol=1e-6, atol=5e-7, equal_nan=True)
+        assert np.isnan(got[2])
+        assert got[0] > 0.5 and got[1] > 0.5
+        assert np.all((got[3:] > 0) & (got[3:] < 1))
+        # 时间在第一个快照之前没有结果
+        assert np.isnan(state.slippage_batch([state.time[0] - 1], [True], [1e18])[0])
+
+
+def test_analyze_opportunities_uses_depth_slippage(monkeypatch):
+    """
+    测试：slippage_model=v3 时风险指标使用池子模拟的滑点，没有快照的机会回退到平方根法则
+    """
+    state = build_pool_state(*_fixture().values())
+    monkeypatch.setattr(pool_state, "load_pool_state", lambda path=None: state)
+    strategy = {**DEFAULT_STRATEGY, "slippage_model": "v3"}
+    block_time = pd.Timestamp(START_TS + 60, unit="s", tz="UTC")
+    pairs = [
+        # 没有快照（第一个快照之前）
+        (block_time - datetime.timedelta(hours=1), 3100.0, 1e9, 50.0, 3000.0),
+        (block_time, 3100.0, 1e9, 50.0, 3000.0),
+        (block_time, 2900.0, 1e9, 50.0, 3000.0),
+    ]
+
+    opportunities = analyze_opportunities(pairs, strategy)
+
+    assert len(opportunities) == 3
+    expected = state.opportunity_slippage(opportunities, strategy)
+    assert np.isnan(expected[0]) and not np.isnan(expected[1:]).any()
+    sqrt_law = calculate_risk_metrics_batch(
+        [o["buy_price"] for o in opportunities],
+        [o["profit_usdt"] for o in opportunities],
+        [0.0] * 3,
+        [50.0] * 3,
+        1000.0,
+    )
+    slippage = [o["risk_metrics"]["estimated_slippage_pct"] for o in opportunities]
+    assert slippage[0] == sqrt_law["estimated_slippage_pct"][0]
+    assert slippage[1:] == [round(float(v) * 100, 4) for v in expected[1:]]
+    # 逐条计算传入相同的滑点得到相同的指标
+    assert opportunities[2]["risk_metrics"] == calculate_risk_metrics_local(
+        opportunities[2], 0.0, 50.0, 1000.0, float(expected[2])
+    )
@@ -212,18 +212,16 @@ class TestProcessPricesModule:
         mock_conn.cursor.return_value.__exit__ = lambda *args: None
 
         # 模拟保存逻辑
-        with patch("block_chain.process_prices.execute_values") as mock_execute_values:
+        with patch("psycopg2.extras.execute_values") as mock_execute_values:
             try:
                 mock_cur.execute("DROP TABLE IF EXISTS aggregated_prices;")
-                mock_cur.execute(
-                    """
+                mock_cur.execute("""
                     CREATE TABLE aggregated_prices (
                         time_bucket timestamptz,
                         source text,
                         average_price numeric
                     );
-                    """
-                )
+                    """)
 
                 records = df_final[
                     ["time_bucket", "source", "average_price"]
@@ -394,51 +392,6 @@ class TestProcessPricesModule:
         assert True  # 如果没有抛出异常，测试通过
 
 
-class TestDaterange:
-    """
-    测试 _daterange 函数
-    """
-
-    def test_daterange_single_day(self):
-        """
-        测试：单天范围
-        """
-        from block_chain.process_prices import _daterange
-
-        start = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
-        end = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
-
-        days = list(_daterange(start, end))
-        assert len(days) == 1
-        assert days[0] == start
-
-    def test_daterange_multiple_days(self):
-        """
-        测试：多天范围
-        """
-        from block_chain.process_prices import _daterange
-
-        start = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
-        end = datetime.datetime(2025, 9, 3, tzinfo=datetime.timezone.utc)
-
-        days = list(_daterange(start, end))
-        assert len(days) == 3
-        assert days[0] == start
-        assert days[-1] == end
-
-    def test_daterange_week(self):
-        """
-        测试：一周范围
-        """
-        from block_chain.process_prices import _daterange
-
-        start = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
-        end = datetime.datetime(2025, 9, 7, tzinfo=datetime.timezone.utc)
-
-        days = list(_daterange(start, end))
-        assert len(days) == 7
-
-
 class TestParseDate:
     """
     测试 _parse_date 函数
@@ -497,11 +450,11 @@ class TestWriteAggregatedPrices:
     测试 _write_aggregated_prices 函数
     """
 
-    def test_write_aggregated_prices_overwrite(self):
+    def test_write_aggregated_prices_upsert(self):
         """
-        测试：覆盖模式写入
+        测试：COPY 到暂存表后 INSERT ... ON CONFLICT 写入，不删除表
         """
-        from block_chain.process_prices import _write_aggregated_prices
+        from block_chain.process_prices import STAGING_TABLE, _write_aggregated_prices
 
         mock_conn = MagicMock()
         mock_cur = MagicMock()
@@ -521,56 +474,122 @@ class TestWriteAggregatedPrices:
             columns=["time_bucket", "source", "average_price"],
         )
 
-        with patch("block_chain.process_prices.execute_values") as mock_execute_values:
-            _write_aggregated_prices(mock_conn, df, overwrite=True)
+        written = _write_aggregated_prices(mock_conn, df, interval_label="5m")
 
-            # 验证DROP TABLE被调用
-            assert mock_cur.execute.call_count >= 2
-            # 验证CREATE TABLE被调用
-            assert "CREATE TABLE" in str(mock_cur.execute.call_args_list)
-            # 验证execute_values被调用
-            assert mock_execute_values.called
-            # 验证commit被调用
-            assert mock_conn.commit.called
+        assert written == 1
+        copy_sql, buffer = mock_cur.copy_expert.call_args[0]
+        assert f"COPY {STAGING_TABLE}" in copy_sql
+        assert "Uniswap,3000.0" in buffer.getvalue()
+        statements = [str(c[0][0]) for c in mock_cur.execute.call_args_list]
+        assert not any("DROP" in sql for sql in statements)
+        upsert_sql, params = mock_cur.execute.call_args[0]
+        assert "ON CONFLICT (bucket_interval, time_bucket, source)" in upsert_sql
+        assert params == ("5m",)
+        assert mock_conn.commit.called
 
-    def test_write_aggregated_prices_append(self):
+    def test_write_aggregated_prices_without_commit(self):
         """
-        测试：追加模式写入
+        测试：commit=False 时由调用方控制事务
         """
         from block_chain.process_prices import _write_aggregated_prices
 
         mock_conn = MagicMock()
-        mock_cur = MagicMock()
-        mock_conn.cursor.return_value.__enter__ = lambda x: mock_cur
-        mock_conn.cursor.return_value.__exit__ = lambda *args: None
-
         df = pd.DataFrame(
-            [
-                (
-                    datetime.datetime(
-                        2025, 9, 1, 10, 0, 0, tzinfo=datetime.timezone.utc
-                    ),
-                    "Uniswap",
-                    3000.0,
-                ),
-            ],
+            [(datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc), "A", 1.0)],
             columns=["time_bucket", "source", "average_price"],
         )
 
-        with patch("block_chain.process_prices.execute_values") as mock_execute_values:
-            _write_aggregated_prices(mock_conn, df, overwrite=False)
+        _write_aggregated_prices(mock_conn, df, commit=False)
+
+        mock_conn.commit.assert_not_called()
+
+    def test_interval_label(self):
+        """
+        测试：粒度秒数映射为 bucket_interval 标签
+        """
+        from block_chain.process_prices import _interval_label
+
+        assert _interval_label(60) == "1m"
+        assert _interval_label(3600) == "1h"
+        assert _interval_label(90) == "90s"
+
+    def test_clear_range_scoped(self, mock_db_connection):
+        """
+        测试：覆盖只删除本次粒度与时间范围内的数据
+        """
+        from block_chain.process_prices import _clear_range
+
+        _, cursor = mock_db_connection
+        start = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(2025, 9, 8, tzinfo=datetime.timezone.utc)
+
+        _clear_range(cursor, "1h", start, end)
 
-            # 验证DROP TABLE没有被调用
-            drop_calls = [
-                str(call)
-                for call in mock_cur.execute.call_args_list
-                if "DROP" in str(call)
+        sql, params = cursor.execute.call_args[0]
+        assert sql.strip().startswith("DELETE FROM aggregated_prices")
+        assert params == ("1h", start, end)
+
+    def test_ensure_table_migrates_old_schema(self, mock_db_connection):
+        """
+        测试：旧表缺少 bucket_interval 列时迁移主键
+        """
+        from block_chain.process_prices import ensure_aggregated_prices_table
+
+        conn, cursor = mock_db_connection
+        cursor.fetchone.return_value = None
+
+        ensure_aggregated_prices_table(conn)
+
+        assert "ADD PRIMARY KEY" in cursor.execute.call_args[0][0]
+        conn.commit.assert_called_once()
+
+    def test_migration_keeps_latest_duplicate(self, pg_connect):
+        """
+        测试（真实 PostgreSQL）：没有主键的旧表中重复追加的时间桶只保留最后写入的一行，迁移后可以正常 upsert
+        """
+        from block_chain.process_prices import (
+            _UPSERT_CONFLICT,
+            ensure_aggregated_prices_table,
+        )
+
+        conn = pg_connect()
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE aggregated_prices (
+                    time_bucket timestamptz,
+                    source text,
+                    average_price numeric
+                );
+                INSERT INTO aggregated_prices VALUES
+                    ('2025-09-01 10:00+00', 'Binance', 3000),
+                    ('2025-09-01 10:00+00', 'Uniswap', 3001),
+                    ('2025-09-01 10:00+00', 'Binance', 3002),
+                    ('2025-09-01 10:01+00', 'Binance', 3003),
+                    ('2025-09-01 10:00+00', 'Binance', 3004);
+                """)
+        conn.commit()
+
+        ensure_aggregated_prices_table(conn)
+
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT bucket_interval, to_char(time_bucket AT TIME ZONE 'UTC', 'HH24:MI'),
+                       source, average_price
+                FROM aggregated_prices ORDER BY 2, 3
+                """)
+            assert [(*row[:3], float(row[3])) for row in cur.fetchall()] == [
+                ("1m", "10:00", "Binance", 3004.0),
+                ("1m", "10:00", "Uniswap", 3001.0),
+                ("1m", "10:01", "Binance", 3003.0),
             ]
-            assert len(drop_calls) == 0
-            # 验证execute_values被调用
-            assert mock_execute_values.called
-            # 验证commit被调用
-            assert mock_conn.commit.called
+            cur.execute(
+                "INSERT INTO aggregated_prices VALUES ('2025-09-01 10:00+00', 'Binance', 1, '1m')"
+                + _UPSERT_CONFLICT
+            )
+            assert cur.rowcount == 1
+        conn.commit()
+        # 再次调用不会重复迁移
+        ensure_aggregated_prices_table(conn)
 
 
 class TestRunProcessPrices:
@@ -827,3 +846,472 @@ class TestRunProcessPrices:
         if call_args:
             params = call_args[0][1]
             assert params[0] == 3600  # 1小时 = 3600秒
+
+
+class TestDayChunks:
+    """
+    测试 _day_chunks 函数
+    """
+
+    def test_chunks_cover_whole_range(self):
+        """
+        测试：分片首尾相接，覆盖开始日零点到结束日次日零点
+        """
+        from block_chain.process_prices import _day_chunks
+
+        start = datetime.datetime(2025, 9, 1, 12, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(2025, 9, 10, tzinfo=datetime.timezone.utc)
+
+        chunks = _day_chunks(start, end, chunk_days=4)
+
+        assert chunks[0][0] == datetime.datetime(
+            2025, 9, 1, tzinfo=datetime.timezone.utc
+        )
+        assert chunks[-1][1] == datetime.datetime(
+            2025, 9, 11, tzinfo=datetime.timezone.utc
+        )
+        assert [c[1] - c[0] for c in chunks] == [
+            datetime.timedelta(days=4),
+            datetime.timedelta(days=4),
+            datetime.timedelta(days=2),
+        ]
+        assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+
+    def test_single_day(self):
+        """
+        测试：单日范围只有一个分片
+        """
+        from block_chain.process_prices import _day_chunks
+
+        day = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+
+        assert _day_chunks(day, day, chunk_days=7) == [
+            (day, day + datetime.timedelta(days=1))
+        ]
+
+
+class TestChunkedAggregation:
+    """
+    测试分片并行聚合
+    """
+
+    @patch("block_chain.process_prices.psycopg2.connect")
+    @patch("block_chain.process_prices.check_task", return_value=False)
+    @patch("block_chain.process_prices.update_task_status")
+    def test_chunks_streamed_in_one_transaction(
+        self, mock_update_status, mock_check_task, mock_connect
+    ):
+        """
+        测试：每个分片一条查询，结果按顺序写入同一事务，只在第一次写入时重建表
+        """
+        from block_chain.process_prices import run_process_prices
+
+        mock_conn = MagicMock()
+        mock_cur = MagicMock()
+        mock_connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__ = lambda x: mock_cur
+        mock_conn.cursor.return_value.__exit__ = lambda *args: None
+        mock_cur.fetchall.return_value = [
+            (
+                datetime.datetime(2025, 9, 1, 10, 0, 0, tzinfo=datetime.timezone.utc),
+                "Uniswap",
+                3000.0,
+            ),
+        ]
+
+        with patch(
+            "block_chain.process_prices._write_aggregated_prices", return_value=1
+        ) as mock_write:
+            run_process_prices(
+                task_id="test_task",
+                overwrite=True,
+                start_date="2025-09-01",
+                end_date="2025-09-10",
+                chunk_days=4,
+                parallel_connections=2,
+                use_bars=False,
+                explain_check=False,
+            )
+
+        # 3 个分片 -> 3 条聚合查询
+        statements = [str(c[0][0]) for c in mock_cur.execute.call_args_list]
+        assert sum("UNION ALL" in sql for sql in statements) == 3
+        # 覆盖只删除请求范围，不删除表
+        assert sum(sql.strip().startswith("DELETE") for sql in statements) == 1
+        assert not any("DROP" in sql for sql in statements)
+        assert mock_write.call_count == 3
+        assert all(c.kwargs["commit"] is False for c in mock_write.call_args_list)
+        assert all(
+            c.kwargs["interval_label"] == "1m" for c in mock_write.call_args_list
+        )
+        # 1 个写入连接 + 2 个查询连接
+        assert mock_connect.call_count == 3
+        mock_update_status.assert_called_with("test_task", 1)
+
+    @patch("block_chain.process_prices.psycopg2.connect")
+    @patch("block_chain.process_prices.update_task_status")
+    def test_cancel_between_chunks_rolls_back(self, mock_update_status, mock_connect):
+        """
+        测试：分片之间检测到取消时回滚已写入的数据，不标记成功
+        """
+        from block_chain.process_prices import run_process_prices
+
+        mock_conn = MagicMock()
+        mock_cur = MagicMock()
+        mock_connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__ = lambda x: mock_cur
+        mock_conn.cursor.return_value.__exit__ = lambda *args: None
+        mock_cur.fetchall.return_value = [
+            (
+                datetime.datetime(2025, 9, 1, 10, 0, 0, tzinfo=datetime.timezone.utc),
+                "Uniswap",
+                3000.0,
+            ),
+        ]
+
+        with patch(
+            "block_chain.process_prices.check_task", side_effect=[False, True]
+        ), patch(
+            "block_chain.process_prices._write_aggregated_prices", return_value=1
+        ) as mock_write:
+            run_process_prices(
+                task_id="test_task",
+                start_date="2025-09-01",
+                end_date="2025-09-10",
+                chunk_days=4,
+                parallel_connections=1,
+                use_bars=False,
+            )
+
+        assert mock_write.call_count == 1
+        assert mock_conn.rollback.called
+        # 只有建表检查提交过，聚合结果没有提交
+        assert mock_conn.commit.call_count == 1
+        mock_update_status.assert_not_called()
+        assert mock_conn.close.called
+
+
+class TestServerSideAggregation:
+    """
+    测试数据库内聚合写入（write_mode=server）
+    """
+
+    @patch("block_chain.process_prices.check_task", return_value=False)
+    def test_overwrite_clears_range_then_upserts(
+        self, mock_check_task, mock_db_connection
+    ):
+        """
+        测试：覆盖模式只删除请求范围，逐分片 INSERT ... SELECT ... ON CONFLICT，返回写入行数
+        """
+        from block_chain.process_prices import _aggregate_server_side
+
+        conn, cursor = mock_db_connection
+        cursor.rowcount = 5
+        chunks = [
+            (
+                datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc),
+                datetime.datetime(2025, 9, 8, tzinfo=datetime.timezone.utc),
+            ),
+            (
+                datetime.datetime(2025, 9, 8, tzinfo=datetime.timezone.utc),
+                datetime.datetime(2025, 9, 10, tzinfo=datetime.timezone.utc),
+            ),
+        ]
+
+        rows = _aggregate_server_side(conn, "t1", chunks, 3600, overwrite=True)
+
+        assert rows == 10
+        calls = cursor.execute.call_args_list
+        delete_sql, delete_params = calls[0][0]
+        assert delete_sql.strip().startswith("DELETE FROM aggregated_prices")
+        assert delete_params == ("1h", chunks[0][0], chunks[-1][1])
+        inserts = [c[0] for c in calls if c[0][0].startswith("INSERT INTO")]
+        assert len(inserts) == 2
+        assert all("ON CONFLICT" in sql for sql, _ in inserts)
+        assert all("UNION ALL" in sql for sql, _ in inserts)
+        assert inserts[0][1][0] == "1h"
+        assert not any("DROP" in c[0][0] for c in calls)
+        conn.commit.assert_not_called()
+
+    @patch("block_chain.process_prices.check_task", return_value=False)
+    def test_append_inserts_into_target(self, mock_check_task, mock_db_connection):
+        """
+        测试：追加模式直接 INSERT 到正式表，不删除表
+        """
+        from block_chain.process_prices import _aggregate_server_side
+
+        conn, cursor = mock_db_connection
+        cursor.rowcount = 3
+        day = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+
+        rows = _aggregate_server_side(
+            conn, "t1", [(day, day + datetime.timedelta(days=1))], 60, overwrite=False
+        )
+
+        assert rows == 3
+        statements = [c[0][0] for c in cursor.execute.call_args_list]
+        assert not any("DROP" in s for s in statements)
+        assert any(s.startswith("INSERT INTO aggregated_prices") for s in statements)
+
+    @patch("block_chain.process_prices.psycopg2.connect")
+    @patch("block_chain.process_prices.check_task", return_value=True)
+    @patch("block_chain.process_prices.update_task_status")
+    def test_cancelled_rolls_back(
+        self, mock_update_status, mock_check_task, mock_connect, mock_db_connection
+    ):
+        """
+        测试：任务被取消时回滚，不标记成功
+        """
+        from block_chain.process_prices import run_process_prices
+
+        conn, cursor = mock_db_connection
+        mock_connect.return_value = conn
+
+        run_process_prices(
+            task_id="t1",
+            start_date="2025-09-01",
+            end_date="2025-09-01",
+            write_mode="server",
+            use_bars=False,
+        )
+
+        assert conn.rollback.called
+        # 只有建表检查提交过，聚合结果没有提交
+        assert conn.commit.call_count == 1
+        mock_update_status.assert_not_called()
+        assert conn.close.called
+
+
+class TestBarsAggregation:
+    """
+    测试已物化 K 线的分片直接由 ohlcv_bars 汇总
+    """
+
+    def test_covered_chunk_uses_bars(self, mock_db_connection):
+        """
+        测试：分片已物化时使用 K 线汇总语句
+        """
+        from block_chain.process_prices import _chunk_query
+        from block_chain.rollup import bars_average_query
+
+        _, cursor = mock_db_connection
+        cursor.fetchone.return_value = (2,)
+        day = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+
+        sql, params = _chunk_query(
+            cursor, 300, day, day + datetime.timedelta(days=1), use_bars=True
+        )
+
+        assert sql == bars_average_query
+        assert params == (300, day, day + datetime.timedelta(days=1))
+
+    def test_uncovered_chunk_scans_raw(self, mock_db_connection):
+        """
+        测试：分片未完整物化时扫描原始成交
+        """
+        from block_chain.process_prices import _chunk_query, sql_query
+
+        _, cursor = mock_db_connection
+        cursor.fetchone.return_value = (1,)
+        day = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+
+        sql, _ = _chunk_query(
+            cursor, 300, day, day + datetime.timedelta(days=1), use_bars=True
+        )
+
+        assert sql == sql_query
+
+
+class TestIndexFriendlyQuery:
+    """
+    测试 date_bin 分桶、聚合索引与执行计划自检
+    """
+
+    def test_filters_on_raw_columns(self):
+        """
+        测试：分桶使用 date_bin，过滤条件不对时间列套函数
+        """
+        from block_chain.process_prices import _chunk_params, sql_query
+
+        assert "date_bin" in sql_query
+        assert "floor(" not in sql_query
+        assert "block_time >= %s AND block_time < %s" in sql_query
+        assert "trade_time >= %s AND trade_time < %s" in sql_query
+        assert sql_query.count("%s") == len(_chunk_params(60, 1, 2)) == 6
+
+    def test_bench_fixture_has_query_columns(self):
+        """
+        测试：基准夹具表包含聚合语句用到的全部列（含按默认交易对过滤的 symbol 列）
+        """
+        import re
+
+        from block_chain.process_prices import _BENCH_FIXTURE_SQL, sql_query
+        from block_chain.symbols import DEFAULT_SYMBOL
+
+        tables = dict(
+            re.findall(
+                r"CREATE TABLE \w+\.(\w+) AS\s+SELECT (.*?)\s+FROM generate_series",
+                _BENCH_FIXTURE_SQL,
+                re.S,
+            )
+        )
+        assert set(tables) == {"binance_trades", "uniswap_swaps"}
+        assert "symbol" in sql_query
+        for table, time_column in (
+            ("binance_trades", "trade_time"),
+            ("uniswap_swaps", "block_time"),
+        ):
+            columns = set(re.findall(r"AS (\w+)", tables[table]))
+            assert {"id", time_column, "price", "symbol"} <= columns
+            assert f"'{DEFAULT_SYMBOL}'::text AS symbol" in tables[table]
+
+    def test_bench_queries_share_where_clause(self):
+        """
+        测试：基准中旧写法与 date_bin 写法的过滤条件完全相同，只比较分桶方式与索引
+        """
+        import re
+
+        from block_chain.process_prices import _LEGACY_SQL_QUERY, sql_query
+
+        def where_clauses(query):
+            return re.findall(r"WHERE\s+(.*?)\s+GROUP BY", query, re.S)
+
+        assert len(where_clauses(sql_query)) == 2
+        assert where_clauses(_LEGACY_SQL_QUERY) == where_clauses(sql_query)
+
+    def test_ensure_indexes_creates_missing_concurrently(self, mock_db_connection):
+        """
+        测试：只创建缺失的索引，且在自动提交模式下 CONCURRENTLY 创建，结束后恢复原模式
+        """
+        from block_chain.process_prices import ensure_aggregation_indexes
+
+        conn, cursor = mock_db_connection
+        conn.autocommit = False
+        cursor.fetchall.return_value = [("binance_trades_trade_time_brin",)]
+        autocommit_seen = []
+        cursor.execute.side_effect = lambda *a, **k: autocommit_seen.append(
+            conn.autocommit
+        )
+
+        created = ensure_aggregation_indexes(conn, "brin")
+
+        assert created == ["uniswap_swaps_block_time_brin"]
+        create_sql = cursor.execute.call_args_list[-1][0][0]
+        assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS" in create_sql
+        assert "USING brin (block_time)" in create_sql
+        assert autocommit_seen[-1] is True
+        assert conn.autocommit is False
+
+    def test_ensure_indexes_none_mode(self, mock_db_connection):
+        """
+        测试：index_mode=none 时不创建索引
+        """
+        from block_chain.process_prices import ensure_aggregation_indexes
+
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = []
+
+        assert ensure_aggregation_indexes(conn, "none") == []
+        assert not any(
+            "CREATE INDEX" in str(c[0][0]) for c in cursor.execute.call_args_list
+        )
+
+    def test_explain_reports_seq_scan(self, mock_db_connection):
+        """
+        测试：执行计划中原始成交表的全表扫描被识别出来
+        """
+        from block_chain.process_prices import explain_chunk, sql_query
+
+        _, cursor = mock_db_connection
+        plan = {
+            "Node Type": "Append",
+            "Total Cost": 123.4,
+            "Plans": [
+                {
+                    "Node Type": "HashAggregate",
+                    "Plans": [
+                        {
+                            "Node Type": "Bitmap Heap Scan",
+                            "Relation Name": "uniswap_swaps",
+                            "Plans": [{"Node Type": "Bitmap Index Scan"}],
+                        }
+                    ],
+                },
+                {"Node Type": "Seq Scan", "Relation Name": "binance_trades"},
+            ],
+        }
+        cursor.fetchone.return_value = ([{"Plan": plan}],)
+
+        report = explain_chunk(cursor, sql_query, (60, 1, 2, 60, 1, 2))
+
+        assert cursor.execute.call_args[0][0].startswith("EXPLAIN (FORMAT JSON)")
+        assert report["seq_scans"] == ["binance_trades"]
+        assert report["scans"]["uniswap_swaps"] == ["Bitmap Heap Scan"]
+        assert report["total_cost"] == 123.4
+
+    def test_self_check_failure_is_not_fatal(self, mock_db_connection):
+        """
+        测试：执行计划自检失败只记录警告并回滚
+        """
+        from block_chain.process_prices import _self_check_plan
+
+        conn, cursor = mock_db_connection
+        cursor.execute.side_effect = Exception("permission denied")
+        day = datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+
+        assert _self_check_plan(conn, 60, day, day) is None
+        conn.rollback.assert_called()
+
+
+class TestColumnarBackend:
+    """
+    测试 analytics_backend=duckdb 时在本机 Parquet 镜像上聚合
+    """
+
+    @patch("block_chain.process_prices.columnar.ColumnarStore")
+    @patch("block_chain.process_prices.psycopg2.connect")
+    @patch("block_chain.process_prices.check_task", return_value=False)
+    @patch("block_chain.process_prices.update_task_status")
+    def test_chunks_aggregated_locally(
+        self, mock_update_status, mock_check_task, mock_connect, mock_store_cls
+    ):
+        """
+        测试：只使用一个写入连接，先同步镜像再逐分片本地聚合，server 模式被忽略
+        """
+        from block_chain.process_prices import run_process_prices
+
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        store = mock_store_cls.return_value
+        store.aggregate.return_value = [
+            (
+                datetime.datetime(2025, 9, 1, 10, 0, 0, tzinfo=datetime.timezone.utc),
+                "Binance",
+                3000.0,
+            ),
+        ]
+
+        with patch(
+            "block_chain.process_prices._write_aggregated_prices", return_value=1
+        ) as mock_write:
+            run_process_prices(
+                task_id="test_task",
+                overwrite=False,
+                start_date="2025-09-01",
+                end_date="2025-09-10",
+                chunk_days=4,
+                analytics_backend="duckdb",
+                write_mode="server",
+            )
+
+        assert mock_connect.call_count == 1
+        store.sync.assert_called_once()
+        sync_args = store.sync.call_args[0]
+        assert sync_args[1] == datetime.datetime(
+            2025, 9, 1, tzinfo=datetime.timezone.utc
+        )
+        assert sync_args[2].date() == datetime.date(2025, 9, 10)
+        assert store.aggregate.call_count == 3
+        assert mock_write.call_count == 3
+        store.close.assert_called_once()
+        mock_update_status.assert_called_once_with("test_task", 1)
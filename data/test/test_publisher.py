@@ -0,0 +1,185 @@
+"""
+publisher.py 的单元测试（使用进程内的假 RabbitMQ 连接）
+"""
+
+import os
+import sys
+import threading
+
+import pika.exceptions
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain.publisher import ConfirmedPublisher
+
+
+class FakeBroker:
+    """记录收到的消息，可以模拟连接失败、发布失败与消息被拒绝"""
+
+    def __init__(self, connect_failures=0, publish_failures=0, nack_keys=()):
+        self.lock = threading.Lock()
+        self.connect_failures = connect_failures
+        self.publish_failures = publish_failures
+        self.nack_keys = set(nack_keys)
+        self.connections = 0
+        self.received = []
+        self.confirm_enabled = []
+
+    def connect(self):
+        with self.lock:
+            if self.connect_failures > 0:
+                self.connect_failures -= 1
+                raise pika.exceptions.AMQPConnectionError("broker down")
+            self.connections += 1
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_closed = False
+
+    def channel(self):
+        return FakeChannel(self.broker)
+
+    def close(self):
+        self.is_closed = True
+
+
+class FakeChannel:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def confirm_delivery(self):
+        self.broker.confirm_enabled.append(True)
+
+    def basic_publish(
+        self, exchange, routing_key, body, properties=None, mandatory=False
+    ):
+        with self.broker.lock:
+            if self.broker.publish_failures > 0:
+                self.broker.publish_failures -= 1
+                raise pika.exceptions.StreamLostError("connection lost")
+            if routing_key in self.broker.nack_keys:
+                raise pika.exceptions.NackError([])
+            self.broker.received.append((exchange, routing_key, body))
+
+
+def make_publisher(broker, **kwargs):
+    kwargs.setdefault("initial_backoff", 0.001)
+    kwargs.setdefault("max_backoff", 0.01)
+    kwargs.setdefault("report_interval", 0)
+    return ConfirmedPublisher(connection_factory=broker.connect, **kwargs)
+
+
+class TestConfirmedPublisher:
+    """
+    测试 ConfirmedPublisher 类
+    """
+
+    def test_publish_confirmed(self):
+        """
+        测试：消息在 confirm 模式下发布，Future 返回确认延迟
+        """
+        broker = FakeBroker()
+        setup_calls = []
+        publisher = make_publisher(broker, setup_channel=setup_calls.append)
+
+        future = publisher.publish("ex", "analyse", b"{}")
+        latency = future.result(timeout=5)
+        publisher.stop()
+
+        assert latency >= 0
+        assert broker.received == [("ex", "analyse", b"{}")]
+        assert broker.confirm_enabled
+        assert len(setup_calls) == broker.connections
+
+    def test_concurrent_publishers(self):
+        """
+        测试：多个线程并发发布，全部消息都被确认且不丢失
+        """
+        broker = FakeBroker()
+        publisher = make_publisher(broker, workers=3, batch_size=10)
+        results = []
+
+        def produce(offset):
+            futures = [
+                publisher.publish("ex", "bulk", str(offset + i).encode())
+                for i in range(100)
+            ]
+            results.extend(f.result(timeout=5) for f in futures)
+
+        threads = [threading.Thread(target=produce, args=(i * 100,)) for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        publisher.stop()
+
+        assert len(results) == 500
+        assert len({body for _, _, body in broker.received}) == 500
+        stats = publisher.stats()
+        assert stats["published"] == 500
+        assert stats["failed"] == 0
+        assert stats["throughput_per_sec"] > 0
+
+    def test_reconnect_with_backoff(self):
+        """
+        测试：Broker 暂时不可用时按退避重连，消息最终被发布
+        """
+        broker = FakeBroker(connect_failures=3)
+        publisher = make_publisher(broker, workers=1)
+
+        publisher.publish("ex", "analyse", b"x").result(timeout=5)
+        publisher.stop()
+
+        assert publisher.stats()["reconnects"] == 3
+        assert len(broker.received) == 1
+
+    def test_republish_after_connection_lost(self):
+        """
+        测试：发布过程中连接断开，重连后重新发布未确认的消息
+        """
+        broker = FakeBroker(publish_failures=1)
+        publisher = make_publisher(broker, workers=1)
+
+        publisher.publish("ex", "analyse", b"x").result(timeout=5)
+        publisher.stop()
+
+        assert broker.connections == 2
+        assert broker.received == [("ex", "analyse", b"x")]
+
+    def test_nack_reported_to_caller(self):
+        """
+        测试：消息被 Broker 拒绝时 Future 抛出异常，不会重试
+        """
+        broker = FakeBroker(nack_keys={"bad"})
+        publisher = make_publisher(broker, workers=1)
+
+        bad = publisher.publish("ex", "bad", b"x")
+        good = publisher.publish("ex", "good", b"y")
+
+        with pytest.raises(pika.exceptions.NackError):
+            bad.result(timeout=5)
+        good.result(timeout=5)
+        publisher.stop()
+
+        assert publisher.stats()["failed"] == 1
+        assert broker.received == [("ex", "good", b"y")]
+
+    def test_publish_after_stop_rejected(self):
+        """
+        测试：停止后不再接受新消息
+        """
+        publisher = make_publisher(FakeBroker())
+        publisher.start()
+        publisher.stop()
+
+        with pytest.raises(RuntimeError):
+            publisher.publish("ex", "analyse", b"x")
@@ -0,0 +1,284 @@
+"""
+replay.py 的单元测试（使用临时目录中的逐笔数组与 Parquet 镜像）
+"""
+
+import datetime
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain.analyse import (
+    DEFAULT_STRATEGY,
+    analyze_opportunities,
+    calculate_profit_buy_cex_sell_dex,
+)
+from block_chain.replay import (
+    CapitalLockStrategy,
+    ParquetReader,
+    PostgresReader,
+    ReplayEngine,
+    ReplayStrategy,
+    TickStoreReader,
+    replay,
+    write_synthetic_ticks,
+)
+from block_chain.streaming import BINANCE, UNISWAP, replay_events
+from block_chain.tickstore import TickStore
+
+START_NS = pd.Timestamp("2025-09-01", tz="UTC").value
+SECOND = 1_000_000_000
+STRATEGY = {**DEFAULT_STRATEGY, "profit_threshold": 1}
+
+
+class Collect(ReplayStrategy):
+    def __init__(self):
+        self.opportunities = []
+        self.times = []
+
+    def on_opportunity(self, engine, opp):
+        self.opportunities.append(opp)
+        self.times.append(engine.now)
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TickStore(root=str(tmp_path / "ticks"))
+    write_synthetic_ticks(s, hours=3)
+    return s
+
+
+class TestReplay:
+    """
+    测试分段回放
+    """
+
+    def test_matches_batch_analysis_across_chunks(self, store):
+        """
+        测试：分段读取的回放（分段边界任意）与整段批量分析的机会一致，机会在检测时刻按时间顺序交给策略
+        """
+        expected = analyze_opportunities(store.price_pairs(STRATEGY), STRATEGY)
+        handler = Collect()
+
+        result = replay(TickStoreReader(store), STRATEGY, handler, chunk_seconds=437)
+
+        assert expected
+        assert result["opportunities"] == len(expected)
+        assert [o["block_time"] for o in handler.opportunities] == [
+            o["block_time"] for o in expected
+        ]
+        assert [o["profit_usdt"] for o in handler.opportunities] == pytest.approx(
+            [o["profit_usdt"] for o in expected], rel=1e-9
+        )
+        assert handler.times == sorted(handler.times)
+        assert all(
+            now > opp["block_time"].value
+            for now, opp in zip(handler.times, handler.opportunities)
+        )
+        assert result["span_seconds"] > 3 * 3600 - 60
+        assert result["speedup"] > 1
+
+    def test_reads_bounded_by_chunk(self, tmp_path):
+        """
+        测试：回放按分段读取，每次读取不超过 chunk_seconds，读取次数随时长线性增长（内存峰值见 benchmark 的 peak_mb）
+        """
+        reads = {}
+        for hours in (2, 8):
+            s = TickStore(root=str(tmp_path / f"ticks_{hours}"))
+            write_synthetic_ticks(s, hours=hours)
+            reader = TickStoreReader(s)
+            windows = reads.setdefault(hours, [])
+            original = reader.read
+
+            def recording(source, lo, hi, original=original, windows=windows):
+                windows.append(hi - lo)
+                return original(source, lo, hi)
+
+            reader.read = recording
+            replay(
+                reader,
+                STRATEGY,
+                CapitalLockStrategy(10_000, 2, 600),
+                chunk_seconds=600,
+            )
+
+        assert all(0 < w <= 600 * SECOND for w in reads[2] + reads[8])
+        assert len(reads[8]) == pytest.approx(4 * len(reads[2]), abs=2)
+
+
+class TestCapitalLockStrategy:
+    """
+    测试资金占用与执行延迟
+    """
+
+    def _events(self):
+        t = START_NS
+        binance = [
+            (t - 4 * SECOND, 3000.0, 1.0),
+            (t + 3 * SECOND, 3000.0, 1.0),
+            # 执行延迟期间 Binance 价格上涨，缩小 CEX 买入的利润
+            (t + 9 * SECOND, 3040.0, 1.0),
+            (t + 16 * SECOND, 3000.0, 1.0),
+            (t + 20 * SECOND, 3000.0, 1.0),
+            (t + 30 * SECOND, 3000.0, 1.0),
+        ]
+        uniswap = [
+            (t, 3100.0, 1e9, -1.0),
+            (t + 12 * SECOND, 3100.0, 1e9, -1.0),
+        ]
+        return replay_events(binance, uniswap)
+
+    def test_execution_repriced_after_delay(self):
+        """
+        测试：成交按执行时刻之前一个窗口的 Binance 均价重新计算利润（不包含该时刻之后的成交）
+        """
+        handler = CapitalLockStrategy(
+            capital=2000, execution_delay_seconds=7, settlement_seconds=0
+        )
+        result = ReplayEngine(STRATEGY, handler).run(self._events())
+
+        assert result["opportunities"] == 2
+        assert result["trades"] == 2
+        # 第一笔在 T+3s 检测，T+10s 执行：窗口 [T+5s, T+10s] 内只有 3040 的成交；
+        # 第二笔在 T+16s 检测，T+23s 执行：窗口 [T+18s, T+23s] 内只有 3000 的成交
+        first = calculate_profit_buy_cex_sell_dex(STRATEGY, 3040.0, 3100.0, 1e9)
+        second = calculate_profit_buy_cex_sell_dex(STRATEGY, 3000.0, 3100.0, 1e9)
+        assert result["realized_pnl"] == pytest.approx(first + second, abs=1e-6)
+
+    def test_locked_capital_skips_opportunities(self):
+        """
+        测试：资金在结算前被占用，期间的机会因可用资金不足被放弃，结算后资金与利润回到可用余额
+        """
+        handler = CapitalLockStrategy(
+            capital=1000, execution_delay_seconds=0, settlement_seconds=60
+        )
+        result = ReplayEngine(STRATEGY, handler).run(self._events())
+
+        assert result["trades"] == 1
+        assert result["skipped_no_capital"] == 1
+        assert result["max_locked"] == 1000
+        assert handler.locked == 0
+        assert result["final_equity"] == pytest.approx(1000 + result["realized_pnl"])
+
+    def test_timers_fire_in_time_order(self):
+        """
+        测试：定时回调在 Binance 时钟越过其时间后按时间顺序触发，数据结束后剩余回调也会触发
+        """
+        fired = []
+
+        class Timers(ReplayStrategy):
+            def on_opportunity(self, engine, opp):
+                for seconds in (20, 1):
+                    engine.after(
+                        seconds, lambda s=seconds: fired.append((s, engine.now))
+                    )
+
+        engine = ReplayEngine(STRATEGY, Timers())
+        engine.run(self._events())
+
+        times = [now for _, now in fired]
+        assert times == sorted(times)
+        assert [s for s, _ in fired] == [1, 1, 20, 20]
+
+
+class TestReaders:
+    """
+    测试数据源读取
+    """
+
+    def test_postgres_reader_parses_copy(self, mock_db_connection):
+        """
+        测试：Postgres 分段读取按左闭右开的时间范围导出，微秒时间转为纳秒
+        """
+        conn, cur = mock_db_connection
+        cur.mogrify.side_effect = lambda sql, params: (sql % params).encode()
+        cur.copy_expert.side_effect = lambda sql, f: f.write(
+            "1756684800000000,3000.5,0.25\n1756684801500000,3001,1\n"
+        )
+
+        arrays = PostgresReader(conn).read("binance", START_NS, START_NS + 2 * SECOND)
+
+        sql, (lo, hi) = cur.mogrify.call_args[0]
+        assert "trade_time >= %s AND trade_time < %s" in sql
+        assert hi - lo == datetime.timedelta(seconds=2)
+        assert lo == datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+        assert arrays["time"].tolist() == [START_NS, START_NS + 1_500_000_000]
+        assert arrays["volume"].tolist() == [0.25, 1.0]
+
+        cur.copy_expert.side_effect = None
+        assert len(PostgresReader(conn).read("uniswap", 0, 1)["gas"]) == 0
+
+    def test_parquet_reader_matches_tickstore(self, tmp_path, store):
+        """
+        测试：Parquet 镜像与逐笔数组读取到相同的事件
+        """
+        duckdb = pytest.importorskip("duckdb")
+        from block_chain.columnar import ColumnarStore
+
+        day = datetime.date(2025, 9, 1)
+        with ColumnarStore(root=str(tmp_path / "parquet")) as columnar:
+            for source, table, time_column, extra in (
+                ("binance", "binance_trades", "trade_time", "volume AS qty"),
+                (
+                    "uniswap",
+                    "uniswap_swaps",
+                    "block_time",
+                    "-volume AS amount_eth, gas AS gas_price",
+                ),
+            ):
+                frame = pd.DataFrame(
+                    {k: v[:] for k, v in store.load_day(source, day).items()}
+                )
+                frame[time_column] = pd.to_datetime(frame["time"], unit="ns")
+                path = columnar.partition_path(table, day)
+                os.makedirs(os.path.dirname(path))
+                duckdb.sql(
+                    f"COPY (SELECT {time_column}, price, {extra} FROM frame)"
+                    f" TO '{path}' (FORMAT parquet)"
+                )
+
+            reader = ParquetReader(columnar)
+            lo, hi = START_NS + 1800 * SECOND, START_NS + 3600 * SECOND
+            for source in ("binance", "uniswap"):
+                got = reader.read(source, lo, hi)
+                want = TickStoreReader(store).read(source, lo, hi)
+                assert got["time"].tolist() == want["time"].tolist()
+                for field in want:
+                    assert got[field].tolist() == pytest.approx(want[field].tolist())
+            assert reader.bounds() == TickStoreReader(store).bounds()
+
+
+def test_merge_orders_binance_first_on_ties():
+    """
+    测试：同一时刻的 Binance 成交排在 Uniswap Swap 之前
+    """
+    from block_chain.replay import merge_chunk
+
+    events = merge_chunk(
+        {
+            "time": pd.array([5, 10], dtype="int64").to_numpy(),
+            "price": pd.array([1.0, 2.0]).to_numpy(),
+            "volume": pd.array([0.1, 0.2]).to_numpy(),
+        },
+        {
+            "time": pd.array([5], dtype="int64").to_numpy(),
+            "price": pd.array([3.0]).to_numpy(),
+            "volume": pd.array([1.5]).to_numpy(),
+            "gas": pd.array([1e9]).to_numpy(),
+        },
+    )
+
+    assert [(t, kind) for t, kind, *_ in events] == [
+        (5, BINANCE),
+        (5, UNISWAP),
+        (10, BINANCE),
+    ]
+    assert events[1][3:] == (1e9, 1.5)
@@ -0,0 +1,148 @@
+"""
+rolling_stats.py 的单元测试
+"""
+
+import datetime
+import os
+import sys
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain import rolling_stats
+from block_chain.rolling_stats import (
+    RollingMeanStd,
+    TimeWindowSum,
+    rolling_volatility,
+)
+
+T0 = datetime.datetime(2025, 9, 1, 10, 0, tzinfo=datetime.timezone.utc)
+
+
+def _brute_window_sums(times, values, window):
+    """SQL RANGE BETWEEN window PRECEDING AND CURRENT ROW 的逐行定义（包含同一时刻的对等行）"""
+    return [
+        sum(v for s, v in zip(times, values) if t - window <= s <= t) for t in times
+    ]
+
+
+class TestRollingMeanStd:
+    """
+    测试 RollingMeanStd 类
+    """
+
+    def test_matches_pandas_rolling(self, monkeypatch):
+        """
+        测试：滚动均值、标准差与波动率与 pandas rolling 一致（包含 NaN 与定期校正）
+        """
+        monkeypatch.setattr(rolling_stats, "_RESYNC_EVERY", 37)
+        rng = np.random.default_rng(3)
+        values = 3000 + np.cumsum(rng.normal(0, 5, 2000))
+        values[[15, 400, 401]] = np.nan
+        series = pd.Series(values)
+
+        stats = RollingMeanStd(10)
+        means, stds = [], []
+        for x in values:
+            stats.push(x)
+            means.append(stats.mean)
+            stds.append(stats.std)
+
+        np.testing.assert_allclose(
+            means, series.rolling(10).mean(), rtol=1e-12, equal_nan=True
+        )
+        np.testing.assert_allclose(
+            stds, series.rolling(10).std(), rtol=1e-6, atol=1e-9, equal_nan=True
+        )
+        expected = series.rolling(10).std() / series.rolling(10).mean()
+        np.testing.assert_allclose(
+            rolling_volatility(values), expected, rtol=1e-6, atol=1e-12, equal_nan=True
+        )
+
+    def test_not_ready_until_window_full(self):
+        """
+        测试：不足 size 个值时结果为 NaN，常数序列的标准差为 0
+        """
+        stats = RollingMeanStd(3)
+        stats.push(5.0)
+        stats.push(5.0)
+        assert not stats.ready
+        assert np.isnan(stats.coefficient_of_variation())
+
+        stats.push(5.0)
+        assert stats.mean == 5.0
+        assert stats.std == 0.0
+        assert stats.coefficient_of_variation() == 0.0
+
+
+class TestTimeWindowSum:
+    """
+    测试 TimeWindowSum 类
+    """
+
+    def test_matches_sql_range_window_across_chunks(self):
+        """
+        测试：跨分段保留状态时，逐行结果与 SQL 的 RANGE 窗口一致（窗口左端闭区间，同一时刻的对等行取相同的值）
+        """
+        rng = np.random.default_rng(5)
+        offsets = np.sort(rng.integers(0, 3600, 400))
+        offsets[50:53] = offsets[50]
+        times = [T0 + datetime.timedelta(seconds=int(s)) for s in offsets]
+        times.append(times[-1] + rolling_stats.VOLUME_WINDOW)
+        values = rng.uniform(0.1, 5, len(times)).tolist()
+        expected = _brute_window_sums(times, values, rolling_stats.VOLUME_WINDOW)
+
+        window = TimeWindowSum()
+        got = []
+        # 分段边界落在不同时刻之间，对等行（第 50-52 行）不跨段
+        for lo, hi in ((0, 50), (50, 200), (200, len(times))):
+            got += window.update(times[lo:hi], values[lo:hi])
+
+        assert got == pytest.approx(expected, rel=1e-9)
+        assert len(window) < len(times)
+
+    def test_integer_times(self):
+        """
+        测试：整数时间（如纳秒时间戳）与同单位的窗口
+        """
+        window = TimeWindowSum(10)
+
+        assert window.update([0, 5, 5, 15, 16], [1, 2, 3, 4, 5]) == [1, 6, 6, 9, 9]
+
+
+def test_fetch_price_pairs_window_volume_in_python():
+    """
+    测试：fetch_price_pairs 的累计成交量在本地计算，没有匹配到 Binance 成交的 Swap 计入成交量但不返回
+    """
+    from block_chain.analyse import fetch_price_pairs
+
+    mock_conn = MagicMock()
+    mock_cur = MagicMock()
+    mock_conn.cursor.return_value.__enter__ = lambda x: mock_cur
+    mock_conn.cursor.return_value.__exit__ = lambda *args: None
+    minute = datetime.timedelta(minutes=1)
+    mock_cur.fetchall.return_value = [
+        (T0, 3000.0, 50e9, 1.0, 2990.0),
+        (T0 + minute, 3001.0, 50e9, 2.0, None),
+        (T0 + 10 * minute, 3002.0, 50e9, 4.0, 2995.0),
+        (T0 + 11 * minute, 3003.0, 50e9, None, 2996.0),
+    ]
+
+    result = fetch_price_pairs(
+        mock_conn, {"time_delay_seconds": 3, "window_seconds": 5}
+    )
+
+    sql = mock_cur.execute.call_args[0][0]
+    assert "OVER" not in sql
+    assert "LEFT JOIN" in sql
+    assert [row[3] for row in result] == [1.0, 7.0, 6.0]
+    assert [row[4] for row in result] == [2990.0, 2995.0, 2996.0]
@@ -0,0 +1,263 @@
+"""
+rollup.py 的单元测试
+"""
+
+import datetime
+import os
+import re
+import sys
+
+import duckdb
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain.rollup import (
+    _REFRESH_SQL,
+    BASE_INTERVAL_SECONDS,
+    SOURCES,
+    bars_average_query,
+    fetch_ohlcv,
+    is_covered,
+    refresh_after_ingest,
+    refresh_bars,
+)
+
+UTC = datetime.timezone.utc
+
+
+def _refresh_params(cursor):
+    """取出 K 线重算语句的参数"""
+    for call in cursor.execute.call_args_list:
+        if "INSERT INTO ohlcv_bars" in call[0][0]:
+            return call[0][1]
+    raise AssertionError("未执行 K 线重算语句")
+
+
+class TestRefreshBars:
+    """
+    测试 refresh_bars 函数
+    """
+
+    def test_uncovered_days_refreshed_whole(self, mock_db_connection):
+        """
+        测试：尚未物化的日期整天重算，并标记为已覆盖
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = []
+        cursor.rowcount = 1440
+
+        refreshed = refresh_bars(
+            conn,
+            "Binance",
+            datetime.datetime(2025, 9, 1, 10, 30, 15, tzinfo=UTC),
+            datetime.datetime(2025, 9, 1, 11, 0, 0, tzinfo=UTC),
+        )
+
+        assert refreshed == 1440
+        params = _refresh_params(cursor)
+        assert params["start"] == datetime.datetime(2025, 9, 1, tzinfo=UTC)
+        assert params["end"] == datetime.datetime(2025, 9, 2, tzinfo=UTC)
+        assert params["base"] == BASE_INTERVAL_SECONDS
+        days = cursor.executemany.call_args[0][1]
+        assert days == [("Binance", datetime.date(2025, 9, 1))]
+
+    def test_covered_day_only_affected_buckets(self, mock_db_connection):
+        """
+        测试：已物化的日期只重算受影响的时间桶
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = [(datetime.date(2025, 9, 1),)]
+        cursor.rowcount = 31
+
+        refresh_bars(
+            conn,
+            "Uniswap",
+            datetime.datetime(2025, 9, 1, 10, 30, 15, tzinfo=UTC),
+            datetime.datetime(2025, 9, 1, 11, 0, 0, tzinfo=UTC),
+        )
+
+        params = _refresh_params(cursor)
+        assert params["start"] == datetime.datetime(2025, 9, 1, 10, 30, tzinfo=UTC)
+        assert params["end"] == datetime.datetime(2025, 9, 1, 11, 1, tzinfo=UTC)
+        # 没有新的整天，无需更新覆盖记录
+        cursor.executemany.assert_not_called()
+
+    def test_source_columns_used(self, mock_db_connection):
+        """
+        测试：按数据源使用对应的原始表与成交量列
+        """
+        conn, cursor = mock_db_connection
+        cursor.fetchall.return_value = []
+        cursor.rowcount = 0
+        day = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+
+        refresh_bars(conn, "Uniswap", day, day)
+
+        sql = next(
+            c[0][0]
+            for c in cursor.execute.call_args_list
+            if "INSERT INTO ohlcv_bars" in c[0][0]
+        )
+        assert "FROM uniswap_swaps" in sql
+        assert SOURCES["Uniswap"]["volume"] in sql
+        assert "ON CONFLICT (source, bucket_start)" in sql
+
+
+class TestRefreshSql:
+    """
+    测试 K 线重算语句本身（在 DuckDB 中执行开盘价与收盘价表达式）
+    """
+
+    @pytest.mark.parametrize("source", list(SOURCES))
+    def test_open_close_on_unsorted_bucket(self, source):
+        """
+        测试：同一时间桶内乱序写入的成交，开盘价为最早的一笔、收盘价为最晚的一笔（同一时刻按 id）
+        """
+        spec = SOURCES[source]
+        sql = _REFRESH_SQL.format(**spec, symbol_filter="TRUE")
+        open_expr, close_expr = re.findall(
+            r"\(array_agg\(price ORDER BY [^)]*\)\)\[1\]", sql
+        )
+        time_column = spec["time_column"]
+        rows = [
+            (3, 12, 3003.0),
+            (1, 11, 3001.0),
+            (5, 15, 3005.0),
+            (1, 10, 3000.0),
+            (5, 14, 3004.0),
+        ]
+        con = duckdb.connect()
+        con.execute(f"CREATE TABLE t ({time_column} INTEGER, id INTEGER, price DOUBLE)")
+        con.executemany("INSERT INTO t VALUES (?, ?, ?)", rows)
+
+        open_price, close_price = con.execute(
+            f"SELECT {open_expr}, {close_expr} FROM t"
+        ).fetchone()
+
+        assert open_price == 3000.0
+        assert close_price == 3005.0
+
+
+class TestRefreshAfterIngest:
+    """
+    测试 refresh_after_ingest 函数
+    """
+
+    def test_no_data_skipped(self, mock_db_connection):
+        """
+        测试：没有写入数据时不刷新
+        """
+        conn, cursor = mock_db_connection
+
+        assert refresh_after_ingest(conn, "Binance", None, None) is None
+        cursor.execute.assert_not_called()
+
+    def test_failure_only_logged(self, mock_db_connection):
+        """
+        测试：刷新失败时回滚并返回 None，不向采集任务抛出异常
+        """
+        conn, cursor = mock_db_connection
+        cursor.execute.side_effect = Exception("db down")
+        day = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+
+        assert refresh_after_ingest(conn, "Binance", day, day) is None
+        assert conn.rollback.call_count == 2
+        conn.commit.assert_not_called()
+
+    def test_failure_invalidates_coverage(self, mock_db_connection):
+        """
+        测试：刷新失败时删除受影响日期的覆盖记录并提交，这些日期改为读取原始成交
+        """
+        conn, cursor = mock_db_connection
+        failed = []
+
+        def execute(sql, params=None):
+            if "INSERT INTO ohlcv_bars" in sql and not failed:
+                failed.append(sql)
+                raise Exception("statement timeout")
+
+        cursor.execute.side_effect = execute
+        start = datetime.datetime(2025, 9, 1, 23, 0, tzinfo=UTC)
+        end = datetime.datetime(2025, 9, 2, 1, 0, tzinfo=UTC)
+
+        assert refresh_after_ingest(conn, "Uniswap", start, end) is None
+
+        sql, params = cursor.execute.call_args[0]
+        assert sql.startswith("DELETE FROM ohlcv_coverage")
+        assert params == ("Uniswap", start.date(), end.date())
+        conn.rollback.assert_called_once()
+        conn.commit.assert_called_once()
+
+
+class TestIsCovered:
+    """
+    测试 is_covered 函数
+    """
+
+    def test_all_sources_all_days(self, mock_db_connection):
+        """
+        测试：每个数据源的每一天都已物化时返回 True
+        """
+        _, cursor = mock_db_connection
+        start = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+        end = datetime.datetime(2025, 9, 8, tzinfo=UTC)
+        cursor.fetchone.return_value = (7 * len(SOURCES),)
+
+        assert is_covered(cursor, start, end, 3600) is True
+
+        cursor.fetchone.return_value = (7 * len(SOURCES) - 1,)
+        assert is_covered(cursor, start, end, 3600) is False
+
+    def test_interval_not_multiple_of_base(self, mock_db_connection):
+        """
+        测试：粒度不是基础粒度的整数倍时不使用 K 线
+        """
+        _, cursor = mock_db_connection
+        day = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+
+        assert is_covered(cursor, day, day + datetime.timedelta(days=1), 90) is False
+        cursor.execute.assert_not_called()
+
+
+class TestFetchOhlcv:
+    """
+    测试 fetch_ohlcv 与 bars_average_query
+    """
+
+    def test_fetch_rollup(self, mock_db_connection):
+        """
+        测试：由基础 K 线汇总指定粒度
+        """
+        conn, cursor = mock_db_connection
+        bucket = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+        cursor.fetchall.return_value = [
+            (bucket, 3000, 3100, 2900, 3050, 10, 30500, 3050, 42)
+        ]
+
+        df = fetch_ohlcv(conn, "Binance", 3600, bucket, bucket)
+
+        assert df.iloc[0]["close"] == 3050
+        assert df.iloc[0]["trade_count"] == 42
+        assert cursor.execute.call_args[0][1]["interval"] == 3600
+
+    def test_fetch_rejects_finer_interval(self, mock_db_connection):
+        """
+        测试：粒度不是基础粒度的整数倍时抛出异常
+        """
+        conn, _ = mock_db_connection
+        day = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+
+        with pytest.raises(ValueError):
+            fetch_ohlcv(conn, "Binance", 30, day, day)
+
+    def test_average_from_sums(self):
+        """
+        测试：均价由 price_sum / trade_count 汇总，与原始 AVG(price) 一致
+        """
+        assert "SUM(price_sum) / SUM(trade_count)" in bars_average_query
@@ -0,0 +1,249 @@
+"""
+routes.py 的单元测试（兑换图、负权环检测与多跳路径扫描）
+"""
+
+import datetime
+import itertools
+import math
+import os
+import sys
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain.routes import (
+    Market,
+    PriceGraph,
+    benchmark,
+    fetch_market_prices,
+    make_market,
+    split_symbol,
+)
+
+T0 = datetime.datetime(2025, 9, 1, 10, 0, tzinfo=datetime.timezone.utc)
+NS = 1_000_000_000
+
+ETH_USDT = Market("uniswap", "ETHUSDT", "ETH", "USDT", 0.0005)
+BTC_USDT = Market("binance", "BTCUSDT", "BTC", "USDT", 0.001)
+ETH_BTC = Market("binance", "ETHBTC", "ETH", "BTC", 0.001)
+
+
+def _brute_force_best(graph, prices):
+    """枚举所有简单环，返回扣费后最大的兑换率之积"""
+    best = 0.0
+    n = len(graph.assets)
+    for length in range(2, n + 1):
+        for path in itertools.permutations(range(n), length):
+            if path[0] != min(path):
+                continue
+            rate = 1.0
+            for a, b in zip(path, path[1:] + path[:1]):
+                step = 0.0
+                for i, market in enumerate(graph.markets):
+                    base = graph.assets.index(market.base)
+                    quote = graph.assets.index(market.quote)
+                    if (a, b) == (base, quote):
+                        step = max(step, prices[i] * (1 - market.fee))
+                    elif (a, b) == (quote, base):
+                        step = max(step, (1 / prices[i]) * (1 - market.fee))
+                rate *= step
+            best = max(best, rate)
+    return best - 1
+
+
+class TestPriceGraph:
+    """
+    测试兑换图与负权环检测
+    """
+
+    def test_triangular_cycle(self):
+        """
+        测试：ETHBTC 定价偏低时找到 USDT -> BTC -> ETH -> USDT 的三角路径，利润率等于兑换率之积减一
+        """
+        graph = PriceGraph([ETH_USDT, BTC_USDT, ETH_BTC])
+        graph.update(0, 3000.0)
+        graph.update(1, 60000.0)
+        # 一致的价格为 0.05，扣除三次手续费后仍无利可图
+        graph.update(2, 0.05)
+        assert graph.find_cycle() is None
+
+        graph.update(2, 0.049)
+        route = graph.describe(graph.find_cycle())
+
+        assert route["path"] == ["USDT", "BTC", "ETH", "USDT"]
+        assert route["legs"] == [
+            "Binance:BTCUSDT buy",
+            "Binance:ETHBTC buy",
+            "Uniswap:ETHUSDT sell",
+        ]
+        assert route["hops"] == 3 and route["dex_hops"] == 1
+        expected = (1 / 60000 * 0.999) * (1 / 0.049 * 0.999) * (3000 * 0.9995) - 1
+        assert route["profit_rate"] == pytest.approx(expected)
+
+    def test_two_venue_cycle(self):
+        """
+        测试：同一交易对在两个市场的价差扣除两边手续费后为正时，得到两跳的环（即原有的 CEX-DEX 套利）
+        """
+        graph = PriceGraph([ETH_USDT, make_market("binance", "ETHUSDT")])
+        graph.update(0, 3000.0)
+        graph.update(1, 3003.0)
+        assert graph.find_cycle() is None
+
+        graph.update(1, 3010.0)
+        route = graph.describe(graph.find_cycle())
+
+        assert route["path"] == ["USDT", "ETH", "USDT"]
+        assert route["profit_rate"] == pytest.approx(3010 / 3000 * 0.999 * 0.9995 - 1)
+
+    def test_matches_brute_force(self):
+        """
+        测试：随机价格下，找到负权环当且仅当枚举得到的最优环有利润，且找到的环确实有利润
+        """
+        rng = np.random.default_rng(7)
+        assets = ["USDT", "ETH", "BTC", "SOL", "DAI"]
+        true = dict(zip(assets, [1.0, 3000.0, 60000.0, 150.0, 1.0]))
+        markets = [
+            Market(venue, f"{b}{q}", b, q, fee)
+            for (b, q), (venue, fee) in itertools.product(
+                [("ETH", "USDT"), ("BTC", "USDT"), ("ETH", "BTC"), ("SOL", "ETH")]
+                + [("SOL", "USDT"), ("DAI", "USDT")],
+                [("uniswap", 0.0005), ("binance", 0.001)],
+            )
+        ]
+        found = 0
+        for _ in range(200):
+            graph = PriceGraph(markets)
+            prices = [
+                true[m.base] / true[m.quote] * math.exp(rng.normal(0, 5e-4))
+                for m in markets
+            ]
+            for i, price in enumerate(prices):
+                graph.update(i, price)
+            edges = graph.find_cycle()
+            best = _brute_force_best(graph, prices)
+            if edges is None:
+                assert best <= 1e-9
+            else:
+                found += 1
+                assert graph.describe(edges)["profit_rate"] > 0
+                assert best > 0
+        assert 0 < found < 200
+
+    def test_symbol_split_and_markets(self):
+        """
+        测试：交易对按计价资产拆分；默认手续费按市场类型取策略参数
+        """
+        assert split_symbol("ethusdt") == ("ETH", "USDT")
+        assert split_symbol("ETHBTC") == ("ETH", "BTC")
+        with pytest.raises(ValueError):
+            split_symbol("USDT")
+
+        assert make_market("uniswap", "ETHUSDT").fee == 0.0005
+        assert make_market("OKX", "ETHUSDT", {"binance_fee_rate": 0.002}).fee == 0.002
+        with pytest.raises(ValueError):
+            make_market("mtgox", "ETHUSDT")
+
+
+class TestScan:
+    """
+    测试按时间回放价格的增量扫描
+    """
+
+    def test_incremental_scan(self):
+        """
+        测试：同一时刻的更新全部应用后才搜索；价格没有变化的时刻不搜索；之后出现的市场追加到已有的图中
+        """
+        graph = PriceGraph([ETH_USDT, BTC_USDT])
+        searches = []
+        original = graph.find_cycle
+
+        def counting():
+            searches.append(1)
+            return original()
+
+        graph.find_cycle = counting
+        routes = graph.scan(
+            np.array([0, 0, NS, 2 * NS]),
+            np.array([0, 1, 0, 1]),
+            np.array([3000.0, 60000.0, 3000.0, 60000.0]),
+        )
+        assert routes == [] and len(searches) == 1
+
+        index = graph.add_market(ETH_BTC)
+        assert index == 2 and graph.add_market(ETH_BTC) == 2
+        assert graph.edge_count == 6 and len(graph.assets) == 3
+
+        start = pd.Timestamp(T0).value
+        routes = graph.scan(
+            np.array([start + NS, start, start + 2 * NS]),
+            np.array([2, 2, 2]),
+            np.array([0.049, 0.05, 0.05]),
+        )
+
+        assert [r["block_time"] for r in routes] == [
+            pd.Timestamp(T0) + pd.Timedelta(1, "s")
+        ]
+        assert routes[0]["path"] == ["USDT", "BTC", "ETH", "USDT"]
+
+    def test_thresholds(self):
+        """
+        测试：低于最低利润率或超过最多跳数的环不报告
+        """
+        graph = PriceGraph([ETH_USDT, BTC_USDT, ETH_BTC])
+        args = (
+            np.array([0, 0, 0]),
+            np.array([0, 1, 2]),
+            np.array([3000.0, 60000.0, 0.049]),
+        )
+
+        assert len(graph.scan(*args)) == 1
+        assert PriceGraph(graph.markets).scan(*args, min_profit_rate=0.05) == []
+        assert PriceGraph(graph.markets).scan(*args, max_hops=2) == []
+
+    def test_fetch_market_prices(self):
+        """
+        测试：Uniswap 市场读取 uniswap_swaps，中心化交易所读取各自的成交表，都按交易对过滤并按秒汇总
+        """
+        conn = MagicMock()
+        cur = MagicMock()
+        conn.cursor.return_value.__enter__.return_value = cur
+        epoch = int(pd.Timestamp(T0).timestamp())
+        cur.fetchall.side_effect = [
+            [(epoch, 3000.0), (epoch + 1, 3001.0)],
+            [(epoch, 3002.5)],
+        ]
+        markets = [ETH_USDT, make_market("okx", "ETHUSDT")]
+
+        times, ids, prices = fetch_market_prices(
+            conn, markets, pd.Timestamp(T0), pd.Timestamp(T0) + pd.Timedelta(1, "h")
+        )
+
+        (uni_sql, uni_params), (okx_sql, _) = [c[0] for c in cur.execute.call_args_list]
+        assert (
+            "FROM uniswap_swaps" in uni_sql
+            and "date_trunc('second', block_time)" in uni_sql
+        )
+        assert "FROM okx_trades" in okx_sql
+        assert uni_params[0] == "ETHUSDT"
+        assert times.tolist() == [epoch * NS, (epoch + 1) * NS, epoch * NS]
+        assert ids.tolist() == [0, 0, 1]
+        assert prices.tolist() == [3000.0, 3001.0, 3002.5]
+
+    def test_benchmark_market(self):
+        """
+        测试：基准的合成市场有 100 条边，回放中偶尔出现套利环（搜索耗时由 --benchmark 报告）
+        """
+        result = benchmark(timestamps=5_000, markets=50)
+
+        assert result["edges"] == 100
+        assert result["timestamps"] == 5_000
+        assert result["routes"] > 0
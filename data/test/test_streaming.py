@@ -0,0 +1,307 @@
+"""
+streaming.py 的单元测试（使用本地回放源）
+"""
+
+import datetime
+import os
+import sys
+import threading
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain.analyse import DEFAULT_STRATEGY, analyze_opportunities
+from block_chain.streaming import (
+    BINANCE,
+    UNISWAP,
+    PostgresTailSource,
+    StreamingDetector,
+    benchmark,
+    replay_events,
+    run_streaming,
+    tickstore_events,
+)
+from block_chain.tickstore import TickStore
+
+DAY = datetime.date(2025, 9, 1)
+START_NS = pd.Timestamp("2025-09-01 08:00", tz="UTC").value
+SECOND = 1_000_000_000
+STRATEGY = {**DEFAULT_STRATEGY, "profit_threshold": 0.5}
+
+
+@pytest.fixture
+def store(tmp_path):
+    """随机行情：Binance 成交时密时疏（部分 Swap 的窗口内没有成交），Uniswap 同一区块有多笔 Swap"""
+    rng = np.random.default_rng(7)
+    b_time = START_NS + np.sort(rng.integers(0, 3600 * SECOND, 4000))
+    b_time = b_time[(b_time - START_NS) % (600 * SECOND) > 30 * SECOND]
+    b_price = 3000 + np.cumsum(rng.normal(0, 0.8, len(b_time)))
+    u_time = START_NS + np.repeat(np.arange(12, 3600, 12) * SECOND, 2)[:500]
+    u_price = 3000 + rng.normal(0, 6, len(u_time))
+
+    s = TickStore(root=str(tmp_path))
+    s.write_day(
+        "binance",
+        DAY,
+        {"time": b_time, "price": b_price, "volume": rng.uniform(0.01, 2, len(b_time))},
+    )
+    s.write_day(
+        "uniswap",
+        DAY,
+        {
+            "time": u_time,
+            "price": u_price,
+            "volume": rng.uniform(0.1, 5, len(u_time)),
+            "gas": rng.uniform(5e9, 5e10, len(u_time)),
+        },
+    )
+    return s
+
+
+class TestStreamingDetector:
+    """
+    测试 StreamingDetector 类
+    """
+
+    def test_matches_batch_analysis(self, store):
+        """
+        测试：逐事件检测的结果与批量分析（同一份数据）完全一致
+        """
+        expected = analyze_opportunities(store.price_pairs(STRATEGY), STRATEGY)
+
+        detector = StreamingDetector(STRATEGY)
+        for batch in tickstore_events(store):
+            detector.process_many(batch)
+        detector.flush()
+        actual = detector.opportunities
+
+        assert expected
+        assert len(actual) == len(expected)
+        for got, want in zip(actual, expected):
+            assert got["block_time"] == want["block_time"]
+            assert got["buy_platform"] == want["buy_platform"]
+            assert got["buy_price"] == pytest.approx(want["buy_price"], rel=1e-12)
+            assert got["profit_usdt"] == pytest.approx(want["profit_usdt"], rel=1e-9)
+            for key, value in want["risk_metrics"].items():
+                assert got["risk_metrics"][key] == pytest.approx(value, abs=1e-6)
+        assert detector.stats()["pending"] == 0
+
+    def test_swap_evaluated_when_binance_window_closes(self):
+        """
+        测试：Swap 在 Binance 时钟越过 T - delay + window 之后立即评估，不等待数据流结束
+        """
+        detector = StreamingDetector(
+            {"time_delay_seconds": 3, "window_seconds": 5, "profit_threshold": 1}
+        )
+        t = START_NS
+        detector.process_many(
+            [
+                (t - 4 * SECOND, BINANCE, 3000.0, 0, 1.0),
+                (t, UNISWAP, 3100.0, 1e9, -2.0),
+                (t + 2 * SECOND, BINANCE, 3000.0, 0, 1.0),
+            ]
+        )
+        # 窗口右端为 T + 2s（闭区间），此时还可能有同一时刻的成交到达
+        assert detector.opportunities == []
+
+        detector.process_many([(t + 2 * SECOND + 1, BINANCE, 3000.0, 0, 1.0)])
+        assert len(detector.opportunities) == 1
+        opp = detector.opportunities[0]
+        assert opp["buy_platform"] == "Binance"
+        assert opp["buy_price"] == 3000.0
+        assert opp["risk_metrics"]["market_volume_eth"] == 2.0
+
+    def test_late_events_dropped(self):
+        """
+        测试：同一数据源内早于该源时钟的乱序事件被计数并丢弃
+        """
+        detector = StreamingDetector({})
+        detector.process_many(
+            [
+                (START_NS + SECOND, BINANCE, 3000.0, 0, 1.0),
+                (START_NS, BINANCE, 2000.0, 0, 1.0),
+            ]
+        )
+
+        assert detector.stats()["late_events"] == 1
+        assert len(detector._binance) == 1
+
+    def test_benchmark_processes_all_events(self):
+        """
+        测试：吞吐基准处理全部合成事件且不留下待匹配的事件（吞吐数值由 --benchmark 报告）
+        """
+        result = benchmark(swaps=5_000)
+
+        assert result["events"] == 50_000
+        assert result["pending"] == 0
+        assert result["events_per_sec"] > 0
+
+
+class _TailCursor:
+    """按 PostgresTailSource 的查询语句返回已提交的行（表 -> {id: 行}）"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params=None):
+        rows = self.tables[
+            "binance_trades" if "binance_trades" in sql else "uniswap_swaps"
+        ]
+        ids = sorted(rows)
+        if "MAX(id)" in sql:
+            self.result = [(max(ids, default=0),)]
+        elif sql.startswith("SELECT id FROM"):
+            lo, hi = params
+            self.result = [(i,) for i in ids if lo < i <= hi]
+        elif "<> ALL" in sql:
+            lo, hi, seen = params
+            self.result = [rows[i] for i in ids if lo < i <= hi and i not in seen]
+        else:
+            last_id, limit = params
+            self.result = [rows[i] for i in ids if i > last_id][:limit]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+
+class TestPostgresTailSource:
+    """
+    测试按 id 轮询原始表
+    """
+
+    def test_late_commit_below_high_water_mark(self):
+        """
+        测试：并发导入时高水位之下晚提交的行在尾部窗口内补读且只读取一次；启动前已有的行不会被当作新行
+        """
+
+        def row(i):
+            return (i, 1_756_713_600_000_000 + i, 3000.0 + i, 0.0, 1.0)
+
+        tables = {"binance_trades": {i: row(i) for i in (1, 2, 3)}, "uniswap_swaps": {}}
+        conn = MagicMock()
+        conn.cursor.return_value = _TailCursor(tables)
+        source = PostgresTailSource(conn, tail_window=10)
+
+        assert source.poll() == []
+        # id 4 所在的事务尚未提交，id 5 先提交
+        tables["binance_trades"][5] = row(5)
+        assert [e[2] for e in source.poll()] == [3005.0]
+        tables["binance_trades"][4] = row(4)
+        assert [e[2] for e in source.poll()] == [3004.0]
+        assert source.poll() == []
+        # 超出尾部窗口的历史区间不再补读
+        tables["binance_trades"][-20] = row(-20)
+        assert source.poll() == []
+
+    def test_late_commit_on_postgres(self, pg_connect):
+        """
+        测试（真实 PostgreSQL）：先分配 id、后提交的 swap 在之后的轮询中补读
+        """
+        setup = pg_connect()
+        with setup.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE binance_trades (
+                    id bigint PRIMARY KEY, price numeric, qty numeric,
+                    trade_time timestamptz, symbol text DEFAULT 'ETHUSDT'
+                );
+                CREATE TABLE uniswap_swaps (
+                    id serial PRIMARY KEY, block_time timestamptz, price numeric,
+                    gas_price numeric, amount_eth numeric, symbol text DEFAULT 'ETHUSDT'
+                );
+                INSERT INTO uniswap_swaps (block_time, price, gas_price, amount_eth)
+                VALUES ('2025-09-01 08:00+00', 3000, 1e9, 1);
+                """)
+        setup.commit()
+        source = PostgresTailSource(pg_connect(), tail_window=100)
+        insert = (
+            "INSERT INTO uniswap_swaps (block_time, price, gas_price, amount_eth)"
+            " VALUES ('2025-09-01 08:00:01+00', %s, 1e9, 1)"
+        )
+        slow, fast = pg_connect(), pg_connect()
+        with slow.cursor() as cur:
+            cur.execute(insert, (3001,))
+        with fast.cursor() as cur:
+            cur.execute(insert, (3002,))
+        fast.commit()
+
+        assert [e[2] for e in source.poll()] == [3002.0]
+        slow.commit()
+        assert [e[2] for e in source.poll()] == [3001.0]
+        assert source.poll() == []
+
+
+class TestRunStreaming:
+    """
+    测试常驻检测循环
+    """
+
+    def test_flushes_opportunities(self):
+        """
+        测试：轮询到的事件被检测，机会按批交给写出函数，停止时写出剩余机会
+        """
+        t = START_NS
+        polls = [
+            [(t - 4 * SECOND, BINANCE, 3000.0, 0, 1.0), (t, UNISWAP, 3100.0, 1e9, 1.0)],
+            [(t + 3 * SECOND, BINANCE, 3000.0, 0, 1.0)],
+        ]
+        stop = threading.Event()
+
+        class Source:
+            def poll(self):
+                if polls:
+                    return polls.pop(0)
+                stop.set()
+                return []
+
+        flushed = []
+        detector = run_streaming(
+            Source(),
+            {"profit_threshold": 1},
+            flushed.append,
+            poll_interval=0,
+            flush_interval=3600,
+            report_interval=0,
+            stop_event=stop,
+        )
+
+        assert [len(batch) for batch in flushed] == [1]
+        assert detector.stats()["events"] == 3
+
+
+def test_replay_events_merges_by_time():
+    """
+    测试：回放源按时间归并两个数据源并按批产出
+    """
+    batches = list(
+        replay_events(
+            [(1, 10.0, 0.1), (5, 11.0, 0.2)],
+            [(3, 12.0, 1e9, -1.0)],
+            batch_size=2,
+        )
+    )
+
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert [event[:2] for batch in batches for event in batch] == [
+        (1, BINANCE),
+        (3, UNISWAP),
+        (5, BINANCE),
+    ]
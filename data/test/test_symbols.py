@@ -0,0 +1,296 @@
+"""
+symbols.py 的单元测试（交易对解析、symbol 列迁移与多交易对并行分析）
+"""
+
+import datetime
+import os
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain import symbols
+from block_chain.collect_binance import process_chunk
+from block_chain.symbols import (
+    DEFAULT_SYMBOL,
+    ensure_symbol_columns,
+    fan_out,
+    normalize_symbol,
+    resolve_symbols,
+    symbol_for_pool,
+)
+
+T0 = datetime.datetime(2025, 9, 1, 10, 0, tzinfo=datetime.timezone.utc)
+
+
+class TestResolveSymbols:
+    """
+    测试交易对的规范化与解析
+    """
+
+    def test_normalize_and_resolve(self):
+        """
+        测试：统一为大写，任务配置的 symbols 优先于 strategy.symbol，去重并保持顺序；不合法的交易对抛出异常
+        """
+        assert normalize_symbol(" solusdt ") == "SOLUSDT"
+        with pytest.raises(ValueError):
+            normalize_symbol("ETH'; DROP TABLE binance_trades; --")
+
+        assert resolve_symbols({}) == [DEFAULT_SYMBOL]
+        assert resolve_symbols({}, {"symbol": "btcusdt"}) == ["BTCUSDT"]
+        assert resolve_symbols(
+            {"symbols": ["ethusdt", "BTCUSDT", "ETHUSDT"]}, {"symbol": "SOLUSDT"}
+        ) == ["ETHUSDT", "BTCUSDT"]
+        assert resolve_symbols({"symbols": "BTCUSDT, SOLUSDT"}) == [
+            "BTCUSDT",
+            "SOLUSDT",
+        ]
+
+    def test_symbol_for_pool(self, monkeypatch):
+        """
+        测试：Uniswap 任务的 symbol 参数优先，其次按池子地址（不区分大小写）查配置，最后为默认交易对
+        """
+        monkeypatch.setattr(symbols, "POOL_SYMBOLS", {"0xabc": "BTCUSDT"})
+
+        assert symbol_for_pool("0xABC") == "BTCUSDT"
+        assert symbol_for_pool("0xABC", "solusdt") == "SOLUSDT"
+        assert symbol_for_pool("0xdef") == DEFAULT_SYMBOL
+
+
+class TestSchema:
+    """
+    测试 symbol 列迁移
+    """
+
+    def test_only_missing_columns_are_added_once(self, mock_db_connection, monkeypatch):
+        """
+        测试：只为缺列的表执行 ALTER TABLE（默认值为默认交易对），同一进程内不再重复检查
+        """
+        monkeypatch.setattr(symbols, "_ensured_tables", set())
+        conn, cur = mock_db_connection
+        cur.fetchall.return_value = [("binance_trades",)]
+
+        ensure_symbol_columns(conn)
+
+        statements = [c[0][0] for c in cur.execute.call_args_list]
+        assert "information_schema.columns" in statements[0]
+        assert statements[1:] == [
+            "SET LOCAL lock_timeout = '5s'",
+            "ALTER TABLE uniswap_swaps ADD COLUMN IF NOT EXISTS symbol text"
+            f" NOT NULL DEFAULT '{DEFAULT_SYMBOL}'",
+        ]
+        # DDL 在独立的短事务中提交，不延续到调用者的采集事务
+        conn.commit.assert_called_once()
+
+        cur.reset_mock()
+        ensure_symbol_columns(conn)
+        cur.execute.assert_not_called()
+
+    def test_failed_ddl_is_not_cached(self, mock_db_connection, monkeypatch):
+        """
+        测试：ALTER TABLE 失败（如等锁超时）时回滚并抛出异常，下次调用重新检查，不会误记为已有 symbol 列
+        """
+        monkeypatch.setattr(symbols, "_ensured_tables", set())
+        conn, cur = mock_db_connection
+        cur.fetchall.return_value = []
+        cur.execute.side_effect = [None, None, Exception("lock timeout")]
+
+        with pytest.raises(Exception, match="lock timeout"):
+            ensure_symbol_columns(conn, ["uniswap_swaps"])
+
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+        assert symbols._ensured_tables == set()
+
+    @pytest.mark.parametrize(
+        "entry", ["replay", "streaming", "rollup", "tickstore", "columnar"]
+    )
+    def test_readers_ensure_column_first(
+        self, entry, mock_db_connection, monkeypatch, tmp_path
+    ):
+        """
+        测试：按默认交易对过滤原始表的读取入口先补齐 symbol 列并提交，升级前的数据库不会因缺列而失败
+        """
+        from block_chain import columnar, replay, rollup, streaming, tickstore
+
+        monkeypatch.setattr(symbols, "_ensured_tables", set())
+        conn, cur = mock_db_connection
+        cur.fetchall.return_value = []
+        cur.fetchone.return_value = (None, None)
+
+        if entry == "replay":
+            replay.PostgresReader(conn)
+        elif entry == "streaming":
+            streaming.PostgresTailSource(conn, from_start=True)
+        elif entry == "rollup":
+            rollup.refresh_after_ingest(conn, "Binance", T0, T0)
+        elif entry == "tickstore":
+            tickstore.TickStore(root=str(tmp_path)).sync(conn, None, None)
+        else:
+            store = columnar.ColumnarStore(root=str(tmp_path))
+            try:
+                store.sync(conn)
+            finally:
+                store.close()
+
+        statements = [c[0][0] for c in cur.execute.call_args_list]
+        assert "information_schema.columns" in statements[0]
+        assert any("ADD COLUMN IF NOT EXISTS symbol" in sql for sql in statements[1:3])
+        assert symbols._ensured_tables == set(symbols.SYMBOL_TABLES)
+
+    def test_process_chunk_writes_symbol(self, mock_db_connection):
+        """
+        测试：Binance 分块按交易对写入 symbol 列
+        """
+        conn, cur = mock_db_connection
+        copied = []
+        cur.copy_expert.side_effect = lambda sql, file: copied.append(
+            (sql, file.getvalue())
+        )
+        chunk = pd.DataFrame(
+            {
+                "id": [1],
+                "price": [60000.0],
+                "qty": [0.1],
+                "quoteQty": [6000.0],
+                "time": [1756720800000000],
+                "isBuyerMaker": [True],
+                "isBestMatch": [True],
+            }
+        )
+
+        process_chunk("task", chunk, 0, [0, 0], None, conn, symbol="BTCUSDT")
+
+        sql, payload = copied[0]
+        assert sql.split("(")[1].split(")")[0].endswith("symbol")
+        assert payload.strip().endswith(",BTCUSDT")
+
+
+class TestFanOut:
+    """
+    测试多交易对并行分析
+    """
+
+    def test_fan_out_runs_in_parallel_and_keeps_order(self):
+        """
+        测试：各交易对在不同线程中同时执行，结果顺序与输入相同；任何一个失败都抛出异常
+        """
+        barrier = threading.Barrier(3, timeout=5)
+
+        def work(symbol):
+            barrier.wait()
+            return symbol.lower()
+
+        assert fan_out(["A1", "B2", "C3"], work, parallelism=3) == {
+            "A1": "a1",
+            "B2": "b2",
+            "C3": "c3",
+        }
+
+        def failing(symbol):
+            if symbol == "B2":
+                raise RuntimeError("boom")
+            return symbol
+
+        with pytest.raises(RuntimeError, match="boom"):
+            fan_out(["A1", "B2"], failing, parallelism=2)
+
+    @patch("block_chain.analyse.save_results")
+    @patch("block_chain.analyse.ensure_batch_exists")
+    @patch("block_chain.analyse.check_task", return_value=False)
+    @patch("block_chain.analyse.update_task_status")
+    @patch("block_chain.analyse.psycopg2.connect")
+    def test_run_analyse_fans_out_over_symbols(
+        self,
+        mock_connect,
+        mock_update_status,
+        mock_check_task,
+        mock_ensure_batch,
+        mock_save_results,
+    ):
+        """
+        测试：一个分析任务按交易对各用一个连接取价格对，机会带上交易对并在一次写入中保存；
+        请求 duckdb 后端时非默认交易对改为在数据库中计算
+        """
+        from block_chain import analyse
+
+        connections = []
+
+        def connect(**kwargs):
+            conn = MagicMock()
+            connections.append(conn)
+            return conn
+
+        mock_connect.side_effect = connect
+        requested = []
+
+        def fetch(conn, strategy, start_time=None, end_time=None):
+            requested.append(strategy["symbol"])
+            gap = 100.0 if strategy["symbol"] == "BTCUSDT" else 50.0
+            return [(T0, 3000.0 + gap, 1e9, 100.0, 3000.0)]
+
+        config_json = (
+            '{"strategy": {"profit_threshold": 1}, "batch_id": 7, '
+            '"symbols": ["ethusdt", "btcusdt", "solusdt"], '
+            '"analytics_backend": "postgres", "incremental": true}'
+        )
+        with patch.object(analyse, "fetch_price_pairs", side_effect=fetch):
+            analyse.run_analyse("task", config_json)
+
+        assert sorted(requested) == ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+        # 主连接 + 每个交易对一个连接，全部关闭
+        assert len(connections) == 4
+        assert all(conn.close.called for conn in connections)
+        saved = mock_save_results.call_args[0][1]
+        assert [opp["symbol"] for opp in saved] == ["ETHUSDT", "BTCUSDT", "SOLUSDT"]
+        assert saved[1]["profit_usdt"] > saved[0]["profit_usdt"]
+        mock_update_status.assert_called_once_with("task", 1)
+
+        # 非默认交易对没有本地镜像
+        with patch.object(
+            analyse, "fetch_price_pairs", return_value=[]
+        ) as pg, patch.object(
+            analyse, "fetch_price_pairs_columnar", return_value=[]
+        ) as duck:
+            analyse._fetch_pairs(
+                MagicMock(),
+                {"analytics_backend": "duckdb"},
+                {"symbol": "BTCUSDT"},
+                None,
+                None,
+            )
+        pg.assert_called_once()
+        duck.assert_not_called()
+
+
+def test_fetch_price_pairs_filters_by_symbol():
+    """
+    测试：两张表都按 strategy.symbol 过滤，未指定时使用默认交易对
+    """
+    from block_chain.analyse import fetch_price_pairs
+
+    mock_conn = MagicMock()
+    mock_cur = MagicMock()
+    mock_conn.cursor.return_value.__enter__ = lambda x: mock_cur
+    mock_conn.cursor.return_value.__exit__ = lambda *args: None
+    mock_cur.fetchall.return_value = []
+    strategy = {"time_delay_seconds": 3, "window_seconds": 5}
+
+    fetch_price_pairs(mock_conn, {**strategy, "symbol": "btcusdt"})
+
+    sql, params = mock_cur.execute.call_args[0]
+    assert "u.symbol = %(symbol)s" in sql
+    assert "b.symbol = %(symbol)s" in sql
+    assert params["symbol"] == "BTCUSDT"
+
+    fetch_price_pairs(mock_conn, strategy)
+    assert mock_cur.execute.call_args[0][1]["symbol"] == DEFAULT_SYMBOL
@@ -0,0 +1,198 @@
+"""
+tickstore.py 的单元测试（使用临时目录中的 .npy 文件）
+"""
+
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain.tickstore import PRICE_PAIR_COLUMNS, TickStore
+
+UTC = datetime.timezone.utc
+DAY = datetime.date(2025, 9, 1)
+STRATEGY = {"time_delay_seconds": 3, "window_seconds": 5}
+
+
+def _ns(text):
+    return pd.Timestamp(text, tz="UTC").value
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TickStore(root=str(tmp_path))
+    s.write_day(
+        "binance",
+        DAY,
+        {
+            "time": [
+                _ns("2025-09-01 09:59:52"),
+                _ns("2025-09-01 09:59:56"),
+                _ns("2025-09-01 09:59:58"),
+                _ns("2025-09-01 10:00:30"),
+            ],
+            "price": [2000.0, 2990.0, 3010.0, 3100.0],
+            "volume": [1.0, 1.0, 1.0, 2.0],
+        },
+    )
+    s.write_day(
+        "uniswap",
+        DAY,
+        {
+            "time": [
+                _ns("2025-09-01 10:00:00"),
+                _ns("2025-09-01 10:00:33"),
+                _ns("2025-09-01 10:00:33"),
+                _ns("2025-09-01 11:00:00"),
+            ],
+            "price": [3050.0, 3150.0, 3160.0, 3200.0],
+            "volume": [1.5, 2.0, 1.0, 4.0],
+            "gas": [50e9, 50e9, 60e9, 70e9],
+        },
+    )
+    return s
+
+
+class TestTickStore:
+    """
+    测试 TickStore 类
+    """
+
+    def test_load_day_is_memory_mapped(self, store):
+        """
+        测试：按定长 dtype 保存，读取时内存映射且只读
+        """
+        arrays = store.load_day("uniswap", DAY)
+
+        assert isinstance(arrays["time"], np.memmap)
+        assert arrays["time"].dtype == np.int64
+        assert arrays["price"].dtype == np.float64
+        assert arrays["gas"].dtype == np.float64
+        assert not arrays["price"].flags.writeable
+
+    def test_load_range_across_days(self, store):
+        """
+        测试：跨日读取按时间拼接，并按闭区间裁剪
+        """
+        store.write_day(
+            "binance",
+            datetime.date(2025, 9, 2),
+            {
+                "time": [_ns("2025-09-02 00:00:00")],
+                "price": [3500.0],
+                "volume": [1.0],
+            },
+        )
+
+        arrays = store.load(
+            "binance", _ns("2025-09-01 09:59:58"), _ns("2025-09-02 00:00:00")
+        )
+
+        assert arrays["price"].tolist() == [3010.0, 3100.0, 3500.0]
+        assert (
+            store.load("binance", _ns("2025-09-05"), _ns("2025-09-06"))["time"].size
+            == 0
+        )
+
+    def test_price_pairs_match_sql_semantics(self, store):
+        """
+        测试：窗口闭区间均价、同一时刻对等行的累计成交量、无成交窗口被丢弃
+        """
+        frame = store.price_pairs(STRATEGY)
+
+        assert list(frame.columns) == PRICE_PAIR_COLUMNS
+        # 11:00:00 的窗口内没有 Binance 成交
+        assert len(frame) == 3
+        first = frame.iloc[0]
+        assert first["block_time"] == pd.Timestamp("2025-09-01 10:00:00", tz="UTC")
+        # 窗口 [09:59:52, 10:00:02] 两端都包含
+        assert first["binance_price"] == pytest.approx((2000 + 2990 + 3010) / 3)
+        assert first["window_volume"] == 1.5
+        # 同一时刻的两笔 swap 互为对等行，累计成交量都包含对方
+        assert frame["window_volume"].tolist()[1:] == [4.5, 4.5]
+        assert frame["binance_price"].tolist()[1:] == [3100.0, 3100.0]
+        assert frame["gas_price"].tolist() == [50e9, 50e9, 60e9]
+
+    def test_price_pairs_time_filter(self, store):
+        """
+        测试：start / end 过滤 Uniswap 事件，累计成交量只计算范围内的事件
+        """
+        frame = store.price_pairs(
+            STRATEGY,
+            pd.Timestamp("2025-09-01 10:00:10", tz="UTC"),
+            pd.Timestamp("2025-09-01 10:30:00", tz="UTC"),
+        )
+
+        assert frame["window_volume"].tolist() == [3.0, 3.0]
+
+    def test_sync_builds_from_copy(self, tmp_path, mock_db_connection):
+        """
+        测试：从 COPY 文本构建数组（微秒转纳秒），已结束的日期不重复构建
+        """
+        conn, cursor = mock_db_connection
+        cursor.mogrify.side_effect = lambda sql, params: sql.encode()
+
+        def copy_expert(sql, f):
+            if "binance_trades" in sql:
+                f.write("1756720800000000,3000.5,1.25\n1756720801500000,3001,2\n")
+            else:
+                f.write("1756720800000000,3000,1.5,50000000000\n")
+
+        cursor.copy_expert.side_effect = copy_expert
+        s = TickStore(root=str(tmp_path))
+        start = datetime.datetime(2025, 9, 1, tzinfo=UTC)
+        end = datetime.datetime(2025, 9, 1, 23, tzinfo=UTC)
+
+        assert s.sync(conn, start, end) == 2
+        assert s.sync(conn, start, end) == 0
+
+        binance = s.load_day("binance", DAY)
+        assert binance["time"].tolist() == [
+            _ns("2025-09-01 10:00:00"),
+            _ns("2025-09-01 10:00:01.5"),
+        ]
+        assert binance["volume"].tolist() == [1.25, 2.0]
+        assert s.load_day("uniswap", DAY)["gas"].tolist() == [50e9]
+
+    def test_rewrite_day_replaces_files(self, store):
+        """
+        测试：重新构建时整体替换，不留下临时目录
+        """
+        store.write_day(
+            "binance",
+            DAY,
+            {"time": [_ns("2025-09-01")], "price": [1.0], "volume": [1.0]},
+        )
+
+        assert store.load_day("binance", DAY)["price"].tolist() == [1.0]
+        assert sorted(os.listdir(os.path.join(store.root, "binance"))) == ["2025-09-01"]
+
+
+def test_analyze_opportunities_accepts_frame(store):
+    """
+    测试：analyze_opportunities 直接使用逐笔数组返回的 DataFrame，结果与元组输入一致
+    """
+    from block_chain.analyse import DEFAULT_STRATEGY, analyze_opportunities
+
+    strategy = {**DEFAULT_STRATEGY, "profit_threshold": -1e9}
+    frame = store.price_pairs(strategy)
+    tuples = list(frame.itertuples(index=False, name=None))
+
+    from_frame = analyze_opportunities(frame, strategy)
+    from_tuples = analyze_opportunities(tuples, strategy)
+
+    assert "volatility" not in frame.columns
+    assert len(from_frame) == len(from_tuples) == 3
+    assert [o["profit_usdt"] for o in from_frame] == [
+        o["profit_usdt"] for o in from_tuples
+    ]
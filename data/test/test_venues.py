@@ -0,0 +1,263 @@
+"""
+venues.py 的单元测试（交易所适配器、统一的 COPY 写入与按交易所分析）
+"""
+
+import datetime
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+import pytest
+
+# 获取当前脚本文件的目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+# 获取上一级目录（父目录）的路径
+parent_dir = os.path.dirname(current_dir)
+# 将上一级目录添加到 sys.path
+sys.path.insert(0, parent_dir)
+
+from block_chain import venues
+from block_chain.collect_binance import collect_binance, process_chunk
+from block_chain.venues import (
+    TRADE_COLUMNS,
+    CsvDumpAdapter,
+    copy_trades,
+    display_name,
+    get_adapter,
+    venue_table,
+)
+
+T0 = datetime.datetime(2025, 9, 1, 10, 0, tzinfo=datetime.timezone.utc)
+
+
+class TestAdapters:
+    """
+    测试各交易所成交文件的规范化
+    """
+
+    def test_okx_dump(self, tmp_path):
+        """
+        测试：OKX 文件按列映射读取，毫秒时间戳转为 UTC，sell 方向记为买方挂单，缺少成交额时按价格 * 数量计算
+        """
+        path = tmp_path / "okx.csv"
+        path.write_text(
+            "instrument_name,trade_id,side,price,size,created_time\n"
+            "ETH-USDT,101,buy,3000.5,0.2,1756720800000\n"
+            "ETH-USDT,102,sell,3001.0,0.1,1756720801000\n"
+            "ETH-USDT,103,sell,3001.0,0.1,bad\n"
+        )
+        adapter = get_adapter("OKX")
+
+        chunks = list(adapter.read_chunks(str(path), chunk_size=10))
+        trades = adapter.normalize(chunks[0], "ETHUSDT")
+
+        assert list(trades.columns) == list(TRADE_COLUMNS)
+        assert trades["id"].tolist() == [101, 102]
+        assert trades["trade_time"].iloc[0] == pd.Timestamp(T0)
+        assert trades["is_buyer_maker"].tolist() == [False, True]
+        assert trades["quote_qty"].iloc[0] == pytest.approx(600.1)
+        assert (trades["symbol"] == "ETHUSDT").all()
+
+    def test_uuid_ids_are_stable(self):
+        """
+        测试：Bybit 的 UUID 成交 ID 映射为稳定的非负整数，秒级小数时间戳保留毫秒
+        """
+        adapter = get_adapter("bybit")
+        raw = pd.DataFrame(
+            {
+                "timestamp": [1756720800.25, 1756720801.5],
+                "side": ["Buy", "Sell"],
+                "size": [0.5, 1.0],
+                "price": [3000.0, 3001.0],
+                "foreignNotional": [1500.0, 3001.0],
+                "trdMatchID": [
+                    "2b2c7d46-d1e5-5c4b-bd6d-fdb36d0b3d6a",
+                    "9d3c3f3e-7d57-5f1b-8a0f-60d9c3a0c1b1",
+                ],
+            }
+        )
+
+        first = adapter.normalize(raw)
+        second = adapter.normalize(raw.copy())
+
+        assert first["id"].tolist() == second["id"].tolist()
+        assert (first["id"] >= 0).all() and first["id"].nunique() == 2
+        assert first["trade_time"].iloc[0] == pd.Timestamp(T0) + pd.Timedelta(
+            milliseconds=250
+        )
+        assert first["quote_qty"].tolist() == [1500.0, 3001.0]
+
+    def test_lookup_and_validation(self):
+        """
+        测试：交易所名称不区分大小写；未知或不合法的交易所、缺少必需列的映射抛出异常
+        """
+        assert venue_table(None) == "binance_trades"
+        assert venue_table("OKX") == "okx_trades"
+        assert display_name("okx") == "OKX"
+        assert display_name() == "Binance"
+        with pytest.raises(ValueError):
+            get_adapter("mtgox")
+        with pytest.raises(ValueError):
+            venue_table("okx; DROP TABLE binance_trades")
+        with pytest.raises(ValueError):
+            CsvDumpAdapter("kraken", {"columns": {"price": "price"}})
+
+
+class TestLoader:
+    """
+    测试统一的 COPY 写入路径
+    """
+
+    def test_copy_trades_targets_venue_table(self):
+        """
+        测试：COPY 的列顺序与 TRADE_COLUMNS 一致，写入适配器对应的成交表
+        """
+        cursor = MagicMock()
+        copied = []
+        cursor.copy_expert.side_effect = lambda sql, file: copied.append(
+            (sql, file.getvalue())
+        )
+        trades = get_adapter("okx").normalize(
+            pd.DataFrame(
+                {
+                    "trade_id": [7],
+                    "side": ["buy"],
+                    "price": [3000.0],
+                    "size": [0.1],
+                    "created_time": [1756720800000],
+                }
+            ),
+            "ETHUSDT",
+        )
+
+        assert copy_trades(cursor, trades, "okx_trades") == 1
+
+        sql, payload = copied[0]
+        assert sql == (
+            "COPY okx_trades (id, price, qty, quote_qty, trade_time, is_buyer_maker,"
+            " is_best_match, symbol) FROM STDIN WITH (FORMAT CSV)"
+        )
+        assert payload.startswith("7,3000.0,0.1,300.0,2025-09-01 10:00:00+00:00,")
+        assert payload.strip().endswith(",False,True,ETHUSDT")
+
+    def test_process_chunk_uses_venue_adapter(self, mock_db_connection):
+        """
+        测试：process_chunk 按 venue 规范化分块并写入该交易所的表
+        """
+        conn, cur = mock_db_connection
+        raw = pd.DataFrame(
+            {
+                "timestamp": [1756720800.0],
+                "side": ["Sell"],
+                "size": [1.0],
+                "price": [3000.0],
+                "foreignNotional": [3000.0],
+                "trdMatchID": ["abc"],
+            }
+        )
+        counter = [0, 0]
+
+        process_chunk("task", raw, 0, counter, None, conn, venue="bybit")
+
+        assert "COPY bybit_trades" in cur.copy_expert.call_args[1]["sql"]
+        assert counter == [1, 1]
+
+    @patch("block_chain.collect_binance.rollup.refresh_after_ingest")
+    @patch("block_chain.collect_binance.columnar.open_ingest_sink")
+    @patch("block_chain.collect_binance.import_data_to_database")
+    @patch("block_chain.collect_binance.count_lines", return_value=100)
+    @patch("block_chain.collect_binance.check_task", return_value=False)
+    @patch("block_chain.collect_binance.update_task_status")
+    @patch("block_chain.collect_binance.psycopg2.connect")
+    def test_collect_creates_venue_table_without_derived_data(
+        self,
+        mock_connect,
+        mock_update_status,
+        mock_check_task,
+        mock_count_lines,
+        mock_import,
+        mock_open_sink,
+        mock_refresh,
+        monkeypatch,
+    ):
+        """
+        测试：其他交易所的表按 binance_trades 创建并在导入前单独提交；派生数据只覆盖 Binance，不写镜像也不刷新 K 线
+        """
+        monkeypatch.setattr(venues.symbols, "_ensured_tables", {"binance_trades"})
+        monkeypatch.setattr(venues, "_ensured_tables", set())
+        conn = MagicMock()
+        cur = MagicMock()
+        conn.cursor.return_value.__enter__.return_value = cur
+        mock_connect.return_value = conn
+        commits_before_import = []
+
+        def run_import(*args, **kwargs):
+            commits_before_import.append(conn.commit.call_count)
+            return [100, 100]
+
+        mock_import.side_effect = run_import
+
+        collect_binance("task", "okx.csv", 100, 1000, venue="okx")
+
+        ddl = cur.execute.call_args_list[0][0][0]
+        assert ddl.startswith(
+            "CREATE TABLE IF NOT EXISTS okx_trades (LIKE binance_trades"
+        )
+        assert mock_import.call_args[1]["venue"] == "okx"
+        # 建表在导入之前单独提交，不与导入事务一起持有锁
+        assert commits_before_import == [1]
+        mock_open_sink.assert_not_called()
+        mock_refresh.assert_not_called()
+
+
+class TestAnalysis:
+    """
+    测试按交易所分析
+    """
+
+    def test_fetch_price_pairs_reads_venue_table(self):
+        """
+        测试：strategy.venue 决定价格对查询 JOIN 的成交表
+        """
+        from block_chain.analyse import fetch_price_pairs
+
+        mock_conn = MagicMock()
+        mock_cur = MagicMock()
+        mock_conn.cursor.return_value.__enter__ = lambda x: mock_cur
+        mock_conn.cursor.return_value.__exit__ = lambda *args: None
+        mock_cur.fetchall.return_value = []
+        strategy = {"time_delay_seconds": 3, "window_seconds": 5}
+
+        fetch_price_pairs(mock_conn, {**strategy, "venue": "okx"})
+        assert "okx_trades b" in mock_cur.execute.call_args[0][0]
+        assert "binance_trades" not in mock_cur.execute.call_args[0][0]
+
+        fetch_price_pairs(mock_conn, strategy)
+        assert "binance_trades b" in mock_cur.execute.call_args[0][0]
+
+    def test_opportunity_uses_venue_name(self):
+        """
+        测试：机会记录中的中心化交易所平台名称来自 strategy.venue；增量哈希不计入默认交易所
+        """
+        from block_chain import incremental
+        from block_chain.analyse import evaluate_pair
+
+        strategy = {
+            "profit_threshold": 1,
+            "initial_investment": 100000,
+            "binance_fee_rate": 0.001,
+            "uniswap_fee_rate": 0.003,
+            "estimated_gas_used": 100000,
+            "venue": "okx",
+        }
+
+        opp = evaluate_pair(strategy, T0, 3200.0, 1e9, 3000.0, 0.0, 100.0, False)
+
+        assert opp["buy_platform"] == "OKX"
+        assert opp["sell_platform"] == "Uniswap"
+        base = {k: v for k, v in strategy.items() if k != "venue"}
+        assert incremental.strategy_hash(
+            {**base, "venue": "binance"}
+        ) == incremental.strategy_hash(base)
+        assert incremental.strategy_hash(strategy) != incremental.strategy_hash(base)